@@ -1,10 +1,11 @@
 from .model_optimizer import ModelOptimizerAgent
 from .model_provider import resolve_model
-from .response_parser import extract_json_object, ensure_keys
+from .response_parser import extract_json_object, ensure_keys, repair_json_object
 
 __all__ = [
     "ModelOptimizerAgent",
     "resolve_model",
     "extract_json_object",
     "ensure_keys",
+    "repair_json_object",
 ]
@@ -0,0 +1,187 @@
+"""
+DET Flow - Circuit Breaker
+Per-model circuit breakers shared by all agents, so a degraded provider fails fast
+(or is skipped in favour of an alternate model) instead of every call waiting for
+the full client timeout.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+import logging
+import threading
+import time
+from datetime import datetime
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitState:
+    """Circuit breaker states."""
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a model whose circuit is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit open for {name}")
+        self.name = name
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after failure_threshold consecutive failures.
+    Open -> half-open after recovery_seconds; up to half_open_max_calls probes are let through.
+    A successful probe closes the circuit, a failed probe opens it again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: Optional[int] = None,
+        recovery_seconds: Optional[float] = None,
+        half_open_max_calls: Optional[int] = None
+    ):
+        self.name = name
+        self.failure_threshold = failure_threshold or settings.circuit_failure_threshold
+        self.recovery_seconds = settings.circuit_recovery_seconds if recovery_seconds is None else recovery_seconds
+        self.half_open_max_calls = half_open_max_calls or settings.circuit_half_open_max_calls
+
+        self._state = CircuitState.CLOSED
+        self._consecutive_failures = 0
+        self._opened_at: Optional[float] = None
+        self._probes_in_flight = 0
+        self._lock = threading.Lock()
+
+        self._stats = {"trips": 0, "rejected": 0, "successes": 0, "failures": 0}
+        self._last_trip: Optional[str] = None
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            self._maybe_half_open()
+            return self._state
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being rejected (open and not yet due for a probe)."""
+        return self.state == CircuitState.OPEN
+
+    def allow_request(self) -> bool:
+        """
+        Check whether a call may go through, reserving a probe slot when half-open.
+
+        Returns:
+            False if the call must fail fast
+        """
+        with self._lock:
+            self._maybe_half_open()
+
+            if self._state == CircuitState.CLOSED:
+                return True
+
+            if self._state == CircuitState.HALF_OPEN and self._probes_in_flight < self.half_open_max_calls:
+                self._probes_in_flight += 1
+                return True
+
+            self._stats["rejected"] += 1
+            return False
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot for a call that never reached the provider."""
+        with self._lock:
+            if self._state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._stats["successes"] += 1
+            self._consecutive_failures = 0
+            if self._state == CircuitState.HALF_OPEN:
+                logger.info(f"Circuit for {self.name} closed after successful probe")
+                self._probes_in_flight = 0
+            self._state = CircuitState.CLOSED
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._stats["failures"] += 1
+            self._consecutive_failures += 1
+
+            if self._state == CircuitState.HALF_OPEN:
+                self._probes_in_flight = max(0, self._probes_in_flight - 1)
+                self._trip("probe failed")
+            elif self._state == CircuitState.CLOSED and self._consecutive_failures >= self.failure_threshold:
+                self._trip(f"{self._consecutive_failures} consecutive failures")
+
+    def reset(self) -> None:
+        """Force the circuit closed (ops override)."""
+        with self._lock:
+            self._state = CircuitState.CLOSED
+            self._consecutive_failures = 0
+            self._opened_at = None
+            self._probes_in_flight = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._maybe_half_open()
+            return {
+                **self._stats,
+                "state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "last_trip": self._last_trip,
+            }
+
+    def _trip(self, reason: str) -> None:
+        self._state = CircuitState.OPEN
+        self._opened_at = time.monotonic()
+        self._stats["trips"] += 1
+        self._last_trip = datetime.now().isoformat(timespec="seconds")
+        logger.warning(f"Circuit for {self.name} opened ({reason}); retrying in {self.recovery_seconds}s")
+
+    def _maybe_half_open(self) -> None:
+        if (
+            self._state == CircuitState.OPEN
+            and self._opened_at is not None
+            and time.monotonic() - self._opened_at >= self.recovery_seconds
+        ):
+            self._state = CircuitState.HALF_OPEN
+            self._probes_in_flight = 0
+
+
+class CircuitBreakerRegistry:
+    """One breaker per model ID, created on first use."""
+
+    def __init__(self):
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self._breakers.get(name)
+            if breaker is None:
+                breaker = self._breakers[name] = CircuitBreaker(name)
+            return breaker
+
+    def reset(self, name: str) -> bool:
+        """Reset a breaker. Returns False if it does not exist."""
+        with self._lock:
+            breaker = self._breakers.get(name)
+        if breaker is None:
+            return False
+        breaker.reset()
+        return True
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            breakers = dict(self._breakers)
+        return {name: breaker.get_stats() for name, breaker in breakers.items()}
+
+
+# Global circuit breaker registry shared by all agents
+circuit_breakers = CircuitBreakerRegistry()
@@ -0,0 +1,229 @@
+"""
+DET Flow - Context Compactor
+Keeps agent prompts inside a per-activity token budget: structural summarization of study
+plans, dropping of low-value fields, history trimming and per-call token logging.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Prompt token budgets for the variable part of each activity's request
+DEFAULT_TOKEN_BUDGETS: Dict[str, int] = {
+    "evaluation": 1500,
+    "study_plan": 2500,
+    "chat": 800,
+    "summarization": 1500,
+    "default": 1500,
+}
+
+# Plan fields that do not help the model adjust the remaining weeks
+LOW_VALUE_PLAN_FIELDS = {"created_at", "student_profile", "study_tips", "motivation_message", "error"}
+LOW_VALUE_TASK_FIELDS = {"resources"}
+
+_encoder = None
+_encoder_loaded = False
+_encoder_lock = threading.Lock()
+
+
+def _get_encoder():
+    """Load the tiktoken encoder once; None when tiktoken or its data is unavailable."""
+    global _encoder, _encoder_loaded
+    if _encoder_loaded:
+        return _encoder
+
+    with _encoder_lock:
+        if not _encoder_loaded:
+            try:
+                import tiktoken
+                _encoder = tiktoken.get_encoding("o200k_base")
+            except Exception as exc:
+                logger.info(f"tiktoken indisponivel, usando estimativa de tokens: {exc}")
+                _encoder = None
+            _encoder_loaded = True
+
+    return _encoder
+
+
+def count_tokens(text: str) -> int:
+    """
+    Count tokens in a text.
+    Uses tiktoken when available and falls back to a ~4 characters per token estimate.
+    """
+    if not text:
+        return 0
+
+    encoder = _get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+
+def to_compact_json(payload: Any) -> str:
+    """Serialize JSON without indentation or padding."""
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+
+
+class ContextCompactor:
+    """
+    Shrinks variable prompt context to fit a per-activity token budget.
+    Budgets can be overridden with CONTEXT_TOKEN_BUDGETS_JSON, e.g. {"chat": 600}.
+    """
+
+    def __init__(self, budgets: Optional[Dict[str, int]] = None):
+        self.budgets = {**DEFAULT_TOKEN_BUDGETS, **self._load_env_budgets(), **(budgets or {})}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def budget_for(self, activity: str) -> int:
+        return self.budgets.get(activity, self.budgets["default"])
+
+    # ==================== Study plans ====================
+
+    def compact_plan(
+        self,
+        plan: Dict[str, Any],
+        completed_weeks: int = 0,
+        activity: str = "study_plan",
+    ) -> Dict[str, Any]:
+        """
+        Structural summary of a plan containing only the weeks still ahead.
+
+        Degrades in steps until the result fits the activity budget:
+        full remaining weeks without low-value fields, then per-day task types only,
+        then one line per week.
+        """
+        budget = self.budget_for(activity)
+        header = {
+            key: value
+            for key, value in plan.items()
+            if key != "weekly_schedule" and key not in LOW_VALUE_PLAN_FIELDS
+        }
+        remaining = [
+            week for week in plan.get("weekly_schedule", [])
+            if int(week.get("week", 0) or 0) > completed_weeks
+        ]
+
+        for summarize in (self._strip_week, self._summarize_week_days, self._summarize_week):
+            compact = {**header, "weekly_schedule": [summarize(week) for week in remaining]}
+            if count_tokens(to_compact_json(compact)) <= budget:
+                return compact
+
+        return compact
+
+    def _strip_week(self, week: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            **{key: value for key, value in week.items() if key != "daily_tasks"},
+            "daily_tasks": [
+                {
+                    **{key: value for key, value in day.items() if key != "tasks"},
+                    "tasks": [
+                        {key: value for key, value in task.items() if key not in LOW_VALUE_TASK_FIELDS}
+                        for task in day.get("tasks", [])
+                    ],
+                }
+                for day in week.get("daily_tasks", [])
+            ],
+        }
+
+    def _summarize_week_days(self, week: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "week": week.get("week"),
+            "focus_areas": week.get("focus_areas", []),
+            "daily_tasks": [
+                {
+                    "day": day.get("day"),
+                    "duration_minutes": day.get("duration_minutes"),
+                    "task_types": [task.get("task_type") for task in day.get("tasks", [])],
+                }
+                for day in week.get("daily_tasks", [])
+            ],
+            "checkpoint": week.get("checkpoint"),
+        }
+
+    def _summarize_week(self, week: Dict[str, Any]) -> Dict[str, Any]:
+        days = week.get("daily_tasks", [])
+        task_types = sorted({
+            task.get("task_type") for day in days for task in day.get("tasks", []) if task.get("task_type")
+        })
+        return {
+            "week": week.get("week"),
+            "focus_areas": week.get("focus_areas", []),
+            "study_days": len(days),
+            "total_minutes": sum(int(day.get("duration_minutes", 0) or 0) for day in days),
+            "task_types": task_types,
+        }
+
+    # ==================== Conversation history ====================
+
+    def compact_history(self, history: List[Dict[str, Any]], activity: str = "chat") -> List[Dict[str, Any]]:
+        """Drop the oldest turns until the history uses at most half the activity budget."""
+        budget = self.budget_for(activity) // 2
+        turns = list(history)
+        while turns and count_tokens(to_compact_json(turns)) > budget:
+            turns.pop(0)
+        return turns
+
+    # ==================== Measurement ====================
+
+    def log_prompt(
+        self,
+        activity: str,
+        prompt: str,
+        original_tokens: Optional[int] = None,
+    ) -> int:
+        """
+        Log the token count of a prompt (and the pre-compaction size, when known).
+
+        Returns:
+            Prompt token count
+        """
+        tokens = count_tokens(prompt)
+        original = original_tokens if original_tokens is not None else tokens
+        budget = self.budget_for(activity)
+
+        with self._lock:
+            stats = self._stats.setdefault(
+                activity, {"calls": 0, "prompt_tokens": 0, "original_tokens": 0, "over_budget": 0}
+            )
+            stats["calls"] += 1
+            stats["prompt_tokens"] += tokens
+            stats["original_tokens"] += original
+            if tokens > budget:
+                stats["over_budget"] += 1
+
+        if original != tokens:
+            logger.info(f"Prompt tokens [{activity}]: {tokens} (original {original}, budget {budget})")
+        else:
+            logger.info(f"Prompt tokens [{activity}]: {tokens} (budget {budget})")
+        return tokens
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Token totals per activity, including tokens saved by compaction."""
+        with self._lock:
+            return {
+                activity: {**stats, "tokens_saved": stats["original_tokens"] - stats["prompt_tokens"]}
+                for activity, stats in self._stats.items()
+            }
+
+    def _load_env_budgets(self) -> Dict[str, int]:
+        env_budgets = os.getenv("CONTEXT_TOKEN_BUDGETS_JSON")
+        if not env_budgets:
+            return {}
+        try:
+            parsed = json.loads(env_budgets)
+            if isinstance(parsed, dict):
+                return {key: int(value) for key, value in parsed.items()}
+        except (json.JSONDecodeError, TypeError, ValueError) as exc:
+            logger.warning(f"CONTEXT_TOKEN_BUDGETS_JSON invalido: {exc}")
+        return {}
+
+
+# Shared compactor instance
+context_compactor = ContextCompactor()
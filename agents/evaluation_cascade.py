@@ -0,0 +1,121 @@
+"""
+DET Flow - Evaluation Cascade
+Two-tier grading: a low-cost triage model evaluates first and the strong evaluation
+model is only called when the triage result is malformed, not confident enough or too
+close to a CEFR boundary to trust. Escalation share and tier agreement are tracked.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional
+import logging
+import threading
+
+from core.config import settings
+from agents.schemas import cefr_for_score
+
+logger = logging.getLogger(__name__)
+
+ESCALATION_REASONS = ("malformed", "low_confidence", "cefr_boundary")
+
+
+class CascadePolicy:
+    """Decides whether a triage evaluation can be accepted."""
+
+    def __init__(self, min_confidence: Optional[float] = None, boundary_margin: Optional[int] = None):
+        """
+        Args:
+            min_confidence: Minimum self-reported confidence (0-1) to accept the triage result
+            boundary_margin: Scores whose CEFR level would change within this many points are escalated
+        """
+        self.min_confidence = settings.cascade_min_confidence if min_confidence is None else min_confidence
+        self.boundary_margin = settings.cascade_boundary_margin if boundary_margin is None else boundary_margin
+
+    def escalation_reason(self, evaluation: Optional[Dict[str, Any]]) -> Optional[str]:
+        """
+        Check a triage evaluation.
+
+        Args:
+            evaluation: Validated triage evaluation, or None if it could not be parsed
+
+        Returns:
+            The reason to escalate, or None to accept the triage result
+        """
+        if not evaluation:
+            return "malformed"
+
+        try:
+            confidence = float(evaluation.get("confidence"))
+        except (TypeError, ValueError):
+            confidence = None
+        if confidence is None or confidence < self.min_confidence:
+            return "low_confidence"
+
+        # A small scoring error would change the CEFR level
+        score = evaluation["overall_score"]
+        if cefr_for_score(score - self.boundary_margin) != cefr_for_score(score + self.boundary_margin):
+            return "cefr_boundary"
+
+        return None
+
+
+class CascadeStats:
+    """Counters for accepted and escalated triage evaluations and tier agreement."""
+
+    def __init__(self):
+        self._stats: Dict[str, Any] = {
+            "evaluations": 0,
+            "accepted": 0,
+            "escalated": 0,
+            "reasons": {reason: 0 for reason in ESCALATION_REASONS},
+            "compared": 0,
+            "abs_score_diff_total": 0.0,
+            "same_cefr": 0,
+            "latency_ms_total": {"accepted": 0, "escalated": 0},
+        }
+        self._lock = threading.Lock()
+
+    def record(self, reason: Optional[str], latency_ms: int) -> None:
+        """Record one cascade evaluation (reason None = triage result accepted)."""
+        path = "escalated" if reason else "accepted"
+        with self._lock:
+            self._stats["evaluations"] += 1
+            self._stats[path] += 1
+            self._stats["latency_ms_total"][path] += latency_ms
+            if reason:
+                self._stats["reasons"][reason] += 1
+
+    def record_comparison(self, triage_score: int, strong_score: int) -> None:
+        """Record how the triage and strong tiers scored the same submission."""
+        with self._lock:
+            self._stats["compared"] += 1
+            self._stats["abs_score_diff_total"] += abs(triage_score - strong_score)
+            if cefr_for_score(triage_score) == cefr_for_score(strong_score):
+                self._stats["same_cefr"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Escalation share, reasons, mean latency per path and tier agreement."""
+        with self._lock:
+            stats = self._stats
+            total = stats["evaluations"]
+            compared = stats["compared"]
+            return {
+                "evaluations": total,
+                "accepted": stats["accepted"],
+                "escalated": stats["escalated"],
+                "escalation_rate": round(stats["escalated"] / total, 4) if total else 0.0,
+                "reasons": dict(stats["reasons"]),
+                "mean_latency_ms": {
+                    path: int(stats["latency_ms_total"][path] / stats[path]) if stats[path] else None
+                    for path in ("accepted", "escalated")
+                },
+                "tier_agreement": {
+                    "compared": compared,
+                    "mean_abs_score_diff": round(stats["abs_score_diff_total"] / compared, 2) if compared else None,
+                    "same_cefr_rate": round(stats["same_cefr"] / compared, 4) if compared else None,
+                },
+            }
+
+
+# Global cascade statistics
+cascade_stats = CascadeStats()
@@ -4,9 +4,10 @@ Official DET examiner that evaluates student submissions using Chain-of-Thought
 Generates scores on the 10-160 scale with subscores for Literacy, Comprehension, Conversation, and Production.
 """
 
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Tuple
 import json
 import logging
+import random
 from datetime import datetime
 
 try:
@@ -17,7 +18,16 @@ except ImportError:
 from core.config import settings
 from agents.model_optimizer import ModelOptimizerAgent
 from agents.model_provider import resolve_model
-from agents.response_parser import extract_json_object, ensure_keys
+from agents.model_router import ModelRouter
+from agents.llm_scheduler import llm_priority
+from agents.model_telemetry import model_telemetry
+from agents.objective_scorer import objective_scorer
+from agents.lexical_features import FEATURE_TASK_TYPES, lexical_features
+from agents.schemas import EvaluationOutput
+from agents.evaluation_cascade import CascadePolicy, cascade_stats
+from agents.structured_output import StructuredOutputError, parse_structured, run_structured, structured_agent_kwargs
+from agents.context_compactor import context_compactor, count_tokens
+from agents.semantic_cache import semantic_cache
 
 logger = logging.getLogger(__name__)
 
@@ -99,7 +109,8 @@ You MUST respond with a valid JSON object containing:
   "strengths": ["<strength 1>", "<strength 2>", ...],
   "weaknesses": ["<weakness 1>", "<weakness 2>", ...],
   "feedback": "<constructive feedback in Portuguese for the student>",
-  "improvement_suggestions": ["<suggestion 1>", "<suggestion 2>", ...]
+  "improvement_suggestions": ["<suggestion 1>", "<suggestion 2>", ...],
+  "confidence": <0.0-1.0, how certain you are that the overall score is within 5 points>
 }
 
 IMPORTANT:
@@ -114,25 +125,58 @@ IMPORTANT:
         model_optimizer = ModelOptimizerAgent()
         recommendation = model_optimizer.recommend_model("evaluation")
         selected_model = recommendation.get("selected_model") or settings.openai_model
-        model_instance = resolve_model(selected_model)
 
-        # Initialize the Agno/Phi Agent
-        self.agent = Agent(
+        # Initialize the Agno/Phi Agent for the selected model
+        self.agent = self._build_agent(selected_model)
+
+        # Route calls with live latency tracking and failover to the alternatives
+        self.router = ModelRouter.from_recommendation(
+            "evaluation",
+            recommendation,
+            model_optimizer.catalog,
+            agent_factory=self._build_agent,
+            primary_agent=self.agent,
+            default_model=selected_model,
+            optimizer=model_optimizer
+        )
+
+        # Cascade mode: a low-cost triage model grades first, uncertain results escalate
+        self.triage_router = None
+        self.cascade_policy = CascadePolicy()
+        if settings.evaluation_cascade_enabled:
+            triage = model_optimizer.recommend_model("evaluation_triage")
+            triage_model = triage.get("selected_model")
+            if triage_model and triage_model != selected_model:
+                self.triage_router = ModelRouter.from_recommendation(
+                    "evaluation_triage",
+                    triage,
+                    model_optimizer.catalog,
+                    agent_factory=self._build_agent,
+                    default_model=triage_model,
+                    optimizer=model_optimizer
+                )
+                logger.info(f"Evaluation cascade enabled: {triage_model} -> {selected_model}")
+
+        logger.info("EvaluatorAgent initialized successfully")
+
+    def _build_agent(self, model_id: str) -> Agent:
+        """Create the agent for a catalog model."""
+        return Agent(
             name="DET Evaluator",
-            model=model_instance,
+            model=resolve_model(model_id),
             instructions=self.system_prompt,
             markdown=False,
-            debug_mode=settings.app_debug
+            debug_mode=settings.app_debug,
+            **structured_agent_kwargs(EvaluationOutput)
         )
 
-        logger.info("EvaluatorAgent initialized successfully")
-
     def evaluate_submission(
         self,
         task_type: str,
         task_prompt: str,
         response_text: str,
-        user_level: Optional[str] = None
+        user_level: Optional[str] = None,
+        reference_answer: Optional[Any] = None
     ) -> Dict[str, Any]:
         """
         Evaluate a student submission and generate detailed feedback with scores.
@@ -142,15 +186,35 @@ IMPORTANT:
             task_prompt: The original task prompt given to the student
             response_text: Student's response to be evaluated
             user_level: Current CEFR level of the user (optional, for context)
+            reference_answer: Correct answer of an objective task; when given, the
+                submission is scored locally without calling the LLM
 
         Returns:
-            Dict containing evaluation results with scores and feedback
+            Dict containing evaluation results with scores and feedback. When the LLM
+            fails on a writing task this is the interim lexical estimate instead, marked
+            "provisional": True, which callers must not store as the final score
         """
         try:
             start_time = datetime.now()
 
-            # Construct evaluation request
+            if objective_scorer.can_score(task_type, reference_answer):
+                evaluation_result = objective_scorer.score(task_type, response_text, reference_answer)
+                evaluation_result["evaluation_duration_ms"] = int((datetime.now() - start_time).total_seconds() * 1000)
+                logger.info(f"Objective {task_type} scored locally - Score: {evaluation_result['overall_score']}")
+                return evaluation_result
+
+            # Near-duplicate of an answer already graded for the same prompt
+            if settings.semantic_cache_enabled:
+                cached = semantic_cache.lookup(task_type, task_prompt, response_text)
+                if cached is not None:
+                    cached["evaluation_duration_ms"] = int((datetime.now() - start_time).total_seconds() * 1000)
+                    logger.info(f"Evaluation served from semantic cache ({cached['cache_match']})")
+                    return cached
+
+            # Static instructions first so the prompt prefix stays cacheable; submission data last
             evaluation_request = f"""
+Please evaluate this submission following the Chain-of-Thought process and provide your assessment in the required JSON format.
+
 TASK TYPE: {task_type}
 
 TASK PROMPT:
@@ -160,20 +224,32 @@ STUDENT RESPONSE:
 {response_text}
 
 {f"STUDENT CURRENT LEVEL: {user_level}" if user_level else ""}
-
-Please evaluate this submission following the Chain-of-Thought process and provide your assessment in the required JSON format.
 """
 
+            # Local features replace judging vocabulary range, complexity and cohesion from scratch
+            features = None
+            if settings.lexical_hints_enabled and task_type in FEATURE_TASK_TYPES:
+                features = lexical_features.extract(response_text)
+                evaluation_request += (
+                    "\nLOCAL TEXT FEATURES (computed automatically; rely on them for vocabulary range, "
+                    f"sentence complexity, cohesion and spelling):\n{lexical_features.format_hints(features)}\n"
+                )
+
             # Get evaluation from the agent
             logger.info(f"Evaluating {task_type} submission...")
-            response = self.agent.run(evaluation_request)
-
-            # Parse the response
-            evaluation_result = self._parse_evaluation(response.content)
+            context_compactor.log_prompt("evaluation", evaluation_request)
+            # Schema-validated output: JSON mode, local repair and at most one targeted re-ask
+            evaluation_result, model_id = self._run_evaluation(evaluation_request)
+            self._maybe_sample_agreement(evaluation_request, model_id, evaluation_result["overall_score"])
 
             # Calculate evaluation duration
             duration_ms = int((datetime.now() - start_time).total_seconds() * 1000)
             evaluation_result["evaluation_duration_ms"] = duration_ms
+            if features:
+                evaluation_result["lexical_features"] = features
+            if settings.semantic_cache_enabled:
+                tokens = count_tokens(evaluation_request) + count_tokens(json.dumps(evaluation_result))
+                semantic_cache.store(task_type, task_prompt, response_text, evaluation_result, tokens=tokens)
 
             logger.info(f"Evaluation completed in {duration_ms}ms - Score: {evaluation_result.get('overall_score')}")
 
@@ -181,24 +257,119 @@ Please evaluate this submission following the Chain-of-Thought process and provi
 
         except Exception as e:
             logger.error(f"Error during evaluation: {e}")
+            # Interim estimate so the student gets feedback now; it is not a final score
+            provisional = self.provisional_evaluation(task_type, response_text)
+            if provisional:
+                return {**provisional, "provisional": True, "error": str(e), "evaluation_duration_ms": 0}
             return self._get_fallback_evaluation(error=str(e))
 
-    def _parse_evaluation(self, response_content: str) -> Dict[str, Any]:
+    def _run_evaluation(self, evaluation_request: str) -> Tuple[Dict[str, Any], str]:
         """
-        Parse the agent's response and extract the JSON evaluation.
+        Grade a request, through the triage cascade when it is enabled.
 
         Args:
-            response_content: Raw response from the agent
+            evaluation_request: Evaluation message for the agent
 
         Returns:
-            Parsed evaluation dictionary
+            (validated evaluation, model ID that produced it)
         """
+        if self.triage_router is None:
+            return run_structured(self.router, evaluation_request, EvaluationOutput, "evaluation")
+
+        start_time = datetime.now()
+        triage_result, triage_model = None, None
         try:
-            evaluation = extract_json_object(response_content)
-            ensure_keys(
-                evaluation,
-                ["overall_score", "subscores", "cefr_level", "analysis", "feedback"]
+            triage_result, triage_model = run_structured(
+                self.triage_router, evaluation_request, EvaluationOutput, "evaluation_triage"
             )
+        except StructuredOutputError as e:
+            logger.warning(f"Triage evaluation malformed, escalating: {e}")
+        except Exception as e:
+            # Triage models unavailable: the strong model grades as if there was no cascade
+            logger.warning(f"Triage evaluation failed, escalating: {e}")
+
+        reason = self.cascade_policy.escalation_reason(triage_result)
+        if reason is None:
+            cascade_stats.record(None, int((datetime.now() - start_time).total_seconds() * 1000))
+            self._maybe_audit_triage(evaluation_request, triage_model, triage_result["overall_score"])
+            return {**triage_result, "evaluation_tier": "triage"}, triage_model
+
+        evaluation_result, model_id = run_structured(self.router, evaluation_request, EvaluationOutput, "evaluation")
+        cascade_stats.record(reason, int((datetime.now() - start_time).total_seconds() * 1000))
+        if triage_result:
+            self._compare_tiers(triage_model, triage_result["overall_score"], model_id, evaluation_result["overall_score"])
+
+        logger.info(f"Evaluation escalated from {triage_model} to {model_id} ({reason})")
+        return {**evaluation_result, "evaluation_tier": "escalated", "escalation_reason": reason}, model_id
+
+    def _compare_tiers(self, triage_model: str, triage_score: int, strong_model: str, strong_score: int) -> None:
+        """Record the agreement between the triage and strong tiers."""
+        cascade_stats.record_comparison(triage_score, strong_score)
+        model_telemetry.record_agreement("evaluation_triage", triage_model, strong_model, triage_score, strong_score)
+
+    def _maybe_audit_triage(self, evaluation_request: str, triage_model: str, triage_score: int) -> None:
+        """Re-grade a sample of accepted triage results with the strong model in the background."""
+        if random.random() >= settings.cascade_audit_rate:
+            return
+
+        def audit():
+            try:
+                strong, model_id = run_structured(self.router, evaluation_request, EvaluationOutput, "evaluation")
+            except Exception as e:
+                logger.warning(f"Cascade audit failed: {e}")
+                return
+            self._compare_tiers(triage_model, triage_score, model_id, strong["overall_score"])
+
+        self.router.executor.submit(audit)
+
+    def provisional_evaluation(self, task_type: str, response_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Instant provisional evaluation from local lexical features (no LLM call).
+
+        Args:
+            task_type: Type of DET task
+            response_text: Student's response
+
+        Returns:
+            Provisional evaluation, or None for tasks without lexical features
+        """
+        if task_type not in FEATURE_TASK_TYPES or not response_text:
+            return None
+        return lexical_features.provisional_evaluation(task_type, response_text)
+
+    def _maybe_sample_agreement(self, evaluation_request: str, model_id: str, score: int) -> None:
+        """Re-score a sample of submissions with a second model in the background."""
+        if random.random() >= settings.model_agreement_sample_rate:
+            return
+
+        other_model = next((m for m in self.router.candidates if m != model_id), None)
+        if other_model is not None:
+            self.router.executor.submit(self._score_agreement, evaluation_request, model_id, other_model, score)
+
+    def _score_agreement(self, evaluation_request: str, model_id: str, other_model: str, score: int) -> None:
+        """Record how closely another model scores the same submission."""
+        try:
+            shadow = self._parse_evaluation(self.router.run_on(other_model, evaluation_request).content)
+        except Exception as e:
+            logger.warning(f"Shadow evaluation with {other_model} failed: {e}")
+            return
+
+        model_telemetry.record_parse("evaluation", other_model, ok="error" not in shadow)
+        if "error" not in shadow:
+            model_telemetry.record_agreement("evaluation", model_id, other_model, score, shadow["overall_score"])
+
+    def _parse_evaluation(self, response_content: Any) -> Dict[str, Any]:
+        """
+        Parse the agent's response and validate it against the evaluation schema.
+
+        Args:
+            response_content: Agent response (schema instance, dict or raw text)
+
+        Returns:
+            Parsed evaluation dictionary
+        """
+        try:
+            evaluation, _ = parse_structured(response_content, EvaluationOutput)
             return evaluation
 
         except json.JSONDecodeError as e:
@@ -247,6 +418,8 @@ Please evaluate this submission following the Chain-of-Thought process and provi
         """
         Evaluate multiple submissions in batch.
 
+        Runs at batch priority so live conversations are served first.
+
         Args:
             submissions: List of submission dictionaries
 
@@ -254,13 +427,15 @@ Please evaluate this submission following the Chain-of-Thought process and provi
             List of evaluation results
         """
         results = []
-        for submission in submissions:
-            result = self.evaluate_submission(
-                task_type=submission.get("task_type"),
-                task_prompt=submission.get("task_prompt"),
-                response_text=submission.get("response_text"),
-                user_level=submission.get("user_level")
-            )
-            results.append(result)
+        with llm_priority("batch"):
+            for submission in submissions:
+                result = self.evaluate_submission(
+                    task_type=submission.get("task_type"),
+                    task_prompt=submission.get("task_prompt"),
+                    response_text=submission.get("response_text"),
+                    user_level=submission.get("user_level"),
+                    reference_answer=submission.get("reference_answer")
+                )
+                results.append(result)
 
         return results
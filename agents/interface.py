@@ -6,6 +6,7 @@ Routes requests to appropriate agents and formats responses for WhatsApp.
 
 from typing import Dict, Any, Optional
 import logging
+import re
 
 try:
     from agno.agent import Agent
@@ -15,9 +16,15 @@ except ImportError:
 from core.config import settings
 from agents.model_optimizer import ModelOptimizerAgent
 from agents.model_provider import resolve_model
+from agents.model_router import ModelRouter
+from agents.context_compactor import context_compactor, count_tokens
 
 logger = logging.getLogger(__name__)
 
+# "semana 3": a week of the active plan. A bare "semana" says nothing about intent
+# ("meu progresso nesta semana") and must not start a new plan.
+WEEK_VIEW_PATTERN = re.compile(r"semana\s*\d+")
+
 
 class InterfaceAgent:
     """
@@ -119,19 +126,33 @@ IMPORTANT:
         model_optimizer = ModelOptimizerAgent()
         recommendation = model_optimizer.recommend_model("chat")
         selected_model = recommendation.get("selected_model") or settings.openai_model
-        model_instance = resolve_model(selected_model)
 
-        # Initialize the Agno/Phi Agent
-        self.agent = Agent(
+        # Initialize the Agno/Phi Agent for the selected model
+        self.agent = self._build_agent(selected_model)
+
+        # Route calls with live latency tracking and failover to the alternatives
+        self.router = ModelRouter.from_recommendation(
+            "chat",
+            recommendation,
+            model_optimizer.catalog,
+            agent_factory=self._build_agent,
+            primary_agent=self.agent,
+            default_model=selected_model,
+            optimizer=model_optimizer
+        )
+
+        logger.info("InterfaceAgent initialized successfully")
+
+    def _build_agent(self, model_id: str) -> Agent:
+        """Create the agent for a catalog model."""
+        return Agent(
             name="DET Interface",
-            model=model_instance,
+            model=resolve_model(model_id),
             instructions=self.system_prompt,
             markdown=False,
             debug_mode=settings.app_debug
         )
 
-        logger.info("InterfaceAgent initialized successfully")
-
     def process_message(
         self,
         user_message: str,
@@ -148,15 +169,19 @@ IMPORTANT:
             Dict containing response and routing information
         """
         try:
-            # Build context for the agent
-            context_info = ""
-            if user_context:
-                context_info = f"\n\nUSER CONTEXT:\n{self._format_context(user_context)}"
+            # Keep the conversation history inside the chat token budget
+            original_tokens = None
+            if user_context and user_context.get("history"):
+                history = context_compactor.compact_history(user_context["history"])
+                if len(history) < len(user_context["history"]):
+                    original_tokens = count_tokens(self._build_prompt(user_message, user_context))
+                    user_context = {**user_context, "history": history}
 
-            full_prompt = f"USER MESSAGE:\n{user_message}{context_info}\n\nPlease respond appropriately and indicate if any specialized agent should be involved."
+            full_prompt = self._build_prompt(user_message, user_context)
+            context_compactor.log_prompt("chat", full_prompt, original_tokens=original_tokens)
 
             # Get response from agent
-            response = self.agent.run(full_prompt)
+            response = self.router.run(full_prompt)
 
             # Parse response and extract routing info
             result = {
@@ -192,6 +217,18 @@ IMPORTANT:
         cefr = evaluation.get("cefr_level", "B1")
         feedback = evaluation.get("feedback", "")
 
+        if evaluation.get("provisional"):
+            weaknesses = "\n".join(f"• {item}" for item in evaluation.get("weaknesses", []))
+            return f"""⏳ *Avaliação Provisória*
+
+📊 *Pontuação estimada:* {score}/160
+📈 *Nível CEFR estimado:* {cefr}
+
+{feedback}
+{weaknesses}
+
+Não conseguimos concluir a avaliação completa agora, então esta nota não foi registrada. Envie sua resposta novamente em alguns minutos para receber a nota final."""
+
         subscores = evaluation.get("subscores", {})
         literacy = subscores.get("literacy", 0)
         comprehension = subscores.get("comprehension", 0)
@@ -266,6 +303,17 @@ Digite o número da semana (1-{plan.get('duration_weeks', 0)}) para ver detalhes
 
         return message
 
+    def _build_prompt(self, user_message: str, user_context: Optional[Dict[str, Any]]) -> str:
+        """Build the agent prompt: fixed instructions first, then context and the message."""
+        context_info = ""
+        if user_context:
+            context_info = f"USER CONTEXT:\n{self._format_context(user_context)}\n\n"
+
+        return (
+            "Please respond appropriately and indicate if any specialized agent should be involved.\n\n"
+            f"{context_info}USER MESSAGE:\n{user_message}"
+        )
+
     def _format_context(self, context: Dict[str, Any]) -> str:
         """Format user context for the agent."""
         formatted = []
@@ -277,9 +325,19 @@ Digite o número da semana (1-{plan.get('duration_weeks', 0)}) para ver detalhes
             formatted.append(f"Target Score: {context['target_score']}")
         if context.get("recent_scores"):
             formatted.append(f"Recent Scores: {context['recent_scores']}")
+        if context.get("history"):
+            formatted.append("Recent Conversation (oldest first):")
+            for turn in context["history"]:
+                formatted.append(f"- Student: {turn.get('user', '')}")
+                if turn.get("assistant"):
+                    formatted.append(f"  Assistant: {turn['assistant']}")
 
         return "\n".join(formatted) if formatted else "No context available"
 
+    def detect_intent(self, message: str) -> str:
+        """Intent of a message from keywords only (no LLM call), e.g. for quota checks."""
+        return self._detect_intent(message)
+
     def _detect_intent(self, message: str) -> str:
         """
         Detect user intent from message.
@@ -294,6 +352,8 @@ Digite o número da semana (1-{plan.get('duration_weeks', 0)}) para ver detalhes
             return "submit"
         elif any(word in message_lower for word in ["plano", "cronograma", "estudar", "preparar"]):
             return "plan"
+        elif WEEK_VIEW_PATTERN.search(message_lower):
+            return "plan"
         elif any(word in message_lower for word in ["progresso", "evolução", "scores", "pontuação"]):
             return "progress"
         elif any(word in message_lower for word in ["ajuda", "dúvida", "como", "o que é"]):
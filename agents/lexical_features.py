@@ -0,0 +1,260 @@
+"""
+DET Flow - Lexical Features
+Fast local text features for written production tasks (type-token ratio, frequency
+band coverage, sentence length distribution, connective usage and spelling error rate).
+They are passed to the EvaluatorAgent as compact hints and can produce an instant
+provisional score while (or instead of, when the LLM fails) the full evaluation runs.
+"""
+
+from __future__ import annotations
+
+from functools import lru_cache
+from statistics import mean, pstdev
+from typing import Any, Dict, Iterable, List, Optional
+import logging
+import re
+
+from agents.objective_scorer import SUBSCORES, allowed_edits, levenshtein, tokenize
+from agents.schemas import MAX_SCORE, MIN_SCORE, cefr_for_score
+from knowledge_base.det_task_types import TaskType
+from knowledge_base.word_frequency import ACADEMIC_WORDS, CONNECTIVES, K1_WORDS, K2_WORDS, frequency_band
+
+logger = logging.getLogger(__name__)
+
+# Written production tasks that get lexical hints, with their expected length in words
+FEATURE_TASK_TYPES: Dict[str, int] = {
+    TaskType.WRITE_ABOUT_PHOTO: 40,
+    TaskType.WRITING_SAMPLE: 120,
+}
+
+MATTR_WINDOW = 50
+BASIC_CONNECTIVES = frozenset({"and", "but", "so", "then", "because"})
+_SENTENCE_RE = re.compile(r"[.!?]+(?:\s+|$)")
+
+# Lexicon indexed by (first letter, length) for spelling suggestions
+_LEXICON_INDEX: Dict[tuple, List[str]] = {}
+for _word in K1_WORDS | K2_WORDS | ACADEMIC_WORDS:
+    _LEXICON_INDEX.setdefault((_word[0], len(_word)), []).append(_word)
+
+
+def _is_transposition(a: str, b: str) -> bool:
+    """True if b is a with two adjacent letters swapped."""
+    if len(a) != len(b):
+        return False
+    diffs = [i for i, (x, y) in enumerate(zip(a, b)) if x != y]
+    return len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+
+
+@lru_cache(maxsize=20000)
+def spelling_suggestion(word: str) -> Optional[str]:
+    """
+    Closest known word for a token that is in none of the frequency lists.
+
+    Only words with the same first letter and a similar length are compared, which
+    keeps the lookup cheap and avoids flagging rare but correctly spelled words.
+
+    Returns:
+        The suggested word, or None when the token does not look like a misspelling
+    """
+    if len(word) < 4 or not word.isalpha() or frequency_band(word):
+        return None
+    tolerance = allowed_edits(word)
+    best, best_distance = None, tolerance + 1
+    for length in range(len(word) - tolerance, len(word) + tolerance + 1):
+        for candidate in _LEXICON_INDEX.get((word[0], length), ()):
+            # Swapped neighbouring letters (becuase) count as a single slip
+            distance = 1 if _is_transposition(word, candidate) else levenshtein(word, candidate)
+            if distance < best_distance:
+                best, best_distance = candidate, distance
+    return best
+
+
+def moving_average_ttr(tokens: List[str], window: int = MATTR_WINDOW) -> float:
+    """Type-token ratio averaged over sliding windows, so long texts are not penalized."""
+    if not tokens:
+        return 0.0
+    if len(tokens) <= window:
+        return len(set(tokens)) / len(tokens)
+
+    counts: Dict[str, int] = {}
+    for token in tokens[:window]:
+        counts[token] = counts.get(token, 0) + 1
+    total = len(counts)
+    for i in range(window, len(tokens)):
+        outgoing = tokens[i - window]
+        counts[outgoing] -= 1
+        if not counts[outgoing]:
+            del counts[outgoing]
+        counts[tokens[i]] = counts.get(tokens[i], 0) + 1
+        total += len(counts)
+    return total / (window * (len(tokens) - window + 1))
+
+
+class LexicalFeatureExtractor:
+    """Computes lexical features of a written response."""
+
+    def extract(self, text: str) -> Dict[str, Any]:
+        """
+        Compute the lexical features of one response.
+
+        Args:
+            text: Student response
+
+        Returns:
+            Dictionary of features (counts, ratios and percentages)
+        """
+        tokens = tokenize(text)
+        word_count = len(tokens)
+
+        bands = {"k1": 0, "k2": 0, "academic": 0, "off_list": 0}
+        misspellings = []
+        for token in tokens:
+            band = frequency_band(token)
+            if band:
+                bands[band] += 1
+                continue
+            suggestion = spelling_suggestion(token)
+            if suggestion:
+                misspellings.append(f"{token}→{suggestion}")
+            else:
+                bands["off_list"] += 1
+
+        sentence_lengths = [
+            len(tokenize(sentence)) for sentence in _SENTENCE_RE.split(text or "") if tokenize(sentence)
+        ]
+
+        padded = f" {' '.join(tokens)} "
+        connectives: Dict[str, int] = {}
+        for category, phrases in CONNECTIVES.items():
+            for phrase in phrases:
+                count = padded.count(f" {phrase} ")
+                if count:
+                    connectives[phrase] = connectives.get(phrase, 0) + count
+        categories = sorted(
+            category for category, phrases in CONNECTIVES.items() if any(p in connectives for p in phrases)
+        )
+
+        known = word_count - len(misspellings)
+        return {
+            "word_count": word_count,
+            "type_token_ratio": round(len(set(tokens)) / word_count, 4) if word_count else 0.0,
+            "mattr": round(moving_average_ttr(tokens), 4),
+            "band_coverage": {band: round(count / known, 4) if known else 0.0 for band, count in bands.items()},
+            "sentence_count": len(sentence_lengths),
+            "mean_sentence_length": round(mean(sentence_lengths), 2) if sentence_lengths else 0.0,
+            "sentence_length_sd": round(pstdev(sentence_lengths), 2) if sentence_lengths else 0.0,
+            "max_sentence_length": max(sentence_lengths, default=0),
+            "connective_count": sum(connectives.values()),
+            "advanced_connectives": sorted(c for c in connectives if c not in BASIC_CONNECTIVES),
+            "connective_categories": categories,
+            "spelling_errors": misspellings,
+            "spelling_error_rate": round(len(misspellings) / word_count, 4) if word_count else 0.0,
+        }
+
+    def extract_batch(self, texts: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        Compute features for many responses; the spelling lookup cache is shared across them.
+
+        Args:
+            texts: Student responses
+
+        Returns:
+            One feature dictionary per response, in order
+        """
+        return [self.extract(text) for text in texts]
+
+    def format_hints(self, features: Dict[str, Any]) -> str:
+        """Render features as a compact one-paragraph hint for the evaluator prompt."""
+        bands = features["band_coverage"]
+        errors = features["spelling_errors"]
+        return (
+            f"words={features['word_count']}; MATTR={features['mattr']:.2f}; "
+            f"bands K1 {bands['k1']:.0%} K2 {bands['k2']:.0%} AWL {bands['academic']:.0%} "
+            f"off-list {bands['off_list']:.0%}; sentences={features['sentence_count']} "
+            f"(mean {features['mean_sentence_length']:.1f}, sd {features['sentence_length_sd']:.1f}, "
+            f"max {features['max_sentence_length']}); connectives={features['connective_count']} "
+            f"[{', '.join(features['connective_categories']) or 'none'}]"
+            f"{'; advanced: ' + ', '.join(features['advanced_connectives'][:6]) if features['advanced_connectives'] else ''}; "
+            f"spelling errors={len(errors)} ({features['spelling_error_rate']:.1%})"
+            f"{': ' + ', '.join(errors[:8]) if errors else ''}"
+        )
+
+    def provisional_score(self, features: Dict[str, Any], task_type: str) -> int:
+        """
+        Heuristic 10-160 score from the features, rounded to 5 like DET scores.
+
+        Args:
+            features: Output of extract()
+            task_type: Task type (sets the expected response length)
+
+        Returns:
+            Provisional overall score
+        """
+        def clamp(value: float) -> float:
+            return max(0.0, min(1.0, value))
+
+        target_words = FEATURE_TASK_TYPES.get(task_type, 60)
+        bands = features["band_coverage"]
+
+        components = {
+            "length": (0.20, clamp(features["word_count"] / target_words)),
+            "diversity": (0.20, clamp((features["mattr"] - 0.45) / 0.40)),
+            "sophistication": (0.20, clamp((bands["k2"] + bands["academic"] + bands["off_list"]) / 0.30)),
+            "complexity": (0.15, clamp((features["mean_sentence_length"] - 5) / 15)),
+            "cohesion": (0.10, clamp(len(features["connective_categories"]) / 4)),
+            "spelling": (0.15, clamp(1 - features["spelling_error_rate"] * 10)),
+        }
+        level = sum(weight * value for weight, value in components.values())
+        # Too short to judge anything beyond the minimum
+        if features["word_count"] < 5:
+            level = 0.0
+
+        score = MIN_SCORE + level * (MAX_SCORE - MIN_SCORE)
+        return int(max(MIN_SCORE, min(MAX_SCORE, 5 * round(score / 5))))
+
+    def provisional_evaluation(self, task_type: str, text: str, features: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Instant evaluation built only from local features.
+
+        Args:
+            task_type: Task type
+            text: Student response
+            features: Precomputed features (computed when omitted)
+
+        Returns:
+            Evaluation dictionary in the EvaluatorAgent format, marked provisional
+        """
+        features = features or self.extract(text)
+        score = self.provisional_score(features, task_type)
+        errors = features["spelling_errors"]
+
+        weaknesses = []
+        if errors:
+            weaknesses.append("Ortografia: " + ", ".join(errors[:8]))
+        if features["word_count"] < FEATURE_TASK_TYPES.get(task_type, 60):
+            weaknesses.append("Resposta curta para a tarefa")
+        if len(features["connective_categories"]) < 2:
+            weaknesses.append("Poucos conectivos para ligar as ideias")
+
+        return {
+            "overall_score": score,
+            "subscores": {name: score for name in SUBSCORES},
+            "cefr_level": cefr_for_score(score),
+            "analysis": {
+                "grammar": "",
+                "vocabulary": f"Diversidade lexical (MATTR) {features['mattr']:.2f}",
+                "relevance": "",
+                "coherence": f"{features['connective_count']} conectivos",
+            },
+            "strengths": [],
+            "weaknesses": weaknesses,
+            "feedback": f"Pontuação provisória estimada: {score}/160. A avaliação completa pode ajustar este valor.",
+            "improvement_suggestions": [],
+            "scoring_method": "provisional",
+            "provisional": True,
+            "lexical_features": features,
+        }
+
+
+# Global lexical feature extractor instance
+lexical_features = LexicalFeatureExtractor()
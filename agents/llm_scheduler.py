@@ -0,0 +1,272 @@
+"""
+DET Flow - LLM Scheduler
+Central admission control for model calls. Each provider has a concurrency cap; when
+it is reached, calls queue per priority class and free slots are granted by weighted
+fair queuing (self-clocked finish tags), so a student's live chat does not wait behind
+a batch of background plan generations while lower classes still make progress.
+
+Priority classes, highest weight first:
+    interactive      conversation turns (chat, summarization)
+    paid_evaluation  other work for paying students (evaluations, study plans)
+    free_evaluation  the same for the free tier
+    batch            background work (prefetch, plan adjustments, batch evaluation)
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import heapq
+import itertools
+import json
+import logging
+import threading
+import time
+
+from core.config import settings
+from core.metrics import metrics
+from core.usage_ledger import current_usage_scope
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_CLASSES = ("interactive", "paid_evaluation", "free_evaluation", "batch")
+
+# Share of contended slots per class (WFQ weights)
+DEFAULT_CLASS_WEIGHTS: Dict[str, float] = {
+    "interactive": 8.0,
+    "paid_evaluation": 4.0,
+    "free_evaluation": 2.0,
+    "batch": 1.0,
+}
+
+INTERACTIVE_ACTIVITIES = {"chat", "summarization"}
+PAID_TIERS = {"premium", "pro"}
+
+# Explicit class for the calls made inside a block (e.g. batch jobs run from a request)
+_priority_override: ContextVar[Optional[str]] = ContextVar("llm_priority", default=None)
+
+
+class LLMQueueTimeout(Exception):
+    """Raised when a call waited too long for a provider slot."""
+
+    def __init__(self, provider: str, priority: str, waited: float):
+        self.provider = provider
+        self.priority = priority
+        super().__init__(f"No {provider} slot for {priority} call after {waited:.1f}s")
+
+
+@contextmanager
+def llm_priority(priority: str) -> Iterator[None]:
+    """Run the LLM calls made inside the block with an explicit priority class."""
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown LLM priority class: {priority}")
+    token = _priority_override.set(priority)
+    try:
+        yield
+    finally:
+        _priority_override.reset(token)
+
+
+def classify(activity: str) -> str:
+    """
+    Priority class of a call made from the current context.
+
+    Calls outside a user's usage scope (background threads) are batch work.
+    """
+    override = _priority_override.get()
+    if override is not None:
+        return override
+
+    scope = current_usage_scope()
+    if scope["user_id"] is None:
+        return "batch"
+    if activity in INTERACTIVE_ACTIVITIES:
+        return "interactive"
+    return "paid_evaluation" if scope["subscription_tier"] in PAID_TIERS else "free_evaluation"
+
+
+class _Waiter:
+    __slots__ = ("priority", "enqueued_at", "event", "granted")
+
+    def __init__(self, priority: str):
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+        self.event = threading.Event()
+        self.granted = False
+
+
+class _ProviderQueue:
+    """Slots and waiting calls of one provider."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_flight = 0
+        self.heap: List[tuple] = []  # (finish tag, sequence, waiter)
+        self.virtual_time = 0.0
+        self.last_finish: Dict[str, float] = {}
+        self.queued: Dict[str, int] = {priority: 0 for priority in PRIORITY_CLASSES}
+
+
+class LLMScheduler:
+    """Per-provider concurrency caps with weighted fair queuing across priority classes."""
+
+    def __init__(
+        self,
+        provider_limits: Optional[Dict[str, int]] = None,
+        default_limit: Optional[int] = None,
+        weights: Optional[Dict[str, float]] = None,
+        queue_timeout_seconds: Optional[float] = None,
+        enabled: Optional[bool] = None
+    ):
+        """
+        Args:
+            provider_limits: Max concurrent calls per provider (LLM_PROVIDER_CONCURRENCY_JSON)
+            default_limit: Cap for providers without an explicit limit
+            weights: WFQ weight per priority class
+            queue_timeout_seconds: Max wait for a slot before LLMQueueTimeout
+            enabled: False to run every call immediately
+        """
+        self.enabled = settings.llm_scheduler_enabled if enabled is None else enabled
+        self.provider_limits = provider_limits if provider_limits is not None else self._load_provider_limits()
+        self.default_limit = default_limit or settings.llm_default_provider_concurrency
+        self.weights = {**DEFAULT_CLASS_WEIGHTS, **(weights or {})}
+        self.queue_timeout_seconds = queue_timeout_seconds or settings.llm_queue_timeout_seconds
+
+        self._queues: Dict[str, _ProviderQueue] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._stats = {
+            priority: {"granted": 0, "queued": 0, "timeouts": 0, "wait_seconds_total": 0.0, "max_wait_seconds": 0.0}
+            for priority in PRIORITY_CLASSES
+        }
+
+    @contextmanager
+    def slot(self, provider: Optional[str], priority: str) -> Iterator[None]:
+        """
+        Hold one of the provider's slots while the block runs.
+
+        Args:
+            provider: Provider of the model called ("" or None share a default queue)
+            priority: Priority class (see PRIORITY_CLASSES)
+
+        Raises:
+            LLMQueueTimeout: When no slot was free within the queue timeout
+        """
+        if not self.enabled:
+            yield
+            return
+
+        provider = provider or "default"
+        self.acquire(provider, priority)
+        try:
+            yield
+        finally:
+            self.release(provider)
+
+    def acquire(self, provider: str, priority: str) -> None:
+        """Take a provider slot, waiting in the priority class queue when all are busy."""
+        if priority not in PRIORITY_CLASSES:
+            priority = "batch"
+
+        with self._lock:
+            queue = self._queue_for(provider)
+            if queue.in_flight < queue.limit and not queue.heap:
+                queue.in_flight += 1
+                self._record_wait(provider, priority, 0.0, queued=False)
+                self._publish(provider, queue)
+                return
+
+            # A class that has been idle starts at the current virtual time, so it
+            # gets no credit for the time it did not use
+            start = max(queue.virtual_time, queue.last_finish.get(priority, 0.0))
+            finish = start + 1.0 / self.weights[priority]
+            queue.last_finish[priority] = finish
+            waiter = _Waiter(priority)
+            heapq.heappush(queue.heap, (finish, next(self._sequence), waiter))
+            queue.queued[priority] += 1
+            self._publish(provider, queue)
+
+        granted = waiter.event.wait(self.queue_timeout_seconds)
+        with self._lock:
+            waited = time.monotonic() - waiter.enqueued_at
+            if not (granted or waiter.granted):
+                queue.heap = [entry for entry in queue.heap if entry[2] is not waiter]
+                heapq.heapify(queue.heap)
+                queue.queued[priority] -= 1
+                self._stats[priority]["timeouts"] += 1
+                self._publish(provider, queue)
+                raise LLMQueueTimeout(provider, priority, waited)
+            self._record_wait(provider, priority, waited, queued=True)
+
+    def release(self, provider: str) -> None:
+        """Free a slot and hand it to the next waiting call in fair-queuing order."""
+        with self._lock:
+            queue = self._queue_for(provider)
+            queue.in_flight -= 1
+            while queue.heap and queue.in_flight < queue.limit:
+                finish, _, waiter = heapq.heappop(queue.heap)
+                queue.virtual_time = finish
+                queue.queued[waiter.priority] -= 1
+                queue.in_flight += 1
+                waiter.granted = True
+                waiter.event.set()
+            if not queue.heap:
+                # Idle provider: restart the virtual clock so no class carries credit
+                queue.virtual_time = 0.0
+                queue.last_finish.clear()
+            self._publish(provider, queue)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            classes = {}
+            for priority, stats in self._stats.items():
+                queued = stats["queued"]
+                classes[priority] = {
+                    "weight": self.weights[priority],
+                    "granted": stats["granted"],
+                    "queued": queued,
+                    "timeouts": stats["timeouts"],
+                    "mean_wait_ms": int(1000 * stats["wait_seconds_total"] / queued) if queued else 0,
+                    "max_wait_ms": int(1000 * stats["max_wait_seconds"]),
+                }
+            return {
+                "enabled": self.enabled,
+                "classes": classes,
+                "providers": {
+                    provider: {"limit": queue.limit, "in_flight": queue.in_flight, "waiting": dict(queue.queued)}
+                    for provider, queue in self._queues.items()
+                },
+            }
+
+    def _queue_for(self, provider: str) -> _ProviderQueue:
+        queue = self._queues.get(provider)
+        if queue is None:
+            queue = self._queues[provider] = _ProviderQueue(self.provider_limits.get(provider, self.default_limit))
+        return queue
+
+    def _record_wait(self, provider: str, priority: str, waited: float, queued: bool) -> None:
+        stats = self._stats[priority]
+        stats["granted"] += 1
+        if queued:
+            stats["queued"] += 1
+            stats["wait_seconds_total"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+        metrics.observe("det_llm_queue_wait_seconds", waited, provider=provider, priority=priority)
+
+    def _publish(self, provider: str, queue: _ProviderQueue) -> None:
+        metrics.set_gauge("det_llm_in_flight", queue.in_flight, provider=provider)
+        for priority, depth in queue.queued.items():
+            metrics.set_gauge("det_llm_queue_depth", depth, provider=provider, priority=priority)
+
+    @staticmethod
+    def _load_provider_limits() -> Dict[str, int]:
+        if not settings.llm_provider_concurrency_json:
+            return {}
+        try:
+            return {provider: int(limit) for provider, limit in json.loads(settings.llm_provider_concurrency_json).items()}
+        except (json.JSONDecodeError, AttributeError, TypeError, ValueError) as e:
+            logger.warning(f"Invalid LLM_PROVIDER_CONCURRENCY_JSON, using the default limit: {e}")
+            return {}
+
+
+# Global LLM scheduler
+llm_scheduler = LLMScheduler()
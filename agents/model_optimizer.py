@@ -1,15 +1,21 @@
 """
 DET Flow - Model Optimizer Agent
 Selects the best cost-benefit model per activity using a weighted heuristic.
+Catalog tiers are the prior; observed telemetry takes over as traffic accumulates,
+with a UCB-style exploration bonus for under-sampled models.
 """
 
 from __future__ import annotations
 
 from typing import Any, Dict, List, Optional
 import json
+import math
 import os
 import logging
 
+from core.config import settings
+from agents.model_telemetry import ModelTelemetry, model_telemetry
+
 logger = logging.getLogger(__name__)
 
 
@@ -19,9 +25,16 @@ class ModelOptimizerAgent:
     It uses a configurable catalog with relative tiers for cost, quality, and latency.
     """
 
-    def __init__(self, catalog: Optional[List[Dict[str, Any]]] = None):
+    def __init__(
+        self,
+        catalog: Optional[List[Dict[str, Any]]] = None,
+        telemetry: Optional[ModelTelemetry] = None,
+        learning_enabled: Optional[bool] = None,
+    ):
         self.catalog = catalog or self._load_catalog()
         self.activity_profiles = self._activity_profiles()
+        self.telemetry = telemetry or model_telemetry
+        self.learning_enabled = settings.model_learning_enabled if learning_enabled is None else learning_enabled
         logger.info("ModelOptimizerAgent initialized successfully")
 
     def recommend_model(
@@ -78,6 +91,7 @@ class ModelOptimizerAgent:
     def _build_profile(self, activity: str, requirements: Dict[str, Any]) -> Dict[str, Any]:
         profile = self.activity_profiles.get(activity, self.activity_profiles["default"]).copy()
         profile = self._apply_profile_env_overrides(activity, profile)
+        profile["activity"] = activity
 
         profile["quality_priority"] = requirements.get("quality_priority", profile["quality_priority"])
         profile["cost_priority"] = requirements.get("cost_priority", profile["cost_priority"])
@@ -100,12 +114,17 @@ class ModelOptimizerAgent:
 
     def _rank_models(self, catalog: List[Dict[str, Any]], profile: Dict[str, Any]) -> List[Dict[str, Any]]:
         ranked: List[Dict[str, Any]] = []
+        activity = profile.get("activity", "default")
+        reference = self.telemetry.reference(activity) if self.learning_enabled else {}
+        total_calls = self.telemetry.activity_calls(activity) if self.learning_enabled else 0
 
         for model in catalog:
             if not self._passes_constraints(model, profile["constraints"]):
                 continue
 
             score, breakdown = self._score_model(model, profile)
+            if self.learning_enabled:
+                score, breakdown = self._apply_telemetry(model, profile, breakdown, reference, total_calls)
             reason = self._build_reason(model, breakdown, profile)
             ranked.append(
                 {
@@ -154,6 +173,77 @@ class ModelOptimizerAgent:
 
         return total, breakdown
 
+    def _apply_telemetry(
+        self,
+        model: Dict[str, Any],
+        profile: Dict[str, Any],
+        breakdown: Dict[str, Any],
+        reference: Dict[str, Optional[float]],
+        total_calls: int,
+    ) -> tuple[float, Dict[str, Any]]:
+        """
+        Blend observed telemetry into the tier scores and add an exploration bonus.
+
+        Observed latency and cost are scored relative to the best model seen for the
+        activity (best = 5). Quality is discounted by error rate, JSON-parse failures
+        and disagreement with other models. The observed scores weigh calls / (calls + prior).
+        """
+        stats = self.telemetry.get_model_stats(profile["activity"], model["id"])
+        calls = stats.calls if stats else 0
+        quality = breakdown["quality"]
+        cost_score = breakdown["cost"]
+        latency_score = breakdown["latency"]
+
+        if stats and calls:
+            weight = calls / (calls + settings.model_telemetry_prior_calls)
+            reliability = (1 - stats.error_rate) * (1 - stats.parse_failure_rate)
+            if stats.agreement is not None:
+                reliability *= stats.agreement
+            quality = (1 - weight) * quality + weight * quality * reliability
+
+            if stats.mean_latency and reference.get("min_latency"):
+                observed = max(1.0, 5 * reference["min_latency"] / stats.mean_latency)
+                latency_score = (1 - weight) * latency_score + weight * observed
+            if stats.mean_cost and reference.get("min_cost"):
+                observed = max(1.0, 5 * reference["min_cost"] / stats.mean_cost)
+                cost_score = (1 - weight) * cost_score + weight * observed
+
+        exploration = settings.model_explore_weight * math.sqrt(math.log(total_calls + 1) / (calls + 1))
+        total = (
+            profile["quality_priority"] * quality
+            + profile["cost_priority"] * cost_score
+            + profile["latency_priority"] * latency_score
+            + exploration
+        )
+
+        return total, {
+            **breakdown,
+            "quality": round(quality, 3),
+            "cost": round(cost_score, 3),
+            "latency": round(latency_score, 3),
+            "exploration": round(exploration, 3),
+            "observed_calls": calls,
+        }
+
+    def estimate_cost(self, model_id: str, usage: Dict[str, Any]) -> Optional[float]:
+        """
+        Estimate the USD cost of a call from its token usage and the catalog prices.
+
+        Returns:
+            Cost in USD, or None when the model has no prices or usage is empty
+        """
+        model = next((item for item in self.catalog if item.get("id") == model_id), None)
+        if not model or "input_cost_per_1m" not in model or not usage.get("input_tokens"):
+            return None
+
+        input_price = model["input_cost_per_1m"]
+        cached_price = model.get("cached_input_cost_per_1m", input_price)
+        return (
+            usage.get("uncached_input_tokens", 0) * input_price
+            + usage.get("cached_input_tokens", 0) * cached_price
+            + usage.get("output_tokens", 0) * model.get("output_cost_per_1m", 0)
+        ) / 1_000_000
+
     def _passes_constraints(self, model: Dict[str, Any], constraints: Dict[str, Any]) -> bool:
         min_quality = constraints.get("min_quality_tier")
         max_cost = constraints.get("max_cost_tier")
@@ -269,6 +359,9 @@ class ModelOptimizerAgent:
                 "cost_tier": 1,
                 "latency_tier": 2,
                 "strengths": ["baixo custo", "baixa latencia", "tarefas simples"],
+                "input_cost_per_1m": 0.15,
+                "cached_input_cost_per_1m": 0.075,
+                "output_cost_per_1m": 0.6,
             },
             {
                 "id": "gpt-4o",
@@ -277,6 +370,9 @@ class ModelOptimizerAgent:
                 "cost_tier": 3,
                 "latency_tier": 2,
                 "strengths": ["alta qualidade", "boa latencia", "uso geral"],
+                "input_cost_per_1m": 2.5,
+                "cached_input_cost_per_1m": 1.25,
+                "output_cost_per_1m": 10.0,
             },
             {
                 "id": "gpt-4-turbo-preview",
@@ -285,6 +381,9 @@ class ModelOptimizerAgent:
                 "cost_tier": 4,
                 "latency_tier": 3,
                 "strengths": ["alta qualidade", "razoavel para analise longa"],
+                "input_cost_per_1m": 10.0,
+                "cached_input_cost_per_1m": 10.0,
+                "output_cost_per_1m": 30.0,
             },
             {
                 "id": "claude-3-5-sonnet",
@@ -293,6 +392,9 @@ class ModelOptimizerAgent:
                 "cost_tier": 4,
                 "latency_tier": 3,
                 "strengths": ["qualidade alta", "boa redacao"],
+                "input_cost_per_1m": 3.0,
+                "cached_input_cost_per_1m": 0.3,
+                "output_cost_per_1m": 15.0,
             },
             {
                 "id": "claude-3-haiku",
@@ -301,6 +403,9 @@ class ModelOptimizerAgent:
                 "cost_tier": 1,
                 "latency_tier": 2,
                 "strengths": ["baixo custo", "respostas rapidas"],
+                "input_cost_per_1m": 0.25,
+                "cached_input_cost_per_1m": 0.03,
+                "output_cost_per_1m": 1.25,
             },
         ]
 
@@ -314,6 +419,15 @@ class ModelOptimizerAgent:
                 "assumptions": ["precisao tem prioridade alta"],
                 "notes": ["usar modelos mais fortes para avaliacao justa"],
             },
+            "evaluation_triage": {
+                "label": "triagem de avaliacao (primeiro nivel da cascata)",
+                "quality_priority": 2,
+                "cost_priority": 5,
+                "latency_priority": 5,
+                "constraints": {"max_cost_tier": 1},
+                "assumptions": ["casos incertos sao escalados para o modelo de avaliacao"],
+                "notes": [],
+            },
             "study_plan": {
                 "label": "criacao de plano de estudos",
                 "quality_priority": 4,
@@ -322,6 +436,30 @@ class ModelOptimizerAgent:
                 "assumptions": ["qualidade e coerencia sao importantes"],
                 "notes": [],
             },
+            "study_plan_adjustment": {
+                "label": "ajuste incremental do plano de estudos (patch)",
+                "quality_priority": 4,
+                "cost_priority": 4,
+                "latency_priority": 3,
+                "assumptions": ["so as semanas restantes e estatisticas de progresso sao enviadas"],
+                "notes": [],
+            },
+            "study_plan_week": {
+                "label": "detalhamento de uma semana do plano sob demanda",
+                "quality_priority": 4,
+                "cost_priority": 4,
+                "latency_priority": 4,
+                "assumptions": ["o aluno espera a semana na conversa"],
+                "notes": [],
+            },
+            "plan_personalization": {
+                "label": "personalizacao curta de plano a partir de template",
+                "quality_priority": 3,
+                "cost_priority": 5,
+                "latency_priority": 4,
+                "assumptions": ["a estrutura do plano ja vem do template"],
+                "notes": [],
+            },
             "chat": {
                 "label": "conversa no WhatsApp",
                 "quality_priority": 3,
@@ -1,16 +1,40 @@
 """
-Resolve model identifiers to Agno/Phi model instances.
+Resolve model identifiers to Agno/Phi model instances and track provider prompt caching.
+
+Every agent sends its long static instructions as the system prompt and puts the
+variable student data at the end of the user message, so the system prompt forms a
+stable prefix that providers can cache (automatic for OpenAI, explicit cache control
+for Anthropic).
 """
 
 from __future__ import annotations
 
-from typing import Any
+from typing import Any, Dict, Optional
+import logging
+import threading
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+OPENAI_IDS = {"gpt-4o", "gpt-4o-mini", "gpt-4-turbo-preview"}
+ANTHROPIC_IDS = {"claude-3-5-sonnet", "claude-3-haiku"}
 
 
-def resolve_model(model_id: str) -> Any:
+def resolve_model(
+    model_id: str,
+    cache_system_prompt: bool = True,
+    timeout: Optional[float] = None
+) -> Any:
     """
     Resolve a model string to a concrete model instance when Agno is available.
     Fallback to returning the raw string for Phi compatibility.
+
+    Args:
+        model_id: Model identifier from the model catalog
+        cache_system_prompt: Mark the system prompt as cacheable (Anthropic only;
+            OpenAI caches long prompt prefixes automatically)
+        timeout: Client request timeout in seconds (settings.llm_request_timeout_seconds by default)
     """
 
     try:
@@ -19,12 +43,121 @@ def resolve_model(model_id: str) -> Any:
     except Exception:
         return model_id
 
-    openai_ids = {"gpt-4o", "gpt-4o-mini", "gpt-4-turbo-preview"}
-    anthropic_ids = {"claude-3-5-sonnet", "claude-3-haiku"}
+    timeout = timeout or settings.llm_request_timeout_seconds
 
-    if model_id in openai_ids:
-        return OpenAIChat(id=model_id)
-    if model_id in anthropic_ids:
-        return Claude(id=model_id)
+    if model_id in OPENAI_IDS:
+        return OpenAIChat(id=model_id, timeout=timeout)
+    if model_id in ANTHROPIC_IDS:
+        return Claude(id=model_id, cache_system_prompt=cache_system_prompt, timeout=timeout)
 
     return model_id
+
+
+def _metric(metrics: Any, name: str) -> int:
+    """Read a token counter from Agno metrics objects or Phi metrics dicts."""
+    if metrics is None:
+        return 0
+    if isinstance(metrics, dict):
+        value = metrics.get(name, 0)
+        # Phi keeps one entry per model call
+        if isinstance(value, list):
+            return int(sum(v or 0 for v in value))
+        return int(value or 0)
+    return int(getattr(metrics, name, 0) or 0)
+
+
+def extract_usage(response: Any, model_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Normalize token usage of an agent run, splitting cached and uncached input tokens.
+
+    OpenAI reports cached tokens as part of the prompt tokens, while Anthropic reports
+    cache reads and writes separately from the uncached input tokens.
+
+    Args:
+        response: Agent run output
+        model_id: Model used for the run
+
+    Returns:
+        Dict with input, cached, uncached, cache write and output token counts
+    """
+    metrics = getattr(response, "metrics", None)
+    input_tokens = _metric(metrics, "input_tokens")
+    cached = _metric(metrics, "cache_read_tokens") or _metric(metrics, "cached_tokens")
+    cache_write = _metric(metrics, "cache_write_tokens")
+
+    if model_id in ANTHROPIC_IDS or (model_id or "").startswith("claude"):
+        uncached = input_tokens + cache_write
+        total_input = uncached + cached
+    else:
+        uncached = max(0, input_tokens - cached)
+        total_input = input_tokens
+
+    return {
+        "input_tokens": total_input,
+        "cached_input_tokens": cached,
+        "uncached_input_tokens": uncached,
+        "cache_write_tokens": cache_write,
+        "output_tokens": _metric(metrics, "output_tokens"),
+    }
+
+
+class PromptCacheStats:
+    """Per-activity counters of cached versus uncached input tokens."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, activity: str, model_id: Optional[str], response: Any) -> Dict[str, Any]:
+        """
+        Record the token usage of one agent call.
+
+        Args:
+            activity: Activity type (evaluation, study_plan, chat)
+            model_id: Model used for the call
+            response: Agent run output
+
+        Returns:
+            Normalized usage for the call
+        """
+        usage = extract_usage(response, model_id)
+
+        with self._lock:
+            stats = self._stats.setdefault(activity, {
+                "calls": 0,
+                "cache_hits": 0,
+                "input_tokens": 0,
+                "cached_input_tokens": 0,
+                "uncached_input_tokens": 0,
+                "cache_write_tokens": 0,
+                "output_tokens": 0,
+            })
+            stats["calls"] += 1
+            if usage["cached_input_tokens"]:
+                stats["cache_hits"] += 1
+            for key in ("input_tokens", "cached_input_tokens", "uncached_input_tokens",
+                        "cache_write_tokens", "output_tokens"):
+                stats[key] += usage[key]
+
+        logger.info(
+            f"LLM usage [{activity}] {model_id}: input={usage['input_tokens']} "
+            f"cached={usage['cached_input_tokens']} uncached={usage['uncached_input_tokens']} "
+            f"output={usage['output_tokens']}"
+        )
+        return usage
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Get counters per activity, including the share of input tokens served from cache."""
+        with self._lock:
+            return {
+                activity: {
+                    **stats,
+                    "cached_ratio": round(stats["cached_input_tokens"] / stats["input_tokens"], 4)
+                    if stats["input_tokens"] else 0.0,
+                }
+                for activity, stats in self._stats.items()
+            }
+
+
+# Global prompt cache statistics
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,463 @@
+"""
+DET Flow - Model Router
+Routes agent calls across the catalog models using live latency and error statistics,
+failing over between providers and optionally hedging slow requests to cut tail latency.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+import logging
+import math
+import threading
+import time
+
+from core.config import settings
+from core.metrics import metrics
+from core.usage_ledger import usage_ledger
+from agents.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError, circuit_breakers
+from agents.llm_scheduler import LLMQueueTimeout, LLMScheduler, classify, llm_scheduler
+from agents.model_provider import prompt_cache_stats
+from agents.model_telemetry import ModelTelemetry, model_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Builds an agent (anything with a run(prompt) method) for a model ID
+AgentFactory = Callable[[str], Any]
+
+
+class ModelCallError(Exception):
+    """An agent run that finished with an error status instead of raising."""
+
+    def __init__(self, model_id: str, message: str):
+        super().__init__(f"{model_id}: {message}")
+        self.model_id = model_id
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile of an unsorted list."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+class ModelStats:
+    """Sliding window of call outcomes for one model."""
+
+    def __init__(self, window_size: int):
+        self.latencies: deque = deque(maxlen=window_size)
+        self.outcomes: deque = deque(maxlen=window_size)
+        self.calls = 0
+        self.errors = 0
+        self.last_error_at: Optional[float] = None
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.calls += 1
+        self.outcomes.append(ok)
+        if ok:
+            self.latencies.append(latency)
+        else:
+            self.errors += 1
+            self.last_error_at = time.monotonic()
+
+    @property
+    def error_rate(self) -> float:
+        if not self.outcomes:
+            return 0.0
+        return 1 - sum(self.outcomes) / len(self.outcomes)
+
+    def percentile(self, q: float) -> Optional[float]:
+        return _percentile(list(self.latencies), q)
+
+
+class LatencyTracker:
+    """
+    Live p50/p95 latency and error rate per model, shared by every router.
+
+    Only successful calls contribute latency samples; failures count towards
+    the error rate and demote the model for a cooldown period.
+    """
+
+    def __init__(
+        self,
+        window_size: Optional[int] = None,
+        max_error_rate: Optional[float] = None,
+        error_cooldown_seconds: Optional[float] = None
+    ):
+        self.window_size = window_size or settings.model_router_window_size
+        self.max_error_rate = settings.model_router_max_error_rate if max_error_rate is None else max_error_rate
+        self.error_cooldown_seconds = (
+            settings.model_router_error_cooldown_seconds if error_cooldown_seconds is None else error_cooldown_seconds
+        )
+        self._models: Dict[str, ModelStats] = {}
+        self._routing: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model_id: str, latency: float, ok: bool) -> None:
+        with self._lock:
+            stats = self._models.get(model_id)
+            if stats is None:
+                stats = self._models[model_id] = ModelStats(self.window_size)
+            stats.record(latency, ok)
+
+    def percentile(self, model_id: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """Latency percentile in seconds, or None with fewer than min_samples successes."""
+        with self._lock:
+            stats = self._models.get(model_id)
+            if stats is None or len(stats.latencies) < max(1, min_samples):
+                return None
+            return stats.percentile(q)
+
+    def is_healthy(self, model_id: str) -> bool:
+        """A model is unhealthy while its error rate is high and it failed recently."""
+        with self._lock:
+            stats = self._models.get(model_id)
+            if stats is None or stats.last_error_at is None:
+                return True
+            recently_failed = time.monotonic() - stats.last_error_at < self.error_cooldown_seconds
+            return not (recently_failed and stats.error_rate >= self.max_error_rate)
+
+    def count(self, activity: str, event: str) -> None:
+        """Increment a routing counter (failovers, hedges...) for an activity."""
+        with self._lock:
+            counters = self._routing.setdefault(activity, {})
+            counters[event] = counters.get(event, 0) + 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get per-model latency/error stats and per-activity routing counters."""
+        with self._lock:
+            models = {
+                model_id: {
+                    "calls": stats.calls,
+                    "errors": stats.errors,
+                    "error_rate": round(stats.error_rate, 4),
+                    "p50_ms": self._ms(stats.percentile(0.5)),
+                    "p95_ms": self._ms(stats.percentile(0.95)),
+                    "samples": len(stats.latencies),
+                }
+                for model_id, stats in self._models.items()
+            }
+            routing = {activity: dict(counters) for activity, counters in self._routing.items()}
+        return {"models": models, "routing": routing}
+
+    @staticmethod
+    def _ms(seconds: Optional[float]) -> Optional[int]:
+        return int(seconds * 1000) if seconds is not None else None
+
+
+class ModelRouter:
+    """
+    Runs prompts on the best available model for an activity.
+
+    Candidates come from the ModelOptimizerAgent ranking, refreshed periodically so
+    the optimizer can learn from the telemetry recorded here. Healthy models keep that
+    order, except that a primary whose live p95 exceeds the latency SLO yields to a
+    healthy model within it. Failures fall over to the next candidate, preferring a
+    different provider. Models whose circuit breaker is open are skipped and, if
+    nothing else is left, calls fail fast with CircuitOpenError. With hedging enabled, a request still running after the
+    model's p95 is duplicated on a backup model and the first success wins; the
+    slower request is cancelled if it has not started, otherwise its result is discarded.
+    Every call holds a provider slot from the LLM scheduler, queued by priority class.
+    """
+
+    def __init__(
+        self,
+        activity: str,
+        candidates: List[str],
+        agent_factory: AgentFactory,
+        providers: Optional[Dict[str, str]] = None,
+        primary_agent: Any = None,
+        tracker: Optional[LatencyTracker] = None,
+        failover_enabled: Optional[bool] = None,
+        hedging_enabled: Optional[bool] = None,
+        hedge_min_samples: Optional[int] = None,
+        latency_slo_ms: Optional[int] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        optimizer: Any = None,
+        telemetry: Optional[ModelTelemetry] = None,
+        breakers: Optional[CircuitBreakerRegistry] = None,
+        scheduler: Optional[LLMScheduler] = None
+    ):
+        if not candidates:
+            raise ValueError("ModelRouter needs at least one candidate model")
+
+        self.activity = activity
+        self.candidates = list(dict.fromkeys(candidates))
+        self.agent_factory = agent_factory
+        self.providers = providers or {}
+        self.tracker = tracker or model_latency_tracker
+        self.failover_enabled = settings.model_failover_enabled if failover_enabled is None else failover_enabled
+        self.hedging_enabled = settings.model_hedging_enabled if hedging_enabled is None else hedging_enabled
+        self.hedge_min_samples = settings.model_hedge_min_samples if hedge_min_samples is None else hedge_min_samples
+        self.latency_slo = (latency_slo_ms or settings.model_router_latency_slo_ms) / 1000
+        self.executor = executor or _hedge_executor
+        self.optimizer = optimizer
+        self.telemetry = telemetry or model_telemetry
+        self.breakers = breakers or circuit_breakers
+        self.scheduler = scheduler or llm_scheduler
+        self._ranked_at = time.monotonic()
+
+        self._agents: Dict[str, Any] = {}
+        if primary_agent is not None:
+            self._agents[self.candidates[0]] = primary_agent
+        self._agents_lock = threading.Lock()
+
+    @classmethod
+    def from_recommendation(
+        cls,
+        activity: str,
+        recommendation: Dict[str, Any],
+        catalog: List[Dict[str, Any]],
+        agent_factory: AgentFactory,
+        primary_agent: Any = None,
+        default_model: Optional[str] = None,
+        optimizer: Any = None
+    ) -> "ModelRouter":
+        """Build a router from a ModelOptimizerAgent recommendation and its catalog."""
+        providers = {model["id"]: model.get("provider", "") for model in catalog}
+        return cls(
+            activity,
+            cls._candidates_from(recommendation, default_model),
+            agent_factory,
+            providers=providers,
+            primary_agent=primary_agent,
+            optimizer=optimizer
+        )
+
+    @staticmethod
+    def _candidates_from(recommendation: Dict[str, Any], default_model: Optional[str] = None) -> List[str]:
+        selected = recommendation.get("selected_model") or default_model or settings.openai_model
+        return list(dict.fromkeys(
+            [selected] + [alt["model"] for alt in recommendation.get("alternatives", [])]
+        ))
+
+    @property
+    def primary_model(self) -> str:
+        return self.candidates[0]
+
+    def route(self) -> List[str]:
+        """Order candidates for the next call: primary first, then failover targets."""
+        self._maybe_rerank()
+        healthy = [model_id for model_id in self.candidates if self._is_available(model_id)]
+        demoted = [model_id for model_id in self.candidates if model_id not in healthy]
+
+        if healthy:
+            primary_p95 = self.tracker.percentile(healthy[0], 0.95, self.hedge_min_samples)
+            if primary_p95 is not None and primary_p95 > self.latency_slo:
+                for model_id in healthy[1:]:
+                    p95 = self.tracker.percentile(model_id, 0.95, self.hedge_min_samples)
+                    if p95 is not None and p95 <= self.latency_slo:
+                        healthy.remove(model_id)
+                        healthy.insert(0, model_id)
+                        break
+
+        order = healthy + demoted
+        if len(order) <= 2:
+            return order
+
+        # After the primary, try other providers first: an outage usually hits a whole provider
+        primary_provider = self.providers.get(order[0])
+        rest = sorted(
+            order[1:],
+            key=lambda model_id: bool(primary_provider) and self.providers.get(model_id) == primary_provider
+        )
+        return [order[0]] + rest
+
+    def run(self, prompt: str, **kwargs) -> Any:
+        """
+        Run a prompt with failover (and hedging when enabled).
+
+        Args:
+            prompt: Request message for the agent
+            **kwargs: Extra arguments passed to agent.run
+
+        Returns:
+            The first successful agent response
+
+        Raises:
+            The last error when every candidate fails
+        """
+        return self.run_with_model(prompt, **kwargs)[0]
+
+    def run_with_model(self, prompt: str, **kwargs) -> Tuple[Any, str]:
+        """Like run(), but also return the ID of the model that answered."""
+        order = self.route()
+        if not self.failover_enabled:
+            order = order[:1]
+        # Classified here: hedged calls run on executor threads without the caller's context
+        priority = classify(self.activity)
+
+        last_error: Optional[Exception] = None
+        for index, model_id in enumerate(order):
+            backup = self._hedge_target(order, model_id) if self.hedging_enabled else None
+            start = time.monotonic()
+            try:
+                response, served_by = self._call_with_hedge(model_id, backup, prompt, kwargs, priority)
+            except CircuitOpenError as e:
+                last_error = e
+                continue
+            except Exception as e:
+                last_error = e
+                logger.warning(f"Model {model_id} failed for {self.activity}: {e}")
+                continue
+
+            if index > 0:
+                self.tracker.count(self.activity, "failovers")
+                logger.info(f"Failover for {self.activity}: served by {served_by}")
+            self._account(served_by, response, int((time.monotonic() - start) * 1000))
+            return response, served_by
+
+        self.tracker.count(self.activity, "failures")
+        raise last_error
+
+    def run_on(self, model_id: str, prompt: str, **kwargs) -> Any:
+        """Run a prompt on one specific model, without failover (e.g. shadow scoring, re-asks)."""
+        start = time.monotonic()
+        response = self._call(model_id, prompt, kwargs, classify(self.activity))
+        self._account(model_id, response, int((time.monotonic() - start) * 1000))
+        return response
+
+    # ==================== Internals ====================
+
+    def _maybe_rerank(self) -> None:
+        """Refresh the candidate order from the optimizer once per rerank interval."""
+        if self.optimizer is None:
+            return
+        if time.monotonic() - self._ranked_at < settings.model_rerank_interval_seconds:
+            return
+
+        self._ranked_at = time.monotonic()
+        try:
+            candidates = self._candidates_from(self.optimizer.recommend_model(self.activity), self.primary_model)
+        except Exception as e:
+            logger.warning(f"Model re-ranking failed for {self.activity}: {e}")
+            return
+
+        if candidates != self.candidates:
+            logger.info(f"Model ranking for {self.activity} changed: {self.candidates} -> {candidates}")
+            self.candidates = candidates
+
+    def _agent_for(self, model_id: str) -> Any:
+        with self._agents_lock:
+            agent = self._agents.get(model_id)
+            if agent is None:
+                agent = self._agents[model_id] = self.agent_factory(model_id)
+            return agent
+
+    def _is_available(self, model_id: str) -> bool:
+        return self.tracker.is_healthy(model_id) and not self.breakers.get(model_id).is_open
+
+    def _call(self, model_id: str, prompt: str, kwargs: Dict[str, Any], priority: str = "batch") -> Any:
+        breaker = self.breakers.get(model_id)
+        if not breaker.allow_request():
+            self.tracker.count(self.activity, "circuit_rejections")
+            raise CircuitOpenError(model_id)
+
+        try:
+            with self.scheduler.slot(self.providers.get(model_id), priority):
+                return self._run_agent(model_id, prompt, kwargs, breaker)
+        except LLMQueueTimeout:
+            breaker.release_probe()  # The call never reached the provider
+            raise
+
+    def _run_agent(self, model_id: str, prompt: str, kwargs: Dict[str, Any], breaker: Any) -> Any:
+        start = time.monotonic()
+        try:
+            response = self._agent_for(model_id).run(prompt, **kwargs)
+            status = getattr(response, "status", None)
+            if str(getattr(status, "value", status)).lower() == "error":
+                raise ModelCallError(model_id, str(getattr(response, "content", "")))
+        except Exception:
+            elapsed = time.monotonic() - start
+            breaker.record_failure()
+            self.tracker.record(model_id, elapsed, ok=False)
+            self.telemetry.record_call(self.activity, model_id, elapsed, ok=False)
+            self._record_metrics(model_id, elapsed, "error")
+            raise
+        elapsed = time.monotonic() - start
+        breaker.record_success()
+        self.tracker.record(model_id, elapsed, ok=True)
+        self.telemetry.record_call(self.activity, model_id, elapsed, ok=True)
+        self._record_metrics(model_id, elapsed, "ok")
+        return response
+
+    def _account(self, model_id: str, response: Any, latency_ms: int) -> None:
+        """Record the tokens, prompt-cache use and cost of an answered call in the usage ledger."""
+        usage = prompt_cache_stats.record(self.activity, model_id, response)
+        for kind in ("input_tokens", "cached_input_tokens", "output_tokens"):
+            if usage.get(kind):
+                metrics.observe("det_llm_call_tokens", usage[kind], activity=self.activity, model=model_id, kind=kind)
+        cost = self.optimizer.estimate_cost(model_id, usage) if self.optimizer is not None else None
+        if cost is not None:
+            self.telemetry.record_cost(self.activity, model_id, cost)
+        usage_ledger.record(self.activity, model_id, usage, latency_ms=latency_ms, cost_usd=cost)
+
+    def _record_metrics(self, model_id: str, elapsed: float, status: str) -> None:
+        metrics.observe("det_llm_call_seconds", elapsed, activity=self.activity, model=model_id, status=status)
+        metrics.inc("det_llm_calls_total", activity=self.activity, model=model_id, status=status)
+
+    def _hedge_target(self, order: List[str], model_id: str) -> Optional[str]:
+        """Healthy backup for a hedge, preferring another provider and a lower p50."""
+        backups = [
+            candidate for candidate in order
+            if candidate != model_id and self._is_available(candidate)
+        ]
+        if not backups:
+            return None
+
+        provider = self.providers.get(model_id)
+
+        def sort_key(candidate: str):
+            p50 = self.tracker.percentile(candidate, 0.5)
+            same_provider = bool(provider) and self.providers.get(candidate) == provider
+            return (same_provider, p50 if p50 is not None else float("inf"))
+
+        return min(backups, key=sort_key)
+
+    def _call_with_hedge(
+        self,
+        model_id: str,
+        backup: Optional[str],
+        prompt: str,
+        kwargs: Dict[str, Any],
+        priority: str
+    ) -> tuple:
+        hedge_after = (
+            self.tracker.percentile(model_id, 0.95, self.hedge_min_samples) if backup else None
+        )
+        if hedge_after is None:
+            return self._call(model_id, prompt, kwargs, priority), model_id
+
+        primary = self.executor.submit(self._call, model_id, prompt, kwargs, priority)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result(), model_id
+
+        self.tracker.count(self.activity, "hedges_sent")
+        logger.info(f"Hedging {self.activity} request: {model_id} passed p95 ({hedge_after:.2f}s), trying {backup}")
+        hedge = self.executor.submit(self._call, backup, prompt, kwargs, priority)
+        owners: Dict[Future, str] = {primary: model_id, hedge: backup}
+
+        pending = set(owners)
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for slower in pending:
+                        slower.cancel()
+                    if owners[future] == backup:
+                        self.tracker.count(self.activity, "hedges_won")
+                    return future.result(), owners[future]
+                error = future.exception()
+
+        raise error
+
+
+# Shared thread pool for hedged requests and global latency tracker
+_hedge_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-hedge")
+model_latency_tracker = LatencyTracker()
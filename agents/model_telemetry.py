@@ -0,0 +1,164 @@
+"""
+DET Flow - Model Telemetry
+Observed latency, token cost, error rate, JSON-parse failures and cross-model score
+agreement per activity and model, used by the ModelOptimizerAgent to re-rank models.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ActivityModelStats:
+    """Running totals for one (activity, model) pair."""
+
+    __slots__ = (
+        "calls", "errors", "latency_total", "cost_calls", "cost_total",
+        "parses", "parse_failures", "agreement_samples", "agreement_total",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.latency_total = 0.0
+        self.cost_calls = 0
+        self.cost_total = 0.0
+        self.parses = 0
+        self.parse_failures = 0
+        self.agreement_samples = 0
+        self.agreement_total = 0.0
+
+    @property
+    def successes(self) -> int:
+        return self.calls - self.errors
+
+    @property
+    def mean_latency(self) -> Optional[float]:
+        return self.latency_total / self.successes if self.successes else None
+
+    @property
+    def mean_cost(self) -> Optional[float]:
+        return self.cost_total / self.cost_calls if self.cost_calls else None
+
+    @property
+    def error_rate(self) -> float:
+        return self.errors / self.calls if self.calls else 0.0
+
+    @property
+    def parse_failure_rate(self) -> float:
+        return self.parse_failures / self.parses if self.parses else 0.0
+
+    @property
+    def agreement(self) -> Optional[float]:
+        return self.agreement_total / self.agreement_samples if self.agreement_samples else None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "error_rate": round(self.error_rate, 4),
+            "mean_latency_ms": int(self.mean_latency * 1000) if self.mean_latency is not None else None,
+            "mean_cost_usd": round(self.mean_cost, 6) if self.mean_cost is not None else None,
+            "parse_failure_rate": round(self.parse_failure_rate, 4),
+            "agreement": round(self.agreement, 4) if self.agreement is not None else None,
+            "agreement_samples": self.agreement_samples,
+        }
+
+
+class ModelTelemetry:
+    """Thread-safe in-memory telemetry keyed by activity and model."""
+
+    def __init__(self):
+        self._stats: Dict[Tuple[str, str], ActivityModelStats] = {}
+        self._lock = threading.Lock()
+
+    def record_call(self, activity: str, model_id: str, latency_seconds: float, ok: bool) -> None:
+        """Record the outcome and latency of one model call."""
+        with self._lock:
+            stats = self._get(activity, model_id)
+            stats.calls += 1
+            if ok:
+                stats.latency_total += latency_seconds
+            else:
+                stats.errors += 1
+
+    def record_cost(self, activity: str, model_id: str, cost_usd: float) -> None:
+        """Record the token cost of one successful call."""
+        with self._lock:
+            stats = self._get(activity, model_id)
+            stats.cost_calls += 1
+            stats.cost_total += cost_usd
+
+    def record_parse(self, activity: str, model_id: str, ok: bool) -> None:
+        """Record whether a model response could be parsed (False = fallback used)."""
+        with self._lock:
+            stats = self._get(activity, model_id)
+            stats.parses += 1
+            if not ok:
+                stats.parse_failures += 1
+
+    def record_agreement(
+        self,
+        activity: str,
+        model_a: str,
+        model_b: str,
+        score_a: float,
+        score_b: float,
+        score_range: float = 150.0
+    ) -> None:
+        """
+        Record how closely two models scored the same submission.
+
+        Agreement is 1 - |score_a - score_b| / score_range, credited to both models.
+        """
+        agreement = max(0.0, 1 - abs(score_a - score_b) / score_range)
+        with self._lock:
+            for model_id in (model_a, model_b):
+                stats = self._get(activity, model_id)
+                stats.agreement_samples += 1
+                stats.agreement_total += agreement
+        logger.info(f"Score agreement [{activity}] {model_a}={score_a} {model_b}={score_b}: {agreement:.2f}")
+
+    def get_model_stats(self, activity: str, model_id: str) -> Optional[ActivityModelStats]:
+        with self._lock:
+            return self._stats.get((activity, model_id))
+
+    def activity_calls(self, activity: str) -> int:
+        """Total calls recorded for an activity across all models."""
+        with self._lock:
+            return sum(stats.calls for (act, _), stats in self._stats.items() if act == activity)
+
+    def reference(self, activity: str) -> Dict[str, Optional[float]]:
+        """
+        Best observed mean latency and cost for an activity (to normalize scores).
+        Needs at least two observed models, otherwise there is nothing to compare.
+        """
+        with self._lock:
+            rows = [stats for (act, _), stats in self._stats.items() if act == activity]
+        latencies = [stats.mean_latency for stats in rows if stats.mean_latency]
+        costs = [stats.mean_cost for stats in rows if stats.mean_cost]
+        return {
+            "min_latency": min(latencies) if len(latencies) > 1 else None,
+            "min_cost": min(costs) if len(costs) > 1 else None,
+        }
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Telemetry per activity and model."""
+        with self._lock:
+            result: Dict[str, Dict[str, Any]] = {}
+            for (activity, model_id), stats in self._stats.items():
+                result.setdefault(activity, {})[model_id] = stats.to_dict()
+            return result
+
+    def _get(self, activity: str, model_id: str) -> ActivityModelStats:
+        stats = self._stats.get((activity, model_id))
+        if stats is None:
+            stats = self._stats[(activity, model_id)] = ActivityModelStats()
+        return stats
+
+
+# Global model telemetry instance
+model_telemetry = ModelTelemetry()
@@ -0,0 +1,256 @@
+"""
+DET Flow - Objective Scorer
+Deterministic local scoring for DET tasks with a correct answer (read_and_complete,
+read_and_select, listen_and_type). Uses bit-parallel edit distance, token-level
+accuracy and a spelling tolerance, and maps the result onto the 10-160 scale without
+any model call. The LLM evaluator is kept for open-ended production tasks.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+import logging
+import re
+import unicodedata
+
+from core.config import settings
+from agents.schemas import MAX_SCORE, MIN_SCORE, cefr_for_score
+from knowledge_base.det_task_types import TaskType, get_task_info, is_objective_task
+
+logger = logging.getLogger(__name__)
+
+SUBSCORES = ("literacy", "comprehension", "conversation", "production")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def levenshtein(a: Sequence[Hashable], b: Sequence[Hashable]) -> int:
+    """
+    Edit distance between two sequences (strings or token lists).
+
+    Myers' bit-parallel algorithm: each column of the DP matrix is a bit vector, so the
+    cost is one pass over the longer sequence with a few integer operations per item.
+
+    Args:
+        a: First sequence
+        b: Second sequence
+
+    Returns:
+        Minimum number of insertions, deletions and substitutions
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    m = len(b)
+    if m == 0:
+        return len(a)
+
+    # Bit mask of the positions where each symbol occurs in the pattern
+    peq: Dict[Hashable, int] = {}
+    for i, symbol in enumerate(b):
+        peq[symbol] = peq.get(symbol, 0) | (1 << i)
+
+    full = (1 << m) - 1
+    last = 1 << (m - 1)
+    pv, mv, score = full, 0, m
+
+    for symbol in a:
+        eq = peq.get(symbol, 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last:
+            score += 1
+        elif mh & last:
+            score -= 1
+        ph = (ph << 1) | 1
+        mh <<= 1
+        pv = (mh | ~(xv | ph)) & full
+        mv = ph & xv & full
+
+    return score
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, strip accents and unify quotes so formatting slips are not penalized."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return text.replace("’", "'").replace("‘", "'").lower()
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into normalized word tokens (punctuation and casing are ignored)."""
+    return _TOKEN_RE.findall(normalize_text(text))
+
+
+def allowed_edits(word: str) -> int:
+    """Spelling tolerance: no slips in short words, one up to 7 letters, two beyond."""
+    if len(word) <= 3:
+        return 0
+    return 1 if len(word) <= 7 else 2
+
+
+def _as_tokens(value: Any) -> List[str]:
+    if isinstance(value, (list, tuple, set)):
+        return [token for item in value for token in tokenize(str(item))]
+    return tokenize(str(value or ""))
+
+
+class ObjectiveScorer:
+    """Scores objective DET tasks against their reference answer."""
+
+    def __init__(self, spelling_credit: Optional[float] = None):
+        """
+        Args:
+            spelling_credit: Credit (0-1) for a word accepted within the spelling tolerance
+        """
+        self.spelling_credit = settings.objective_spelling_credit if spelling_credit is None else spelling_credit
+
+    def can_score(self, task_type: str, reference_answer: Any) -> bool:
+        """True if the task is objective and a reference answer is available."""
+        return settings.objective_scoring_enabled and is_objective_task(task_type) and bool(reference_answer)
+
+    def score(self, task_type: str, response_text: str, reference_answer: Any) -> Dict[str, Any]:
+        """
+        Score a submission for an objective task.
+
+        Args:
+            task_type: read_and_complete, read_and_select or listen_and_type
+            response_text: Student's answer
+            reference_answer: Expected text (listen_and_type), missing words in order
+                (read_and_complete) or the real words of the list (read_and_select);
+                lists or space/comma separated strings are accepted
+
+        Returns:
+            Evaluation dictionary in the same format as the EvaluatorAgent
+        """
+        if task_type == TaskType.READ_AND_SELECT:
+            accuracy, details = self._score_selection(response_text, reference_answer)
+        elif task_type == TaskType.READ_AND_COMPLETE:
+            accuracy, details = self._score_completion(response_text, reference_answer)
+        elif task_type == TaskType.LISTEN_AND_TYPE:
+            accuracy, details = self._score_transcription(response_text, reference_answer)
+        else:
+            raise ValueError(f"Task type {task_type} is not objective")
+
+        return self._build_evaluation(task_type, accuracy, details)
+
+    # ==================== Task scorers ====================
+
+    def _match_word(self, given: str, expected: str) -> float:
+        """Credit for one word: 1 exact, spelling_credit within tolerance, 0 otherwise."""
+        if given == expected:
+            return 1.0
+        if given and levenshtein(given, expected) <= allowed_edits(expected):
+            return self.spelling_credit
+        return 0.0
+
+    def _score_transcription(self, response_text: str, reference_answer: Any) -> Tuple[float, Dict[str, Any]]:
+        """listen_and_type: word-level edit distance after snapping misspellings to reference words."""
+        expected = _as_tokens(reference_answer)
+        given = _as_tokens(response_text)
+        vocabulary = set(expected)
+
+        snapped, misspelled = [], []
+        for word in given:
+            if word not in vocabulary:
+                match = min(vocabulary, key=lambda ref: levenshtein(word, ref), default=None)
+                if match is not None and self._match_word(word, match):
+                    misspelled.append((word, match))
+                    word = match
+            snapped.append(word)
+
+        word_errors = levenshtein(snapped, expected)
+        token_accuracy = max(0.0, len(expected) - word_errors - (1 - self.spelling_credit) * len(misspelled))
+        token_accuracy = token_accuracy / len(expected) if expected else 0.0
+
+        # Character similarity adds partial credit for nearly-right words beyond the tolerance
+        reference_chars, response_chars = " ".join(expected), " ".join(given)
+        longest = max(len(reference_chars), len(response_chars)) or 1
+        char_accuracy = 1 - levenshtein(response_chars, reference_chars) / longest
+
+        accuracy = 0.8 * token_accuracy + 0.2 * char_accuracy
+        return accuracy, {
+            "expected_words": len(expected),
+            "word_errors": word_errors,
+            "misspellings": [f"{word} → {match}" for word, match in misspelled],
+            "token_accuracy": round(token_accuracy, 4),
+            "char_accuracy": round(char_accuracy, 4),
+        }
+
+    def _score_completion(self, response_text: str, reference_answer: Any) -> Tuple[float, Dict[str, Any]]:
+        """read_and_complete: positional credit per missing word."""
+        expected = _as_tokens(reference_answer)
+        given = _as_tokens(response_text)
+
+        credits, mistakes = [], []
+        for index, word in enumerate(expected):
+            answer = given[index] if index < len(given) else ""
+            credit = self._match_word(answer, word)
+            credits.append(credit)
+            if credit < 1:
+                mistakes.append(f"{answer or '—'} → {word}")
+
+        accuracy = sum(credits) / len(expected) if expected else 0.0
+        return accuracy, {
+            "expected_words": len(expected),
+            "correct_words": sum(1 for credit in credits if credit == 1),
+            "mistakes": mistakes,
+        }
+
+    def _score_selection(self, response_text: str, reference_answer: Any) -> Tuple[float, Dict[str, Any]]:
+        """read_and_select: hits minus false alarms, as selecting every option must not pay off."""
+        expected = set(_as_tokens(reference_answer))
+        selected = set(_as_tokens(response_text))
+
+        hits = selected & expected
+        false_alarms = selected - expected
+        accuracy = max(0.0, (len(hits) - len(false_alarms)) / len(expected)) if expected else 0.0
+        return accuracy, {
+            "expected_words": len(expected),
+            "hits": len(hits),
+            "missed": sorted(expected - selected),
+            "false_alarms": sorted(false_alarms),
+        }
+
+    # ==================== Result ====================
+
+    def _build_evaluation(self, task_type: str, accuracy: float, details: Dict[str, Any]) -> Dict[str, Any]:
+        """Map accuracy onto the DET scale and build an evaluator-compatible result."""
+        accuracy = max(0.0, min(1.0, accuracy))
+        score = int(round(MIN_SCORE + accuracy * (MAX_SCORE - MIN_SCORE)))
+        percent = int(round(accuracy * 100))
+
+        errors = details.get("misspellings") or details.get("mistakes") or []
+        weaknesses = []
+        if errors:
+            weaknesses.append("Erros: " + ", ".join(errors[:10]))
+        if details.get("missed"):
+            weaknesses.append("Palavras reais não selecionadas: " + ", ".join(details["missed"][:10]))
+        if details.get("false_alarms"):
+            weaknesses.append("Pseudopalavras selecionadas: " + ", ".join(details["false_alarms"][:10]))
+
+        task_name = get_task_info(task_type).get("name", task_type)
+        return {
+            "overall_score": score,
+            # Objective items measure one ability, so the score is reported for every subscore
+            "subscores": {name: score for name in SUBSCORES},
+            "cefr_level": cefr_for_score(score),
+            "analysis": {
+                "grammar": "",
+                "vocabulary": f"Precisão de {percent}% no item objetivo",
+                "relevance": "",
+                "coherence": "",
+            },
+            "strengths": ["Resposta totalmente correta"] if accuracy == 1 else [],
+            "weaknesses": weaknesses,
+            "feedback": f"{task_name}: você acertou {percent}% do item.",
+            "improvement_suggestions": [] if accuracy == 1 else [
+                "Revise a ortografia das palavras indicadas e refaça o exercício."
+            ],
+            "scoring_method": "objective",
+            "objective_details": {**details, "accuracy": round(accuracy, 4)},
+        }
+
+
+# Global objective scorer instance
+objective_scorer = ObjectiveScorer()
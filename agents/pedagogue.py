@@ -16,7 +16,13 @@ except ImportError:
 from core.config import settings
 from agents.model_optimizer import ModelOptimizerAgent
 from agents.model_provider import resolve_model
-from agents.response_parser import extract_json_object, ensure_keys
+from agents.model_router import ModelRouter
+from agents.schemas import PlanPersonalization, StudyPlanOutput, StudyPlanPatch, WeekSchedule
+from agents.plan_patch import apply_plan_patch, summarize_progress
+from agents.plan_templates import PlanProfile, plan_templates
+from agents.plan_weeks import find_week, new_plan_uid, week_details, week_needs_details, week_outline
+from agents.structured_output import run_structured, structured_agent_kwargs
+from agents.context_compactor import context_compactor, count_tokens, to_compact_json
 
 logger = logging.getLogger(__name__)
 
@@ -125,18 +131,123 @@ IMPORTANT:
         model_optimizer = ModelOptimizerAgent()
         recommendation = model_optimizer.recommend_model("study_plan")
         selected_model = recommendation.get("selected_model") or settings.openai_model
-        model_instance = resolve_model(selected_model)
 
-        # Initialize the Agno/Phi Agent
-        self.agent = Agent(
+        # Initialize the Agno/Phi Agent for the selected model
+        self.agent = self._build_agent(selected_model)
+
+        # Route calls with live latency tracking and failover to the alternatives
+        self.router = ModelRouter.from_recommendation(
+            "study_plan",
+            recommendation,
+            model_optimizer.catalog,
+            agent_factory=self._build_agent,
+            primary_agent=self.agent,
+            default_model=selected_model,
+            optimizer=model_optimizer
+        )
+
+        # Progress adjustments return a patch for the changed weeks only
+        adjustment = model_optimizer.recommend_model("study_plan_adjustment")
+        self.adjustment_router = ModelRouter.from_recommendation(
+            "study_plan_adjustment",
+            adjustment,
+            model_optimizer.catalog,
+            agent_factory=self._build_adjuster,
+            default_model=adjustment.get("selected_model") or selected_model,
+            optimizer=model_optimizer
+        )
+
+        # Daily tasks of skeleton plans, generated one week at a time
+        week_recommendation = model_optimizer.recommend_model("study_plan_week")
+        self.week_router = ModelRouter.from_recommendation(
+            "study_plan_week",
+            week_recommendation,
+            model_optimizer.catalog,
+            agent_factory=self._build_week_planner,
+            default_model=week_recommendation.get("selected_model") or selected_model,
+            optimizer=model_optimizer
+        )
+
+        # Short personalization pass for template plans, on a low-cost model
+        self.personalization_router = None
+        if settings.plan_personalization_enabled:
+            personalization = model_optimizer.recommend_model("plan_personalization")
+            self.personalization_router = ModelRouter.from_recommendation(
+                "plan_personalization",
+                personalization,
+                model_optimizer.catalog,
+                agent_factory=self._build_personalizer,
+                default_model=personalization.get("selected_model"),
+                optimizer=model_optimizer
+            )
+
+        logger.info("PedagogueAgent initialized successfully")
+
+    def _build_agent(self, model_id: str) -> Agent:
+        """Create the agent for a catalog model."""
+        return Agent(
             name="DET Pedagogue",
-            model=model_instance,
+            model=resolve_model(model_id),
             instructions=self.system_prompt,
             markdown=False,
-            debug_mode=settings.app_debug
+            debug_mode=settings.app_debug,
+            **structured_agent_kwargs(StudyPlanOutput)
         )
 
-        logger.info("PedagogueAgent initialized successfully")
+    def _build_adjuster(self, model_id: str) -> Agent:
+        """Create the agent that returns plan adjustments as patches."""
+        return Agent(
+            name="DET Plan Adjuster",
+            model=resolve_model(model_id),
+            instructions=(
+                "You adjust the remaining weeks of DET study plans to the student's actual progress. "
+                "If they're ahead of schedule, increase difficulty; if behind, add more foundational practice. "
+                "Return only the changes as JSON: "
+                '{"weeks": [{"op": "update", "week": N, "focus_areas": [...], "daily_tasks": [...], '
+                '"checkpoint": "..."}], "priority_weaknesses": [...], "study_tips": [...], '
+                '"motivation_message": "...", "rationale": "..."}. '
+                'Use op "update" with only the changed fields, or op "replace" with focus_areas and '
+                "daily_tasks for a full week. Never include completed weeks or unchanged weeks; omit plan "
+                "fields that do not change. Text for the student must be in Portuguese."
+            ),
+            markdown=False,
+            debug_mode=settings.app_debug,
+            **structured_agent_kwargs(StudyPlanPatch)
+        )
+
+    def _build_week_planner(self, model_id: str) -> Agent:
+        """Create the agent that details one week of a skeleton plan."""
+        return Agent(
+            name="DET Week Planner",
+            model=resolve_model(model_id),
+            instructions=(
+                "You write the daily tasks for one week of a DET study plan. Follow the week's focus areas "
+                "and checkpoint, fit the student's weekly study time and keep continuity with the previous "
+                "week. Include rest and review. Task descriptions must be in Portuguese. Respond only with "
+                'JSON: {"week": N, "focus_areas": [...], "daily_tasks": [{"day": "Monday", '
+                '"duration_minutes": 60, "tasks": [{"task_type": "...", "description": "...", "goal": "...", '
+                '"resources": [...]}]}], "checkpoint": "..."}'
+            ),
+            markdown=False,
+            debug_mode=settings.app_debug,
+            **structured_agent_kwargs(WeekSchedule)
+        )
+
+    def _build_personalizer(self, model_id: str) -> Agent:
+        """Create the agent that personalizes template plans."""
+        return Agent(
+            name="DET Plan Personalizer",
+            model=resolve_model(model_id),
+            instructions=(
+                "You personalize DET study plans built from templates. Given the plan outline and the "
+                "student profile, write a short plan title, an encouraging motivation message and 3 study "
+                "tips, all in Portuguese. Respond only with JSON: "
+                '{"plan_title": "...", "motivation_message": "...", "study_tips": ["...", "...", "..."]}'
+            ),
+            markdown=False,
+            debug_mode=settings.app_debug,
+            **structured_agent_kwargs(PlanPersonalization)
+        )
 
     def create_study_plan(
         self,
@@ -162,9 +273,34 @@ IMPORTANT:
             Dict containing the complete study plan
         """
         try:
-            # Prepare the request
+            profile = PlanProfile(current_level, target_score, available_hours_per_week, weaknesses, deadline_weeks)
+
+            # Common profiles: instantiate the bucket template locally (milliseconds, no LLM call)
+            if settings.plan_templates_enabled:
+                study_plan = plan_templates.instantiate(profile)
+                if study_plan is not None:
+                    if self.personalization_router is not None:
+                        study_plan = self._personalize_plan(study_plan, profile, strengths)
+                    logger.info(f"Study plan built from template {profile.key}")
+                    return self._add_plan_metadata(
+                        study_plan, current_level, target_score, available_hours_per_week, weaknesses, strengths
+                    )
+
+            # Skeleton mode: weeks, focus areas and checkpoints now, daily tasks on first view
+            lazy_weeks = settings.plan_lazy_weeks_enabled
+            scope = (
+                "Return only the plan skeleton: for each week give focus_areas and checkpoint, "
+                "and leave daily_tasks as an empty list."
+                if lazy_weeks else
+                "Design a comprehensive, week-by-week study plan that will help this student achieve their target score."
+            )
+
+            # Static instructions first so the prompt prefix stays cacheable; student data last
             plan_request = f"""
-Create a personalized DET study plan with the following profile:
+Create a personalized DET study plan for the student profile below.
+{scope}
+Focus on addressing weaknesses while maintaining strengths.
+Provide your response in the required JSON format.
 
 STUDENT PROFILE:
 - Current Level: {current_level}
@@ -173,63 +309,146 @@ STUDENT PROFILE:
 {f"- Weaknesses: {', '.join(weaknesses)}" if weaknesses else ""}
 {f"- Strengths: {', '.join(strengths)}" if strengths else ""}
 {f"- Study Duration: {deadline_weeks} weeks" if deadline_weeks else "- Study Duration: Recommend optimal duration"}
-
-Please design a comprehensive, week-by-week study plan that will help this student achieve their target score.
-Focus on addressing weaknesses while maintaining strengths.
-
-Provide your response in the required JSON format.
 """
 
             logger.info(f"Generating study plan for level {current_level} targeting score {target_score}")
-            response = self.agent.run(plan_request)
-
-            # Parse the response
-            study_plan = self._parse_study_plan(response.content)
-
-            # Add metadata
-            study_plan["created_at"] = datetime.now().isoformat()
-            study_plan["student_profile"] = {
-                "current_level": current_level,
-                "target_score": target_score,
-                "available_hours_per_week": available_hours_per_week,
-                "weaknesses": weaknesses or [],
-                "strengths": strengths or []
-            }
+            context_compactor.log_prompt("study_plan", plan_request)
+            # Schema-validated output: JSON mode, local repair and at most one targeted re-ask
+            study_plan, _ = run_structured(self.router, plan_request, StudyPlanOutput, "study_plan")
+
+            if lazy_weeks:
+                study_plan["plan_uid"] = new_plan_uid()
+                study_plan["lazy_weeks"] = True
+                for week in study_plan.get("weekly_schedule", []):
+                    week["daily_tasks"] = []
+
+            # Rare profile: the generated plan becomes the template of its bucket (full plans only)
+            elif settings.plan_templates_enabled:
+                plan_templates.save_generated(profile, study_plan)
 
             logger.info(f"Study plan created successfully - {study_plan.get('duration_weeks')} weeks")
 
-            return study_plan
+            return self._add_plan_metadata(
+                study_plan, current_level, target_score, available_hours_per_week, weaknesses, strengths
+            )
 
         except Exception as e:
             logger.error(f"Error creating study plan: {e}")
             return self._get_fallback_plan(current_level, target_score, error=str(e))
 
-    def _parse_study_plan(self, response_content: str) -> Dict[str, Any]:
+    def _add_plan_metadata(
+        self,
+        study_plan: Dict[str, Any],
+        current_level: str,
+        target_score: int,
+        available_hours_per_week: int,
+        weaknesses: Optional[List[str]],
+        strengths: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """Attach the creation time and the student profile to a plan."""
+        study_plan["created_at"] = datetime.now().isoformat()
+        study_plan["student_profile"] = {
+            "current_level": current_level,
+            "target_score": target_score,
+            "available_hours_per_week": available_hours_per_week,
+            "weaknesses": weaknesses or [],
+            "strengths": strengths or []
+        }
+        return study_plan
+
+    def get_week_details(self, study_plan: Dict[str, Any], week: int) -> Optional[Dict[str, Any]]:
         """
-        Parse the agent's response and extract the JSON study plan.
+        Get one week of a plan with its daily tasks, generating them for skeleton weeks.
+
+        Generated details are written into study_plan (the caller persists it) and the
+        following skeleton week is prefetched in the background.
 
         Args:
-            response_content: Raw response from the agent
+            study_plan: Study plan dictionary
+            week: Week number
 
         Returns:
-            Parsed study plan dictionary
+            The week, or None if the plan has no such week
         """
+        entry = find_week(study_plan, week)
+        if entry is None or not week_needs_details(study_plan, week):
+            return entry
+
+        plan_uid = study_plan.setdefault("plan_uid", new_plan_uid())
         try:
-            plan = extract_json_object(response_content)
-            ensure_keys(
-                plan,
-                ["plan_title", "duration_weeks", "target_score", "weekly_schedule"]
+            details = week_details.get(
+                plan_uid, week, lambda: self._generate_week(study_plan, week),
+                timeout=settings.llm_request_timeout_seconds
             )
-            return plan
+            entry.update({**details, "week": week})
+        except Exception as e:
+            logger.error(f"Error generating details of week {week}: {e}")
+            return entry  # The skeleton week (focus areas and checkpoint) is still useful
+
+        if settings.plan_prefetch_enabled and week_needs_details(study_plan, week + 1):
+            week_details.prefetch(plan_uid, week + 1, lambda: self._generate_week(study_plan, week + 1))
+
+        return entry
+
+    def _generate_week(self, study_plan: Dict[str, Any], week: int) -> Dict[str, Any]:
+        """Generate the daily tasks of one skeleton week."""
+        profile = study_plan.get("student_profile", {})
+        previous = find_week(study_plan, week - 1)
+        request = f"""
+Write the daily tasks for week {week} of this study plan.
+
+PLAN:
+- Title: {study_plan.get('plan_title', '')}
+- Current Level: {study_plan.get('current_level') or profile.get('current_level', '')}
+- Target Score: {study_plan.get('target_score', '')}
+- Available Study Time: {profile.get('available_hours_per_week', 'unknown')} hours per week
+- Priority Weaknesses: {', '.join(study_plan.get('priority_weaknesses', [])) or 'none reported'}
+
+WEEK:
+{to_compact_json(find_week(study_plan, week))}
+
+PREVIOUS WEEK:
+{to_compact_json(week_outline(previous)) if previous else 'none'}
+"""
+        context_compactor.log_prompt("study_plan_week", request)
+        details, _ = run_structured(self.week_router, request, WeekSchedule, "study_plan_week")
+        return details
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Failed to parse JSON study plan: {e}")
-            logger.debug(f"Raw response: {response_content}")
-            raise
+    def _personalize_plan(
+        self,
+        study_plan: Dict[str, Any],
+        profile: PlanProfile,
+        strengths: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """
+        Replace the title, motivation message and tips of a template plan with personalized ones.
+        The weekly schedule is not sent, only its focus areas, so the call stays short.
+        """
+        outline = [
+            {"week": week.get("week"), "focus_areas": week.get("focus_areas", [])}
+            for week in study_plan.get("weekly_schedule", [])
+        ]
+        request = f"""
+PLAN OUTLINE:
+{to_compact_json(outline)}
+
+STUDENT PROFILE:
+- Current Level: {profile.current_level}
+- Target Score: {profile.target_score}
+- Available Study Time: {profile.hours} hours per week
+- Weaknesses: {', '.join(profile.weaknesses) or 'none reported'}
+- Strengths: {', '.join(strengths or []) or 'none reported'}
+"""
+        try:
+            personalization, _ = run_structured(
+                self.personalization_router, request, PlanPersonalization, "plan_personalization"
+            )
         except Exception as e:
-            logger.error(f"Failed to parse study plan payload: {e}")
-            logger.debug(f"Raw response: {response_content}")
-            raise
+            logger.warning(f"Plan personalization failed, keeping template texts: {e}")
+            return study_plan
+
+        study_plan.update(personalization)
+        return study_plan
 
     def _get_fallback_plan(self, current_level: str, target_score: int, error: str = "") -> Dict[str, Any]:
         """
@@ -278,25 +497,31 @@ Provide your response in the required JSON format.
             Adjusted study plan
         """
         try:
-            adjustment_request = f"""
-Adjust this study plan based on student progress:
+            # Only the weeks still ahead and compact progress stats are sent; the model
+            # answers with a patch for the weeks it changes, applied and validated locally
+            remaining_plan = context_compactor.compact_plan(original_plan, completed_weeks)
+            progress = summarize_progress(recent_scores, completed_weeks, original_plan)
 
-ORIGINAL PLAN:
-{json.dumps(original_plan, indent=2)}
-
-PROGRESS DATA:
-- Completed Weeks: {completed_weeks}
-- Recent Scores: {recent_scores}
-- Average Score: {sum(recent_scores) / len(recent_scores) if recent_scores else 'N/A'}
+            adjustment_request = f"""
+Adjust the remaining weeks of this study plan to the student's progress.
+Return a patch with only the weeks (after week {completed_weeks}) that need to change.
 
-Please adjust the remaining weeks of the plan to better match the student's actual progress.
-If they're ahead of schedule, increase difficulty. If behind, add more foundational practice.
+REMAINING PLAN:
+{to_compact_json(remaining_plan)}
 
-Provide the adjusted plan in JSON format.
+PROGRESS:
+{to_compact_json(progress)}
 """
 
-            response = self.agent.run(adjustment_request)
-            adjusted_plan = self._parse_study_plan(response.content)
+            context_compactor.log_prompt(
+                "study_plan_adjustment",
+                adjustment_request,
+                original_tokens=count_tokens(json.dumps(original_plan, indent=2))
+            )
+            patch, _ = run_structured(
+                self.adjustment_router, adjustment_request, StudyPlanPatch, "study_plan_adjustment"
+            )
+            adjusted_plan = apply_plan_patch(original_plan, patch, completed_weeks)
 
             logger.info("Study plan adjusted based on progress")
             return adjusted_plan
@@ -0,0 +1,117 @@
+"""
+DET Flow - Study Plan Patches
+Progress-based plan adjustments are exchanged as patches: the Pedagogue sees only the
+remaining weeks and compact progress statistics, returns changes for the weeks that
+need them, and the patch is validated and applied locally.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, List
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+WEEK_FIELDS = ("focus_areas", "daily_tasks", "checkpoint")
+PLAN_FIELDS = ("priority_weaknesses", "study_tips", "motivation_message")
+
+
+class PlanPatchError(ValueError):
+    """The patch cannot be applied to the plan."""
+
+
+def summarize_progress(recent_scores: List[int], completed_weeks: int, plan: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Compact progress statistics for the adjustment prompt.
+
+    Args:
+        recent_scores: Recent submission scores, oldest first
+        completed_weeks: Number of weeks completed
+        plan: Current study plan
+
+    Returns:
+        Counts, mean, trend per submission and the gap to the target score
+    """
+    duration = int(plan.get("duration_weeks") or len(plan.get("weekly_schedule", [])) or 0)
+    stats: Dict[str, Any] = {
+        "completed_weeks": completed_weeks,
+        "remaining_weeks": max(0, duration - completed_weeks),
+        "submissions": len(recent_scores),
+    }
+    if not recent_scores:
+        return stats
+
+    count = len(recent_scores)
+    mean = sum(recent_scores) / count
+    # Least-squares slope: points gained per submission
+    x_mean = (count - 1) / 2
+    denominator = sum((i - x_mean) ** 2 for i in range(count))
+    slope = sum((i - x_mean) * (score - mean) for i, score in enumerate(recent_scores)) / denominator if denominator else 0.0
+
+    stats.update({
+        "mean": round(mean, 1),
+        "last": recent_scores[-1],
+        "best": max(recent_scores),
+        "trend_per_submission": round(slope, 2),
+    })
+    if plan.get("target_score"):
+        stats["gap_to_target"] = int(plan["target_score"]) - recent_scores[-1]
+    return stats
+
+
+def apply_plan_patch(plan: Dict[str, Any], patch: Dict[str, Any], completed_weeks: int) -> Dict[str, Any]:
+    """
+    Apply a validated StudyPlanPatch to a plan.
+
+    Args:
+        plan: Current study plan (not modified)
+        patch: StudyPlanPatch as a dict
+        completed_weeks: Weeks that must not change
+
+    Returns:
+        Patched copy of the plan
+
+    Raises:
+        PlanPatchError if the patch touches a completed or unknown week, or repeats a week
+    """
+    weeks = {int(week.get("week", 0) or 0): week for week in plan.get("weekly_schedule", [])}
+    seen = set()
+    for change in patch.get("weeks", []):
+        number = change["week"]
+        if number <= completed_weeks:
+            raise PlanPatchError(f"Week {number} is already completed")
+        if number not in weeks:
+            raise PlanPatchError(f"Week {number} is not part of the plan")
+        if number in seen:
+            raise PlanPatchError(f"Week {number} is patched twice")
+        seen.add(number)
+
+    patched = copy.deepcopy(plan)
+    schedule = patched.get("weekly_schedule", [])
+    index = {int(week.get("week", 0) or 0): position for position, week in enumerate(schedule)}
+
+    for change in patch.get("weeks", []):
+        position = index[change["week"]]
+        if change["op"] == "replace":
+            schedule[position] = {
+                "week": change["week"],
+                "focus_areas": change.get("focus_areas") or [],
+                "daily_tasks": change.get("daily_tasks") or [],
+                "checkpoint": change.get("checkpoint") or "",
+            }
+        else:
+            schedule[position].update({field: change[field] for field in WEEK_FIELDS if change.get(field) is not None})
+
+    for field in PLAN_FIELDS:
+        if patch.get(field) is not None:
+            patched[field] = patch[field]
+
+    history = patched.setdefault("adjustments", [])
+    history.append({
+        "completed_weeks": completed_weeks,
+        "changed_weeks": sorted(seen),
+        "rationale": patch.get("rationale", ""),
+    })
+    logger.info(f"Plan patch applied: weeks {sorted(seen) or 'none'} changed")
+    return patched
@@ -0,0 +1,371 @@
+"""
+DET Flow - Study Plan Templates
+Most students fall into a small set of profiles (current level, target band, weekly
+hours, weak subscores). Plans are kept as templates per profile bucket and instantiated
+locally with the student's values, so the Pedagogue only calls the LLM for rare
+profiles (whose generated plans then become templates) or an optional short
+personalization pass.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+import json
+import logging
+import math
+import re
+import threading
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+
+from core.config import settings
+from agents.schemas import CEFR_LEVELS, cefr_for_score
+from knowledge_base.det_task_types import TaskType, get_task_info, get_tasks_by_subscore
+
+logger = logging.getLogger(__name__)
+
+SUBSCORES = ("literacy", "comprehension", "conversation", "production")
+DURATION_BUCKETS = (4, 8, 12, 16)
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# Typical DET score at each CEFR level, used to size the plan
+LEVEL_BASELINE = {"A1": 25, "A2": 50, "B1": 75, "B2": 105, "C1": 132, "C2": 152}
+
+# Weakness labels (English or Portuguese) mapped to the DET subscore they train
+WEAKNESS_SUBSCORES = {
+    "literacy": "literacy", "reading": "literacy", "leitura": "literacy", "writing": "literacy",
+    "escrita": "literacy", "grammar": "literacy", "gramatica": "literacy", "spelling": "literacy",
+    "ortografia": "literacy", "vocabulary": "literacy", "vocabulario": "literacy",
+    "comprehension": "comprehension", "compreensao": "comprehension", "listening": "comprehension",
+    "escuta": "comprehension", "audicao": "comprehension",
+    "conversation": "conversation", "conversacao": "conversation", "speaking": "conversation",
+    "fala": "conversation", "pronunciation": "conversation", "pronuncia": "conversation",
+    "fluency": "conversation", "fluencia": "conversation",
+    "production": "production", "producao": "production",
+}
+
+TASK_DESCRIPTIONS = {
+    TaskType.READ_AND_COMPLETE: "Complete 3 textos com lacunas e revise as palavras que errou",
+    TaskType.READ_AND_SELECT: "Faça 5 rodadas de Read and Select e anote as pseudopalavras que enganaram você",
+    TaskType.LISTEN_AND_TYPE: "Transcreva 10 frases de áudio e compare com o original",
+    TaskType.READ_ALOUD: "Leia 5 frases em voz alta, grave e compare sua pronúncia",
+    TaskType.WRITE_ABOUT_PHOTO: "Escreva sobre 2 fotos (1 minuto cada) usando vocabulário descritivo",
+    TaskType.SPEAK_ABOUT_PHOTO: "Fale por 90 segundos sobre 2 fotos e grave suas respostas",
+    TaskType.INTERACTIVE_READING: "Resolva 1 Interactive Reading completo e revise as inferências",
+    TaskType.INTERACTIVE_LISTENING: "Faça 1 Interactive Listening e anote as ideias principais",
+    TaskType.WRITING_SAMPLE: "Escreva um texto de 5 minutos sobre um tema do DET",
+    TaskType.SPEAKING_SAMPLE: "Grave um Speaking Sample de 3 minutos e avalie sua fluência",
+    TaskType.READ_THEN_SPEAK: "Leia um texto curto e fale 90 segundos sobre ele",
+    TaskType.LISTEN_THEN_SPEAK: "Ouça um áudio e responda falando por 90 segundos",
+}
+
+# (phase name, share of the plan, focus areas)
+PHASES = (
+    ("Diagnóstico", 0.0, ["Diagnóstico inicial", "Formato do exame"]),
+    ("Fundamentos", 0.3, ["Gramática essencial", "Vocabulário acadêmico e cotidiano"]),
+    ("Desenvolvimento", 0.35, ["Estratégias por tipo de tarefa", "Fluência"]),
+    ("Prática intensiva", 0.2, ["Simulados completos", "Áreas fracas: {weaknesses}"]),
+    ("Revisão final", 0.15, ["Simulados cronometrados", "Confiança para a prova"]),
+)
+
+
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in text if not unicodedata.combining(ch)).strip().lower()
+
+
+def hours_band(hours: int) -> str:
+    """Bucket weekly study time: low (<5h), medium (5-9h) or high (10h+)."""
+    if hours < 5:
+        return "low"
+    return "medium" if hours < 10 else "high"
+
+
+def recommended_weeks(current_level: str, target_score: int, hours: int) -> int:
+    """Plan length from the score gap and the weekly study time, snapped to a duration bucket."""
+    gap = max(0, target_score - LEVEL_BASELINE.get(current_level, 75))
+    points_per_week = {"low": 2.5, "medium": 4.0, "high": 5.5}[hours_band(hours)]
+    weeks = math.ceil(gap / points_per_week) if gap else DURATION_BUCKETS[0]
+    return min(DURATION_BUCKETS, key=lambda bucket: (abs(bucket - weeks), bucket))
+
+
+class PlanProfile:
+    """Profile bucket of a plan request."""
+
+    def __init__(
+        self,
+        current_level: str,
+        target_score: int,
+        available_hours_per_week: int,
+        weaknesses: Optional[List[str]] = None,
+        deadline_weeks: Optional[int] = None
+    ):
+        self.current_level = (current_level or "").strip().upper()[:2]
+        self.target_score = int(target_score)
+        self.hours = int(available_hours_per_week)
+        self.weaknesses = list(weaknesses or [])
+        self.deadline_weeks = deadline_weeks
+
+        mapped = [WEAKNESS_SUBSCORES.get(_normalize(weakness)) for weakness in self.weaknesses]
+        self.weak_subscores: FrozenSet[str] = frozenset(subscore for subscore in mapped if subscore)
+        self.unmapped_weaknesses = sorted(
+            _normalize(weakness) for weakness, subscore in zip(self.weaknesses, mapped) if not subscore
+        )
+
+        weeks = deadline_weeks or recommended_weeks(self.current_level, self.target_score, self.hours)
+        self.duration_weeks = min(DURATION_BUCKETS, key=lambda bucket: (abs(bucket - weeks), bucket))
+
+    @property
+    def target_band(self) -> str:
+        return cefr_for_score(self.target_score)
+
+    @property
+    def is_common(self) -> bool:
+        """Standard profile that a curated template covers without the LLM."""
+        return (
+            self.current_level in CEFR_LEVELS
+            and not self.unmapped_weaknesses
+            and (self.deadline_weeks is None or self.deadline_weeks in DURATION_BUCKETS)
+        )
+
+    @property
+    def key(self) -> str:
+        # An explicit deadline off the buckets keeps its own length, so its generated plan
+        # never serves (or is served) the standard plans of the nearest bucket
+        weeks = self.deadline_weeks if self.deadline_weeks and self.deadline_weeks not in DURATION_BUCKETS else self.duration_weeks
+        parts = [
+            self.current_level or "?",
+            self.target_band,
+            hours_band(self.hours),
+            f"{weeks}w",
+            "+".join(sorted(self.weak_subscores)) or "balanced",
+        ]
+        if self.unmapped_weaknesses:
+            parts.append("+".join(self.unmapped_weaknesses))
+        return "|".join(parts)
+
+    def substitutions(self) -> Dict[str, str]:
+        return {
+            "current_level": self.current_level,
+            "target_score": str(self.target_score),
+            "hours": str(self.hours),
+            "weaknesses": ", ".join(self.weaknesses) or "equilíbrio entre as habilidades",
+        }
+
+
+def _substitute(value: Any, substitutions: Dict[str, str]) -> Any:
+    """Replace {placeholders} in every string of a template."""
+    if isinstance(value, str):
+        for key, replacement in substitutions.items():
+            value = value.replace(f"{{{key}}}", replacement)
+        return value
+    if isinstance(value, list):
+        return [_substitute(item, substitutions) for item in value]
+    if isinstance(value, dict):
+        return {key: _substitute(item, substitutions) for key, item in value.items()}
+    return value
+
+
+def _templatize(value: Any, profile: PlanProfile) -> Any:
+    """Turn a generated plan back into a template by replacing the student's values."""
+    if isinstance(value, str):
+        value = re.sub(rf"\b{profile.target_score}\b", "{target_score}", value)
+        if profile.current_level:
+            value = re.sub(rf"\b{re.escape(profile.current_level)}\b", "{current_level}", value)
+        return value
+    if isinstance(value, list):
+        return [_templatize(item, profile) for item in value]
+    if isinstance(value, dict):
+        return {key: _templatize(item, profile) for key, item in value.items()}
+    return value
+
+
+def build_curated_template(profile: PlanProfile) -> Dict[str, Any]:
+    """
+    Build the curated template of a profile bucket from the DET task catalog.
+
+    Weeks follow the Pedagogue phases (diagnosis, foundations, development, intensive
+    practice, final review); daily tasks rotate through the task types that train
+    the weak subscores, with full-test practice in the last phases.
+
+    Args:
+        profile: Profile bucket
+
+    Returns:
+        Plan template with {placeholders}
+    """
+    weeks = profile.duration_weeks
+    band = hours_band(profile.hours)
+    study_days = {"low": 3, "medium": 5, "high": 6}[band]
+
+    focus_tasks = [
+        task for subscore in sorted(profile.weak_subscores or SUBSCORES) for task in get_tasks_by_subscore(subscore)
+    ]
+    focus_tasks = list(dict.fromkeys(focus_tasks)) or list(TASK_DESCRIPTIONS)
+    all_tasks = list(TASK_DESCRIPTIONS)
+
+    # Phase boundaries: week 1 is always the diagnosis, the rest is split by share
+    phase_of_week = ["Diagnóstico"]
+    for name, share, _ in PHASES[1:]:
+        phase_of_week += [name] * max(1, round(share * (weeks - 1)))
+    phase_of_week = (phase_of_week + [PHASES[-1][0]] * weeks)[:weeks]
+    focus_by_phase = {name: focus for name, _, focus in PHASES}
+
+    schedule = []
+    rotation = 0
+    for week in range(1, weeks + 1):
+        phase = phase_of_week[week - 1]
+        daily_tasks = []
+        for day in WEEKDAYS[:study_days]:
+            if phase in ("Prática intensiva", "Revisão final") and day == WEEKDAYS[study_days - 1]:
+                tasks = [{
+                    "task_type": "practice_test",
+                    "description": "Faça um simulado completo cronometrado e compare com a meta de {target_score}",
+                    "goal": "Medir o progresso em condições de prova",
+                    "resources": ["Simulado oficial do DET"],
+                }]
+            else:
+                primary = focus_tasks[rotation % len(focus_tasks)]
+                secondary = all_tasks[(rotation * 3 + week) % len(all_tasks)]
+                rotation += 1
+                tasks = [
+                    {
+                        "task_type": TaskType(task).value,
+                        "description": TASK_DESCRIPTIONS[task],
+                        "goal": ", ".join(get_task_info(task).get("scoring_criteria", [])[:2]),
+                        "resources": ["Prática oficial do DET", "Banco de exercícios DET Flow"],
+                    }
+                    for task in dict.fromkeys([primary, secondary])
+                ]
+            daily_tasks.append({"day": day, "duration_minutes": 0, "tasks": tasks})
+
+        schedule.append({
+            "week": week,
+            "focus_areas": [f"{phase}: {area}" for area in focus_by_phase[phase]],
+            "daily_tasks": daily_tasks,
+            "checkpoint": (
+                "Faça uma tarefa de cada tipo para definir sua linha de base (nível {current_level})"
+                if week == 1 else f"Revise os erros da semana {week} e registre sua pontuação"
+            ),
+        })
+
+    return {
+        "plan_title": "Plano DET {current_level} → {target_score} pontos",
+        "duration_weeks": weeks,
+        "target_score": 0,
+        "current_level": "{current_level}",
+        "expected_improvement": 0,
+        "weekly_schedule": schedule,
+        "priority_weaknesses": [],
+        "study_tips": [
+            "Estude {hours} horas por semana, de preferência em sessões curtas e diárias",
+            "Priorize: {weaknesses}",
+            "Anote os erros de cada sessão e revise-os no fim da semana",
+        ],
+        "motivation_message": "Você consegue chegar aos {target_score} pontos! Um passo de cada vez. 💪",
+    }
+
+
+class PlanTemplateStore:
+    """
+    Templates per profile bucket: curated ones are built on first use, generated ones
+    come from LLM plans of rare profiles. Generated templates are persisted as JSON
+    when a directory is configured.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = Path(directory) if directory else (
+            Path(settings.plan_template_dir) if settings.plan_template_dir else None
+        )
+        self._templates: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._stats = {"curated": 0, "generated": 0, "misses": 0, "saved": 0}
+
+        if self.directory and self.directory.is_dir():
+            for path in self.directory.glob("*.json"):
+                try:
+                    data = json.loads(path.read_text(encoding="utf-8"))
+                    self._templates[data["key"]] = ("generated", data["template"])
+                except (OSError, ValueError, KeyError) as e:
+                    logger.warning(f"Skipping plan template {path.name}: {e}")
+
+    def instantiate(self, profile: PlanProfile) -> Optional[Dict[str, Any]]:
+        """
+        Build a plan for a student from the template of their profile bucket.
+
+        Args:
+            profile: Student profile
+
+        Returns:
+            Instantiated plan, or None when no template covers the profile
+        """
+        with self._lock:
+            source, template = self._templates.get(profile.key, (None, None))
+            if template is None and profile.is_common:
+                source, template = "curated", build_curated_template(profile)
+                self._templates[profile.key] = (source, template)
+            if template is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats[source] += 1
+
+        # _substitute rebuilds every container, so the stored template is never mutated
+        plan = _substitute(template, profile.substitutions())
+        plan["target_score"] = profile.target_score
+        plan["current_level"] = profile.current_level
+        plan["duration_weeks"] = len(plan.get("weekly_schedule", [])) or plan.get("duration_weeks")
+        plan["expected_improvement"] = max(0, profile.target_score - LEVEL_BASELINE.get(profile.current_level, 75))
+        plan["priority_weaknesses"] = profile.weaknesses or plan.get("priority_weaknesses", [])
+        self._fit_daily_minutes(plan, profile.hours)
+        plan["template"] = {"key": profile.key, "source": source}
+        return plan
+
+    def save_generated(self, profile: PlanProfile, plan: Dict[str, Any]) -> None:
+        """Keep an LLM-generated plan as the template of its profile bucket."""
+        if "error" in plan or not plan.get("weekly_schedule"):
+            return
+
+        template = _templatize(
+            {key: value for key, value in plan.items() if key not in ("created_at", "student_profile", "template")},
+            profile
+        )
+        with self._lock:
+            self._templates[profile.key] = ("generated", template)
+            self._stats["saved"] += 1
+
+        if self.directory:
+            try:
+                self.directory.mkdir(parents=True, exist_ok=True)
+                name = re.sub(r"[^a-zA-Z0-9_-]+", "_", profile.key)
+                (self.directory / f"{name}.json").write_text(
+                    json.dumps({"key": profile.key, "template": template, "saved_at": datetime.now().isoformat()},
+                               ensure_ascii=False),
+                    encoding="utf-8"
+                )
+            except OSError as e:
+                logger.warning(f"Could not persist plan template {profile.key}: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            served = self._stats["curated"] + self._stats["generated"]
+            requests = served + self._stats["misses"]
+            return {
+                **self._stats,
+                "templates": len(self._templates),
+                "template_hit_rate": round(served / requests, 4) if requests else 0.0,
+            }
+
+    @staticmethod
+    def _fit_daily_minutes(plan: Dict[str, Any], hours: int) -> None:
+        """Spread the weekly study time over the study days, rounded to 5 minutes."""
+        for week in plan.get("weekly_schedule", []):
+            days = week.get("daily_tasks", [])
+            if days:
+                minutes = max(15, 5 * round(hours * 60 / len(days) / 5))
+                for day in days:
+                    day["duration_minutes"] = minutes
+
+
+# Global plan template store
+plan_templates = PlanTemplateStore()
@@ -0,0 +1,167 @@
+"""
+DET Flow - Lazy Plan Weeks
+Study plans can be generated as a skeleton (weeks, focus areas and checkpoints) and
+have the daily tasks of each week generated on first request. Generated weeks are
+cached per plan and the following week is prefetched in the background, so the
+student rarely waits for a week and weeks that are never opened cost nothing.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+import threading
+import uuid
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+WeekKey = Tuple[str, int]
+
+
+def new_plan_uid() -> str:
+    """Identifier that ties cached week details to a plan, stored in the plan itself."""
+    return uuid.uuid4().hex
+
+
+def find_week(plan: Dict[str, Any], week: int) -> Optional[Dict[str, Any]]:
+    """Get a week of the plan schedule, or None if the plan has no such week."""
+    for entry in plan.get("weekly_schedule", []):
+        if int(entry.get("week", 0) or 0) == week:
+            return entry
+    return None
+
+
+def week_needs_details(plan: Dict[str, Any], week: int) -> bool:
+    """Whether a skeleton week still has to get its daily tasks generated."""
+    entry = find_week(plan, week)
+    return entry is not None and not entry.get("daily_tasks")
+
+
+def week_outline(entry: Dict[str, Any]) -> Dict[str, Any]:
+    """Focus areas and task types of a week, enough context to continue from it."""
+    task_types = sorted({
+        task.get("task_type")
+        for day in entry.get("daily_tasks", [])
+        for task in day.get("tasks", [])
+        if task.get("task_type")
+    })
+    return {"week": entry.get("week"), "focus_areas": entry.get("focus_areas", []), "task_types": task_types}
+
+
+class WeekDetailCache:
+    """
+    Generated week details per plan, with deduplicated background prefetch.
+
+    A week requested while its prefetch is running waits for that generation
+    instead of starting another one.
+    """
+
+    def __init__(self, max_weeks: Optional[int] = None, workers: int = 2):
+        """
+        Args:
+            max_weeks: Generated weeks kept in memory (least recently used are dropped)
+            workers: Background prefetch threads
+        """
+        self.max_weeks = max_weeks or settings.plan_week_cache_size
+        self._weeks: "OrderedDict[WeekKey, Dict[str, Any]]" = OrderedDict()
+        self._pending: Dict[WeekKey, Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="plan-prefetch")
+        self._stats = {
+            "requests": 0,
+            "hits": 0,
+            "waited_on_prefetch": 0,
+            "generated": 0,
+            "prefetched": 0,
+            "failures": 0,
+        }
+
+    def get(
+        self,
+        plan_uid: str,
+        week: int,
+        generate: Callable[[], Dict[str, Any]],
+        timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        Get the details of a week, generating them if needed.
+
+        Args:
+            plan_uid: Plan identifier
+            week: Week number
+            generate: Produces the week details (an LLM call)
+            timeout: Max seconds to wait for a running prefetch
+
+        Returns:
+            Week details
+
+        Raises:
+            Whatever generate raises
+        """
+        key = (plan_uid, week)
+        with self._lock:
+            self._stats["requests"] += 1
+            if key in self._weeks:
+                self._stats["hits"] += 1
+                self._weeks.move_to_end(key)
+                return self._weeks[key]
+            pending = self._pending.get(key)
+            if pending is not None:
+                self._stats["waited_on_prefetch"] += 1
+
+        if pending is not None:
+            try:
+                return pending.result(timeout=timeout)
+            except Exception as e:
+                logger.warning(f"Prefetch of week {week} failed, generating again: {e}")
+
+        details = generate()
+        self._store(key, details, "generated")
+        return details
+
+    def prefetch(self, plan_uid: str, week: int, generate: Callable[[], Dict[str, Any]]) -> None:
+        """Generate a week in the background unless it is cached or already running."""
+        key = (plan_uid, week)
+        with self._lock:
+            if key in self._weeks or key in self._pending:
+                return
+            future = self._executor.submit(self._run_prefetch, key, generate)
+            self._pending[key] = future
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            requests = self._stats["requests"]
+            return {
+                **self._stats,
+                "hit_rate": round(self._stats["hits"] / requests, 4) if requests else 0.0,
+                "cached_weeks": len(self._weeks),
+                "pending_prefetches": len(self._pending),
+            }
+
+    def _run_prefetch(self, key: WeekKey, generate: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        try:
+            details = generate()
+        except Exception:
+            with self._lock:
+                self._pending.pop(key, None)
+                self._stats["failures"] += 1
+            raise
+        self._store(key, details, "prefetched")
+        return details
+
+    def _store(self, key: WeekKey, details: Dict[str, Any], counter: str) -> None:
+        with self._lock:
+            self._pending.pop(key, None)
+            self._weeks[key] = details
+            self._weeks.move_to_end(key)
+            self._stats[counter] += 1
+            while len(self._weeks) > self.max_weeks:
+                self._weeks.popitem(last=False)
+
+
+# Global cache of lazily generated plan weeks
+week_details = WeekDetailCache()
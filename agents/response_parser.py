@@ -5,8 +5,11 @@ Shared helpers for extracting JSON from LLM responses.
 from __future__ import annotations
 
 import json
+import re
 from typing import Any, Dict
 
+from core.metrics import metrics
+
 
 def extract_json_object(text: str) -> Dict[str, Any]:
     """
@@ -16,6 +19,12 @@ def extract_json_object(text: str) -> Dict[str, Any]:
     if not text:
         raise ValueError("Empty response")
 
+    metrics.observe("det_json_payload_bytes", len(text))
+    with metrics.span("extract_json_object"):
+        return _extract_json_object(text)
+
+
+def _extract_json_object(text: str) -> Dict[str, Any]:
     cleaned = text.strip()
 
     if "```" in cleaned:
@@ -38,3 +47,67 @@ def ensure_keys(payload: Dict[str, Any], required_keys: list[str]) -> Dict[str,
     if missing:
         raise ValueError(f"Missing required keys: {', '.join(missing)}")
     return payload
+
+
+def _close_truncated_json(text: str) -> str:
+    """Close strings, arrays and objects left open by a truncated response."""
+    stack: list[str] = []
+    in_string = False
+    escaped = False
+
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]" and stack:
+            stack.pop()
+
+    repaired = text + ('"' if in_string else "")
+    repaired = re.sub(r",\s*$", "", repaired.rstrip())
+    return repaired + "".join(reversed(stack))
+
+
+def repair_json_object(text: str) -> Dict[str, Any]:
+    """
+    Extract a JSON object, repairing common LLM formatting slips locally:
+    code fences, smart quotes, trailing commas, Python literals and truncated output.
+    """
+    try:
+        return extract_json_object(text)
+    except (ValueError, json.JSONDecodeError):
+        pass
+
+    if not text or "{" not in text:
+        raise ValueError("No JSON object found in response")
+
+    candidate = text[text.find("{"):]
+    if "```" in candidate:
+        candidate = candidate.split("```")[0]
+    candidate = candidate.strip()
+    if candidate.rfind("}") > 0:
+        tail = candidate[candidate.rfind("}") + 1:]
+        if tail.strip() and not tail.strip().startswith((",", "]", "}")):
+            candidate = candidate[:candidate.rfind("}") + 1]
+
+    candidate = (
+        candidate.replace("“", '"').replace("”", '"')
+        .replace("‘", "'").replace("’", "'")
+    )
+    candidate = re.sub(r"\bTrue\b", "true", candidate)
+    candidate = re.sub(r"\bFalse\b", "false", candidate)
+    candidate = re.sub(r"\bNone\b", "null", candidate)
+    candidate = _close_truncated_json(candidate)
+    candidate = re.sub(r",\s*([}\]])", r"\1", candidate)
+
+    parsed = json.loads(candidate)
+    if not isinstance(parsed, dict):
+        raise ValueError("Repaired response is not a JSON object")
+    return parsed
@@ -0,0 +1,254 @@
+"""
+DET Flow - Agent Output Schemas
+Pydantic models for the structured outputs of the Evaluator and Pedagogue agents.
+Validators coerce common model slips (numeric strings, out-of-range scores, lowercase
+CEFR levels) so small deviations are repaired locally instead of failing the parse.
+"""
+
+from __future__ import annotations
+
+from typing import Any, List, Literal, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, field_validator, model_validator
+
+CEFR_LEVELS = ("A1", "A2", "B1", "B2", "C1", "C2")
+MIN_SCORE = 10
+MAX_SCORE = 160
+
+
+def coerce_score(value: Any) -> Any:
+    """Turn '120', '120/160' or 119.6 into an int within the DET 10-160 range."""
+    if isinstance(value, str):
+        value = value.strip().split("/")[0].strip()
+    try:
+        score = int(round(float(value)))
+    except (TypeError, ValueError):
+        return value  # Let validation report it
+    return max(MIN_SCORE, min(MAX_SCORE, score))
+
+
+def cefr_for_score(score: int) -> str:
+    """CEFR level matching a DET score (same mapping as the evaluator prompt)."""
+    if score < 60:
+        return "A2"
+    if score < 90:
+        return "B1"
+    if score < 120:
+        return "B2"
+    if score < 145:
+        return "C1"
+    return "C2"
+
+
+def _as_list(value: Any) -> Any:
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return value
+
+
+# ==================== Evaluation ====================
+
+class Subscores(BaseModel):
+    """DET subscores, each 10-160."""
+
+    literacy: int
+    comprehension: int
+    conversation: int
+    production: int
+
+    @field_validator("literacy", "comprehension", "conversation", "production", mode="before")
+    @classmethod
+    def _coerce(cls, value: Any) -> Any:
+        return coerce_score(value)
+
+
+class EvaluationAnalysis(BaseModel):
+    """Chain-of-Thought analysis per criterion."""
+
+    grammar: str = ""
+    vocabulary: str = ""
+    relevance: str = ""
+    coherence: str = ""
+
+
+class EvaluationOutput(BaseModel):
+    """Evaluator response."""
+
+    model_config = ConfigDict(extra="allow")
+
+    overall_score: int
+    subscores: Subscores
+    cefr_level: str
+    analysis: EvaluationAnalysis
+    strengths: List[str] = Field(default_factory=list)
+    weaknesses: List[str] = Field(default_factory=list)
+    feedback: str
+    improvement_suggestions: List[str] = Field(default_factory=list)
+    confidence: Optional[float] = None
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _confidence_ratio(cls, value: Any) -> Any:
+        """Accept 0-1 ratios and 0-100 percentages."""
+        try:
+            value = float(str(value).rstrip("%")) if value is not None else None
+        except ValueError:
+            return None
+        if value is not None and value > 1:
+            value /= 100
+        return None if value is None else max(0.0, min(1.0, value))
+
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        if "overall_score" in data:
+            data["overall_score"] = coerce_score(data["overall_score"])
+
+        level = str(data.get("cefr_level") or "").strip().upper()[:2]
+        if level not in CEFR_LEVELS and isinstance(data.get("overall_score"), int):
+            level = cefr_for_score(data["overall_score"])
+        if level:
+            data["cefr_level"] = level
+
+        if isinstance(data.get("analysis"), str):
+            data["analysis"] = {"grammar": data["analysis"]}
+        for key in ("strengths", "weaknesses", "improvement_suggestions"):
+            if key in data:
+                data[key] = _as_list(data[key])
+        return data
+
+    @field_validator("cefr_level")
+    @classmethod
+    def _valid_level(cls, value: str) -> str:
+        if value not in CEFR_LEVELS:
+            raise ValueError(f"cefr_level must be one of {', '.join(CEFR_LEVELS)}")
+        return value
+
+
+# ==================== Study plan ====================
+
+class PlanTask(BaseModel):
+    """One practice task."""
+
+    model_config = ConfigDict(extra="allow")
+
+    task_type: str
+    description: str = ""
+    goal: str = ""
+    resources: List[str] = Field(default_factory=list)
+
+    @field_validator("resources", mode="before")
+    @classmethod
+    def _resources_list(cls, value: Any) -> Any:
+        return _as_list(value)
+
+
+class DailyTasks(BaseModel):
+    """Tasks scheduled for one day."""
+
+    model_config = ConfigDict(extra="allow")
+
+    day: str
+    duration_minutes: int = 0
+    tasks: List[PlanTask] = Field(default_factory=list)
+
+
+class WeekSchedule(BaseModel):
+    """One week of the plan."""
+
+    model_config = ConfigDict(extra="allow")
+
+    week: int
+    focus_areas: List[str] = Field(default_factory=list)
+    daily_tasks: List[DailyTasks] = Field(default_factory=list)
+    checkpoint: str = ""
+
+    @field_validator("focus_areas", mode="before")
+    @classmethod
+    def _focus_areas_list(cls, value: Any) -> Any:
+        return _as_list(value)
+
+
+class StudyPlanOutput(BaseModel):
+    """Pedagogue response."""
+
+    model_config = ConfigDict(extra="allow")
+
+    plan_title: str
+    duration_weeks: int
+    target_score: int
+    current_level: str = ""
+    expected_improvement: int = 0
+    weekly_schedule: List[WeekSchedule]
+    priority_weaknesses: List[str] = Field(default_factory=list)
+    study_tips: List[str] = Field(default_factory=list)
+    motivation_message: str = ""
+
+    @model_validator(mode="before")
+    @classmethod
+    def _repair(cls, data: Any) -> Any:
+        if not isinstance(data, dict):
+            return data
+        data = dict(data)
+        if "target_score" in data:
+            data["target_score"] = coerce_score(data["target_score"])
+        if isinstance(data.get("weekly_schedule"), dict):
+            data["weekly_schedule"] = [data["weekly_schedule"]]
+        for key in ("priority_weaknesses", "study_tips"):
+            if key in data:
+                data[key] = _as_list(data[key])
+        return data
+
+
+class PlanPersonalization(BaseModel):
+    """Short personalization pass over a template-based plan."""
+
+    plan_title: str
+    motivation_message: str
+    study_tips: List[str] = Field(default_factory=list)
+
+    @field_validator("study_tips", mode="before")
+    @classmethod
+    def _tips_list(cls, value: Any) -> Any:
+        return _as_list(value)
+
+
+class WeekPatch(BaseModel):
+    """Change to one remaining week: replace it entirely or update some fields."""
+
+    op: Literal["replace", "update"] = "update"
+    week: int
+    focus_areas: Optional[List[str]] = None
+    daily_tasks: Optional[List[DailyTasks]] = None
+    checkpoint: Optional[str] = None
+
+    @field_validator("focus_areas", mode="before")
+    @classmethod
+    def _focus_areas_list(cls, value: Any) -> Any:
+        return None if value is None else _as_list(value)
+
+    @model_validator(mode="after")
+    def _complete_replacement(self) -> "WeekPatch":
+        if self.op == "replace" and (self.focus_areas is None or self.daily_tasks is None):
+            raise ValueError("replace needs focus_areas and daily_tasks")
+        return self
+
+
+class StudyPlanPatch(BaseModel):
+    """Pedagogue adjustment: only the weeks and plan fields that change."""
+
+    weeks: List[WeekPatch] = Field(default_factory=list)
+    priority_weaknesses: Optional[List[str]] = None
+    study_tips: Optional[List[str]] = None
+    motivation_message: Optional[str] = None
+    rationale: str = ""
+
+    @field_validator("priority_weaknesses", "study_tips", mode="before")
+    @classmethod
+    def _optional_list(cls, value: Any) -> Any:
+        return None if value is None else _as_list(value)
@@ -0,0 +1,311 @@
+"""
+DET Flow - Semantic Evaluation Cache
+Near-duplicate detection for submissions to the same practice prompt. Responses are
+embedded locally (signed feature hashing of words, word bigrams and character
+trigrams, no model call) and compared against a flat per-prompt index. Very similar
+responses reuse the cached evaluation; similar ones get it calibrated with the local
+lexical features. NumPy speeds up the index when installed.
+"""
+
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import copy
+import hashlib
+import logging
+import math
+import threading
+import time
+import zlib
+
+from core.config import settings
+from agents.lexical_features import FEATURE_TASK_TYPES, lexical_features
+from agents.objective_scorer import SUBSCORES, tokenize
+from agents.schemas import MAX_SCORE, MIN_SCORE, cefr_for_score
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+SparseVector = Dict[int, float]
+
+
+def embed(text: str, dim: Optional[int] = None) -> SparseVector:
+    """
+    L2-normalized hashed embedding of a response.
+
+    Words and word bigrams capture content and phrasing, character trigrams make the
+    vector tolerant to spelling slips. Signed hashing keeps collisions unbiased.
+
+    Args:
+        text: Response text
+        dim: Number of hash buckets (settings.semantic_cache_dim by default)
+
+    Returns:
+        Sparse vector as {bucket: weight}
+    """
+    dim = dim or settings.semantic_cache_dim
+    tokens = tokenize(text)
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    for token in tokens:
+        padded = f"<{token}>"
+        features.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    vector: SparseVector = {}
+    for feature in features:
+        digest = zlib.crc32(feature.encode("utf-8"))
+        bucket = digest % dim
+        vector[bucket] = vector.get(bucket, 0.0) + (1.0 if digest & 0x80000000 else -1.0)
+
+    norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+    return {bucket: weight / norm for bucket, weight in vector.items() if weight} if norm else {}
+
+
+def cosine(a: SparseVector, b: SparseVector) -> float:
+    """Cosine similarity of two normalized sparse vectors."""
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(weight * b.get(bucket, 0.0) for bucket, weight in a.items())
+
+
+def prompt_key(task_type: str, task_prompt: str) -> str:
+    """Index key for a practice prompt (whitespace and casing are ignored)."""
+    normalized = " ".join((task_prompt or "").lower().split())
+    return f"{task_type}:{hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]}"
+
+
+class CacheEntry:
+    """One graded response."""
+
+    __slots__ = ("vector", "evaluation", "response_text", "tokens", "created_at", "hits")
+
+    def __init__(self, vector: SparseVector, evaluation: Dict[str, Any], response_text: str, tokens: int):
+        self.vector = vector
+        self.evaluation = evaluation
+        self.response_text = response_text
+        self.tokens = tokens
+        self.created_at = time.time()
+        self.hits = 0
+
+
+class PromptIndex:
+    """Flat similarity index over the cached responses of one prompt."""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.entries: List[CacheEntry] = []
+        self._matrix = None  # Dense NumPy copy, rebuilt lazily after changes
+
+    def add(self, entry: CacheEntry) -> None:
+        self.entries.append(entry)
+        self._matrix = None
+
+    def remove(self, index: int) -> CacheEntry:
+        self._matrix = None
+        return self.entries.pop(index)
+
+    def nearest(self, vector: SparseVector) -> Tuple[Optional[int], float]:
+        """Index and similarity of the most similar cached response."""
+        if not self.entries or not vector:
+            return None, 0.0
+
+        if np is not None and len(self.entries) > 8:
+            if self._matrix is None:
+                matrix = np.zeros((len(self.entries), self.dim), dtype=np.float32)
+                for row, entry in enumerate(self.entries):
+                    matrix[row, list(entry.vector)] = list(entry.vector.values())
+                self._matrix = matrix
+            query = np.zeros(self.dim, dtype=np.float32)
+            query[list(vector)] = list(vector.values())
+            scores = self._matrix @ query
+            best = int(scores.argmax())
+            return best, float(scores[best])
+
+        scores = [cosine(vector, entry.vector) for entry in self.entries]
+        best = max(range(len(scores)), key=scores.__getitem__)
+        return best, scores[best]
+
+
+class SemanticEvaluationCache:
+    """
+    Per-prompt near-duplicate cache of evaluations.
+
+    Similarity >= reuse_threshold returns the cached evaluation as is; similarity >=
+    calibrate_threshold shifts the cached scores by the difference between the
+    provisional lexical scores of both responses (writing tasks only). Entries expire
+    after ttl_seconds; each prompt keeps max_entries_per_prompt responses and the
+    least recently used prompts are evicted beyond max_prompts.
+    """
+
+    def __init__(
+        self,
+        reuse_threshold: Optional[float] = None,
+        calibrate_threshold: Optional[float] = None,
+        max_entries_per_prompt: Optional[int] = None,
+        max_prompts: Optional[int] = None,
+        ttl_seconds: Optional[int] = None,
+        dim: Optional[int] = None
+    ):
+        self.reuse_threshold = reuse_threshold or settings.semantic_cache_reuse_threshold
+        self.calibrate_threshold = calibrate_threshold or settings.semantic_cache_calibrate_threshold
+        self.max_entries_per_prompt = max_entries_per_prompt or settings.semantic_cache_max_entries_per_prompt
+        self.max_prompts = max_prompts or settings.semantic_cache_max_prompts
+        self.ttl_seconds = ttl_seconds or settings.semantic_cache_ttl_seconds
+        self.dim = dim or settings.semantic_cache_dim
+
+        self._indexes: "OrderedDict[str, PromptIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "lookups": 0,
+            "reused": 0,
+            "calibrated": 0,
+            "misses": 0,
+            "stored": 0,
+            "evictions": 0,
+            "tokens_saved": 0,
+        }
+
+    def lookup(self, task_type: str, task_prompt: str, response_text: str) -> Optional[Dict[str, Any]]:
+        """
+        Find a cached evaluation for a near-duplicate response.
+
+        Args:
+            task_type: Type of DET task
+            task_prompt: Practice prompt the response answers
+            response_text: Student's response
+
+        Returns:
+            Evaluation (with cache_match and cache_similarity) or None on a miss
+        """
+        vector = embed(response_text, self.dim)
+        key = prompt_key(task_type, task_prompt)
+
+        with self._lock:
+            self._stats["lookups"] += 1
+            index = self._indexes.get(key)
+            if index is None:
+                self._stats["misses"] += 1
+                return None
+            self._indexes.move_to_end(key)
+            self._expire(key, index)
+
+            position, similarity = index.nearest(vector)
+            if position is None or similarity < self.calibrate_threshold:
+                self._stats["misses"] += 1
+                return None
+            entry = index.entries[position]
+
+            if similarity >= self.reuse_threshold:
+                evaluation, match = copy.deepcopy(entry.evaluation), "reused"
+            else:
+                evaluation = self._calibrate(task_type, entry, response_text)
+                if evaluation is None:
+                    self._stats["misses"] += 1
+                    return None
+                match = "calibrated"
+
+            entry.hits += 1
+            self._stats[match] += 1
+            self._stats["tokens_saved"] += entry.tokens
+
+        evaluation["cache_match"] = match
+        evaluation["cache_similarity"] = round(similarity, 4)
+        return evaluation
+
+    def store(
+        self,
+        task_type: str,
+        task_prompt: str,
+        response_text: str,
+        evaluation: Dict[str, Any],
+        tokens: int = 0
+    ) -> None:
+        """
+        Cache a fresh LLM evaluation.
+
+        Args:
+            task_type: Type of DET task
+            task_prompt: Practice prompt
+            response_text: Student's response
+            evaluation: Evaluation result (fallback and provisional results are ignored)
+            tokens: Estimated tokens the evaluation cost, counted as saved on each hit
+        """
+        if "error" in evaluation or evaluation.get("provisional") or evaluation.get("cache_match"):
+            return
+
+        # Per-response data does not carry over to a near-duplicate
+        evaluation = {
+            key: value for key, value in evaluation.items() if key not in ("lexical_features", "evaluation_duration_ms")
+        }
+        entry = CacheEntry(embed(response_text, self.dim), copy.deepcopy(evaluation), response_text, tokens)
+        key = prompt_key(task_type, task_prompt)
+
+        with self._lock:
+            index = self._indexes.get(key)
+            if index is None:
+                index = self._indexes[key] = PromptIndex(self.dim)
+                while len(self._indexes) > self.max_prompts:
+                    _, evicted = self._indexes.popitem(last=False)
+                    self._stats["evictions"] += len(evicted.entries)
+            self._indexes.move_to_end(key)
+
+            index.add(entry)
+            self._stats["stored"] += 1
+            if len(index.entries) > self.max_entries_per_prompt:
+                # Drop the least useful entry: fewest hits, then oldest
+                victim = min(range(len(index.entries)), key=lambda i: (index.entries[i].hits, index.entries[i].created_at))
+                index.remove(victim)
+                self._stats["evictions"] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._indexes.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._stats["lookups"]
+            hits = self._stats["reused"] + self._stats["calibrated"]
+            return {
+                **self._stats,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "prompts": len(self._indexes),
+                "entries": sum(len(index.entries) for index in self._indexes.values()),
+                "numpy": np is not None,
+            }
+
+    def _calibrate(self, task_type: str, entry: CacheEntry, response_text: str) -> Optional[Dict[str, Any]]:
+        """Shift the cached scores by the lexical difference between both responses."""
+        if task_type not in FEATURE_TASK_TYPES:
+            return None
+
+        delta = (
+            lexical_features.provisional_score(lexical_features.extract(response_text), task_type)
+            - lexical_features.provisional_score(lexical_features.extract(entry.response_text), task_type)
+        )
+        evaluation = copy.deepcopy(entry.evaluation)
+
+        def shift(score: int) -> int:
+            return max(MIN_SCORE, min(MAX_SCORE, int(score) + delta))
+
+        evaluation["overall_score"] = shift(evaluation["overall_score"])
+        evaluation["subscores"] = {name: shift(evaluation["subscores"].get(name, evaluation["overall_score"])) for name in SUBSCORES}
+        evaluation["cefr_level"] = cefr_for_score(evaluation["overall_score"])
+        evaluation["cache_calibration"] = delta
+        return evaluation
+
+    def _expire(self, key: str, index: PromptIndex) -> None:
+        cutoff = time.time() - self.ttl_seconds
+        for position in range(len(index.entries) - 1, -1, -1):
+            if index.entries[position].created_at < cutoff:
+                index.remove(position)
+                self._stats["evictions"] += 1
+        if not index.entries:
+            del self._indexes[key]
+
+
+# Global semantic evaluation cache
+semantic_cache = SemanticEvaluationCache()
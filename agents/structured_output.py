@@ -0,0 +1,170 @@
+"""
+DET Flow - Structured Output
+Schema-driven parsing of agent responses: provider JSON mode where available, local
+repair of near-miss JSON, and a single targeted re-ask (the invalid answer plus the
+validation errors, not the whole request) before giving up.
+"""
+
+from __future__ import annotations
+
+from typing import Any, Dict, Optional, Tuple, Type
+import json
+import logging
+import threading
+
+from pydantic import BaseModel, ValidationError
+
+from agents.model_telemetry import ModelTelemetry, model_telemetry
+from agents.response_parser import extract_json_object, repair_json_object
+
+logger = logging.getLogger(__name__)
+
+# Parse outcomes, from cheapest to most expensive
+OUTCOMES = ("native", "parsed", "repaired", "reasked", "failed")
+
+REASK_TEMPLATE = """Your previous answer could not be used because it does not match the required JSON format.
+Return ONLY the corrected JSON object, with no text before or after it. Keep the same content; fix only the format.
+
+VALIDATION ERRORS:
+{errors}
+
+PREVIOUS ANSWER:
+{previous}
+"""
+
+
+class StructuredOutputError(Exception):
+    """The response could not be turned into the schema, even after repair and re-ask."""
+
+
+def structured_agent_kwargs(schema: Type[BaseModel]) -> Dict[str, Any]:
+    """
+    Agent arguments that request JSON output for a schema.
+
+    Agno: output_schema with JSON mode (response_format json_object plus the schema in the
+    system prompt). Phi: response_model.
+    """
+    try:
+        from agno.agent import Agent  # noqa: F401
+    except ImportError:
+        return {"response_model": schema}
+    return {"output_schema": schema, "use_json_mode": True}
+
+
+def _format_errors(error: Exception) -> str:
+    if isinstance(error, ValidationError):
+        return "\n".join(
+            f"- {'.'.join(str(part) for part in item['loc']) or 'root'}: {item['msg']}"
+            for item in error.errors()[:10]
+        )
+    return f"- {error}"
+
+
+def parse_structured(content: Any, schema: Type[BaseModel]) -> Tuple[Dict[str, Any], str]:
+    """
+    Validate a response against a schema, repairing it locally when needed.
+
+    Args:
+        content: Response content (schema instance, dict or text)
+        schema: Pydantic model
+
+    Returns:
+        (validated dict, outcome) where outcome is native, parsed or repaired
+
+    Raises:
+        ValidationError or ValueError when the content cannot be repaired
+    """
+    if isinstance(content, schema):
+        return content.model_dump(), "native"
+    if isinstance(content, BaseModel):
+        return schema.model_validate(content.model_dump()).model_dump(), "native"
+    if isinstance(content, dict):
+        return schema.model_validate(content).model_dump(), "native"
+
+    text = content if isinstance(content, str) else str(content or "")
+    try:
+        return schema.model_validate(extract_json_object(text)).model_dump(), "parsed"
+    except (ValueError, json.JSONDecodeError):
+        # ValidationError is a ValueError: schema mismatches are repaired too
+        pass
+
+    return schema.model_validate(repair_json_object(text)).model_dump(), "repaired"
+
+
+class StructuredOutputStats:
+    """Counts parse outcomes per activity."""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, activity: str, outcome: str) -> None:
+        with self._lock:
+            stats = self._stats.setdefault(activity, {name: 0 for name in OUTCOMES})
+            stats[outcome] += 1
+
+    def get_stats(self) -> Dict[str, Dict[str, Any]]:
+        """Outcome counts per activity and the resulting parse-failure rate."""
+        with self._lock:
+            result = {}
+            for activity, stats in self._stats.items():
+                total = sum(stats.values())
+                result[activity] = {
+                    **stats,
+                    "total": total,
+                    "parse_failure_rate": round(stats["failed"] / total, 4) if total else 0.0,
+                }
+            return result
+
+
+def run_structured(
+    router: Any,
+    prompt: str,
+    schema: Type[BaseModel],
+    activity: str,
+    telemetry: Optional[ModelTelemetry] = None,
+    max_reask_chars: int = 6000
+) -> Tuple[Dict[str, Any], str]:
+    """
+    Run a prompt through a ModelRouter and return schema-valid output.
+
+    Args:
+        router: ModelRouter for the activity
+        prompt: Request message
+        schema: Expected output schema
+        activity: Activity name for stats
+        telemetry: Telemetry receiving per-model parse outcomes
+        max_reask_chars: Max characters of the invalid answer echoed in the re-ask
+
+    Returns:
+        (validated dict, model ID that produced it)
+
+    Raises:
+        StructuredOutputError after a failed re-ask
+    """
+    telemetry = telemetry or model_telemetry
+    response, model_id = router.run_with_model(prompt)
+
+    try:
+        result, outcome = parse_structured(response.content, schema)
+    except (ValueError, json.JSONDecodeError) as e:
+        logger.warning(f"{activity} output from {model_id} invalid, re-asking: {e}")
+        previous = response.content if isinstance(response.content, str) else json.dumps(response.content, default=str)
+        reask = REASK_TEMPLATE.format(errors=_format_errors(e), previous=previous[:max_reask_chars])
+
+        try:
+            result, _ = parse_structured(router.run_on(model_id, reask).content, schema)
+            outcome = "reasked"
+        except Exception as reask_error:
+            structured_output_stats.record(activity, "failed")
+            telemetry.record_parse(activity, model_id, ok=False)
+            raise StructuredOutputError(f"Invalid {schema.__name__} from {model_id}: {reask_error}") from reask_error
+
+    structured_output_stats.record(activity, outcome)
+    # A re-ask still costs a second call, so it counts against the model
+    telemetry.record_parse(activity, model_id, ok=outcome != "reasked")
+    return result, model_id
+
+
+# Global structured output statistics
+structured_output_stats = StructuredOutputStats()
@@ -15,6 +15,23 @@ from core.database import get_db
 from core.models import User, Submission
 from core.auth import get_password_hash
 from core.subscription import SubscriptionStatus, SubscriptionPlan, subscription_manager
+from core.message_worker import message_worker_pool
+from core.whatsapp import whatsapp_sender
+from core.plan_progress import plan_progress
+from core.rate_limiter import rate_limiter
+from core.usage_ledger import usage_ledger
+from core.query_profiler import query_profiler
+from agents.context_compactor import context_compactor
+from agents.model_provider import prompt_cache_stats
+from agents.model_router import model_latency_tracker
+from agents.model_telemetry import model_telemetry
+from agents.circuit_breaker import circuit_breakers
+from agents.llm_scheduler import llm_scheduler
+from agents.structured_output import structured_output_stats
+from agents.evaluation_cascade import cascade_stats
+from agents.semantic_cache import semantic_cache
+from agents.plan_templates import plan_templates
+from agents.plan_weeks import week_details
 
 logger = logging.getLogger(__name__)
 
@@ -399,6 +416,52 @@ async def activate_user(
     return {"message": "Usuário reativado", "user_id": user_id}
 
 
+# ==================== LLM Usage ====================
+
+@router.get("/usage")
+async def get_llm_usage(
+    admin: bool = Depends(verify_admin_key),
+    db: Session = Depends(get_db),
+    group_by: str = Query("activity,model", description="Comma-separated: day, user, activity, model, tier"),
+    days: int = Query(7, ge=1, le=365),
+    user_id: Optional[int] = None,
+    limit: int = Query(100, ge=1, le=1000)
+):
+    """
+    Get LLM token usage and estimated cost rollups, most expensive groups first.
+    """
+    dimensions = [name.strip() for name in group_by.split(",") if name.strip()]
+    usage_ledger.flush()  # Include calls still buffered in this worker
+    try:
+        rows = usage_ledger.rollup(
+            db, dimensions, since=datetime.now() - timedelta(days=days), user_id=user_id, limit=limit
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    return {"group_by": dimensions, "days": days, "user_id": user_id, "rows": rows}
+
+
+@router.get("/usage/users/{user_id}")
+async def get_user_llm_usage(
+    user_id: int,
+    admin: bool = Depends(verify_admin_key),
+    db: Session = Depends(get_db),
+    days: int = Query(30, ge=1, le=365)
+):
+    """
+    Get a user's LLM usage per day and activity, plus today's in-memory token total.
+    """
+    usage_ledger.flush()
+    return {
+        "user_id": user_id,
+        "tokens_today": usage_ledger.tokens_today(user_id),
+        "rows": usage_ledger.rollup(
+            db, ["day", "activity"], since=datetime.now() - timedelta(days=days), user_id=user_id
+        ),
+    }
+
+
 # ==================== System Management ====================
 
 @router.post("/system/expire-subscriptions")
@@ -441,3 +504,198 @@ async def expire_old_subscriptions(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Erro ao expirar assinaturas"
         )
+
+
+@router.get("/system/messaging")
+async def get_messaging_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get WhatsApp pipeline counters.
+
+    Includes inbound queue depth, duplicates dropped, coalesced messages
+    (and the LLM calls they avoided) and outbound delivery stats.
+    """
+    return {
+        "fast_ack_enabled": message_worker_pool.is_running,
+        "inbound": message_worker_pool.get_stats(),
+        "outbound": whatsapp_sender.get_stats()
+    }
+
+
+@router.get("/system/prompt-tokens")
+async def get_prompt_token_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get prompt token counts per activity.
+
+    Shows the configured budgets, the tokens actually sent and the tokens
+    saved by context compaction.
+    """
+    return {
+        "budgets": context_compactor.budgets,
+        "activities": context_compactor.get_stats()
+    }
+
+
+@router.get("/system/prompt-cache")
+async def get_prompt_cache_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get provider prompt-cache usage per activity.
+
+    Reports cached versus uncached input tokens, so the savings from
+    caching the static system prompts can be tracked.
+    """
+    return {"activities": prompt_cache_stats.get_stats()}
+
+
+@router.get("/system/structured-output")
+async def get_structured_output_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get structured-output parse outcomes per activity.
+
+    Counts responses that were valid as returned, repaired locally, fixed by a
+    targeted re-ask or failed (fallback used), plus the parse-failure rate.
+    """
+    return {"activities": structured_output_stats.get_stats()}
+
+
+@router.get("/system/evaluation-cascade")
+async def get_evaluation_cascade_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get evaluation cascade statistics.
+
+    Reports the share of evaluations escalated from the triage model to the
+    strong model (by reason), mean latency per path and how closely both
+    tiers agree on the submissions graded by both.
+    """
+    return cascade_stats.get_stats()
+
+
+@router.get("/system/semantic-cache")
+async def get_semantic_cache_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get semantic evaluation cache statistics.
+
+    Reports lookups, reused and calibrated hits, evictions and the estimated
+    LLM tokens saved by serving near-duplicate responses from the cache.
+    """
+    return semantic_cache.get_stats()
+
+
+@router.post("/system/semantic-cache/clear")
+async def clear_semantic_cache(admin: bool = Depends(verify_admin_key)):
+    """Drop all cached evaluations (e.g. after changing the evaluator prompt or model)."""
+    semantic_cache.clear()
+    return {"success": True}
+
+
+@router.get("/system/plan-templates")
+async def get_plan_template_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get study plan template usage.
+
+    Counts plans served from curated and LLM-generated templates, template
+    misses (rare profiles sent to the LLM) and templates saved.
+    """
+    return plan_templates.get_stats()
+
+
+@router.get("/system/plan-weeks")
+async def get_plan_week_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get lazy plan week generation stats.
+
+    Counts week requests served from the cache, requests that waited on a running
+    prefetch, weeks generated on demand or prefetched, and generation failures.
+    """
+    return week_details.get_stats()
+
+
+@router.get("/system/plan-progress")
+async def get_plan_progress_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get study plan progress tracking stats.
+
+    Counts submissions matched to plan tasks, extra practice outside the plan,
+    replayed submissions ignored and drift-triggered plan adjustments.
+    """
+    return plan_progress.get_stats()
+
+
+@router.get("/system/usage-ledger")
+async def get_usage_ledger_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get LLM usage ledger health.
+
+    Counts calls recorded, rows written, insert batches, failed writes and rows
+    dropped while the database was unreachable.
+    """
+    return usage_ledger.get_stats()
+
+
+@router.get("/system/rate-limits")
+async def get_rate_limit_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get per-user quota stats.
+
+    Shows the limits per subscription tier, quota checks made, messages and
+    submissions refused, and whether counters are shared through Redis.
+    """
+    return rate_limiter.get_stats()
+
+
+@router.get("/system/llm-scheduler")
+async def get_llm_scheduler_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get LLM scheduling stats.
+
+    Shows calls granted, queued and timed out per priority class with their mean
+    and max wait, and the in-flight calls and queue depth of every provider.
+    """
+    return llm_scheduler.get_stats()
+
+
+@router.get("/system/query-profiler")
+async def get_query_profiler_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get per-route SQL statement counts and slow-request samples.
+
+    Routes show mean and max statements per request and how many requests
+    repeated a statement (possible N+1); samples list the slowest statements
+    of slow requests. Empty unless QUERY_PROFILER_ENABLED is set.
+    """
+    return query_profiler.get_stats()
+
+
+@router.get("/system/model-routing")
+async def get_model_routing_stats(admin: bool = Depends(verify_admin_key)):
+    """
+    Get live model latency and routing counters.
+
+    Includes p50/p95 latency and error rate per model, failovers and hedged
+    requests per activity, and the telemetry the optimizer learns from.
+    """
+    return {**model_latency_tracker.get_stats(), "telemetry": model_telemetry.get_stats()}
+
+
+@router.get("/system/circuit-breakers")
+async def get_circuit_breakers(admin: bool = Depends(verify_admin_key)):
+    """
+    Get the LLM circuit breaker of each model.
+
+    Shows state (closed, open, half_open), trip counts and calls rejected while open.
+    """
+    return {"breakers": circuit_breakers.get_stats()}
+
+
+@router.post("/system/circuit-breakers/{model_id}/reset")
+async def reset_circuit_breaker(model_id: str, admin: bool = Depends(verify_admin_key)):
+    """
+    Force a model's circuit breaker closed.
+    """
+    if not circuit_breakers.reset(model_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Circuit breaker não encontrado"
+        )
+
+    logger.info(f"Circuit breaker for {model_id} reset by admin")
+    return {"message": f"Circuit breaker de {model_id} reiniciado"}
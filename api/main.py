@@ -5,14 +5,25 @@ Provides REST API endpoints for WhatsApp webhook integration and dashboard acces
 
 from fastapi import FastAPI, HTTPException, Depends, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, Response
 from pydantic import BaseModel, Field
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Union
+import asyncio
 import logging
+import secrets
+import time
 from datetime import datetime
 
 from core.config import settings
 from core.database import init_db, close_db, get_db, SessionLocal
+from core.metrics import metrics
+from core.query_profiler import query_profiler
 from core.models import User, Submission
+from core.whatsapp import SenderOverloadedError, whatsapp_sender
+from core.message_worker import message_worker_pool, persist_inbound_message
+from core.rate_limiter import rate_limiter, limit_message
+from core.session_store import session_store
+from core.usage_ledger import usage_ledger, usage_scope
 from maestro import maestro
 from sqlalchemy.orm import Session
 
@@ -24,6 +35,9 @@ from api.admin import router as admin_router
 # Configure logging
 logger = logging.getLogger(__name__)
 
+# Longest the webhook waits for room in a full outbound queue before dropping a limit reply
+LIMIT_REPLY_WAIT_SECONDS = 0.05
+
 # Create FastAPI app
 app = FastAPI(
     title="DET Flow API",
@@ -41,6 +55,41 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    """Time API requests per route template (not per raw path, to bound label cardinality)."""
+    if not metrics.enabled:
+        return await call_next(request)
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    metrics.observe(
+        "det_http_server_seconds", time.perf_counter() - start,
+        method=request.method, route=getattr(route, "path", "unmatched"), status=response.status_code
+    )
+    return response
+
+
+@app.middleware("http")
+async def profile_request_queries(request: Request, call_next):
+    """Count and time the SQL of each request when the query profiler is on (or a test captures)."""
+    if not query_profiler.active:
+        return await call_next(request)
+    start = time.perf_counter()
+    started = query_profiler.start_request(f"{request.method} {request.url.path}")
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        query_profiler.finish_request(
+            started, f"{request.method} {getattr(route, 'path', 'unmatched')}", status_code, time.perf_counter() - start
+        )
+
+
 # Include API routers
 app.include_router(auth_router)
 app.include_router(payments_router)
@@ -55,6 +104,7 @@ class WhatsAppMessage(BaseModel):
     message: str = Field(..., description="Message text")
     instance: Optional[str] = Field(None, description="Evolution API instance name")
     session_id: Optional[str] = Field(None, description="Session ID for conversation continuity")
+    message_id: Optional[str] = Field(None, description="Provider message ID used for deduplication")
 
 
 class WhatsAppResponse(BaseModel):
@@ -71,15 +121,18 @@ class SubmissionRequest(BaseModel):
     task_type: str
     task_prompt: str
     response_text: str
+    reference_answer: Optional[Union[str, List[str]]] = None  # Objective tasks are scored without the LLM
 
 
 class SubmissionResponse(BaseModel):
     """Submission evaluation response."""
     submission_id: int
-    overall_score: int
-    subscores: Dict[str, int]
+    overall_score: Optional[int] = None  # None while only a provisional estimate exists
+    subscores: Dict[str, int] = {}
     feedback: str
-    cefr_level: str
+    cefr_level: Optional[str] = None
+    provisional_score: Optional[int] = None  # Interim lexical estimate when the full evaluation failed
+    remaining_submissions: Optional[int] = None  # Daily quota left (None = unlimited)
 
 
 # ==================== Startup/Shutdown Events ====================
@@ -90,6 +143,9 @@ async def startup_event():
     try:
         logger.info("Initializing DET Flow API...")
         init_db()
+        metrics.configure_opentelemetry()
+        if settings.webhook_fast_ack:
+            await message_worker_pool.start(processor=maestro.process_user_message)
         logger.info("DET Flow API started successfully")
     except Exception as e:
         logger.error(f"Error during startup: {e}")
@@ -101,6 +157,10 @@ async def shutdown_event():
     """Clean up resources on shutdown."""
     try:
         logger.info("Shutting down DET Flow API...")
+        await message_worker_pool.stop()
+        await whatsapp_sender.close()
+        session_store.close()
+        usage_ledger.close()
         close_db()
         logger.info("DET Flow API shutdown complete")
     except Exception as e:
@@ -141,6 +201,24 @@ async def health_check():
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics(authorization: Optional[str] = Header(None)):
+    """
+    Hot-path metrics in the Prometheus text format.
+
+    Scrapers send METRICS_TOKEN as a bearer token; without a token configured the
+    endpoint is only open in development.
+    """
+    if settings.metrics_token:
+        if not secrets.compare_digest(authorization or "", f"Bearer {settings.metrics_token}"):
+            raise HTTPException(status_code=401, detail="Invalid metrics token")
+    elif not settings.is_development:
+        raise HTTPException(status_code=403, detail="Set METRICS_TOKEN to scrape metrics outside development")
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.post("/webhook/whatsapp", response_model=WhatsAppResponse)
 async def whatsapp_webhook(
     message: WhatsAppMessage,
@@ -150,10 +228,71 @@ async def whatsapp_webhook(
     Webhook endpoint for receiving WhatsApp messages from Evolution API.
 
     This endpoint receives messages from Evolution API and processes them through the Maestro.
+    With WEBHOOK_FAST_ACK enabled the message is persisted and acknowledged immediately;
+    the reply is pushed later through the outbound sender.
     """
+    claimed = False
     try:
         logger.info(f"Received WhatsApp message from {message.phone}")
 
+        # Evolution/WhatsApp redeliveries are acknowledged without reprocessing
+        claimed = message_worker_pool.accept(message.message_id)
+        if not claimed:
+            logger.info(f"Duplicate WhatsApp message {message.message_id} from {message.phone} ignored")
+            return WhatsAppResponse(
+                phone=message.phone,
+                message="",
+                success=True,
+                metadata={"duplicate": True, "message_id": message.message_id}
+            )
+
+        # Flood limit and daily submission quota, before any database or LLM work
+        quota = rate_limiter.check_message(
+            message.phone, is_submission=maestro.interface.detect_intent(message.message) == "submit"
+        )
+        if not quota.allowed:
+            logger.info(f"Rate limited {message.phone} ({quota.scope}), retry in {quota.retry_after}s")
+            reply = limit_message(quota)
+            metadata = {"rate_limited": quota.scope, "retry_after": quota.retry_after}
+            if message_worker_pool.is_running:
+                try:
+                    await whatsapp_sender.enqueue_text(message.phone, reply, wait_timeout=LIMIT_REPLY_WAIT_SECONDS)
+                except SenderOverloadedError:
+                    # The sender is still busy with this phone's replies; the ack must not wait
+                    logger.info(f"Outbound queue full for {message.phone}, rate limit reply dropped")
+                return WhatsAppResponse(phone=message.phone, message="", success=True, metadata=metadata)
+            return WhatsAppResponse(phone=message.phone, message=reply, success=True, metadata=metadata)
+
+        if message_worker_pool.is_running:
+            # Blocking commit: keep it off the event loop so other acks are not held up
+            inbound_id = await asyncio.to_thread(
+                persist_inbound_message,
+                phone_number=message.phone,
+                message_text=message.message,
+                session_id=message.session_id,
+                provider_message_id=message.message_id
+            )
+            if inbound_id is not None:
+                message_worker_pool.submit(
+                    phone_number=message.phone,
+                    message_text=message.message,
+                    session_id=message.session_id,
+                    inbound_id=inbound_id
+                )
+
+            return WhatsAppResponse(
+                phone=message.phone,
+                message="",
+                success=True,
+                metadata={
+                    "queued": inbound_id is not None,
+                    "duplicate": inbound_id is None,
+                    "inbound_id": inbound_id,
+                    "timestamp": datetime.now().isoformat(),
+                    "session_id": message.session_id
+                }
+            )
+
         # Process message through Maestro
         result = maestro.process_user_message(
             phone_number=message.phone,
@@ -168,7 +307,7 @@ async def whatsapp_webhook(
             success=True,
             metadata={
                 "timestamp": datetime.now().isoformat(),
-                "session_id": message.session_id
+                "session_id": result.get("session_id", message.session_id)
             }
         )
 
@@ -177,6 +316,9 @@ async def whatsapp_webhook(
 
     except Exception as e:
         logger.error(f"Error processing WhatsApp webhook: {e}")
+        if claimed and message.message_id:
+            # Nothing was stored or answered: let the provider's redelivery through
+            message_worker_pool.deduplicator.release(message.message_id)
         return WhatsAppResponse(
             phone=message.phone,
             message="Desculpe, ocorreu um erro ao processar sua mensagem. Por favor, tente novamente.",
@@ -188,19 +330,38 @@ async def whatsapp_webhook(
 @app.post("/api/submissions", response_model=SubmissionResponse)
 async def create_submission(
     submission: SubmissionRequest,
+    response: Response,
     db: Session = Depends(get_db)
 ):
     """
     Direct API endpoint for creating and evaluating submissions.
 
     Alternative to WhatsApp webhook for web dashboard or mobile app integration.
+    Returns 429 with Retry-After once the user's daily submission quota is used.
     """
-    try:
-        # Get user
-        user = db.query(User).filter(User.id == submission.user_id).first()
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
+    user = db.query(User).filter(User.id == submission.user_id).first()
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # Daily quota, before any LLM work. Keyed by phone number like the WhatsApp
+    # webhook, so a student has one quota across both channels
+    rate_limiter.remember_tier(user.phone_number, user.subscription_tier)
+    quota = rate_limiter.check_submission(user.phone_number)
+    if not quota.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Daily submission limit of {quota.limit} reached",
+            headers={
+                "Retry-After": str(int(quota.retry_after)),
+                "X-RateLimit-Limit": str(quota.limit),
+                "X-RateLimit-Remaining": "0"
+            }
+        )
+    if quota.limit is not None:
+        response.headers["X-RateLimit-Limit"] = str(quota.limit)
+        response.headers["X-RateLimit-Remaining"] = str(quota.remaining)
 
+    try:
         # Create submission record
         db_submission = Submission(
             user_id=user.id,
@@ -215,39 +376,51 @@ async def create_submission(
         db.refresh(db_submission)
 
         # Evaluate using Maestro's evaluator
-        evaluation = maestro.evaluator.evaluate_submission(
-            task_type=submission.task_type,
-            task_prompt=submission.task_prompt,
-            response_text=submission.response_text,
-            user_level=user.current_level
-        )
+        with usage_scope(user.id, user.subscription_tier):
+            evaluation = maestro.evaluator.evaluate_submission(
+                task_type=submission.task_type,
+                task_prompt=submission.task_prompt,
+                response_text=submission.response_text,
+                user_level=user.current_level,
+                reference_answer=submission.reference_answer
+            )
 
         # Update submission with results
-        db_submission.overall_score = evaluation.get("overall_score")
-        db_submission.literacy_score = evaluation.get("subscores", {}).get("literacy")
-        db_submission.comprehension_score = evaluation.get("subscores", {}).get("comprehension")
-        db_submission.conversation_score = evaluation.get("subscores", {}).get("conversation")
-        db_submission.production_score = evaluation.get("subscores", {}).get("production")
+        # A provisional estimate (LLM unavailable) is kept in the feedback, not as the score
+        scored = {} if evaluation.get("provisional") else evaluation
+        db_submission.overall_score = scored.get("overall_score")
+        db_submission.literacy_score = scored.get("subscores", {}).get("literacy")
+        db_submission.comprehension_score = scored.get("subscores", {}).get("comprehension")
+        db_submission.conversation_score = scored.get("subscores", {}).get("conversation")
+        db_submission.production_score = scored.get("subscores", {}).get("production")
         db_submission.feedback = evaluation
         db_submission.evaluator_comments = evaluation.get("feedback")
         db_submission.evaluated_at = datetime.now()
-        db_submission.status = "completed"
+        db_submission.status = "provisional" if evaluation.get("provisional") else "completed"
+        remaining = quota.remaining
+        if evaluation.get("provisional"):
+            rate_limiter.refund_submission(user.phone_number)  # No final score: the retry is on us
+            remaining = None if remaining is None else remaining + 1
 
         user.total_submissions += 1
 
         db.commit()
+        maestro.update_plan_progress(db, db_submission)
 
         # Return response
         return SubmissionResponse(
             submission_id=db_submission.id,
-            overall_score=evaluation.get("overall_score"),
-            subscores=evaluation.get("subscores"),
+            overall_score=scored.get("overall_score"),
+            subscores=scored.get("subscores", {}),
             feedback=evaluation.get("feedback"),
-            cefr_level=evaluation.get("cefr_level")
+            cefr_level=scored.get("cefr_level"),
+            provisional_score=evaluation.get("overall_score") if evaluation.get("provisional") else None,
+            remaining_submissions=remaining
         )
 
     except Exception as e:
         logger.error(f"Error creating submission: {e}")
+        rate_limiter.refund_submission(user.phone_number)  # Nothing was evaluated
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""
+DET Flow - Evaluator Regression Harness
+Runs a labeled corpus of graded DET responses through an EvaluatorAgent configuration
+(model, system prompt and any setting such as the cascade or lexical hints) with
+bounded concurrency, and reports scoring accuracy against the reference scores
+together with parse failures, latency and tokens per evaluation, so prompt and model
+changes can be compared before they ship.
+
+Usage:
+    python -m benchmarks.evaluator_harness --model gpt-4o-mini --concurrency 4 \
+        --output reports/evaluator/gpt-4o-mini.json
+    python -m benchmarks.evaluator_harness --system-prompt prompts/evaluator_v2.txt --label prompt-v2
+    python -m benchmarks.evaluator_harness --set evaluation_cascade_enabled=true --set lexical_hints_enabled=false
+    python -m benchmarks.evaluator_harness --cassette benchmarks/data/maestro_cassette.json   # offline dry run
+"""
+
+from typing import Any, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import hashlib
+import json
+import logging
+import sys
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from core.config import settings
+from agents.model_provider import extract_usage
+from agents.schemas import cefr_for_score
+from agents.structured_output import structured_output_stats
+from benchmarks.replay import Cassette, current_commit, percentile
+from benchmarks.semantic_cache_eval import DEFAULT_CORPUS, load_corpus
+
+logger = logging.getLogger(__name__)
+
+EVALUATION_ACTIVITIES = ("evaluation", "evaluation_triage")
+
+# Settings applied unless overridden: caching would reuse grades across the corpus and
+# usage rows have no database to go to
+DEFAULT_OVERRIDES: Dict[str, Any] = {
+    "semantic_cache_enabled": False,
+    "usage_tracking_enabled": False,
+    "model_agreement_sample_rate": 0.0,
+}
+
+
+class _UsageMeter:
+    """Tokens of the model calls made by the current worker thread."""
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def reset(self) -> None:
+        self._local.usage = {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+
+    def add(self, response: Any, model_id: str) -> None:
+        usage = extract_usage(response, model_id)
+        current = getattr(self._local, "usage", None)
+        if current is None:
+            self.reset()
+            current = self._local.usage
+        current["calls"] += 1
+        current["input_tokens"] += usage["input_tokens"]
+        current["output_tokens"] += usage["output_tokens"]
+
+    def take(self) -> Dict[str, int]:
+        usage = getattr(self._local, "usage", None) or {"calls": 0, "input_tokens": 0, "output_tokens": 0}
+        self.reset()
+        return usage
+
+
+class _MeteredAgent:
+    def __init__(self, agent: Any, model_id: str, meter: _UsageMeter):
+        self.agent = agent
+        self.model_id = model_id
+        self.meter = meter
+
+    def run(self, prompt: str, **kwargs) -> Any:
+        response = self.agent.run(prompt, **kwargs)
+        self.meter.add(response, self.model_id)
+        return response
+
+
+def parse_overrides(pairs: List[str]) -> Dict[str, Any]:
+    """
+    Turn KEY=VALUE pairs into settings values typed like the current setting.
+
+    Raises:
+        ValueError: Unknown setting or malformed pair
+    """
+    overrides: Dict[str, Any] = {}
+    for pair in pairs:
+        key, sep, raw = pair.partition("=")
+        key = key.strip().lower()
+        if not sep or not hasattr(settings, key):
+            raise ValueError(f"Unknown setting override: {pair}")
+        current = getattr(settings, key)
+        if isinstance(current, bool):
+            value: Any = raw.strip().lower() in ("1", "true", "yes", "on")
+        elif isinstance(current, int):
+            value = int(raw)
+        elif isinstance(current, float):
+            value = float(raw)
+        else:
+            value = raw
+        overrides[key] = value
+    return overrides
+
+
+def build_evaluator(
+    meter: _UsageMeter,
+    model: Optional[str] = None,
+    system_prompt: Optional[str] = None,
+    cassette: Optional[Cassette] = None
+):
+    """
+    Create an EvaluatorAgent for the configuration under test.
+
+    Args:
+        meter: Collects the tokens of every model call
+        model: Only grade with this catalog model (no failover, no re-ranking)
+        system_prompt: Replacement evaluator instructions
+        cassette: Answer model calls from recorded outputs instead of the live models
+
+    Returns:
+        The configured EvaluatorAgent
+    """
+    from agents.evaluator import EvaluatorAgent
+
+    evaluator = EvaluatorAgent()
+    if system_prompt is not None:
+        evaluator.system_prompt = system_prompt
+
+    for router in (evaluator.router, evaluator.triage_router):
+        if router is None:
+            continue
+        factory = cassette.factory_for(router.activity, router.agent_factory) if cassette else router.agent_factory
+        router.agent_factory = lambda model_id, factory=factory: _MeteredAgent(factory(model_id), model_id, meter)
+        router._agents.clear()  # Rebuilt with the new prompt and meter
+        router.hedging_enabled = False  # Hedged calls would run on other threads and blur the metrics
+        if model is not None and router is evaluator.router:
+            router.candidates = [model]
+            router.optimizer = None
+    return evaluator
+
+
+def evaluate_corpus(evaluator: Any, corpus: List[Dict[str, Any]], meter: _UsageMeter, concurrency: int) -> List[Dict[str, Any]]:
+    """
+    Grade every item with at most `concurrency` evaluations in flight.
+
+    Returns:
+        One row per item with predicted and reference scores, errors, latency and tokens
+    """
+    def grade(item: Dict[str, Any]) -> Dict[str, Any]:
+        meter.reset()
+        start = time.perf_counter()
+        result = evaluator.evaluate_submission(
+            task_type=item["task_type"],
+            task_prompt=item["task_prompt"],
+            response_text=item["response_text"],
+            user_level=item.get("user_level"),
+            reference_answer=item.get("reference_answer")
+        )
+        latency_ms = (time.perf_counter() - start) * 1000
+        usage = meter.take()
+
+        reference_cefr = item.get("reference_cefr") or cefr_for_score(item["reference_score"])
+        failed = "error" in result
+        predicted = None if failed else result.get("overall_score")
+        return {
+            "id": item.get("id"),
+            "task_type": item["task_type"],
+            "reference": item["reference_score"],
+            "predicted": predicted,
+            "error": abs(predicted - item["reference_score"]) if predicted is not None else None,
+            "reference_cefr": reference_cefr,
+            "predicted_cefr": None if failed else result.get("cefr_level"),
+            "failed": failed,
+            "failure": result.get("error") if failed else None,
+            "evaluation_tier": result.get("evaluation_tier"),
+            "latency_ms": round(latency_ms, 1),
+            "calls": usage["calls"],
+            "input_tokens": usage["input_tokens"],
+            "output_tokens": usage["output_tokens"],
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="eval-harness") as executor:
+        return list(executor.map(grade, corpus))
+
+
+def summarize(rows: List[Dict[str, Any]], elapsed: float, outcomes: Dict[str, int]) -> Dict[str, Any]:
+    """
+    Accuracy, reliability and cost of a set of graded rows.
+
+    Args:
+        rows: Rows from evaluate_corpus
+        elapsed: Wall time of the run in seconds
+        outcomes: Structured output outcomes (native, parsed, repaired, reasked, failed) of the run
+
+    Returns:
+        MAE, CEFR agreement, parse-failure and error rates, latency percentiles and tokens
+    """
+    graded = [row for row in rows if not row["failed"]]
+    errors = [row["error"] for row in graded]
+    latencies = [row["latency_ms"] for row in rows]
+    parsed_calls = sum(outcomes.values())
+
+    def mean(values: List[float]) -> Optional[float]:
+        return round(sum(values) / len(values), 2) if values else None
+
+    return {
+        "items": len(rows),
+        "graded": len(graded),
+        "mae": mean(errors),
+        "max_error": max(errors, default=None),
+        "within_10_points": round(sum(1 for e in errors if e <= 10) / len(errors), 4) if errors else None,
+        "cefr_agreement": (
+            round(sum(row["predicted_cefr"] == row["reference_cefr"] for row in graded) / len(graded), 4) if graded else None
+        ),
+        "error_rate": round((len(rows) - len(graded)) / len(rows), 4) if rows else 0.0,
+        "parse_failure_rate": round(outcomes.get("failed", 0) / parsed_calls, 4) if parsed_calls else 0.0,
+        "parse_outcomes": outcomes,
+        "latency_ms": {
+            "p50": percentile(latencies, 0.5),
+            "p95": percentile(latencies, 0.95),
+            "mean": mean(latencies),
+        },
+        "tokens_per_evaluation": {
+            "input": mean([row["input_tokens"] for row in rows]),
+            "output": mean([row["output_tokens"] for row in rows]),
+            "calls": mean([row["calls"] for row in rows]),
+        },
+        "throughput_per_second": round(len(rows) / elapsed, 3) if elapsed else None,
+    }
+
+
+def _outcome_counts() -> Dict[str, int]:
+    stats = structured_output_stats.get_stats()
+    counts: Dict[str, int] = {}
+    for activity in EVALUATION_ACTIVITIES:
+        for outcome, value in stats.get(activity, {}).items():
+            if outcome not in ("total", "parse_failure_rate"):
+                counts[outcome] = counts.get(outcome, 0) + value
+    return counts
+
+
+def run_harness(
+    corpus: List[Dict[str, Any]],
+    model: Optional[str] = None,
+    system_prompt: Optional[str] = None,
+    overrides: Optional[Dict[str, Any]] = None,
+    concurrency: int = 4,
+    cassette: Optional[Cassette] = None,
+    label: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Grade the corpus with one evaluator configuration.
+
+    Settings overrides apply while the run lasts and are restored afterwards.
+
+    Returns:
+        Report with the configuration, overall and per task type summaries, and every row
+    """
+    applied = {**DEFAULT_OVERRIDES, **(overrides or {})}
+    previous = {key: getattr(settings, key) for key in applied}
+    for key, value in applied.items():
+        setattr(settings, key, value)
+
+    try:
+        meter = _UsageMeter()
+        evaluator = build_evaluator(meter, model=model, system_prompt=system_prompt, cassette=cassette)
+        outcomes_before = _outcome_counts()
+        started = time.perf_counter()
+        rows = evaluate_corpus(evaluator, corpus, meter, concurrency)
+        elapsed = time.perf_counter() - started
+        outcomes_after = _outcome_counts()
+    finally:
+        for key, value in previous.items():
+            setattr(settings, key, value)
+
+    outcomes = {key: value - outcomes_before.get(key, 0) for key, value in outcomes_after.items()}
+    prompt = evaluator.system_prompt
+    return {
+        "label": label or model or "default",
+        "commit": current_commit(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "config": {
+            "model": model or evaluator.router.primary_model,
+            "system_prompt_sha256": hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16],
+            "system_prompt_chars": len(prompt),
+            "overrides": applied,
+            "concurrency": concurrency,
+            "cassette": cassette is not None,
+        },
+        "summary": summarize(rows, elapsed, outcomes),
+        "by_task_type": {
+            task_type: summarize([row for row in rows if row["task_type"] == task_type], elapsed, {})
+            for task_type in sorted({row["task_type"] for row in rows})
+        },
+        "rows": rows,
+    }
+
+
+def main():
+    """Grade the corpus with the requested configuration and write the JSON report."""
+    parser = argparse.ArgumentParser(description="Evaluator accuracy, reliability and cost on a graded corpus")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="Graded responses (JSONL)")
+    parser.add_argument("--model", help="Catalog model to grade with (default: the optimizer's choice)")
+    parser.add_argument("--system-prompt", type=Path, help="File with replacement evaluator instructions")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE",
+                        help="Setting override, e.g. evaluation_cascade_enabled=true (repeatable)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Evaluations in flight")
+    parser.add_argument("--cassette", type=Path, help="Answer from recorded outputs instead of the live models")
+    parser.add_argument("--label", help="Name of the configuration in the report")
+    parser.add_argument("--output", type=Path, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    report = run_harness(
+        load_corpus(args.corpus),
+        model=args.model,
+        system_prompt=args.system_prompt.read_text(encoding="utf-8") if args.system_prompt else None,
+        overrides=parse_overrides(args.overrides),
+        concurrency=args.concurrency,
+        cassette=Cassette.load(args.cassette) if args.cassette else None,
+        label=args.label,
+    )
+
+    summary = report["summary"]
+    print(
+        f"{report['label']} ({report['config']['model']}): MAE {summary['mae']}, "
+        f"CEFR agreement {summary['cefr_agreement']}, parse failures {summary['parse_failure_rate']:.1%}, "
+        f"errors {summary['error_rate']:.1%}, p50 {summary['latency_ms']['p50']} ms, "
+        f"p95 {summary['latency_ms']['p95']} ms, "
+        f"{summary['tokens_per_evaluation']['input']} in / {summary['tokens_per_evaluation']['output']} out tokens"
+    )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"corpus": str(args.corpus), **report}, indent=2))
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+DET Flow - Maestro Replay Benchmark
+Deterministic performance harness for the WhatsApp pipeline. A seeded mix of traffic
+(greetings, submissions, plan requests, progress checks and questions) is replayed
+through the Maestro and through the FastAPI app against a seeded SQLite database, with
+every model call answered from a cassette of recorded agent outputs. Reports
+throughput, latency percentiles, database statements and allocations per turn, and
+stores each run under the current commit so runs can be compared.
+
+Usage:
+    python -m benchmarks.replay --turns 300 --seed 7
+    python -m benchmarks.replay --compare 1a2b3c4            # deltas against a stored run
+    python -m benchmarks.replay --record --turns 40          # re-record the cassette (live models)
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import json
+import logging
+import math
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine
+
+from core.config import settings
+from core.database import Base, SessionLocal
+from core.models import StudyPlan, Submission, User
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CASSETTE = Path(__file__).parent / "data" / "maestro_cassette.json"
+DEFAULT_OUTPUT_DIR = Path(__file__).parent / "results" / "replay"
+
+# Share of each kind of turn in the replayed traffic
+DEFAULT_MIX: Dict[str, float] = {
+    "greeting": 0.2,
+    "submission": 0.35,
+    "plan": 0.15,
+    "progress": 0.15,
+    "question": 0.15,
+}
+
+# Messages per kind, written to hit the Interface Agent keyword intents
+MESSAGES: Dict[str, List[str]] = {
+    "greeting": ["Oi, bom dia!", "Olá! Tudo bem?", "Boa noite 👋"],
+    "submission": [
+        "Pode corrigir minha resposta? In this picture I can see a family having a picnic in a park. They are sitting on a blanket and the weather is sunny.",
+        "Quero avaliar este texto: The photo shows a busy street with many cars and people walking. Some shops are open and a man is selling fruit.",
+        "Corrigir por favor: There is a kitchen with a woman cooking. She is cutting vegetables and the water is boiling on the stove.",
+    ],
+    "plan": ["Quero um plano de estudos para o DET", "Monta um cronograma pra mim?", "Me mostra a semana 2 do meu plano"],
+    "progress": ["Qual é o meu progresso?", "Quero ver minha evolução", "Minhas pontuações recentes"],
+    "question": ["Tenho uma dúvida sobre o teste", "O que é o Read and Select?", "Como funciona a nota do DET?"],
+}
+
+TIERS = ("free", "free", "free", "premium", "pro")
+LEVELS = ("A2", "B1", "B1", "B2", "C1")
+
+# Threads that write in the background; their statements are not charged to turns
+BACKGROUND_THREADS = ("usage-writer", "session-flusher", "plan-adjust", "plan-prefetch")
+
+
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile (q in 0-1)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    """Mean, p50, p90, p95, p99 and max of latencies in milliseconds."""
+    if not values:
+        return {"mean": None, "p50": None, "p90": None, "p95": None, "p99": None, "max": None}
+    return {
+        "mean": round(sum(values) / len(values), 2),
+        **{f"p{int(q * 100)}": round(percentile(values, q), 2) for q in (0.5, 0.9, 0.95, 0.99)},
+        "max": round(max(values), 2),
+    }
+
+
+# ==================== Cassette ====================
+
+class RecordedResponse:
+    """Agent run output replayed from the cassette."""
+
+    def __init__(self, content: str, metrics: Optional[Dict[str, int]] = None):
+        self.content = content
+        self.metrics = metrics or {}
+        self.status = "COMPLETED"
+
+
+class Cassette:
+    """
+    Recorded agent outputs per activity.
+
+    In replay mode each activity's recordings are served in order, wrapping around,
+    so a run with the same traffic always gets the same answers. In record mode calls
+    go to the live agents and their outputs are appended.
+    """
+
+    def __init__(self, activities: Optional[Dict[str, List[Dict[str, Any]]]] = None, record: bool = False):
+        self.activities = activities or {}
+        self.record = record
+        self.served: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: Path, record: bool = False) -> "Cassette":
+        if record and not path.exists():
+            return cls(record=True)
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls({} if record else data["activities"], record=record)
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {"recorded_at": datetime.now().isoformat(timespec="seconds"), "activities": self.activities}
+        path.write_text(json.dumps(data, ensure_ascii=False, indent=2) + "\n", encoding="utf-8")
+
+    def factory_for(self, activity: str, live_factory: Callable[[str], Any]) -> Callable[[str], Any]:
+        """Agent factory for a router: replaying, or recording around the live agents."""
+        if self.record:
+            return lambda model_id: _RecordingAgent(self, activity, live_factory(model_id))
+        return lambda model_id: _CassetteAgent(self, activity)
+
+    def next_response(self, activity: str) -> RecordedResponse:
+        with self._lock:
+            recordings = self.activities.get(activity)
+            if not recordings:
+                raise KeyError(f"Cassette has no recordings for activity '{activity}'")
+            index = self.served.get(activity, 0)
+            self.served[activity] = index + 1
+            recording = recordings[index % len(recordings)]
+        return RecordedResponse(recording["content"], recording.get("metrics"))
+
+    def append(self, activity: str, response: Any) -> None:
+        metrics = getattr(response, "metrics", None) or {}
+        tokens = {}
+        for name in ("input_tokens", "output_tokens"):
+            value = metrics.get(name) if isinstance(metrics, dict) else getattr(metrics, name, None)
+            tokens[name] = int(sum(value) if isinstance(value, list) else value or 0)
+        content = getattr(response, "content", response)
+        if not isinstance(content, str):
+            content = content.model_dump_json() if hasattr(content, "model_dump_json") else json.dumps(content)
+        with self._lock:
+            self.activities.setdefault(activity, []).append({"content": content, "metrics": tokens})
+
+
+class _CassetteAgent:
+    def __init__(self, cassette: Cassette, activity: str):
+        self.cassette = cassette
+        self.activity = activity
+
+    def run(self, prompt: str, **kwargs) -> RecordedResponse:
+        return self.cassette.next_response(self.activity)
+
+
+class _RecordingAgent:
+    def __init__(self, cassette: Cassette, activity: str, agent: Any):
+        self.cassette = cassette
+        self.activity = activity
+        self.agent = agent
+
+    def run(self, prompt: str, **kwargs) -> Any:
+        response = self.agent.run(prompt, **kwargs)
+        self.cassette.append(self.activity, response)
+        return response
+
+
+def install_cassette(maestro: Any, cassette: Cassette) -> int:
+    """
+    Point every model router of the Maestro's agents at the cassette.
+
+    Hedging is turned off so each turn makes the same calls on every run.
+
+    Returns:
+        Number of routers patched
+    """
+    from agents.model_router import ModelRouter
+
+    patched = 0
+    for agent in (maestro.evaluator, maestro.pedagogue, maestro.interface):
+        for router in vars(agent).values():
+            if isinstance(router, ModelRouter):
+                router.agent_factory = cassette.factory_for(router.activity, router.agent_factory)
+                router._agents.clear()
+                router.hedging_enabled = False
+                patched += 1
+    return patched
+
+
+# ==================== Database fixture ====================
+
+def seed_database(path: Path, users: int, seed: int) -> Engine:
+    """
+    Create a SQLite database with students, past submissions and active study plans.
+
+    The global SessionLocal is bound to it, so every module (Maestro, session store,
+    usage ledger, API dependencies) uses the fixture.
+
+    Returns:
+        The fixture engine
+    """
+    rng = random.Random(seed)
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(engine)
+    SessionLocal.configure(bind=engine)
+
+    plan_data = None
+    cassette_plan = Cassette.load(DEFAULT_CASSETTE).activities.get("study_plan")
+    if cassette_plan:
+        plan_data = json.loads(cassette_plan[0]["content"])
+
+    db = SessionLocal()
+    try:
+        now = datetime.now()
+        for index in range(users):
+            level = LEVELS[index % len(LEVELS)]
+            user = User(
+                phone_number=f"5511900{index:06d}",
+                name=f"Aluno {index}",
+                current_level=level,
+                target_score=rng.choice((100, 110, 120, 130)),
+                subscription_tier=TIERS[index % len(TIERS)],
+                total_submissions=0,
+                created_at=now - timedelta(days=30),
+                last_active=now - timedelta(days=rng.randint(0, 7)),
+            )
+            db.add(user)
+            db.flush()
+
+            for day in range(rng.randint(0, 8)):
+                score = rng.randint(60, 130)
+                db.add(Submission(
+                    user_id=user.id,
+                    task_type=rng.choice(("write_about_photo", "read_and_select", "listen_and_type")),
+                    task_prompt="Write about what you see in the photo.",
+                    response_text="Seeded response.",
+                    overall_score=score,
+                    literacy_score=score + rng.randint(-10, 10),
+                    comprehension_score=score + rng.randint(-10, 10),
+                    conversation_score=score + rng.randint(-10, 10),
+                    production_score=score + rng.randint(-10, 10),
+                    status="completed",
+                    created_at=now - timedelta(days=day + 1),
+                    evaluated_at=now - timedelta(days=day + 1),
+                ))
+                user.total_submissions += 1
+
+            if plan_data and index % 3 == 0:
+                db.add(StudyPlan(
+                    user_id=user.id,
+                    title=plan_data["plan_title"],
+                    plan_data=plan_data,
+                    duration_weeks=plan_data["duration_weeks"],
+                    is_active=True,
+                    start_date=now - timedelta(days=8),
+                    created_at=now - timedelta(days=8),
+                ))
+        db.commit()
+    finally:
+        db.close()
+    return engine
+
+
+class QueryCounter:
+    """Counts statements on the fixture engine, separating background writers."""
+
+    def __init__(self, engine: Engine):
+        self.turn_queries = 0
+        self.background_queries = 0
+        self._lock = threading.Lock()
+        event.listen(engine, "before_cursor_execute", self._count)
+
+    def _count(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        with self._lock:
+            if threading.current_thread().name.startswith(BACKGROUND_THREADS):
+                self.background_queries += 1
+            else:
+                self.turn_queries += 1
+
+
+# ==================== Traffic ====================
+
+def build_traffic(users: List[Dict[str, Any]], turns: int, seed: int, mix: Optional[Dict[str, float]] = None) -> List[Dict[str, Any]]:
+    """
+    Seeded list of turns.
+
+    Each turn has kind, phone, user_id, message and, for submissions, the API channel
+    ("webhook" or "rest" for /api/submissions) used when replaying through the app.
+    """
+    rng = random.Random(seed)
+    mix = mix or DEFAULT_MIX
+    kinds, weights = zip(*mix.items())
+    traffic = []
+    for _ in range(turns):
+        kind = rng.choices(kinds, weights)[0]
+        user = rng.choice(users)
+        traffic.append({
+            "kind": kind,
+            "phone": user["phone"],
+            "user_id": user["id"],
+            "message": rng.choice(MESSAGES[kind]),
+            "channel": rng.choice(("webhook", "rest")) if kind == "submission" else "webhook",
+        })
+    return traffic
+
+
+def _seeded_users() -> List[Dict[str, Any]]:
+    db = SessionLocal()
+    try:
+        return [{"id": user.id, "phone": user.phone_number} for user in db.query(User).order_by(User.id)]
+    finally:
+        db.close()
+
+
+# ==================== Replay ====================
+
+def _maestro_turn(maestro: Any) -> Callable[[Dict[str, Any]], bool]:
+    def run(turn: Dict[str, Any]) -> bool:
+        result = maestro.process_user_message(phone_number=turn["phone"], message=turn["message"])
+        return "error" not in result
+    return run
+
+
+def _api_turn(client: Any) -> Callable[[Dict[str, Any]], bool]:
+    headers = {"X-API-Key": settings.evolution_api_key}
+
+    def run(turn: Dict[str, Any]) -> bool:
+        if turn["channel"] == "rest":
+            response = client.post("/api/submissions", json={
+                "user_id": turn["user_id"],
+                "task_type": "write_about_photo",
+                "task_prompt": "Write about what you see in the photo.",
+                "response_text": turn["message"],
+            })
+            return response.status_code == 200
+        response = client.post("/webhook/whatsapp", headers=headers, json={
+            "phone": turn["phone"],
+            "message": turn["message"],
+        })
+        return response.status_code == 200 and response.json().get("success", False)
+    return run
+
+
+def replay(traffic: List[Dict[str, Any]], run_turn: Callable[[Dict[str, Any]], bool], counter: QueryCounter) -> Dict[str, Any]:
+    """
+    Replay turns one after the other, timing each and counting its statements.
+
+    Returns:
+        Throughput, latency percentiles and statement counts, overall and per kind
+    """
+    turns = []
+    started = time.perf_counter()
+    for turn in traffic:
+        queries_before = counter.turn_queries
+        start = time.perf_counter()
+        try:
+            ok = run_turn(turn)
+        except Exception as e:
+            logger.warning(f"Turn {turn['kind']} failed: {e}")
+            ok = False
+        turns.append({
+            "kind": turn["kind"],
+            "latency_ms": (time.perf_counter() - start) * 1000,
+            "queries": counter.turn_queries - queries_before,
+            "ok": ok,
+        })
+    elapsed = time.perf_counter() - started
+
+    def summarize(selected: List[Dict[str, Any]]) -> Dict[str, Any]:
+        queries = [t["queries"] for t in selected]
+        return {
+            "turns": len(selected),
+            "errors": sum(1 for t in selected if not t["ok"]),
+            "latency_ms": latency_summary([t["latency_ms"] for t in selected]),
+            "queries_per_turn": {
+                "mean": round(sum(queries) / len(queries), 2) if queries else None,
+                "max": max(queries, default=None),
+            },
+        }
+
+    return {
+        **summarize(turns),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_turns_per_second": round(len(turns) / elapsed, 2) if elapsed else None,
+        "by_kind": {kind: summarize([t for t in turns if t["kind"] == kind]) for kind in sorted({t["kind"] for t in turns})},
+    }
+
+
+def measure_allocations(traffic: List[Dict[str, Any]], run_turn: Callable[[Dict[str, Any]], bool]) -> Dict[str, Any]:
+    """
+    Replay turns with tracemalloc on, separately from the timed replay (tracing slows
+    everything down). Tracing restarts for every turn, so each turn reports only what it
+    allocated: peak and still-held bytes, in KiB.
+    """
+    per_kind: Dict[str, Dict[str, List[float]]] = {}
+    for turn in traffic:
+        tracemalloc.start()
+        try:
+            run_turn(turn)
+        except Exception as e:
+            logger.warning(f"Turn {turn['kind']} failed: {e}")
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        entry = per_kind.setdefault(turn["kind"], {"peak": [], "retained": []})
+        entry["peak"].append(peak / 1024)
+        entry["retained"].append(current / 1024)
+
+    def mean(values: List[float]) -> float:
+        return round(sum(values) / len(values), 1)
+
+    peaks = [v for entry in per_kind.values() for v in entry["peak"]]
+    return {
+        "turns": len(traffic),
+        "peak_kib_mean": mean(peaks) if peaks else None,
+        "peak_kib_p95": round(percentile(peaks, 0.95), 1) if peaks else None,
+        "by_kind": {
+            kind: {"peak_kib_mean": mean(entry["peak"]), "retained_kib_mean": mean(entry["retained"])}
+            for kind, entry in sorted(per_kind.items())
+        },
+    }
+
+
+# ==================== Results ====================
+
+def current_commit() -> str:
+    """Short commit hash, suffixed with -dirty when the tree has local changes."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], capture_output=True, text=True
+        ).stdout.strip()
+        return f"{commit}-dirty" if dirty else commit
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def store_report(report: Dict[str, Any], output_dir: Path) -> Path:
+    """Write the run under its commit and append a summary line to history.jsonl."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    path = output_dir / f"{report['commit']}.json"
+    path.write_text(json.dumps(report, indent=2) + "\n")
+
+    summary = {"commit": report["commit"], "created_at": report["created_at"]}
+    for target, result in report["targets"].items():
+        summary[target] = {
+            "throughput": result["throughput_turns_per_second"],
+            "p50_ms": result["latency_ms"]["p50"],
+            "p95_ms": result["latency_ms"]["p95"],
+            "queries_per_turn": result["queries_per_turn"]["mean"],
+        }
+    with open(output_dir / "history.jsonl", "a") as f:
+        f.write(json.dumps(summary) + "\n")
+    return path
+
+
+def compare_reports(baseline: Dict[str, Any], report: Dict[str, Any]) -> List[str]:
+    """Human-readable deltas of throughput, latency and statements per target."""
+    lines = [f"Compared with {baseline['commit']}:"]
+    for target, result in report["targets"].items():
+        base = baseline.get("targets", {}).get(target)
+        if not base:
+            continue
+        pairs = {
+            "throughput/s": (base["throughput_turns_per_second"], result["throughput_turns_per_second"]),
+            "p50 ms": (base["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            "p95 ms": (base["latency_ms"]["p95"], result["latency_ms"]["p95"]),
+            "p99 ms": (base["latency_ms"]["p99"], result["latency_ms"]["p99"]),
+            "queries/turn": (base["queries_per_turn"]["mean"], result["queries_per_turn"]["mean"]),
+        }
+        deltas = []
+        for name, (before, after) in pairs.items():
+            if before and after is not None:
+                deltas.append(f"{name} {before} -> {after} ({(after - before) / before:+.1%})")
+        lines.append(f"  {target}: " + ", ".join(deltas))
+    return lines
+
+
+def run_benchmark(
+    turns: int = 300,
+    users: int = 40,
+    seed: int = 7,
+    targets: tuple = ("maestro", "api"),
+    allocation_turns: int = 50,
+    cassette_path: Path = DEFAULT_CASSETTE,
+    record: bool = False
+) -> Dict[str, Any]:
+    """
+    Seed the fixture, install the cassette and replay the traffic through each target.
+
+    Returns:
+        Report with the configuration, per-target results, allocations and the
+        statements run by background writers
+    """
+    # Quotas would refuse the replayed submissions; the benchmark measures the pipeline
+    previous_bind, previous_rate_limit = SessionLocal.kw.get("bind"), settings.rate_limit_enabled
+    settings.rate_limit_enabled = False
+    try:
+        workdir = Path(tempfile.mkdtemp(prefix="det-replay-"))
+        engine = seed_database(workdir / "replay.db", users, seed)
+        counter = QueryCounter(engine)
+
+        from maestro import maestro
+        cassette = Cassette.load(cassette_path, record=record)
+        install_cassette(maestro, cassette)
+
+        runners = {"maestro": _maestro_turn(maestro)}
+        if "api" in targets:
+            from fastapi.testclient import TestClient
+            from api.main import app
+            runners["api"] = _api_turn(TestClient(app))
+
+        traffic = build_traffic(_seeded_users(), turns, seed)
+        report: Dict[str, Any] = {
+            "commit": current_commit(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "config": {"turns": turns, "users": users, "seed": seed, "mix": DEFAULT_MIX, "cassette": str(cassette_path)},
+            "targets": {},
+        }
+        for target in targets:
+            logger.info(f"Replaying {turns} turns through {target}")
+            report["targets"][target] = replay(traffic, runners[target], counter)
+
+        if allocation_turns:
+            report["allocations"] = measure_allocations(traffic[:allocation_turns], runners[targets[0]])
+
+        # Write-behind rows go to the fixture before the database is switched back
+        from core.session_store import session_store
+        from core.usage_ledger import usage_ledger
+        session_store.flush()
+        usage_ledger.flush()
+        report["background_queries"] = counter.background_queries
+        report["cassette_calls"] = dict(cassette.served)
+    finally:
+        SessionLocal.configure(bind=previous_bind)
+        settings.rate_limit_enabled = previous_rate_limit
+
+    if record:
+        cassette.save(cassette_path)
+        logger.info(f"Cassette written to {cassette_path}")
+    return report
+
+
+def main():
+    """Run the replay benchmark, store the report and print a summary."""
+    parser = argparse.ArgumentParser(description="Deterministic replay benchmark of the Maestro pipeline")
+    parser.add_argument("--turns", type=int, default=300, help="Turns replayed per target")
+    parser.add_argument("--users", type=int, default=40, help="Students in the database fixture")
+    parser.add_argument("--seed", type=int, default=7, help="Seed of the fixture and traffic")
+    parser.add_argument("--target", choices=["maestro", "api", "both"], default="both")
+    parser.add_argument("--allocation-turns", type=int, default=50, help="Turns replayed with tracemalloc (0 = skip)")
+    parser.add_argument("--cassette", type=Path, default=DEFAULT_CASSETTE, help="Recorded agent outputs")
+    parser.add_argument("--record", action="store_true", help="Call the live models and write a new cassette")
+    parser.add_argument("--output-dir", type=Path, default=DEFAULT_OUTPUT_DIR, help="Where runs are stored per commit")
+    parser.add_argument("--compare", help="Commit (or report path) to compare with")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    targets = ("maestro", "api") if args.target == "both" else (args.target,)
+    report = run_benchmark(
+        turns=args.turns,
+        users=args.users,
+        seed=args.seed,
+        targets=targets,
+        allocation_turns=args.allocation_turns,
+        cassette_path=args.cassette,
+        record=args.record,
+    )
+    path = store_report(report, args.output_dir)
+
+    for target, result in report["targets"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{target}: {result['throughput_turns_per_second']} turns/s, "
+            f"p50 {latency['p50']} ms, p95 {latency['p95']} ms, p99 {latency['p99']} ms, "
+            f"{result['queries_per_turn']['mean']} queries/turn, {result['errors']} errors"
+        )
+    if "allocations" in report:
+        print(f"allocations: {report['allocations']['peak_kib_mean']} KiB peak per turn (mean)")
+    print(f"Report written to {path}")
+
+    if args.compare:
+        baseline_path = Path(args.compare)
+        if not baseline_path.exists():
+            baseline_path = args.output_dir / f"{args.compare}.json"
+        baseline = json.loads(baseline_path.read_text())
+        print("\n".join(compare_reports(baseline, report)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+DET Flow - Semantic Cache Evaluation
+Offline harness that replays a graded corpus through the semantic evaluation cache
+and reports, per threshold pair, how many LLM tokens the cache would save and how much
+scoring accuracy that costs.
+
+Usage:
+    python -m benchmarks.semantic_cache_eval --corpus benchmarks/data/graded_responses.jsonl \
+        --thresholds 0.99:0.95 0.97:0.9 0.95:0.85 --output reports/semantic_cache.json
+"""
+
+from typing import Any, Dict, List
+import argparse
+import json
+import logging
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from agents.context_compactor import count_tokens
+from agents.objective_scorer import SUBSCORES
+from agents.schemas import cefr_for_score
+from agents.semantic_cache import SemanticEvaluationCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS = Path(__file__).parent / "data" / "graded_responses.jsonl"
+
+# Rough evaluator cost outside the submission itself (system prompt and JSON output)
+SYSTEM_PROMPT_TOKENS = 900
+OUTPUT_TOKENS = 400
+
+
+def load_corpus(path: Path) -> List[Dict[str, Any]]:
+    """
+    Load graded responses.
+
+    Each line holds task_type, task_prompt, response_text, reference_score and
+    optionally reference_cefr.
+    """
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _reference_evaluation(item: Dict[str, Any]) -> Dict[str, Any]:
+    score = item["reference_score"]
+    return {
+        "overall_score": score,
+        "subscores": {name: score for name in SUBSCORES},
+        "cefr_level": item.get("reference_cefr") or cefr_for_score(score),
+    }
+
+
+def evaluate_thresholds(corpus: List[Dict[str, Any]], reuse: float, calibrate: float) -> Dict[str, Any]:
+    """
+    Replay the corpus in order: misses are "graded" with their reference score and
+    cached, hits are compared with the reference score.
+
+    Args:
+        corpus: Graded responses in arrival order
+        reuse: Similarity to reuse a cached evaluation
+        calibrate: Similarity to calibrate a cached evaluation
+
+    Returns:
+        Report with hit rate, token savings and accuracy loss
+    """
+    cache = SemanticEvaluationCache(reuse_threshold=reuse, calibrate_threshold=calibrate)
+    tokens_total = tokens_saved = 0
+    hits: List[Dict[str, Any]] = []
+
+    for item in corpus:
+        tokens = SYSTEM_PROMPT_TOKENS + OUTPUT_TOKENS + count_tokens(item["task_prompt"] + item["response_text"])
+        tokens_total += tokens
+
+        cached = cache.lookup(item["task_type"], item["task_prompt"], item["response_text"])
+        if cached is None:
+            cache.store(item["task_type"], item["task_prompt"], item["response_text"], _reference_evaluation(item), tokens)
+            continue
+
+        tokens_saved += tokens
+        hits.append({
+            "id": item.get("id"),
+            "match": cached["cache_match"],
+            "similarity": cached["cache_similarity"],
+            "predicted": cached["overall_score"],
+            "reference": item["reference_score"],
+            "error": abs(cached["overall_score"] - item["reference_score"]),
+            "same_cefr": cached["cefr_level"] == (item.get("reference_cefr") or cefr_for_score(item["reference_score"])),
+        })
+
+    errors = [hit["error"] for hit in hits]
+    return {
+        "reuse_threshold": reuse,
+        "calibrate_threshold": calibrate,
+        "items": len(corpus),
+        "hits": len(hits),
+        "reused": sum(1 for hit in hits if hit["match"] == "reused"),
+        "calibrated": sum(1 for hit in hits if hit["match"] == "calibrated"),
+        "hit_rate": round(len(hits) / len(corpus), 4) if corpus else 0.0,
+        "tokens_total": tokens_total,
+        "tokens_saved": tokens_saved,
+        "token_savings_rate": round(tokens_saved / tokens_total, 4) if tokens_total else 0.0,
+        "mae_on_hits": round(sum(errors) / len(errors), 2) if errors else 0.0,
+        "max_error": max(errors, default=0),
+        "cefr_agreement_on_hits": round(sum(hit["same_cefr"] for hit in hits) / len(hits), 4) if hits else None,
+        # Error spread over every item: the accuracy cost of caching for the whole traffic
+        "added_mae": round(sum(errors) / len(corpus), 2) if corpus else 0.0,
+        "hit_details": hits,
+    }
+
+
+def main():
+    """Run the threshold sweep and print (or write) the report."""
+    parser = argparse.ArgumentParser(description="Semantic evaluation cache: accuracy loss vs tokens saved")
+    parser.add_argument("--corpus", type=Path, default=DEFAULT_CORPUS, help="Graded responses (JSONL)")
+    parser.add_argument(
+        "--thresholds", nargs="+", default=["0.99:0.95", "0.97:0.9", "0.95:0.85"],
+        help="reuse:calibrate similarity pairs"
+    )
+    parser.add_argument("--output", type=Path, help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+    reports = []
+    for pair in args.thresholds:
+        reuse, calibrate = (float(value) for value in pair.split(":"))
+        reports.append(evaluate_thresholds(corpus, reuse, calibrate))
+
+    for report in reports:
+        print(
+            f"reuse>={report['reuse_threshold']:.2f} calibrate>={report['calibrate_threshold']:.2f}: "
+            f"hit rate {report['hit_rate']:.0%}, tokens saved {report['token_savings_rate']:.0%}, "
+            f"MAE on hits {report['mae_on_hits']}, added MAE {report['added_mae']}, "
+            f"CEFR agreement {report['cefr_agreement_on_hits']}"
+        )
+
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps({"corpus": str(args.corpus), "results": reports}, indent=2))
+        logger.info(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -27,6 +27,65 @@ class Settings(BaseSettings):
     openai_model: str = Field(default="gpt-4-turbo-preview", description="Default OpenAI model")
     anthropic_api_key: Optional[str] = Field(default=None, description="Anthropic API Key (optional)")
 
+    # ==================== Model Routing ====================
+    model_failover_enabled: bool = Field(default=True, description="Retry failed LLM calls on alternative catalog models")
+    model_hedging_enabled: bool = Field(default=False, description="Send a hedged request when a call passes the model's p95")
+    model_hedge_min_samples: int = Field(default=20, description="Latency samples needed before hedging a model")
+    model_router_window_size: int = Field(default=200, description="Recent calls kept per model for latency/error stats")
+    model_router_max_error_rate: float = Field(default=0.5, description="Error rate above which a model is demoted")
+    model_router_error_cooldown_seconds: float = Field(default=60.0, description="How long a failing model stays demoted")
+    model_router_latency_slo_ms: int = Field(default=15000, description="p95 latency above which a faster healthy model is preferred")
+    model_learning_enabled: bool = Field(default=True, description="Re-rank models from observed telemetry")
+    model_explore_weight: float = Field(default=1.0, description="UCB exploration bonus weight for under-sampled models")
+    model_telemetry_prior_calls: int = Field(default=20, description="Calls before telemetry outweighs the catalog tiers")
+    model_rerank_interval_seconds: float = Field(default=300.0, description="How often routers refresh their model ranking")
+    model_agreement_sample_rate: float = Field(default=0.0, description="Share of evaluations re-scored by a second model")
+    llm_request_timeout_seconds: float = Field(default=30.0, description="Client timeout for a single LLM request")
+
+    # ==================== LLM Scheduling ====================
+    llm_scheduler_enabled: bool = Field(default=True, description="Queue LLM calls by priority class when a provider is at its concurrency cap")
+    llm_default_provider_concurrency: int = Field(default=16, description="Concurrent LLM calls per provider without an explicit cap")
+    llm_provider_concurrency_json: str = Field(default="", description='Concurrent LLM calls per provider, e.g. {"openai": 24, "anthropic": 8}')
+    llm_queue_timeout_seconds: float = Field(default=60.0, description="Max wait for a provider slot before the call fails over")
+
+    # ==================== Circuit Breakers ====================
+    circuit_failure_threshold: int = Field(default=5, description="Consecutive failures that open a model's circuit")
+    circuit_recovery_seconds: float = Field(default=30.0, description="Time an open circuit waits before probing")
+    circuit_half_open_max_calls: int = Field(default=1, description="Probe calls allowed while half-open")
+
+    # ==================== Evaluation Cascade ====================
+    evaluation_cascade_enabled: bool = Field(default=False, description="Grade with a cheap model first and escalate uncertain results")
+    cascade_min_confidence: float = Field(default=0.75, description="Minimum triage confidence accepted without escalation")
+    cascade_boundary_margin: int = Field(default=5, description="Escalate triage scores this close to a CEFR boundary")
+    cascade_audit_rate: float = Field(default=0.05, description="Share of accepted triage results re-graded by the strong model")
+
+    # ==================== Local Scoring ====================
+    objective_scoring_enabled: bool = Field(default=True, description="Score objective tasks locally instead of with the LLM")
+    lexical_hints_enabled: bool = Field(default=True, description="Add local lexical features to writing evaluation prompts")
+    objective_spelling_credit: float = Field(default=0.75, description="Credit for a word accepted with a spelling slip (0-1)")
+
+    # ==================== Semantic Cache ====================
+    semantic_cache_enabled: bool = Field(default=False, description="Reuse evaluations of near-duplicate responses to the same prompt")
+    semantic_cache_reuse_threshold: float = Field(default=0.97, description="Similarity at which a cached evaluation is reused as is")
+    semantic_cache_calibrate_threshold: float = Field(default=0.9, description="Similarity at which a cached evaluation is calibrated")
+    semantic_cache_max_entries_per_prompt: int = Field(default=200, description="Cached responses kept per prompt")
+    semantic_cache_max_prompts: int = Field(default=1000, description="Prompts kept in the semantic cache")
+    semantic_cache_ttl_seconds: int = Field(default=604800, description="Lifetime of a cached evaluation")
+    semantic_cache_dim: int = Field(default=1024, description="Hash buckets of the local response embeddings")
+
+    # ==================== Study Plans ====================
+    plan_templates_enabled: bool = Field(default=True, description="Build study plans for common profiles from templates")
+    plan_personalization_enabled: bool = Field(default=False, description="Run a short LLM personalization pass on template plans")
+    plan_template_dir: str = Field(default="", description="Directory where LLM-generated plan templates are persisted")
+    plan_lazy_weeks_enabled: bool = Field(default=False, description="Generate plan skeletons and each week's daily tasks on first view")
+    plan_prefetch_enabled: bool = Field(default=True, description="Generate the next skeleton week in the background")
+    plan_week_cache_size: int = Field(default=2000, description="Generated plan weeks kept in memory")
+
+    # ==================== Plan Progress ====================
+    plan_score_drift_threshold: int = Field(default=10, description="Points off the plan's score trajectory that trigger an adjustment")
+    plan_completion_drift_threshold: float = Field(default=25.0, description="Completion percentage points behind schedule that trigger an adjustment")
+    plan_adjustment_min_submissions: int = Field(default=3, description="Submissions since the last adjustment before another one")
+
     # ==================== Database ====================
     database_url: PostgresDsn = Field(..., description="PostgreSQL database URL")
     supabase_url: Optional[str] = Field(default=None, description="Supabase project URL")
@@ -37,6 +96,17 @@ class Settings(BaseSettings):
     evolution_api_key: str = Field(..., description="Evolution API authentication key")
     evolution_api_url: str = Field(..., description="Evolution API base URL")
     evolution_instance_name: str = Field(default="det_flow_instance", description="Evolution instance name")
+    evolution_send_timeout_seconds: float = Field(default=10.0, description="Timeout for outbound Evolution API requests")
+    evolution_max_connections: int = Field(default=20, description="Max pooled HTTP connections to the Evolution API")
+    evolution_rate_limit_per_second: float = Field(default=20.0, description="Global outbound message rate limit")
+    evolution_send_max_retries: int = Field(default=3, description="Retries for failed outbound messages")
+    whatsapp_max_message_length: int = Field(default=4096, description="Max characters per outbound WhatsApp message")
+    whatsapp_queue_max_size: int = Field(default=50, description="Max pending outbound messages per recipient")
+    webhook_fast_ack: bool = Field(default=False, description="Acknowledge webhooks immediately and reply via the outbound sender")
+    message_worker_count: int = Field(default=8, description="Background workers processing inbound messages")
+    inbound_dedup_ttl_seconds: int = Field(default=86400, description="How long provider message IDs are remembered")
+    inbound_coalesce_window_ms: int = Field(default=1500, description="Quiet period that closes a burst of user messages")
+    inbound_coalesce_max_wait_ms: int = Field(default=5000, description="Max delay before a burst is processed")
 
     # ==================== Application Settings ====================
     app_env: str = Field(default="development", description="Application environment")
@@ -49,6 +119,25 @@ class Settings(BaseSettings):
     log_level: str = Field(default="INFO", description="Logging level")
     log_file: str = Field(default="logs/det_flow.log", description="Log file path")
 
+    # ==================== LLM Usage Accounting ====================
+    usage_tracking_enabled: bool = Field(default=True, description="Record tokens, latency and cost of every LLM call")
+    usage_batch_size: int = Field(default=100, description="Buffered usage rows written per INSERT")
+    usage_flush_interval_seconds: float = Field(default=5.0, description="Max time a usage row waits before being written")
+    llm_daily_token_budgets_json: str = Field(default="", description='Daily token budget per tier, e.g. {"free": 50000}')
+
+    # ==================== Metrics & Tracing ====================
+    metrics_enabled: bool = Field(default=True, description="Record hot-path metrics and serve them on /metrics")
+    metrics_token: Optional[str] = Field(default=None, description="Bearer token required to scrape /metrics (required outside development)")
+    otel_enabled: bool = Field(default=False, description="Export spans through OpenTelemetry")
+    otel_exporter_endpoint: str = Field(default="", description="OTLP/HTTP traces endpoint")
+    otel_service_name: str = Field(default="det-flow", description="Service name reported to OpenTelemetry")
+
+    # ==================== Query Profiler ====================
+    query_profiler_enabled: bool = Field(default=False, description="Count and time the SQL of every API request")
+    query_profiler_slow_request_ms: float = Field(default=500.0, description="Profiled requests this slow are sampled with their SQL")
+    query_profiler_sample_rate: float = Field(default=1.0, description="Fraction of slow requests kept as samples")
+    query_profiler_repeat_threshold: int = Field(default=5, description="Executions of one statement in a request flagged as N+1")
+
     # ==================== DET Scoring Configuration ====================
     det_min_score: int = Field(default=10, description="Minimum DET score")
     det_max_score: int = Field(default=160, description="Maximum DET score")
@@ -57,6 +146,13 @@ class Settings(BaseSettings):
     # ==================== Session Configuration ====================
     session_timeout_minutes: int = Field(default=30, description="Session timeout in minutes")
     max_submissions_per_day: int = Field(default=10, description="Maximum submissions per user per day")
+    session_history_max_turns: int = Field(default=6, description="Conversation turns kept in the session history")
+    session_history_max_chars: int = Field(default=2000, description="Character budget for the session history")
+    session_flush_interval_seconds: float = Field(default=5.0, description="Write-behind interval for session persistence")
+
+    # ==================== Rate Limiting ====================
+    rate_limit_enabled: bool = Field(default=True, description="Enforce per-user message and submission quotas")
+    rate_limit_tiers_json: str = Field(default="", description='Limits per tier, e.g. {"premium": {"submissions_per_day": 50}}')
 
     # ==================== Redis (Optional) ====================
     redis_url: Optional[str] = Field(default=None, description="Redis connection URL")
@@ -10,6 +10,8 @@ from typing import Generator
 import logging
 
 from core.config import settings
+from core.metrics import instrument_engine
+from core.query_profiler import query_profiler
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +23,8 @@ engine = create_engine(
     max_overflow=10,
     echo=settings.app_debug  # Log SQL queries in debug mode
 )
+instrument_engine(engine)
+query_profiler.install(engine)
 
 # Create SessionLocal class
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
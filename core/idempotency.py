@@ -0,0 +1,113 @@
+"""
+DET Flow - Idempotency Store
+Remembers recently seen keys (e.g. provider message IDs) so redelivered events are processed once.
+Uses Redis when enabled so every API worker shares the same view, with an in-memory fallback.
+"""
+
+from typing import Dict, Any, Optional
+from collections import OrderedDict
+import logging
+import threading
+import time
+
+from core.config import settings
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyStore:
+    """
+    TTL-bounded set of claimed keys.
+
+    claim() is atomic: only the first caller for a key gets True until the key expires.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        ttl_seconds: Optional[int] = None,
+        max_entries: int = 100_000,
+        redis_url: Optional[str] = None
+    ):
+        """Initialize the store. Redis is used when enabled in settings and installed."""
+        self.namespace = namespace
+        self.ttl_seconds = ttl_seconds or settings.inbound_dedup_ttl_seconds
+        self.max_entries = max_entries
+
+        self._entries: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._redis = None
+
+        redis_url = redis_url or (settings.redis_url if settings.redis_enabled else None)
+        if redis_url:
+            if redis is None:
+                logger.warning("Redis enabled but the redis package is not installed; using in-memory idempotency store")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+        self._stats = {"claimed": 0, "duplicates": 0}
+
+    def claim(self, key: str) -> bool:
+        """
+        Claim a key.
+
+        Returns:
+            True if the key was not seen within the TTL, False for duplicates
+        """
+        if self._redis is not None:
+            try:
+                first = bool(self._redis.set(f"{self.namespace}:{key}", 1, nx=True, ex=self.ttl_seconds))
+                return self._count(first)
+            except Exception as e:
+                logger.warning(f"Redis idempotency check failed, falling back to memory: {e}")
+
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            expires_at = self._entries.get(key)
+            if expires_at is not None and expires_at > now:
+                return self._count(False)
+
+            self._entries[key] = now + self.ttl_seconds
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return self._count(True)
+
+    def release(self, key: str) -> None:
+        """Forget a key so it can be claimed again (e.g. when processing could not start)."""
+        if self._redis is not None:
+            try:
+                self._redis.delete(f"{self.namespace}:{key}")
+            except Exception as e:
+                logger.warning(f"Redis idempotency release failed: {e}")
+
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get claim counters."""
+        return {
+            **self._stats,
+            "backend": "redis" if self._redis is not None else "memory",
+            "tracked_keys": len(self._entries),
+        }
+
+    def _count(self, first: bool) -> bool:
+        self._stats["claimed" if first else "duplicates"] += 1
+        return first
+
+    def _evict_expired(self, now: float) -> None:
+        # Entries are kept in insertion order and share one TTL, so expired ones are at the front
+        while self._entries:
+            key, expires_at = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            self._entries.popitem(last=False)
@@ -0,0 +1,345 @@
+"""
+DET Flow - Inbound Message Worker Pool
+Processes persisted WhatsApp messages in the background so the webhook can acknowledge
+immediately. Messages from the same phone number are handled strictly in order, while
+different users are processed in parallel. Redelivered messages are dropped and bursts
+of messages from one user are coalesced into a single turn.
+"""
+
+from typing import Dict, Any, Optional, Callable, List
+from collections import deque
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from sqlalchemy.exc import IntegrityError
+
+from core.config import settings
+from core.database import SessionLocal
+from core.idempotency import IdempotencyStore
+from core.models import InboundMessage
+from core.whatsapp import WhatsAppSender, whatsapp_sender
+
+logger = logging.getLogger(__name__)
+
+# Signature of Maestro.process_user_message
+MessageProcessor = Callable[..., Dict[str, Any]]
+
+
+def persist_inbound_message(
+    phone_number: str,
+    message_text: str,
+    session_id: Optional[str] = None,
+    provider_message_id: Optional[str] = None
+) -> Optional[int]:
+    """
+    Store an inbound message so it survives restarts before being processed.
+
+    Returns:
+        InboundMessage database ID, or None if the provider message ID was already stored
+    """
+    db = SessionLocal()
+    try:
+        inbound = InboundMessage(
+            phone_number=phone_number,
+            message_text=message_text,
+            session_id=session_id,
+            provider_message_id=provider_message_id,
+            status="received"
+        )
+        db.add(inbound)
+        db.commit()
+        return inbound.id
+    except IntegrityError:
+        db.rollback()
+        logger.info(f"Duplicate inbound message ignored: {provider_message_id}")
+        return None
+    finally:
+        db.close()
+
+
+class _Job:
+    """One conversational turn: one inbound message, or a coalesced burst of them."""
+
+    __slots__ = ("inbound_ids", "phone_number", "message_text", "session_id", "received_at", "message_count")
+
+    def __init__(
+        self,
+        inbound_ids: List[int],
+        phone_number: str,
+        message_text: str,
+        session_id: Optional[str],
+        received_at: Optional[float] = None,
+        message_count: int = 1
+    ):
+        self.inbound_ids = inbound_ids
+        self.phone_number = phone_number
+        self.message_text = message_text
+        self.session_id = session_id
+        self.received_at = received_at if received_at is not None else time.monotonic()
+        self.message_count = message_count
+
+
+class MessageWorkerPool:
+    """
+    Bounded pool of async workers with one ordered lane per phone number.
+
+    A phone number is scheduled on at most one worker at a time; after each turn
+    it goes to the back of the ready queue so busy users cannot starve others.
+    A lane is only picked up once the user has been quiet for the coalescing
+    window (or the burst hit its max wait), and everything queued by then is
+    merged into one Maestro turn.
+    """
+
+    def __init__(
+        self,
+        worker_count: Optional[int] = None,
+        sender: Optional[WhatsAppSender] = None,
+        coalesce_window_ms: Optional[int] = None,
+        coalesce_max_wait_ms: Optional[int] = None,
+        deduplicator: Optional[IdempotencyStore] = None
+    ):
+        """Initialize the pool. Workers start with start()."""
+        self.worker_count = worker_count or settings.message_worker_count
+        self.sender = sender or whatsapp_sender
+        window_ms = settings.inbound_coalesce_window_ms if coalesce_window_ms is None else coalesce_window_ms
+        max_wait_ms = settings.inbound_coalesce_max_wait_ms if coalesce_max_wait_ms is None else coalesce_max_wait_ms
+        self.coalesce_window = window_ms / 1000
+        self.coalesce_max_wait = max(max_wait_ms, window_ms) / 1000
+        self.deduplicator = deduplicator or IdempotencyStore(namespace="inbound_message")
+        self.processor: Optional[MessageProcessor] = None
+
+        self._lanes: Dict[str, deque] = {}
+        self._scheduled: set = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._workers: List[asyncio.Task] = []
+
+        self._stats = {
+            "messages_submitted": 0,
+            "messages_processed": 0,
+            "messages_failed": 0,
+            "turns_processed": 0,
+            "messages_coalesced": 0,
+        }
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._workers)
+
+    async def start(self, processor: MessageProcessor) -> None:
+        """Start the workers and re-queue messages left unprocessed by a previous run."""
+        if self.is_running:
+            return
+
+        self.processor = processor
+        self._ready = asyncio.Queue()
+        self._workers = [
+            asyncio.create_task(self._worker(index)) for index in range(self.worker_count)
+        ]
+        logger.info(f"Message worker pool started with {self.worker_count} workers")
+
+        for job in await asyncio.to_thread(self._load_pending_jobs):
+            self._enqueue(job)
+
+    async def stop(self) -> None:
+        """Stop the workers. Unfinished messages stay in the database for the next start."""
+        for task in self._workers:
+            task.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        self._lanes.clear()
+        self._scheduled.clear()
+        self._ready = None
+
+    def accept(self, provider_message_id: Optional[str]) -> bool:
+        """
+        Check a provider message ID against the idempotency store.
+
+        Returns:
+            False if the message was already accepted (redelivery), True otherwise
+        """
+        if not provider_message_id:
+            return True
+        return self.deduplicator.claim(provider_message_id)
+
+    def submit(
+        self,
+        phone_number: str,
+        message_text: str,
+        session_id: Optional[str] = None,
+        inbound_id: Optional[int] = None
+    ) -> None:
+        """Queue a message for background processing. Never blocks."""
+        if not self.is_running:
+            raise RuntimeError("Message worker pool is not running")
+
+        inbound_ids = [inbound_id] if inbound_id is not None else []
+        self._enqueue(_Job(inbound_ids, phone_number, message_text, session_id))
+
+    async def drain(self) -> None:
+        """Wait until every queued message has been processed (used by tests and shutdown)."""
+        while self._scheduled:
+            await asyncio.sleep(0.01)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get processing counters, queue depth and work avoided by deduplication/coalescing."""
+        dedup_stats = self.deduplicator.get_stats()
+        turns_avoided = self._stats["messages_coalesced"] + dedup_stats["duplicates"]
+        return {
+            **self._stats,
+            "duplicates_dropped": dedup_stats["duplicates"],
+            "turns_avoided": turns_avoided,
+            # Every Maestro turn makes at least one InterfaceAgent call, so this is a lower bound
+            "llm_calls_avoided": turns_avoided,
+            "workers": len(self._workers),
+            "pending_messages": sum(len(lane) for lane in self._lanes.values()),
+            "active_users": len(self._scheduled),
+        }
+
+    # ==================== Internals ====================
+
+    def _enqueue(self, job: _Job) -> None:
+        lane = self._lanes.setdefault(job.phone_number, deque())
+        lane.append(job)
+        self._stats["messages_submitted"] += 1
+
+        if job.phone_number not in self._scheduled:
+            self._scheduled.add(job.phone_number)
+            self._ready.put_nowait(job.phone_number)
+
+    def _burst_delay(self, lane: deque) -> float:
+        """Seconds to wait before the burst in this lane is complete (0 = ready now)."""
+        now = time.monotonic()
+        quiet_remaining = self.coalesce_window - (now - lane[-1].received_at)
+        max_wait_remaining = self.coalesce_max_wait - (now - lane[0].received_at)
+        return max(0.0, min(quiet_remaining, max_wait_remaining))
+
+    def _take_burst(self, lane: deque) -> _Job:
+        """Merge every job queued in the lane into one turn."""
+        jobs = list(lane)
+        lane.clear()
+
+        if len(jobs) == 1:
+            return jobs[0]
+
+        self._stats["messages_coalesced"] += len(jobs) - 1
+        logger.info(f"Coalesced {len(jobs)} messages from {jobs[0].phone_number} into one turn")
+
+        session_id = next((job.session_id for job in reversed(jobs) if job.session_id), None)
+        return _Job(
+            inbound_ids=[inbound_id for job in jobs for inbound_id in job.inbound_ids],
+            phone_number=jobs[0].phone_number,
+            message_text="\n".join(job.message_text for job in jobs),
+            session_id=session_id,
+            received_at=jobs[0].received_at,
+            message_count=sum(job.message_count for job in jobs)
+        )
+
+    async def _worker(self, index: int) -> None:
+        loop = asyncio.get_running_loop()
+
+        while True:
+            phone_number = await self._ready.get()
+            lane = self._lanes.get(phone_number)
+
+            if lane:
+                delay = self._burst_delay(lane)
+                if delay > 0:
+                    # Burst still open: come back later without holding this worker
+                    loop.call_later(delay, self._ready.put_nowait, phone_number)
+                    continue
+
+                job = self._take_burst(lane)
+                try:
+                    await self._handle(job)
+                except Exception as e:
+                    logger.error(f"Worker {index} failed processing message from {phone_number}: {e}")
+
+            # Re-schedule the lane at the back of the queue, or release it
+            if self._lanes.get(phone_number):
+                self._ready.put_nowait(phone_number)
+            else:
+                self._lanes.pop(phone_number, None)
+                self._scheduled.discard(phone_number)
+
+    async def _handle(self, job: _Job) -> None:
+        """Run the Maestro pipeline off the event loop, then push the reply."""
+        await asyncio.to_thread(self._mark_status, job.inbound_ids, "processing")
+
+        try:
+            result = await asyncio.to_thread(
+                self.processor,
+                phone_number=job.phone_number,
+                message=job.message_text,
+                session_id=job.session_id
+            )
+            response_text = result.get("response") or ""
+
+            if response_text:
+                await self.sender.send_text(job.phone_number, response_text)
+
+            await asyncio.to_thread(
+                self._mark_status, job.inbound_ids, "completed", response_text=response_text
+            )
+            self._stats["turns_processed"] += 1
+            self._stats["messages_processed"] += job.message_count
+
+        except Exception as e:
+            self._stats["messages_failed"] += job.message_count
+            await asyncio.to_thread(self._mark_status, job.inbound_ids, "failed", error=str(e))
+            raise
+
+    def _mark_status(
+        self,
+        inbound_ids: List[int],
+        status: str,
+        response_text: Optional[str] = None,
+        error: Optional[str] = None
+    ) -> None:
+        if not inbound_ids:
+            return
+
+        db = SessionLocal()
+        try:
+            rows = db.query(InboundMessage).filter(InboundMessage.id.in_(inbound_ids)).all()
+            for inbound in rows:
+                inbound.status = status
+                if response_text is not None:
+                    inbound.response_text = response_text
+                if error is not None:
+                    inbound.error = error
+                if status in ("completed", "failed"):
+                    inbound.processed_at = datetime.now()
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error updating inbound messages {inbound_ids}: {e}")
+        finally:
+            db.close()
+
+    def _load_pending_jobs(self) -> List[_Job]:
+        """Load messages accepted but not finished before the last shutdown."""
+        db = SessionLocal()
+        try:
+            pending = (
+                db.query(InboundMessage)
+                .filter(InboundMessage.status.in_(["received", "processing"]))
+                .order_by(InboundMessage.id)
+                .all()
+            )
+            if pending:
+                logger.info(f"Recovering {len(pending)} unprocessed inbound messages")
+            return [
+                _Job([row.id], row.phone_number, row.message_text, row.session_id)
+                for row in pending
+            ]
+        except Exception as e:
+            logger.error(f"Error loading pending inbound messages: {e}")
+            return []
+        finally:
+            db.close()
+
+
+# Global message worker pool instance
+message_worker_pool = MessageWorkerPool()
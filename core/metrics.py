@@ -0,0 +1,309 @@
+"""
+DET Flow - Metrics and Tracing
+Lightweight in-process instrumentation for the hot paths (WhatsApp turns, agent runs,
+JSON extraction, database queries and outbound HTTP). Spans, histograms and counters
+are aggregated in memory and rendered in the Prometheus text format for the /metrics
+endpoint; spans are also exported through OpenTelemetry when it is installed and
+enabled. When metrics are disabled every call returns immediately.
+"""
+
+from typing import Any, Dict, Optional, Tuple
+import bisect
+import logging
+import threading
+import time
+
+from core.config import settings
+
+try:
+    from opentelemetry import trace as otel_trace
+except ImportError:
+    otel_trace = None
+
+logger = logging.getLogger(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Histogram buckets by metric name suffix
+BUCKETS: Dict[str, Tuple[float, ...]] = {
+    "_seconds": (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+    "_tokens": (50, 100, 250, 500, 1000, 2000, 4000, 8000, 16000),
+    "_bytes": (128, 512, 1024, 4096, 16384, 65536, 262144),
+    "_queries": (1, 2, 5, 10, 20, 50, 100, 250),
+}
+
+METRIC_HELP: Dict[str, str] = {
+    "det_span_duration_seconds": "Duration of instrumented operations",
+    "det_llm_call_seconds": "Latency of single agent runs per activity and model",
+    "det_llm_call_tokens": "Tokens per agent run (input, cached input, output)",
+    "det_json_payload_bytes": "Size of model responses parsed for JSON",
+    "det_db_query_seconds": "Database statement latency",
+    "det_http_client_seconds": "Outbound HTTP request latency",
+    "det_http_server_seconds": "API request latency",
+    "det_llm_calls_total": "Agent runs per activity, model and status",
+    "det_db_queries_total": "Database statements executed",
+    "det_errors_total": "Errors per component",
+    "det_llm_queue_wait_seconds": "Time LLM calls waited for a provider slot per priority class",
+    "det_llm_queue_depth": "LLM calls waiting for a provider slot",
+    "det_llm_in_flight": "LLM calls running per provider",
+    "det_http_request_queries": "Database statements per profiled API request",
+    "det_db_repeated_statements_total": "Profiled requests that repeated a statement (possible N+1)",
+}
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket histogram for one label set."""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Span:
+    """Timed operation; labels can be added while it runs (e.g. the detected intent)."""
+
+    __slots__ = ("registry", "name", "labels", "start", "_otel_context", "_otel_span")
+
+    def __init__(self, registry: "MetricsRegistry", name: str, labels: Dict[str, Any]):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+        self._otel_context = None
+        self._otel_span = None
+
+    def set(self, key: str, value: Any) -> None:
+        self.labels[key] = value
+        if self._otel_span is not None:
+            self._otel_span.set_attribute(key, str(value))
+
+    def __enter__(self) -> "Span":
+        if self.registry.tracer is not None:
+            self._otel_context = self.registry.tracer.start_as_current_span(
+                self.name, attributes={key: str(value) for key, value in self.labels.items()}
+            )
+            self._otel_span = self._otel_context.__enter__()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        elapsed = time.perf_counter() - self.start
+        status = "error" if exc_type else "ok"
+        self.registry.observe("det_span_duration_seconds", elapsed, span=self.name, status=status, **self.labels)
+        if self._otel_context is not None:
+            self._otel_context.__exit__(exc_type, exc, tb)
+        return False
+
+
+class _NullSpan:
+    """Span used while metrics are disabled."""
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms with Prometheus text rendering."""
+
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = settings.metrics_enabled if enabled is None else enabled
+        self.tracer = None
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **labels: Any):
+        """
+        Time an operation.
+
+        Usage:
+            with metrics.span("maestro.process_user_message") as span:
+                span.set("intent", intent)
+        """
+        if not self.enabled:
+            return _NULL_SPAN
+        return Span(self, name, labels)
+
+    def inc(self, name: str, value: float = 1.0, **labels: Any) -> None:
+        """Increase a counter."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0.0) + value
+
+    def set_gauge(self, name: str, value: float, **labels: Any) -> None:
+        """Set a gauge to its current value (queue depths, in-flight calls)."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels: Any) -> None:
+        """Record a histogram sample; buckets follow the name suffix (_seconds, _tokens, _bytes, _queries)."""
+        if not self.enabled:
+            return
+        key = _label_key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                bounds = next((b for suffix, b in BUCKETS.items() if name.endswith(suffix)), BUCKETS["_seconds"])
+                histogram = series[key] = Histogram(bounds)
+            histogram.observe(value)
+
+    def render_prometheus(self) -> str:
+        """All series in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} counter")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} gauge")
+                for key, value in series.items():
+                    lines.append(f"{name}{_format_labels(key)} {value:g}")
+
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# HELP {name} {METRIC_HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.bounds, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, ('le', f'{bound:g}'))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Count and mean of every histogram series, for the admin dashboard."""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "opentelemetry": self.tracer is not None,
+                "histograms": {
+                    name: [
+                        {
+                            "labels": dict(key),
+                            "count": histogram.count,
+                            "mean": round(histogram.sum / histogram.count, 6) if histogram.count else None,
+                        }
+                        for key, histogram in series.items()
+                    ]
+                    for name, series in self._histograms.items()
+                },
+                "counters": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._counters.items()
+                },
+                "gauges": {
+                    name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                    for name, series in self._gauges.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._gauges.clear()
+
+    def configure_opentelemetry(self) -> bool:
+        """
+        Export spans through OpenTelemetry (OTLP over HTTP when an endpoint is configured).
+
+        Returns:
+            True if spans are exported
+        """
+        if not (self.enabled and settings.otel_enabled):
+            return False
+        if otel_trace is None:
+            logger.warning("OTEL_ENABLED is set but opentelemetry is not installed")
+            return False
+
+        try:
+            from opentelemetry.sdk.resources import Resource
+            from opentelemetry.sdk.trace import TracerProvider
+            from opentelemetry.sdk.trace.export import BatchSpanProcessor
+
+            provider = TracerProvider(resource=Resource.create({"service.name": settings.otel_service_name}))
+            if settings.otel_exporter_endpoint:
+                from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+                provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(endpoint=settings.otel_exporter_endpoint)))
+            otel_trace.set_tracer_provider(provider)
+        except ImportError as e:
+            logger.warning(f"OpenTelemetry SDK unavailable, using the global tracer provider: {e}")
+
+        self.tracer = otel_trace.get_tracer("det_flow")
+        logger.info("OpenTelemetry span export enabled")
+        return True
+
+
+def instrument_engine(engine: Any, registry: Optional[MetricsRegistry] = None) -> None:
+    """Time every statement executed by a SQLAlchemy engine."""
+    registry = registry or metrics
+    if not registry.enabled:
+        return
+
+    from sqlalchemy import event
+
+    # The start time lives on the statement's execution context: after_cursor_execute does
+    # not fire for failed statements, so a per-connection stack would pair later
+    # statements with stale start times
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context.det_query_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "det_query_start", None)
+        if start is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "UNKNOWN"
+        registry.observe("det_db_query_seconds", time.perf_counter() - start, operation=operation)
+        registry.inc("det_db_queries_total", operation=operation)
+
+
+# Global metrics registry
+metrics = MetricsRegistry()
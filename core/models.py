@@ -81,7 +81,7 @@ class Submission(Base):
     evaluation_duration_ms = Column(Integer, nullable=True)
 
     # Status
-    status = Column(String(20), default="pending")  # pending, evaluating, completed, failed
+    status = Column(String(20), default="pending")  # pending, evaluating, completed, provisional, failed
 
     # Relationships
     user = relationship("User", back_populates="submissions")
@@ -118,6 +118,61 @@ class UserSession(Base):
         return f"<UserSession(id={self.id}, session_id={self.session_id}, user_id={self.user_id})>"
 
 
+class InboundMessage(Base):
+    """
+    Inbound WhatsApp message persisted before asynchronous processing.
+    """
+    __tablename__ = "inbound_messages"
+
+    id = Column(Integer, primary_key=True, index=True)
+    phone_number = Column(String(20), index=True, nullable=False)
+    provider_message_id = Column(String(255), unique=True, nullable=True)  # Evolution/WhatsApp message ID
+
+    # Message data
+    message_text = Column(Text, nullable=False)
+    session_id = Column(String(255), nullable=True)
+    response_text = Column(Text, nullable=True)
+    error = Column(Text, nullable=True)
+
+    # Timestamps
+    received_at = Column(DateTime(timezone=True), server_default=func.now())
+    processed_at = Column(DateTime(timezone=True), nullable=True)
+
+    # Status
+    status = Column(String(20), default="received", index=True)  # received, processing, completed, failed
+
+    def __repr__(self):
+        return f"<InboundMessage(id={self.id}, phone={self.phone_number}, status={self.status})>"
+
+
+class LLMUsage(Base):
+    """
+    Append-only record of one LLM call: tokens, latency and estimated cost.
+    """
+    __tablename__ = "llm_usage"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=True, index=True)  # None for system work
+
+    # Call details
+    activity = Column(String(50), nullable=False)  # evaluation, study_plan, chat, ...
+    model = Column(String(100), nullable=False)
+    subscription_tier = Column(String(50), nullable=True)
+
+    # Usage
+    input_tokens = Column(Integer, default=0)
+    cached_input_tokens = Column(Integer, default=0)
+    output_tokens = Column(Integer, default=0)
+    latency_ms = Column(Integer, nullable=True)
+    cost_usd = Column(Float, nullable=True)
+
+    # Timestamp
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+    def __repr__(self):
+        return f"<LLMUsage(id={self.id}, activity={self.activity}, model={self.model})>"
+
+
 class StudyPlan(Base):
     """
     Personalized study plans generated by the Pedagogue Agent.
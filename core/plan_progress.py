@@ -0,0 +1,343 @@
+"""
+DET Flow - Study Plan Progress
+Keeps StudyPlan.completion_percentage current as submissions complete. Each completed
+submission is matched to an open plan task of the same task type (current week first,
+then earlier weeks still open) and the progress state kept in plan_data is updated
+incrementally, without rescanning submissions or calling an LLM. A plan adjustment is
+only triggered when score or completion drift from the plan's trajectory passes the
+configured thresholds.
+
+Skeleton weeks of lazy plans have no daily tasks until they are opened; they are
+counted as untyped task slots (as many as a detailed week of the plan, or the study
+days for the student's weekly hours) that any submission of that week fills. Slots
+filled before a week is detailed stop counting once its real tasks exist.
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+import copy
+import logging
+import threading
+from datetime import datetime
+
+from sqlalchemy.orm.attributes import flag_modified
+
+from core.config import settings
+from core.database import SessionLocal
+from core.models import StudyPlan, Submission
+
+logger = logging.getLogger(__name__)
+
+# Signature of PedagogueAgent.adjust_plan_based_on_progress
+PlanAdjuster = Callable[[Dict[str, Any], List[int], int], Dict[str, Any]]
+
+RECENT_SCORES_KEPT = 10
+APPLIED_IDS_KEPT = 200
+
+# Planned slot of a skeleton week that any task type fills
+ANY_TASK = "*"
+
+
+def normalize_task_type(task_type: Optional[str]) -> str:
+    """'Read Aloud', 'read-aloud' and 'read_aloud' are the same task type."""
+    return "_".join((task_type or "").lower().replace("-", " ").split())
+
+
+def _skeleton_week_slots(plan_data: Dict[str, Any], planned: Dict[int, Dict[str, int]]) -> int:
+    """Tasks a skeleton week stands for: the mean of the detailed weeks, else one per study day."""
+    detailed = [sum(counts.values()) for counts in planned.values() if counts]
+    if detailed:
+        return max(1, round(sum(detailed) / len(detailed)))
+    hours = int(plan_data.get("student_profile", {}).get("available_hours_per_week") or 5)
+    return 3 if hours < 5 else 5 if hours < 10 else 6  # Study days of the curated templates
+
+
+def planned_tasks(plan_data: Dict[str, Any]) -> Dict[int, Dict[str, int]]:
+    """Planned task count per week and task type (ANY_TASK slots for skeleton weeks)."""
+    planned: Dict[int, Dict[str, int]] = {}
+    skeleton_weeks = []
+    for week in plan_data.get("weekly_schedule", []):
+        number = int(week.get("week", 0) or 0)
+        counts = planned.setdefault(number, {})
+        if plan_data.get("lazy_weeks") and not week.get("daily_tasks"):
+            skeleton_weeks.append(number)
+            continue
+        for day in week.get("daily_tasks", []):
+            for task in day.get("tasks", []):
+                task_type = normalize_task_type(task.get("task_type"))
+                if task_type:
+                    counts[task_type] = counts.get(task_type, 0) + 1
+
+    if skeleton_weeks:
+        slots = _skeleton_week_slots(plan_data, planned)
+        for number in skeleton_weeks:
+            planned[number] = {ANY_TASK: slots}
+    return planned
+
+
+def current_week(start: Optional[datetime], duration_weeks: int, now: Optional[datetime] = None) -> int:
+    """Plan week (1-based, within the plan duration) a date falls in."""
+    if start is None:
+        return 1
+    now = now or datetime.now(start.tzinfo)
+    if (now.tzinfo is None) != (start.tzinfo is None):
+        # Naive datetime.now() values next to timezone-aware server defaults
+        now, start = now.replace(tzinfo=None), start.replace(tzinfo=None)
+    week = (now - start).days // 7 + 1
+    return max(1, min(week, max(duration_weeks, 1)))
+
+
+class PlanProgressEngine:
+    """
+    Incremental plan progress: task matching, completion and drift detection.
+
+    Progress lives in plan_data["progress"]:
+        done: completed task count per week and task type
+        extra: submissions that matched no open task
+        scores: most recent scores, oldest first
+        baseline_score: first score recorded for the plan
+        applied_ids: most recent submissions applied, in any order (replays are ignored)
+        submissions_since_adjustment / last_adjusted_week: adjustment cooldown
+    """
+
+    def __init__(
+        self,
+        score_drift_threshold: Optional[int] = None,
+        completion_drift_threshold: Optional[float] = None,
+        min_submissions: Optional[int] = None
+    ):
+        """
+        Args:
+            score_drift_threshold: Points between recent scores and the expected score that trigger an adjustment
+            completion_drift_threshold: Percentage points of completion behind schedule that trigger an adjustment
+            min_submissions: Submissions needed since the last adjustment before another one
+        """
+        self.score_drift_threshold = score_drift_threshold or settings.plan_score_drift_threshold
+        self.completion_drift_threshold = completion_drift_threshold or settings.plan_completion_drift_threshold
+        self.min_submissions = min_submissions or settings.plan_adjustment_min_submissions
+
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="plan-adjust")
+        self._adjusting: set = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "submissions": 0,
+            "matched": 0,
+            "extra": 0,
+            "ignored": 0,
+            "adjustments_triggered": 0,
+            "adjustments_failed": 0,
+        }
+
+    def apply_submission(
+        self,
+        plan_data: Dict[str, Any],
+        submission_id: int,
+        task_type: str,
+        score: Optional[int],
+        week: int
+    ) -> Dict[str, Any]:
+        """
+        Apply one completed submission to the plan progress (plan_data is updated in place).
+
+        Args:
+            plan_data: Study plan dictionary
+            submission_id: Submission ID
+            task_type: Submitted task type
+            score: Overall score, if evaluated
+            week: Plan week the submission was made in
+
+        Returns:
+            Progress summary: matched week, completion, expected completion, drifts and
+            whether the plan should be adjusted
+        """
+        progress = plan_data.setdefault("progress", {})
+        applied = progress.get("applied_ids")
+        if applied is None:
+            # Plans recorded before applied_ids kept only the highest ID
+            applied = [progress["last_submission_id"]] if progress.get("last_submission_id") else []
+        progress.pop("last_submission_id", None)
+
+        # Submissions commit out of ID order (WhatsApp and the API run concurrently), so
+        # only IDs already applied are replays; an ID older than the whole bounded window
+        # is too old to tell and treated as one
+        too_old = len(applied) >= APPLIED_IDS_KEPT and submission_id < min(applied)
+        if submission_id in applied or too_old:
+            with self._lock:
+                self._stats["ignored"] += 1
+            return {**self.summarize(plan_data, week), "matched_week": None, "duplicate": True}
+        progress["applied_ids"] = (applied + [submission_id])[-APPLIED_IDS_KEPT:]
+
+        planned = planned_tasks(plan_data)
+        done = progress.setdefault("done", {})
+        task_type = normalize_task_type(task_type)
+
+        # Current week first, then the open tasks of earlier weeks (catching up)
+        matched_week = None
+        for candidate in [week] + list(range(1, week)):
+            week_done = done.get(str(candidate), {})
+            week_planned = planned.get(candidate, {})
+            slot = next(
+                (key for key in (task_type, ANY_TASK) if week_done.get(key, 0) < week_planned.get(key, 0)), None
+            )
+            if slot is not None:
+                done.setdefault(str(candidate), {})[slot] = week_done.get(slot, 0) + 1
+                matched_week = candidate
+                break
+        if matched_week is None:
+            progress["extra"] = progress.get("extra", 0) + 1
+
+        if score is not None:
+            progress.setdefault("baseline_score", score)
+            progress["scores"] = (progress.get("scores", []) + [score])[-RECENT_SCORES_KEPT:]
+        progress["submissions_since_adjustment"] = progress.get("submissions_since_adjustment", 0) + 1
+
+        with self._lock:
+            self._stats["submissions"] += 1
+            self._stats["matched" if matched_week else "extra"] += 1
+
+        return {**self.summarize(plan_data, week), "matched_week": matched_week}
+
+    def summarize(self, plan_data: Dict[str, Any], week: int) -> Dict[str, Any]:
+        """
+        Completion and drift of a plan at a given week.
+
+        Returns:
+            completion_percentage, expected_completion, completion_drift, expected_score,
+            score_drift and needs_adjustment
+        """
+        progress = plan_data.get("progress", {})
+        planned = planned_tasks(plan_data)
+        done = progress.get("done", {})
+
+        total = sum(sum(counts.values()) for counts in planned.values())
+        completed = sum(
+            min(count, planned.get(int(w), {}).get(task_type, 0))
+            for w, counts in done.items()
+            for task_type, count in counts.items()
+        )
+        due = sum(sum(counts.values()) for w, counts in planned.items() if w < week)
+        completion = round(100 * completed / total, 1) if total else 0.0
+        expected_completion = round(100 * due / total, 1) if total else 0.0
+
+        summary: Dict[str, Any] = {
+            "week": week,
+            "completion_percentage": completion,
+            "expected_completion": expected_completion,
+            "completion_drift": round(completion - expected_completion, 1),
+            "expected_score": None,
+            "score_drift": None,
+        }
+
+        scores = progress.get("scores", [])
+        duration = int(plan_data.get("duration_weeks") or len(planned) or 1)
+        if scores and plan_data.get("target_score"):
+            baseline = progress.get("baseline_score", scores[0])
+            expected = baseline + (int(plan_data["target_score"]) - baseline) * (week - 1) / duration
+            recent = scores[-3:]
+            summary["expected_score"] = round(expected)
+            summary["score_drift"] = round(sum(recent) / len(recent) - expected, 1)
+
+        drifted = (
+            (summary["score_drift"] is not None and abs(summary["score_drift"]) >= self.score_drift_threshold)
+            or -summary["completion_drift"] >= self.completion_drift_threshold
+        )
+        summary["needs_adjustment"] = bool(
+            drifted
+            and progress.get("submissions_since_adjustment", 0) >= self.min_submissions
+            and progress.get("last_adjusted_week", 0) < week
+        )
+        return summary
+
+    def record_submission(
+        self,
+        db,
+        submission: Submission,
+        adjuster: Optional[PlanAdjuster] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Update the active plan of the submission's user after the submission completed.
+
+        Args:
+            db: Database session (committed here)
+            submission: Completed submission
+            adjuster: Called in the background when the plan drifted
+
+        Returns:
+            Progress summary, or None when the user has no active plan
+        """
+        # Row lock: concurrent submissions of one user (WhatsApp and the API) must not
+        # overwrite each other's progress
+        db_plan = (
+            db.query(StudyPlan)
+            .filter(StudyPlan.user_id == submission.user_id, StudyPlan.is_active == True)
+            .order_by(StudyPlan.created_at.desc())
+            .with_for_update()
+            .first()
+        )
+        if db_plan is None:
+            return None
+
+        plan_data = copy.deepcopy(db_plan.plan_data)
+        duration = int(db_plan.duration_weeks or plan_data.get("duration_weeks") or 1)
+        week = current_week(db_plan.start_date or db_plan.created_at, duration, submission.evaluated_at)
+        # The evaluator's fallback (a fixed 50) and provisional lexical estimates are not
+        # real scores: the task still counts as done, but they must not drive score drift
+        feedback = submission.feedback or {}
+        score = None if "error" in feedback or feedback.get("provisional") else submission.overall_score
+        summary = self.apply_submission(plan_data, submission.id, submission.task_type, score, week)
+
+        db_plan.plan_data = plan_data
+        db_plan.completion_percentage = summary["completion_percentage"]
+        flag_modified(db_plan, "plan_data")
+        db.commit()
+
+        if summary["needs_adjustment"] and adjuster is not None:
+            self._schedule_adjustment(db_plan.id, week, adjuster)
+        return summary
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "adjustments_running": len(self._adjusting)}
+
+    def _schedule_adjustment(self, plan_id: int, week: int, adjuster: PlanAdjuster) -> None:
+        with self._lock:
+            if plan_id in self._adjusting:
+                return
+            self._adjusting.add(plan_id)
+            self._stats["adjustments_triggered"] += 1
+        self._executor.submit(self._adjust, plan_id, week, adjuster)
+
+    def _adjust(self, plan_id: int, week: int, adjuster: PlanAdjuster) -> None:
+        """Adjust a drifted plan; progress recorded meanwhile is kept."""
+        db = SessionLocal()
+        try:
+            db_plan = db.query(StudyPlan).filter(StudyPlan.id == plan_id).first()
+            if db_plan is None:
+                return
+            plan_data = copy.deepcopy(db_plan.plan_data)
+            adjusted = adjuster(plan_data, plan_data.get("progress", {}).get("scores", []), week - 1)
+            changed = adjusted != plan_data
+
+            # Keep progress recorded while the adjuster ran; the cooldown applies even
+            # when the adjustment failed so a drifted plan is not retried on every submission
+            db.refresh(db_plan, with_for_update=True)
+            progress = copy.deepcopy(db_plan.plan_data.get("progress", {}))
+            progress.update({"submissions_since_adjustment": 0, "last_adjusted_week": week})
+            db_plan.plan_data = {**(adjusted if changed else db_plan.plan_data), "progress": progress}
+            flag_modified(db_plan, "plan_data")
+            db.commit()
+            if changed:
+                logger.info(f"Study plan {plan_id} adjusted after drift in week {week}")
+        except Exception as e:
+            db.rollback()
+            with self._lock:
+                self._stats["adjustments_failed"] += 1
+            logger.error(f"Error adjusting study plan {plan_id}: {e}")
+        finally:
+            db.close()
+            with self._lock:
+                self._adjusting.discard(plan_id)
+
+
+# Global plan progress engine
+plan_progress = PlanProgressEngine()
@@ -0,0 +1,258 @@
+"""
+DET Flow - Query Profiler
+Per-request SQL instrumentation built on SQLAlchemy cursor events. Statements run while
+a profile is active are counted and timed; the same statement text executed again and
+again within one request (a lazy-loaded relationship read in a loop, the classic N+1)
+is flagged. Tests use it to hold endpoints to a query budget; in production it can be
+switched on to keep samples of slow requests together with their SQL.
+
+Only statement text is kept, never bound parameters, so samples carry no student data.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from collections import Counter, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+import logging
+import random
+import threading
+import time
+
+from core.config import settings
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+MAX_SAMPLES = 50
+MAX_SAMPLE_STATEMENTS = 20
+MAX_STATEMENT_CHARS = 2000
+
+_current_profile: ContextVar[Optional["QueryProfile"]] = ContextVar("query_profile", default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Raised when a profiled block ran more statements than its budget allows."""
+
+
+def _normalize(statement: str) -> str:
+    return " ".join(statement.split())
+
+
+class QueryProfile:
+    """Statements executed during one request or profiled block."""
+
+    def __init__(self, label: str):
+        self.label = label
+        self.statements: List[tuple] = []  # (normalized statement, seconds)
+        self._lock = threading.Lock()
+
+    def record(self, statement: str, seconds: float) -> None:
+        with self._lock:
+            self.statements.append((_normalize(statement), seconds))
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    @property
+    def total_seconds(self) -> float:
+        return sum(seconds for _, seconds in self.statements)
+
+    def repeated(self, threshold: Optional[int] = None) -> Dict[str, int]:
+        """
+        Statements executed at least `threshold` times (N+1 candidates).
+
+        Args:
+            threshold: Minimum executions of the same statement text (QUERY_PROFILER_REPEAT_THRESHOLD)
+
+        Returns:
+            Statement text -> executions, most repeated first
+        """
+        threshold = threshold or settings.query_profiler_repeat_threshold
+        counts = Counter(statement for statement, _ in self.statements)
+        return {statement: n for statement, n in counts.most_common() if n >= threshold}
+
+    def summary(self) -> Dict[str, Any]:
+        """Counts, time and the slowest statements, for logs and samples."""
+        slowest = sorted(self.statements, key=lambda item: item[1], reverse=True)[:MAX_SAMPLE_STATEMENTS]
+        return {
+            "label": self.label,
+            "queries": self.count,
+            "query_ms": round(self.total_seconds * 1000, 1),
+            "repeated": {statement[:MAX_STATEMENT_CHARS]: n for statement, n in self.repeated().items()},
+            "slowest": [
+                {"statement": statement[:MAX_STATEMENT_CHARS], "ms": round(seconds * 1000, 2)}
+                for statement, seconds in slowest
+            ],
+        }
+
+
+@contextmanager
+def profile_queries(label: str = "block") -> Iterator[QueryProfile]:
+    """Profile the statements executed by the current thread or task inside the block."""
+    profile = QueryProfile(label)
+    token = _current_profile.set(profile)
+    try:
+        yield profile
+    finally:
+        _current_profile.reset(token)
+
+
+def assert_query_budget(profile: QueryProfile, max_queries: int, max_repeats: Optional[int] = None) -> None:
+    """
+    Fail when a profile exceeds its statement budget or repeats a statement too often.
+
+    Args:
+        profile: Profile of the request or block under test
+        max_queries: Statements allowed in total
+        max_repeats: Executions allowed for any single statement text (default: no check)
+
+    Raises:
+        QueryBudgetExceeded: With the statements that broke the budget
+    """
+    if profile.count > max_queries:
+        counts = Counter(statement for statement, _ in profile.statements)
+        listing = "\n".join(f"  {n}x {statement[:200]}" for statement, n in counts.most_common())
+        raise QueryBudgetExceeded(f"{profile.label}: {profile.count} queries, budget {max_queries}\n{listing}")
+
+    if max_repeats is not None:
+        repeated = profile.repeated(threshold=max_repeats + 1)
+        if repeated:
+            listing = "\n".join(f"  {n}x {statement[:200]}" for statement, n in repeated.items())
+            raise QueryBudgetExceeded(f"{profile.label}: statements repeated more than {max_repeats} times (N+1?)\n{listing}")
+
+
+class QueryProfiler:
+    """Engine hooks, request profiling and the slow-request samples."""
+
+    def __init__(
+        self,
+        enabled: Optional[bool] = None,
+        slow_request_ms: Optional[float] = None,
+        sample_rate: Optional[float] = None
+    ):
+        """
+        Args:
+            enabled: Profile every API request (QUERY_PROFILER_ENABLED)
+            slow_request_ms: Requests at least this slow are sampled with their SQL
+            sample_rate: Fraction of slow requests kept
+        """
+        self.enabled = settings.query_profiler_enabled if enabled is None else enabled
+        self.slow_request_ms = settings.query_profiler_slow_request_ms if slow_request_ms is None else slow_request_ms
+        self.sample_rate = settings.query_profiler_sample_rate if sample_rate is None else sample_rate
+
+        self._samples: deque = deque(maxlen=MAX_SAMPLES)
+        self._captures: List[List[QueryProfile]] = []
+        self._routes: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        """Whether requests should be profiled (enabled, or a test is capturing)."""
+        return self.enabled or bool(self._captures)
+
+    def install(self, engine: Any) -> None:
+        """Record the statements of an engine into the active profile, if any."""
+        from sqlalchemy import event
+
+        # The start time lives on the statement's execution context: after_cursor_execute
+        # does not fire for failed statements, so a per-connection stack would be left
+        # with stale entries and time later statements against them
+        @event.listens_for(engine, "before_cursor_execute")
+        def _before(conn, cursor, statement, parameters, context, executemany):
+            if context is not None and _current_profile.get() is not None:
+                context.det_profile_start = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def _after(conn, cursor, statement, parameters, context, executemany):
+            profile = _current_profile.get()
+            start = getattr(context, "det_profile_start", None)
+            if profile is None or start is None:
+                return
+            profile.record(statement, time.perf_counter() - start)
+
+    @contextmanager
+    def capture(self) -> Iterator[List[QueryProfile]]:
+        """
+        Collect the profile of every request finished inside the block.
+
+        The test client runs the app on another thread, so request profiles are
+        handed over here rather than through the caller's context.
+        """
+        profiles: List[QueryProfile] = []
+        with self._lock:
+            self._captures.append(profiles)
+        try:
+            yield profiles
+        finally:
+            with self._lock:
+                self._captures.remove(profiles)
+
+    def start_request(self, label: str) -> tuple:
+        """Start profiling a request; the returned handle is passed to finish_request."""
+        profile = QueryProfile(label)
+        return profile, _current_profile.set(profile)
+
+    def finish_request(self, started, route: str, status: int, duration_seconds: float) -> QueryProfile:
+        """
+        Close a request profile: record route stats, warn on N+1 and sample slow requests.
+
+        Args:
+            started: Handle returned by start_request
+            route: Route template of the request
+            status: Response status code
+            duration_seconds: Request wall time
+        """
+        profile, token = started
+        _current_profile.reset(token)
+        profile.label = route
+
+        repeated = profile.repeated()
+        duration_ms = duration_seconds * 1000
+        with self._lock:
+            for profiles in self._captures:
+                profiles.append(profile)
+            stats = self._routes.setdefault(route, {"requests": 0, "queries": 0, "max_queries": 0, "query_seconds": 0.0, "n_plus_one": 0})
+            stats["requests"] += 1
+            stats["queries"] += profile.count
+            stats["max_queries"] = max(stats["max_queries"], profile.count)
+            stats["query_seconds"] += profile.total_seconds
+            if repeated:
+                stats["n_plus_one"] += 1
+            if duration_ms >= self.slow_request_ms and random.random() < self.sample_rate:
+                self._samples.append({
+                    "at": time.time(),
+                    "status": status,
+                    "duration_ms": round(duration_ms, 1),
+                    **profile.summary(),
+                })
+
+        metrics.observe("det_http_request_queries", profile.count, route=route)
+        if repeated:
+            metrics.inc("det_db_repeated_statements_total", route=route)
+            statement, n = next(iter(repeated.items()))
+            logger.warning(f"Possible N+1 on {route}: statement ran {n} times: {statement[:200]}")
+        return profile
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "slow_request_ms": self.slow_request_ms,
+                "sample_rate": self.sample_rate,
+                "routes": {
+                    route: {
+                        "requests": stats["requests"],
+                        "mean_queries": round(stats["queries"] / stats["requests"], 2),
+                        "max_queries": stats["max_queries"],
+                        "mean_query_ms": round(1000 * stats["query_seconds"] / stats["requests"], 2),
+                        "n_plus_one_requests": stats["n_plus_one"],
+                    }
+                    for route, stats in self._routes.items()
+                },
+                "slow_requests": list(self._samples),
+            }
+
+
+# Global query profiler
+query_profiler = QueryProfiler()
@@ -0,0 +1,298 @@
+"""
+DET Flow - Rate Limiter
+Per-user quotas checked before any database or LLM work: a per-minute message limit
+against floods and the daily submission quota (max_submissions_per_day for the free
+tier), both tiered by subscription_tier. Counters use the sliding window counter
+algorithm (current window plus the weighted previous window) in memory, or in Redis
+when enabled so every API worker shares them.
+"""
+
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+import json
+import logging
+import math
+import threading
+import time
+
+from core.config import settings
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+MINUTE = 60
+DAY = 86400
+
+# Limits per subscription tier; None = unlimited. The free tier's daily submissions
+# come from MAX_SUBMISSIONS_PER_DAY. Override with RATE_LIMIT_TIERS_JSON.
+DEFAULT_TIER_LIMITS: Dict[str, Dict[str, Optional[int]]] = {
+    "free": {"messages_per_minute": 20, "submissions_per_day": None},
+    "premium": {"messages_per_minute": 40, "submissions_per_day": 50},
+    "pro": {"messages_per_minute": 60, "submissions_per_day": 200},
+}
+
+
+class RateLimitResult(NamedTuple):
+    """Outcome of a quota check."""
+
+    allowed: bool
+    limit: Optional[int]  # None = unlimited
+    remaining: Optional[int]
+    retry_after: float  # Seconds until the next request would be allowed (0 when allowed)
+    scope: str = ""
+
+
+class SlidingWindowCounter:
+    """
+    Approximate sliding window: count = current window + previous window x the share
+    of it still inside the sliding window. Two integers per key, O(1) per check.
+    """
+
+    def __init__(self, redis_url: Optional[str] = None, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self._windows: Dict[Tuple[str, str], list] = {}  # (scope, key) -> [window index, current, previous]
+        self._lock = threading.Lock()
+
+        self._redis = None
+        if redis_url:
+            if redis is None:
+                logger.warning("Redis enabled but the redis package is not installed; using in-memory rate limits")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+    def hit(self, scope: str, key: str, limit: Optional[int], window: int, consume: bool = True) -> RateLimitResult:
+        """
+        Check (and by default consume) one unit of a quota.
+
+        Args:
+            scope: Quota name (messages, submissions)
+            key: Who the quota belongs to (the student's phone number)
+            limit: Max units per window (None or <= 0 = unlimited)
+            window: Window length in seconds
+            consume: False to only read the remaining quota
+
+        Returns:
+            RateLimitResult; denied hits are not counted
+        """
+        if not limit or limit <= 0:
+            return RateLimitResult(True, None, None, 0.0, scope)
+
+        now = self.clock()
+        index = int(now // window)
+        weight = 1 - (now % window) / window
+
+        if self._redis is not None:
+            try:
+                return self._hit_redis(scope, key, limit, window, index, weight, now, consume)
+            except Exception as e:
+                logger.warning(f"Redis rate limit check failed, using memory: {e}")
+
+        with self._lock:
+            entry = self._windows.get((scope, key))
+            if entry is None or entry[0] < index - 1:
+                entry = [index, 0, 0]
+            elif entry[0] == index - 1:
+                entry = [index, 0, entry[1]]
+            self._windows[(scope, key)] = entry
+            if len(self._windows) > 100_000:
+                self._windows = {k: v for k, v in self._windows.items() if v[0] >= index - 1}
+
+            result = self._decide(scope, limit, window, entry[1], entry[2], weight, now)
+            if consume and result.allowed:
+                entry[1] += 1
+                result = result._replace(remaining=result.remaining - 1)
+            return result
+
+    def _hit_redis(self, scope, key, limit, window, index, weight, now, consume) -> RateLimitResult:
+        current_key = f"ratelimit:{scope}:{key}:{index}"
+        previous_key = f"ratelimit:{scope}:{key}:{index - 1}"
+        pipe = self._redis.pipeline()
+        if not consume:
+            pipe.get(current_key)
+            pipe.get(previous_key)
+            current, previous = (int(value or 0) for value in pipe.execute())
+            return self._decide(scope, limit, window, current, previous, weight, now)
+
+        # Increment first so concurrent workers each see their own position in the
+        # window; a check-then-increment would let all of them pass at limit - 1
+        pipe.incr(current_key)
+        pipe.expire(current_key, window * 2)
+        pipe.get(previous_key)
+        current, _, previous = pipe.execute()
+
+        result = self._decide(scope, limit, window, int(current) - 1, int(previous or 0), weight, now)
+        if not result.allowed:
+            self._redis.decr(current_key)  # Denied hits are not counted
+            return result
+        return result._replace(remaining=result.remaining - 1)
+
+    def refund(self, scope: str, key: str, window: int) -> None:
+        """
+        Give back one unit consumed in the current window, e.g. when the work it paid for failed.
+
+        Units consumed in an earlier window are not refunded.
+        """
+        index = int(self.clock() // window)
+        if self._redis is not None:
+            try:
+                current_key = f"ratelimit:{scope}:{key}:{index}"
+                if self._redis.decr(current_key) < 0:
+                    self._redis.incr(current_key)  # Nothing was consumed in this window
+                return
+            except Exception as e:
+                logger.warning(f"Redis rate limit refund failed, using memory: {e}")
+
+        with self._lock:
+            entry = self._windows.get((scope, key))
+            if entry is not None and entry[0] == index and entry[1] > 0:
+                entry[1] -= 1
+
+    @staticmethod
+    def _decide(scope, limit, window, current, previous, weight, now) -> RateLimitResult:
+        used = current + previous * weight
+        if used + 1 <= limit:
+            return RateLimitResult(True, limit, max(0, int(limit - used)), 0.0, scope)
+
+        # Time until enough of the previous window slides out (or the current one ends)
+        if previous and current < limit:
+            needed = (used + 1 - limit) / previous  # Weight that has to drop
+            retry_after = needed * window
+        else:
+            retry_after = window - (now % window)
+        return RateLimitResult(False, limit, 0, round(max(1.0, retry_after), 1), scope)
+
+
+class RateLimiter:
+    """Tiered message and submission quotas."""
+
+    def __init__(self, counter: Optional[SlidingWindowCounter] = None):
+        redis_url = settings.redis_url if settings.redis_enabled else None
+        self.counter = counter or SlidingWindowCounter(redis_url)
+        self.tiers = self._load_tiers()
+        self._tiers_by_key: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "limited": {"messages": 0, "submissions": 0}}
+
+    def remember_tier(self, key: str, subscription_tier: Optional[str]) -> None:
+        """Cache a key's tier so later checks need no database lookup."""
+        tier = subscription_tier or "free"
+        with self._lock:
+            if self._tiers_by_key.get(key) == tier:
+                return
+            self._tiers_by_key[key] = tier
+        if self.counter._redis is not None:
+            try:
+                self.counter._redis.set(f"ratelimit:tier:{key}", tier, ex=DAY * 7)
+            except Exception as e:
+                logger.warning(f"Error caching tier in Redis: {e}")
+
+    def tier_for(self, key: str) -> str:
+        """Cached tier of a key; unknown keys get the free tier limits."""
+        with self._lock:
+            tier = self._tiers_by_key.get(key)
+        if tier is None and self.counter._redis is not None:
+            try:
+                value = self.counter._redis.get(f"ratelimit:tier:{key}")
+                tier = value.decode() if isinstance(value, bytes) else value
+            except Exception as e:
+                logger.warning(f"Error reading tier from Redis: {e}")
+        return tier or "free"
+
+    def limits_for(self, subscription_tier: Optional[str]) -> Dict[str, Optional[int]]:
+        return self.tiers.get(subscription_tier or "free", self.tiers["free"])
+
+    def check_message(self, key: str, is_submission: bool = False) -> RateLimitResult:
+        """
+        Check an inbound message against the flood limit and, for submissions, the daily quota.
+
+        Args:
+            key: Student's phone number
+            is_submission: Whether the message will be evaluated
+
+        Returns:
+            The first limit that denies it, or the submission (else message) quota result
+        """
+        if not settings.rate_limit_enabled:
+            return RateLimitResult(True, None, None, 0.0, "messages")
+        limits = self.limits_for(self.tier_for(key))
+
+        # Nothing is consumed unless the whole check passes
+        result = self.counter.hit("messages", key, limits["messages_per_minute"], MINUTE, consume=False)
+        if result.allowed and is_submission:
+            result = self.counter.hit("submissions", key, limits["submissions_per_day"], DAY)
+        if result.allowed:
+            message = self.counter.hit("messages", key, limits["messages_per_minute"], MINUTE)
+            if not message.allowed:  # Another worker took the last message unit meanwhile
+                if is_submission:
+                    self.counter.refund("submissions", key, DAY)
+                result = message
+            elif not is_submission:
+                result = message
+        self._count(result)
+        return result
+
+    def check_submission(self, key: str) -> RateLimitResult:
+        """Consume one unit of the daily submission quota."""
+        if not settings.rate_limit_enabled:
+            return RateLimitResult(True, None, None, 0.0, "submissions")
+        result = self.counter.hit("submissions", key, self.limits_for(self.tier_for(key))["submissions_per_day"], DAY)
+        self._count(result)
+        return result
+
+    def refund_submission(self, key: str) -> None:
+        """Give back a daily submission unit whose evaluation failed."""
+        if settings.rate_limit_enabled:
+            self.counter.refund("submissions", key, DAY)
+
+    def remaining_submissions(self, key: str) -> RateLimitResult:
+        """Read the daily submission quota without consuming it."""
+        if not settings.rate_limit_enabled:
+            return RateLimitResult(True, None, None, 0.0, "submissions")
+        return self.counter.hit(
+            "submissions", key, self.limits_for(self.tier_for(key))["submissions_per_day"], DAY, consume=False
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checks": self._stats["checks"],
+                "limited": dict(self._stats["limited"]),
+                "tiers": self.tiers,
+                "known_keys": len(self._tiers_by_key),
+                "backend": "redis" if self.counter._redis is not None else "memory",
+            }
+
+    def _count(self, result: RateLimitResult) -> None:
+        with self._lock:
+            self._stats["checks"] += 1
+            if not result.allowed:
+                self._stats["limited"][result.scope] += 1
+
+    def _load_tiers(self) -> Dict[str, Dict[str, Optional[int]]]:
+        tiers = {tier: dict(limits) for tier, limits in DEFAULT_TIER_LIMITS.items()}
+        tiers["free"]["submissions_per_day"] = settings.max_submissions_per_day
+        if settings.rate_limit_tiers_json:
+            try:
+                for tier, limits in json.loads(settings.rate_limit_tiers_json).items():
+                    tiers.setdefault(tier, dict(tiers["free"])).update(limits)
+            except (json.JSONDecodeError, AttributeError, TypeError) as e:
+                logger.warning(f"Invalid RATE_LIMIT_TIERS_JSON, using defaults: {e}")
+        return tiers
+
+
+def limit_message(result: RateLimitResult) -> str:
+    """WhatsApp reply for a denied message."""
+    if result.scope == "submissions":
+        hours = max(1, math.ceil(result.retry_after / 3600))
+        return (
+            f"Você atingiu o limite de {result.limit} correções por dia do seu plano. "
+            f"Tente novamente em cerca de {hours}h. ⏳"
+        )
+    return "Você está enviando mensagens muito rápido. Aguarde um minuto e tente novamente. ⏳"
+
+
+# Global rate limiter
+rate_limiter = RateLimiter()
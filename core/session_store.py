@@ -0,0 +1,367 @@
+"""
+DET Flow - Conversation Session Store
+Keeps each student's active conversation in a hot tier (memory, or Redis when enabled) and
+persists it to the user_sessions table with write-behind batching. Sessions expire after
+settings.session_timeout_minutes of inactivity and carry a compact, size-bounded history
+of recent turns for the InterfaceAgent; the flusher also marks expired rows inactive.
+"""
+
+from typing import Dict, Any, Optional, List
+import json
+import logging
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+from core.config import settings
+from core.database import SessionLocal
+from core.models import UserSession
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+# How often the flusher marks expired user_sessions rows inactive
+EXPIRY_SWEEP_INTERVAL_SECONDS = 60
+
+
+class ConversationSession:
+    """In-memory view of a UserSession row."""
+
+    __slots__ = ("session_id", "user_id", "context", "created_at", "last_interaction", "expires_at")
+
+    def __init__(
+        self,
+        session_id: str,
+        user_id: int,
+        context: Optional[Dict[str, Any]] = None,
+        created_at: Optional[datetime] = None,
+        last_interaction: Optional[datetime] = None,
+        expires_at: Optional[datetime] = None
+    ):
+        now = datetime.now()
+        self.session_id = session_id
+        self.user_id = user_id
+        self.context = context or {"history": []}
+        self.created_at = created_at or now
+        self.last_interaction = last_interaction or now
+        self.expires_at = expires_at or now + timedelta(minutes=settings.session_timeout_minutes)
+
+    @property
+    def is_expired(self) -> bool:
+        return datetime.now() >= self.expires_at
+
+    @property
+    def history(self) -> List[Dict[str, Any]]:
+        return self.context.setdefault("history", [])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "context": self.context,
+            "created_at": self.created_at.isoformat(),
+            "last_interaction": self.last_interaction.isoformat(),
+            "expires_at": self.expires_at.isoformat(),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationSession":
+        return cls(
+            session_id=data["session_id"],
+            user_id=data["user_id"],
+            context=data.get("context"),
+            created_at=datetime.fromisoformat(data["created_at"]),
+            last_interaction=datetime.fromisoformat(data["last_interaction"]),
+            expires_at=datetime.fromisoformat(data["expires_at"]),
+        )
+
+
+class SessionStore:
+    """
+    Two-tier session store with write-behind persistence.
+
+    Reads hit the hot tier first and fall back to the latest active user_sessions row.
+    Writes only mark the session dirty; a background thread flushes dirty sessions to
+    the database in one transaction every session_flush_interval_seconds.
+    """
+
+    def __init__(
+        self,
+        timeout_minutes: Optional[int] = None,
+        max_turns: Optional[int] = None,
+        max_chars: Optional[int] = None,
+        flush_interval_seconds: Optional[float] = None,
+        redis_url: Optional[str] = None
+    ):
+        """Initialize the store. Redis is used when enabled in settings and installed."""
+        self.timeout = timedelta(minutes=timeout_minutes or settings.session_timeout_minutes)
+        self.max_turns = max_turns or settings.session_history_max_turns
+        self.max_chars = max_chars or settings.session_history_max_chars
+        self.flush_interval_seconds = flush_interval_seconds or settings.session_flush_interval_seconds
+
+        self._sessions: Dict[int, ConversationSession] = {}
+        self._dirty: Dict[str, ConversationSession] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._last_sweep = 0.0
+
+        self._redis = None
+        redis_url = redis_url or (settings.redis_url if settings.redis_enabled else None)
+        if redis_url:
+            if redis is None:
+                logger.warning("Redis enabled but the redis package is not installed; using in-memory session store")
+            else:
+                self._redis = redis.Redis.from_url(redis_url)
+
+    # ==================== Public API ====================
+
+    def get_session(self, user_id: int, session_id: Optional[str] = None) -> ConversationSession:
+        """
+        Get the user's active session, creating a new one when none is active.
+
+        Args:
+            user_id: User ID
+            session_id: Optional session ID supplied by the client
+
+        Returns:
+            Active ConversationSession
+        """
+        session = self._get_hot(user_id)
+
+        if session is None or session.is_expired or (session_id and session.session_id != session_id):
+            session = self._load_from_db(user_id, session_id)
+
+        if session is None or session.is_expired:
+            session = ConversationSession(
+                session_id=session_id or f"wa-{uuid.uuid4().hex}",
+                user_id=user_id,
+                expires_at=datetime.now() + self.timeout
+            )
+            logger.info(f"New conversation session {session.session_id} for user {user_id}")
+
+        self._put_hot(session)
+        return session
+
+    def append_turn(
+        self,
+        session: ConversationSession,
+        user_message: str,
+        assistant_message: Optional[str],
+        intent: Optional[str] = None
+    ) -> None:
+        """Record a conversation turn, trim the history and schedule persistence."""
+        now = datetime.now()
+        turn = {
+            "user": self._truncate(user_message, self.max_chars // 4),
+            "assistant": self._truncate(assistant_message or "", self.max_chars // 4),
+            "intent": intent,
+            "at": now.isoformat(timespec="seconds"),
+        }
+
+        history = session.history
+        history.append(turn)
+        del history[:-self.max_turns]
+
+        # Drop the oldest turns until the history fits the character budget
+        while len(history) > 1 and sum(len(t["user"]) + len(t["assistant"]) for t in history) > self.max_chars:
+            history.pop(0)
+
+        if intent:
+            session.context["last_intent"] = intent
+        session.last_interaction = now
+        session.expires_at = now + self.timeout
+
+        self._put_hot(session)
+        self._mark_dirty(session)
+
+    def recent_history(self, session: ConversationSession) -> List[Dict[str, Any]]:
+        """Get the rolling history in the compact form passed to the InterfaceAgent."""
+        return [
+            {"user": turn["user"], "assistant": turn["assistant"]}
+            for turn in session.history
+        ]
+
+    def flush(self) -> int:
+        """
+        Persist dirty sessions to user_sessions in a single transaction.
+
+        Returns:
+            Number of sessions written
+        """
+        with self._flush_lock:
+            with self._lock:
+                dirty = list(self._dirty.values())
+                self._dirty.clear()
+
+            if not dirty:
+                return 0
+
+            db = SessionLocal()
+            try:
+                existing = {
+                    row.session_id: row
+                    for row in db.query(UserSession).filter(
+                        UserSession.session_id.in_([s.session_id for s in dirty])
+                    ).all()
+                }
+
+                for session in dirty:
+                    row = existing.get(session.session_id)
+                    if row is None:
+                        row = UserSession(session_id=session.session_id, user_id=session.user_id)
+                        db.add(row)
+                    row.context = json.loads(json.dumps(session.context))
+                    row.last_interaction = session.last_interaction
+                    row.expires_at = session.expires_at
+                    row.is_active = True
+
+                db.commit()
+                return len(dirty)
+
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error persisting conversation sessions: {e}")
+                # Keep them dirty so the next flush retries, unless newer state arrived
+                with self._lock:
+                    for session in dirty:
+                        self._dirty.setdefault(session.session_id, session)
+                return 0
+            finally:
+                db.close()
+
+    def deactivate_expired(self) -> int:
+        """
+        Mark user_sessions rows past their expiry as inactive.
+
+        Returns:
+            Number of rows deactivated
+        """
+        self._last_sweep = time.monotonic()
+        db = SessionLocal()
+        try:
+            count = db.query(UserSession).filter(
+                UserSession.is_active == True,  # noqa: E712
+                UserSession.expires_at <= datetime.now()
+            ).update({UserSession.is_active: False}, synchronize_session=False)
+            db.commit()
+            if count:
+                logger.info(f"Deactivated {count} expired conversation sessions")
+            return count
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error deactivating expired conversation sessions: {e}")
+            return 0
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        """Stop the background flusher, persist pending writes and deactivate expired sessions."""
+        self._stop_event.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval_seconds * 2)
+            self._flusher = None
+        self.flush()
+        self.deactivate_expired()
+
+    # ==================== Hot tier ====================
+
+    def _get_hot(self, user_id: int) -> Optional[ConversationSession]:
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(self._redis_key(user_id))
+                return ConversationSession.from_dict(json.loads(raw)) if raw else None
+            except Exception as e:
+                logger.warning(f"Redis session read failed, using memory: {e}")
+
+        with self._lock:
+            session = self._sessions.get(user_id)
+            if session is not None and session.is_expired:
+                del self._sessions[user_id]
+                return None
+            return session
+
+    def _put_hot(self, session: ConversationSession) -> None:
+        if self._redis is not None:
+            try:
+                ttl = max(1, int((session.expires_at - datetime.now()).total_seconds()))
+                self._redis.set(self._redis_key(session.user_id), json.dumps(session.to_dict()), ex=ttl)
+            except Exception as e:
+                logger.warning(f"Redis session write failed, using memory: {e}")
+
+        with self._lock:
+            self._sessions[session.user_id] = session
+            if len(self._sessions) > 10_000:
+                self._evict_expired()
+
+    def _evict_expired(self) -> None:
+        expired = [user_id for user_id, session in self._sessions.items() if session.is_expired]
+        for user_id in expired:
+            del self._sessions[user_id]
+
+    @staticmethod
+    def _redis_key(user_id: int) -> str:
+        return f"session:user:{user_id}"
+
+    # ==================== Persistence ====================
+
+    def _load_from_db(self, user_id: int, session_id: Optional[str]) -> Optional[ConversationSession]:
+        db = SessionLocal()
+        try:
+            query = db.query(UserSession).filter(
+                UserSession.user_id == user_id,
+                UserSession.is_active == True  # noqa: E712
+            )
+            if session_id:
+                query = query.filter(UserSession.session_id == session_id)
+            row = query.order_by(UserSession.last_interaction.desc()).first()
+
+            if row is None or (row.expires_at and row.expires_at.replace(tzinfo=None) <= datetime.now()):
+                return None
+
+            return ConversationSession(
+                session_id=row.session_id,
+                user_id=row.user_id,
+                context=row.context or {"history": []},
+                created_at=row.created_at.replace(tzinfo=None) if row.created_at else None,
+                last_interaction=row.last_interaction.replace(tzinfo=None) if row.last_interaction else None,
+                expires_at=row.expires_at.replace(tzinfo=None) if row.expires_at else None
+            )
+        except Exception as e:
+            logger.error(f"Error loading conversation session for user {user_id}: {e}")
+            return None
+        finally:
+            db.close()
+
+    def _mark_dirty(self, session: ConversationSession) -> None:
+        with self._lock:
+            self._dirty[session.session_id] = session
+            self._ensure_flusher()
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._stop_event.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-flusher", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.wait(self.flush_interval_seconds):
+            self.flush()
+            if time.monotonic() - self._last_sweep >= EXPIRY_SWEEP_INTERVAL_SECONDS:
+                self.deactivate_expired()
+
+    @staticmethod
+    def _truncate(text: str, limit: int) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+# Global session store instance
+session_store = SessionStore()
@@ -0,0 +1,285 @@
+"""
+DET Flow - LLM Usage Ledger
+Records the tokens, latency and estimated cost of every LLM call in the append-only
+llm_usage table. Calls are attributed to the user whose turn triggered them through a
+context variable set by the Maestro, buffered in memory and written in batches by a
+background thread. Per-user daily token totals are also kept in memory so tier
+budgets can be checked without a query.
+"""
+
+from typing import Any, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, datetime, timedelta
+import json
+import logging
+import threading
+
+from sqlalchemy import func, insert
+
+from core.config import settings
+from core.database import SessionLocal
+from core.models import LLMUsage
+
+logger = logging.getLogger(__name__)
+
+# User the current LLM work is done for (None = system work, e.g. background jobs)
+_usage_context: ContextVar[Optional[Dict[str, Any]]] = ContextVar("llm_usage_context", default=None)
+
+ROLLUP_DIMENSIONS = ("day", "user", "activity", "model", "tier")
+
+
+@contextmanager
+def usage_scope(user_id: Optional[int], subscription_tier: Optional[str] = None) -> Iterator[None]:
+    """Attribute the LLM calls made inside the block to a user."""
+    token = _usage_context.set({"user_id": user_id, "subscription_tier": subscription_tier})
+    try:
+        yield
+    finally:
+        _usage_context.reset(token)
+
+
+def current_usage_scope() -> Dict[str, Any]:
+    """User and tier the current LLM calls are attributed to."""
+    return _usage_context.get() or {"user_id": None, "subscription_tier": None}
+
+
+class UsageLedger:
+    """Buffered, batched writer for llm_usage rows plus rollup queries."""
+
+    def __init__(
+        self,
+        session_factory=None,
+        batch_size: Optional[int] = None,
+        flush_interval_seconds: Optional[float] = None
+    ):
+        """
+        Args:
+            session_factory: Creates database sessions (SessionLocal by default)
+            batch_size: Buffered rows that trigger an immediate flush
+            flush_interval_seconds: Max time a row waits in the buffer
+        """
+        self.session_factory = session_factory or SessionLocal
+        self.batch_size = batch_size or settings.usage_batch_size
+        self.flush_interval_seconds = flush_interval_seconds or settings.usage_flush_interval_seconds
+
+        self._buffer: List[Dict[str, Any]] = []
+        self._daily_tokens: Dict[int, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop_event = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self._stats = {"recorded": 0, "written": 0, "batches": 0, "write_errors": 0, "dropped": 0}
+
+    def record(
+        self,
+        activity: str,
+        model: str,
+        usage: Dict[str, Any],
+        latency_ms: Optional[int] = None,
+        cost_usd: Optional[float] = None
+    ) -> None:
+        """
+        Buffer the usage of one LLM call (attributed to the current usage scope).
+
+        Args:
+            activity: Activity type (evaluation, study_plan, chat, ...)
+            model: Model that served the call
+            usage: Normalized usage from extract_usage
+            latency_ms: Call latency, failover and hedging included
+            cost_usd: Estimated cost
+        """
+        if not settings.usage_tracking_enabled:
+            return
+
+        scope = current_usage_scope()
+        row = {
+            "user_id": scope["user_id"],
+            "subscription_tier": scope["subscription_tier"],
+            "activity": activity,
+            "model": model,
+            "input_tokens": int(usage.get("input_tokens", 0) or 0),
+            "cached_input_tokens": int(usage.get("cached_input_tokens", 0) or 0),
+            "output_tokens": int(usage.get("output_tokens", 0) or 0),
+            "latency_ms": latency_ms,
+            "cost_usd": cost_usd,
+            "created_at": datetime.now(),
+        }
+
+        with self._lock:
+            self._buffer.append(row)
+            self._stats["recorded"] += 1
+            if scope["user_id"] is not None:
+                self._add_daily_tokens(scope["user_id"], row["input_tokens"] + row["output_tokens"])
+            if len(self._buffer) > self.batch_size * 20:
+                # Database unreachable for a long time: keep memory bounded
+                dropped = len(self._buffer) - self.batch_size * 20
+                del self._buffer[:dropped]
+                self._stats["dropped"] += dropped
+            full = len(self._buffer) >= self.batch_size
+            self._ensure_flusher()
+
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        """
+        Write buffered rows in one multi-row INSERT.
+
+        Returns:
+            Number of rows written
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._buffer = self._buffer, []
+            if not rows:
+                return 0
+
+            db = self.session_factory()
+            try:
+                db.execute(insert(LLMUsage), rows)
+                db.commit()
+                with self._lock:
+                    self._stats["written"] += len(rows)
+                    self._stats["batches"] += 1
+                return len(rows)
+            except Exception as e:
+                db.rollback()
+                logger.error(f"Error writing LLM usage: {e}")
+                with self._lock:
+                    self._buffer[:0] = rows  # Retried on the next flush
+                    self._stats["write_errors"] += 1
+                return 0
+            finally:
+                db.close()
+
+    def close(self) -> None:
+        """Stop the background writer and persist pending rows."""
+        self._stop_event.set()
+        self._wakeup.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=self.flush_interval_seconds * 2)
+            self._flusher = None
+        self.flush()
+
+    def tokens_today(self, user_id: int) -> int:
+        """Tokens recorded for a user today by this process."""
+        with self._lock:
+            entry = self._daily_tokens.get(user_id)
+            return entry["tokens"] if entry and entry["day"] == date.today() else 0
+
+    def is_over_budget(self, user_id: Optional[int], subscription_tier: Optional[str]) -> bool:
+        """
+        Check the user's daily token budget for their tier (LLM_DAILY_TOKEN_BUDGETS_JSON).
+
+        Tiers without a budget are unlimited.
+        """
+        if user_id is None:
+            return False
+        budget = self._budgets().get(subscription_tier or "free")
+        return budget is not None and self.tokens_today(user_id) >= budget
+
+    def rollup(
+        self,
+        db,
+        group_by: List[str],
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        user_id: Optional[int] = None,
+        limit: int = 500
+    ) -> List[Dict[str, Any]]:
+        """
+        Aggregate usage over the requested dimensions.
+
+        Args:
+            db: Database session
+            group_by: Dimensions among day, user, activity, model and tier
+            since: Start of the period (default: 7 days ago)
+            until: End of the period (default: now)
+            user_id: Only this user
+            limit: Max groups, most expensive first
+
+        Returns:
+            One dict per group with calls, token totals, mean latency and cost
+        """
+        unknown = [name for name in group_by if name not in ROLLUP_DIMENSIONS]
+        if unknown:
+            raise ValueError(f"Unknown rollup dimensions: {', '.join(unknown)}")
+
+        columns = {
+            "day": func.date(LLMUsage.created_at).label("day"),
+            "user": LLMUsage.user_id.label("user"),
+            "activity": LLMUsage.activity.label("activity"),
+            "model": LLMUsage.model.label("model"),
+            "tier": LLMUsage.subscription_tier.label("tier"),
+        }
+        dimensions = [columns[name] for name in group_by]
+        total_tokens = func.sum(LLMUsage.input_tokens + LLMUsage.output_tokens)
+        query = db.query(
+            *dimensions,
+            func.count(LLMUsage.id).label("calls"),
+            func.sum(LLMUsage.input_tokens).label("input_tokens"),
+            func.sum(LLMUsage.cached_input_tokens).label("cached_input_tokens"),
+            func.sum(LLMUsage.output_tokens).label("output_tokens"),
+            func.avg(LLMUsage.latency_ms).label("mean_latency_ms"),
+            func.sum(LLMUsage.cost_usd).label("cost_usd"),
+        ).filter(
+            LLMUsage.created_at >= (since or datetime.now() - timedelta(days=7)),
+            LLMUsage.created_at <= (until or datetime.now())
+        )
+        if user_id is not None:
+            query = query.filter(LLMUsage.user_id == user_id)
+        if dimensions:
+            query = query.group_by(*dimensions)
+
+        rows = query.order_by(func.coalesce(func.sum(LLMUsage.cost_usd), 0).desc(), total_tokens.desc()).limit(limit)
+        return [
+            {
+                **{name: (str(getattr(row, name)) if name == "day" else getattr(row, name)) for name in group_by},
+                "calls": row.calls,
+                "input_tokens": int(row.input_tokens or 0),
+                "cached_input_tokens": int(row.cached_input_tokens or 0),
+                "output_tokens": int(row.output_tokens or 0),
+                "mean_latency_ms": int(row.mean_latency_ms) if row.mean_latency_ms is not None else None,
+                "cost_usd": round(row.cost_usd, 6) if row.cost_usd is not None else None,
+            }
+            for row in rows
+        ]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "buffered": len(self._buffer), "users_tracked_today": len(self._daily_tokens)}
+
+    def _add_daily_tokens(self, user_id: int, tokens: int) -> None:
+        today = date.today()
+        if len(self._daily_tokens) > 100_000:
+            self._daily_tokens = {uid: e for uid, e in self._daily_tokens.items() if e["day"] == today}
+        entry = self._daily_tokens.get(user_id)
+        if entry is None or entry["day"] != today:
+            entry = self._daily_tokens[user_id] = {"day": today, "tokens": 0}
+        entry["tokens"] += tokens
+
+    def _budgets(self) -> Dict[str, int]:
+        try:
+            return json.loads(settings.llm_daily_token_budgets_json or "{}")
+        except json.JSONDecodeError:
+            logger.warning("Invalid LLM_DAILY_TOKEN_BUDGETS_JSON, budgets disabled")
+            return {}
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is not None and self._flusher.is_alive():
+            return
+        self._stop_event.clear()
+        self._flusher = threading.Thread(target=self._flush_loop, name="usage-writer", daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self) -> None:
+        while not self._stop_event.is_set():
+            self._wakeup.wait(self.flush_interval_seconds)
+            self._wakeup.clear()
+            self.flush()
+
+
+# Global LLM usage ledger
+usage_ledger = UsageLedger()
@@ -0,0 +1,386 @@
+"""
+DET Flow - WhatsApp Outbound Sender
+Pushes messages to students through the Evolution API using a pooled HTTP client,
+per-recipient ordered queues, a global rate limit and retries with backoff.
+"""
+
+from typing import Dict, Any, Optional, List
+import asyncio
+import logging
+import time
+
+import httpx
+
+from core.config import settings
+from core.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying (rate limited or transient server failures)
+RETRYABLE_STATUS_CODES = {408, 425, 429, 500, 502, 503, 504}
+
+
+class EvolutionAPIError(Exception):
+    """Exception raised for Evolution API errors."""
+    pass
+
+
+class SenderOverloadedError(EvolutionAPIError):
+    """Raised when a recipient queue stays full longer than the caller is willing to wait."""
+    pass
+
+
+def split_message(text: str, max_length: int) -> List[str]:
+    """
+    Split a message into chunks that fit the WhatsApp size limit.
+
+    Prefers paragraph boundaries, then line breaks, then spaces, and only cuts
+    words when a single word is longer than the limit.
+
+    Args:
+        text: Message text
+        max_length: Maximum characters per chunk
+
+    Returns:
+        List of chunks, in order
+    """
+    if max_length <= 0:
+        raise ValueError("max_length must be positive")
+
+    text = text.strip()
+    if len(text) <= max_length:
+        return [text] if text else []
+
+    chunks: List[str] = []
+    remaining = text
+    while len(remaining) > max_length:
+        window = remaining[:max_length + 1]
+        cut = -1
+        for separator in ("\n\n", "\n", " "):
+            cut = window.rfind(separator)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = max_length
+
+        chunk = remaining[:cut].rstrip()
+        if chunk:
+            chunks.append(chunk)
+        remaining = remaining[cut:].lstrip()
+
+    if remaining:
+        chunks.append(remaining)
+
+    return chunks
+
+
+class RateLimiter:
+    """Async token bucket shared by every recipient queue."""
+
+    def __init__(self, rate_per_second: float, burst: Optional[int] = None):
+        self.rate = max(rate_per_second, 0.001)
+        self.capacity = float(burst or max(1, int(rate_per_second)))
+        self._tokens = self.capacity
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Wait until a token is available and consume it."""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class _OutboundItem:
+    """A queued message waiting to be delivered to one recipient."""
+
+    __slots__ = ("chunks", "future")
+
+    def __init__(self, chunks: List[str], future: asyncio.Future):
+        self.chunks = chunks
+        self.future = future
+
+
+class WhatsAppSender:
+    """
+    Asynchronous outbound sender for the Evolution API.
+
+    Messages for the same phone number are delivered strictly in order by a
+    dedicated worker, while different recipients are served concurrently.
+    Consecutive queued messages for a recipient are merged into as few API calls
+    as the size limit allows.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        instance_name: Optional[str] = None,
+        max_message_length: Optional[int] = None,
+        rate_limit_per_second: Optional[float] = None,
+        max_retries: Optional[int] = None,
+        max_connections: Optional[int] = None,
+        queue_max_size: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+        backoff_base_seconds: float = 0.5,
+        idle_worker_seconds: float = 30.0,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """Initialize the sender. Defaults come from settings."""
+        self.base_url = (base_url or settings.evolution_api_url).rstrip("/")
+        self.api_key = api_key or settings.evolution_api_key
+        self.instance_name = instance_name or settings.evolution_instance_name
+        self.max_message_length = max_message_length or settings.whatsapp_max_message_length
+        self.rate_limit_per_second = rate_limit_per_second or settings.evolution_rate_limit_per_second
+        self.max_retries = settings.evolution_send_max_retries if max_retries is None else max_retries
+        self.max_connections = max_connections or settings.evolution_max_connections
+        self.queue_max_size = queue_max_size or settings.whatsapp_queue_max_size
+        self.timeout_seconds = timeout_seconds or settings.evolution_send_timeout_seconds
+        self.backoff_base_seconds = backoff_base_seconds
+        self.idle_worker_seconds = idle_worker_seconds
+        self._transport = transport
+
+        self._client: Optional[httpx.AsyncClient] = None
+        self._rate_limiter: Optional[RateLimiter] = None
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+        self._stats = {
+            "messages_enqueued": 0,
+            "messages_delivered": 0,
+            "messages_failed": 0,
+            "api_calls": 0,
+            "retries": 0,
+            "chunks_merged": 0,
+        }
+
+    # ==================== Public API ====================
+
+    async def send_text(self, phone: str, text: str, wait_timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Queue a message and wait until it has been delivered.
+
+        Args:
+            phone: Recipient phone number
+            text: Message text (split automatically when too long)
+            wait_timeout: Max seconds to wait for room in the recipient queue
+
+        Returns:
+            Evolution API responses, one per API call that carried this message
+        """
+        future = await self.enqueue_text(phone, text, wait_timeout=wait_timeout)
+        return await future
+
+    async def enqueue_text(self, phone: str, text: str, wait_timeout: Optional[float] = None) -> asyncio.Future:
+        """
+        Queue a message for delivery without waiting for it to be sent.
+
+        Applies backpressure: when the recipient queue is full the call waits for
+        room, and raises SenderOverloadedError after wait_timeout seconds.
+
+        Returns:
+            Future resolved with the Evolution API responses once delivered
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        item = _OutboundItem(split_message(text, self.max_message_length), future)
+
+        if not item.chunks:
+            future.set_result([])
+            return future
+
+        queue = self._queues.get(phone)
+        if queue is None:
+            queue = asyncio.Queue(maxsize=self.queue_max_size)
+            self._queues[phone] = queue
+
+        try:
+            if wait_timeout is None:
+                await queue.put(item)
+            else:
+                await asyncio.wait_for(queue.put(item), timeout=wait_timeout)
+        except asyncio.TimeoutError:
+            raise SenderOverloadedError(f"Outbound queue full for {phone}")
+
+        self._stats["messages_enqueued"] += 1
+        self._ensure_worker(phone)
+        return future
+
+    async def flush(self) -> None:
+        """Wait until every queued message has been processed."""
+        for queue in list(self._queues.values()):
+            await queue.join()
+
+    async def close(self) -> None:
+        """Drain pending messages, stop workers and release pooled connections."""
+        await self.flush()
+        for task in list(self._workers.values()):
+            task.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
+        self._workers.clear()
+        self._queues.clear()
+
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self._rate_limiter = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get delivery counters and current queue depths."""
+        return {
+            **self._stats,
+            "active_recipients": len(self._workers),
+            "queued_messages": sum(queue.qsize() for queue in self._queues.values()),
+        }
+
+    # ==================== Internals ====================
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """Create the pooled HTTP client on first use (bound to the running loop)."""
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={"apikey": self.api_key, "Content-Type": "application/json"},
+                timeout=self.timeout_seconds,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections
+                ),
+                transport=self._transport
+            )
+        return self._client
+
+    def _get_rate_limiter(self) -> RateLimiter:
+        if self._rate_limiter is None:
+            self._rate_limiter = RateLimiter(self.rate_limit_per_second)
+        return self._rate_limiter
+
+    def _ensure_worker(self, phone: str) -> None:
+        task = self._workers.get(phone)
+        if task is None or task.done():
+            self._workers[phone] = asyncio.create_task(self._recipient_worker(phone))
+
+    async def _recipient_worker(self, phone: str) -> None:
+        """Deliver queued messages for one recipient, strictly in order."""
+        queue = self._queues[phone]
+
+        while True:
+            try:
+                first = await asyncio.wait_for(queue.get(), timeout=self.idle_worker_seconds)
+            except asyncio.TimeoutError:
+                # No await between the emptiness check and the removal, so no
+                # message can slip in without a worker.
+                if queue.empty():
+                    self._workers.pop(phone, None)
+                    self._queues.pop(phone, None)
+                    return
+                continue
+
+            batch = [first]
+            while not queue.empty():
+                batch.append(queue.get_nowait())
+
+            try:
+                await self._deliver_batch(phone, batch)
+            finally:
+                for _ in batch:
+                    queue.task_done()
+
+    async def _deliver_batch(self, phone: str, batch: List[_OutboundItem]) -> None:
+        """Merge consecutive chunks of a batch and send them in order."""
+        merged: List[str] = []
+        last_chunk_index: List[int] = []
+        for item in batch:
+            for chunk in item.chunks:
+                if merged and len(merged[-1]) + 2 + len(chunk) <= self.max_message_length:
+                    merged[-1] = f"{merged[-1]}\n\n{chunk}"
+                    self._stats["chunks_merged"] += 1
+                else:
+                    merged.append(chunk)
+            last_chunk_index.append(len(merged) - 1)
+
+        responses: List[Dict[str, Any]] = []
+        item_index = 0
+        for chunk_index, chunk in enumerate(merged):
+            try:
+                responses.append(await self._post_text(phone, chunk))
+            except Exception as e:
+                logger.error(f"Failed to deliver WhatsApp message to {phone}: {e}")
+                for item in batch[item_index:]:
+                    self._stats["messages_failed"] += 1
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                return
+
+            while item_index < len(batch) and last_chunk_index[item_index] == chunk_index:
+                item = batch[item_index]
+                self._stats["messages_delivered"] += 1
+                if not item.future.done():
+                    item.future.set_result(list(responses))
+                item_index += 1
+
+    async def _post_text(self, phone: str, text: str) -> Dict[str, Any]:
+        """Send a single text message, retrying transient failures with backoff."""
+        client = self._get_client()
+        path = f"/message/sendText/{self.instance_name}"
+        payload = {"number": phone, "text": text}
+
+        attempt = 0
+        while True:
+            await self._get_rate_limiter().acquire()
+            self._stats["api_calls"] += 1
+
+            retry_after: Optional[float] = None
+            start = time.perf_counter()
+            try:
+                response = await client.post(path, json=payload)
+                metrics.observe(
+                    "det_http_client_seconds", time.perf_counter() - start,
+                    target="evolution", status=response.status_code
+                )
+                if response.status_code < 300:
+                    return response.json() if response.content else {}
+
+                error = EvolutionAPIError(
+                    f"Evolution API returned {response.status_code}: {response.text[:200]}"
+                )
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    raise error
+                retry_after = self._parse_retry_after(response.headers.get("Retry-After"))
+
+            except httpx.TransportError as e:
+                metrics.observe(
+                    "det_http_client_seconds", time.perf_counter() - start, target="evolution", status="unreachable"
+                )
+                error = EvolutionAPIError(f"Evolution API unreachable: {e}")
+
+            if attempt >= self.max_retries:
+                raise error
+
+            attempt += 1
+            self._stats["retries"] += 1
+            delay = retry_after if retry_after is not None else self.backoff_base_seconds * (2 ** (attempt - 1))
+            logger.warning(f"Retrying WhatsApp message to {phone} in {delay:.2f}s ({error})")
+            await asyncio.sleep(delay)
+
+    @staticmethod
+    def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            return None
+
+
+# Global WhatsApp sender instance
+whatsapp_sender = WhatsAppSender()
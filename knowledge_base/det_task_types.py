@@ -33,6 +33,14 @@ class TaskType(str, Enum):
     SPEAKING_SAMPLE = "speaking_sample"
 
 
+# Tasks with a single correct answer, scored locally instead of by the LLM evaluator
+OBJECTIVE_TASK_TYPES = frozenset({
+    TaskType.READ_AND_COMPLETE,
+    TaskType.READ_AND_SELECT,
+    TaskType.LISTEN_AND_TYPE,
+})
+
+
 # Task characteristics and subscores mapping
 TASK_CHARACTERISTICS: Dict[str, Dict] = {
     TaskType.READ_AND_COMPLETE: {
@@ -48,6 +56,18 @@ TASK_CHARACTERISTICS: Dict[str, Dict] = {
         ]
     },
 
+    TaskType.READ_AND_SELECT: {
+        "name": "Read and Select",
+        "description": "Select the real English words from a list",
+        "duration_seconds": 60,
+        "primary_subscores": ["literacy", "comprehension"],
+        "difficulty_levels": ["A1", "A2", "B1", "B2", "C1"],
+        "scoring_criteria": [
+            "Word recognition",
+            "Vocabulary size"
+        ]
+    },
+
     TaskType.WRITE_ABOUT_PHOTO: {
         "name": "Write About the Photo",
         "description": "Write a description of a photo in at least one minute",
@@ -225,3 +245,16 @@ def get_tasks_by_subscore(subscore: str) -> List[str]:
         if subscore.lower() in info.get("primary_subscores", []):
             tasks.append(task_type)
     return tasks
+
+
+def is_objective_task(task_type: str) -> bool:
+    """
+    Check whether a task type has a correct answer that can be scored without the LLM.
+
+    Args:
+        task_type: The task type identifier
+
+    Returns:
+        True for objective tasks (read_and_complete, read_and_select, listen_and_type)
+    """
+    return task_type in OBJECTIVE_TASK_TYPES
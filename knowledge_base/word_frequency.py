@@ -0,0 +1,186 @@
+"""
+DET Flow - Word Frequency Reference
+Compact English frequency bands (first and second thousand most common word families
+plus a sample of the Academic Word List) and discourse connectives, used by the local
+lexical feature extractor to estimate vocabulary range and cohesion.
+"""
+
+from typing import Dict, Optional, Tuple
+
+
+def _words(block: str) -> frozenset:
+    return frozenset(block.split())
+
+
+# Most frequent word families (K1 band, core subset)
+K1_WORDS = _words("""
+a about above across act add after again against age ago air all almost alone along already also
+although always am among an and animal another answer any anyone anything appear are area arm around
+art as ask at away baby back bad bag ball bank be beautiful because become bed been before begin
+behind being believe below best better between big bird bit black blue boat body book born both box
+boy bread break bring brother brown build building burn business busy but buy by call came can car
+care carry case cat catch cause center certain chair change child children choose city class clean
+clear close clothes cloud cold color come common company complete could country course cover cross
+cry cup cut dark day dead dear decide deep did die different difficult dinner do doctor does dog
+door done down draw dream dress drink drive dry during each ear early earth easy eat egg eight either
+else end enough even evening ever every everyone everything example eye face fact fall family far
+farm fast father feel feet few field fight fill find fine finish fire first fish five floor flower fly
+follow food foot for forest forget form four free friend from front fruit full fun game garden gave
+get girl give glass go god gold gone good got great green ground group grow had hair half hand happen
+happy hard has hat have he head hear heart heavy help her here high hill him his hold home hope horse
+hot hour house how however hundred i idea if important in inside interest into is it its job just
+keep kind king kitchen knew know lady lake land language large last late laugh learn least leave left
+leg less let letter life light like line list listen little live long look lose lot love low made make
+man many map mark market matter may me mean meet men might mile milk mind minute miss moment money month
+more morning most mother mountain mouth move much music must my name near need never new news next
+nice night nine no none north not nothing now number of off office often oh old on once one only open
+or order other our out outside over own page paper parent park part party pass past pay people perhaps
+person picture piece place plan plant play please point poor possible power present pretty problem
+pull put question quick quiet rain ran reach read ready real reason red remember rest right river road
+rock room round run said same sat saw say school sea second see seem sell send sentence set seven
+several shall she ship shop short should show side simple since sing sister sit six sky sleep small
+smile snow so some someone something sometimes son song soon sound south speak special spend stand
+star start stay still stop story street strong student study such summer sun sure table take talk tall
+teach teacher tell ten than thank that the their them then there these they thing think third this
+those though thought three through time to today together told too took top toward town tree true try
+turn two under understand until up upon us use usually very visit voice wait walk wall want war warm
+was watch water way we wear weather week well went were west what when where which while white who
+whole why wide wife will win wind window winter wish with without woman women wonder wood word work
+world would write wrong year yellow yes yet you young your
+""")
+
+# Second thousand word families (K2 band, core subset)
+K2_WORDS = _words("""
+accept accident account action active actually admire adult advantage adventure advice afraid agree
+aim alive allow amazing amount ancient angry announce anxious apartment apologize appreciate approach
+argue arrange arrive article attack attempt attend attention attractive audience available avoid aware
+balance band basic battle beach bear beat beauty behave belong benefit bill birth blame blood board
+border borrow bottle bottom brain branch brave breath bridge bright broad budget burst calm camera
+campaign cancel capital career careful castle celebrate century challenge chance character charge
+cheap check cheerful chief choice church citizen claim climate climb coast coin collect comfortable
+comment communicate community compare competition complain concern condition confident connect
+consider contain continue control conversation cook cool copy correct cost cottage count couple courage
+crazy create crime crowd culture curious customer damage danger deal decision degree delay deliver
+demand depend describe desert design desire destroy detail develop device diet direction dirty
+discover discuss disease distance divide double doubt drop earn economy edge educate effect effort
+election electric emergency emotion employ empty encourage enemy energy engine enjoy enormous enter
+entertain environment equal escape especially event exact examine excellent excited excuse exercise
+exist expect expensive experience explain express extra fail fair familiar famous fashion favorite
+fear feature festival figure final flat flight focus force foreign forward freedom fresh friendly
+frighten fuel funny furniture future gain gather general generous gentle gift global goal government
+grade grateful guess guest guide habit handle hang harm health heat height hide history hobby holiday
+honest huge human hungry hurry hurt ideal identify ignore ill imagine immediately improve include
+increase independent industry influence inform injury insect instead instruction intend introduce
+invent invite island journey judge justice knowledge lack landscape law lazy lead leader lesson level
+library limit local lonely lovely luck machine manage manner marry material meal measure medicine
+member memory mention message method middle military mirror mistake modern motor museum narrow nation
+natural nature neighbor nervous noise normal notice object obvious occasion ocean offer opinion
+opportunity ordinary organize origin pain pair peace perfect perform period permit pleasant plenty
+pocket poem police polite popular population position positive practice prefer prepare pressure
+prevent price pride private prize produce professional program progress promise protect proud provide
+public purpose quality quarter quite race rare rather realize receive recent recognize recommend
+reduce refuse region relax religion remain repair repeat replace reply report request rescue respect
+responsible result return reward rich risk role rule rush safe salt satisfy save scene schedule
+science search season secret seek serious serve service shake shape share shelter shine shock silence
+silly skill smell smooth society soft soldier solution solve sort spirit split spread square stage
+steal straight strange stress structure succeed success suddenly suggest suit supply support suppose
+surface surprise surround survive sweet symbol system task taste tax technology temperature terrible
+theater thick thin threat throw tiny tired tool total tough tourist traffic travel treat trip trouble
+trust typical ugly unique universe unusual useful valley value various victory view village violent
+wage waste wealth weapon weigh welcome wild wise worry worth
+""")
+
+# Academic Word List (sample of the most useful families)
+ACADEMIC_WORDS = _words("""
+abstract academic access accurate achieve acknowledge acquire adapt adequate adjust advocate affect
+aggregate allocate alter alternative ambiguous analyse analysis analyze annual anticipate apparent
+approximate aspect assess assume attitude attribute authority benefit capacity category challenge
+circumstance cite coherent coincide collapse commission commit communicate compensate complex
+component comprehensive concept conclude concurrent conduct consequence considerable consist constant
+constitute constrain construct consult consume contemporary context contradict contrast contribute
+controversy convention convince crucial culture data debate decline deduce define demonstrate denote
+derive design despite detect deviate dimension diminish distinct distribute diverse document domain
+dominant dramatic dynamic economic element eliminate emerge emphasis empirical enable encounter enhance
+ensure entity environment equivalent establish estimate evaluate eventual evident evolve exceed exclude
+explicit exploit expose external facilitate factor feature finite flexible fluctuate focus format
+framework function fundamental generate global guarantee hence hierarchy highlight hypothesis identical
+identify ideology ignorance illustrate impact implement implication implicit impose incentive incidence
+indicate individual inevitable infer inherent initial innovate insight instance integrate integrity
+interpret intervene investigate involve isolate issue justify label labor likewise link logic maintain
+major manipulate maximize mechanism mediate minimal minimize modify monitor motive mutual negative
+network neutral nevertheless nonetheless notion objective obtain occupy occur odd ongoing option
+orient outcome output overall paradigm parameter participate perceive percent period persist
+perspective phase phenomenon philosophy policy portion potential precede precise predict predominant
+preliminary presume previous primary principle prior priority proceed process professional prohibit
+project promote proportion prospect protocol psychology publish pursue radical random range ratio
+rational react recover refine regime regulate reinforce reject relevant reluctant rely remove require
+research reside resolve resource respond restore restrict retain reveal revenue reverse revise
+scenario scheme scope section sector secure seek select sequence series significant similar simulate
+sole source specific sphere stable statistic status strategy stress structure submit subsequent
+substitute subtle sufficient summary supplement survey sustain symbol target technique temporary
+tension theory thereby thesis topic trace tradition transfer transform transition trend trigger
+ultimate undergo underlie undertake uniform unify utilize valid variable vary version via violate
+virtual visible vision volume voluntary welfare whereas widespread
+""")
+
+# Discourse connectives by function; multi-word phrases are matched on word boundaries
+CONNECTIVES: Dict[str, Tuple[str, ...]] = {
+    "addition": ("and", "also", "moreover", "furthermore", "in addition", "besides", "as well as", "additionally"),
+    "contrast": ("but", "however", "although", "though", "whereas", "while", "nevertheless", "on the other hand",
+                 "in contrast", "despite", "yet", "nonetheless"),
+    "cause": ("because", "since", "therefore", "so", "thus", "as a result", "consequently", "due to", "hence"),
+    "sequence": ("first", "firstly", "second", "secondly", "then", "next", "finally", "afterwards", "meanwhile",
+                 "eventually", "lastly"),
+    "example": ("for example", "for instance", "such as", "in particular", "namely", "especially"),
+    "conclusion": ("in conclusion", "to sum up", "overall", "in summary", "all in all", "to conclude"),
+}
+
+_SUFFIXES = ("ies", "ied", "ize", "ing", "ed", "es", "ly", "er", "est", "s")
+
+
+def _stems(word: str):
+    """Naive stems for plural, past, -ing, -ly, -ize and comparative forms."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            stem = word[: -len(suffix)]
+            yield stem
+            if suffix in ("ies", "ied"):
+                yield stem + "y"
+            elif suffix == "ize":
+                yield stem + "is"  # emphasize -> emphasis
+            elif suffix in ("ed", "er", "est", "ing"):
+                yield stem + "e"
+                if len(stem) > 3 and stem[-1] == stem[-2]:
+                    yield stem[:-1]
+
+
+def _candidates(word: str):
+    """The word and its stems, also in American spelling (colour, organise)."""
+    forms = [word]
+    if "our" in word[1:]:
+        forms.append(word.replace("our", "or"))
+    if "is" in word[3:]:
+        forms.append(word[:3] + word[3:].replace("is", "iz"))
+    for form in forms:
+        yield form
+        yield from _stems(form)
+
+
+def frequency_band(word: str) -> Optional[str]:
+    """
+    Get the frequency band of a word.
+
+    Args:
+        word: Lowercase word
+
+    Returns:
+        "k1", "k2", "academic" or None when the word is in none of the lists
+    """
+    for candidate in _candidates(word):
+        if candidate in K1_WORDS:
+            return "k1"
+        if candidate in K2_WORDS:
+            return "k2"
+        if candidate in ACADEMIC_WORDS:
+            return "academic"
+    return None
@@ -4,15 +4,24 @@ Central orchestrator that coordinates all specialized agents and manages the ove
 """
 
 from typing import Dict, Any, Optional
+import copy
 import logging
+import re
 from datetime import datetime
 
+from sqlalchemy.orm.attributes import flag_modified
+
 from agents.evaluator import EvaluatorAgent
 from agents.pedagogue import PedagogueAgent
 from agents.interface import InterfaceAgent
 from core.config import settings
 from core.database import get_db, SessionLocal
 from core.models import User, Submission, UserSession, StudyPlan
+from core.metrics import metrics
+from core.plan_progress import plan_progress
+from core.rate_limiter import rate_limiter
+from core.usage_ledger import usage_ledger, usage_scope
+from core.session_store import session_store
 
 logger = logging.getLogger(__name__)
 
@@ -48,54 +57,76 @@ class Maestro:
         Returns:
             Dict containing response and metadata
         """
-        try:
-            logger.info(f"Processing message from {phone_number}")
-
-            # Get or create user
-            db = SessionLocal()
-            user = self._get_or_create_user(db, phone_number)
-
-            # Get user context
-            user_context = self._build_user_context(db, user)
-
-            # Process through Interface Agent
-            interface_result = self.interface.process_message(message, user_context)
-
-            # Route to specialized agent if needed
-            if interface_result.get("requires_routing"):
-                intent = interface_result.get("intent")
-
-                if intent == "submit":
-                    # Route to Evaluator
-                    result = self._handle_submission(db, user, message)
-
-                elif intent == "plan":
-                    # Route to Pedagogue
-                    result = self._handle_study_plan_request(db, user, message)
-
-                elif intent == "progress":
-                    # Handle progress tracking
-                    result = self._handle_progress_request(db, user)
-
-                else:
-                    result = {"response": interface_result.get("response_text")}
-            else:
-                result = {"response": interface_result.get("response_text")}
-
-            # Update user activity
-            user.last_active = datetime.now()
-            db.commit()
-            db.close()
-
-            logger.info(f"Message processed successfully for {phone_number}")
-            return result
-
-        except Exception as e:
-            logger.error(f"Error processing message: {e}")
-            return {
-                "response": "Desculpe, ocorreu um erro. Por favor, tente novamente. 🔧",
-                "error": str(e)
-            }
+        with metrics.span("maestro.process_user_message") as span:
+            try:
+                logger.info(f"Processing message from {phone_number}")
+
+                # Get or create user
+                db = SessionLocal()
+                user = self._get_or_create_user(db, phone_number)
+                rate_limiter.remember_tier(phone_number, user.subscription_tier)
+
+                # Students over their tier's daily LLM budget get a short reply without LLM work
+                if usage_ledger.is_over_budget(user.id, user.subscription_tier):
+                    db.close()
+                    return {"response": "Você atingiu o limite diário de uso do seu plano. Volte amanhã para continuar praticando! 📚"}
+
+                # LLM calls of this turn are accounted to the user
+                with usage_scope(user.id, user.subscription_tier):
+                    # Get user context and conversation memory
+                    session = session_store.get_session(user.id, session_id)
+                    user_context = self._build_user_context(db, user)
+                    user_context["history"] = session_store.recent_history(session)
+
+                    # Process through Interface Agent
+                    interface_result = self.interface.process_message(message, user_context)
+                    span.set("intent", interface_result.get("intent"))
+
+                    # Route to specialized agent if needed
+                    if interface_result.get("requires_routing"):
+                        intent = interface_result.get("intent")
+
+                        if intent == "submit":
+                            # Route to Evaluator
+                            result = self._handle_submission(db, user, message)
+
+                        elif intent == "plan":
+                            # Route to Pedagogue
+                            result = self._handle_study_plan_request(db, user, message)
+
+                        elif intent == "progress":
+                            # Handle progress tracking
+                            result = self._handle_progress_request(db, user)
+
+                        else:
+                            result = {"response": interface_result.get("response_text")}
+                    else:
+                        result = {"response": interface_result.get("response_text")}
+
+                # Remember the turn (persisted asynchronously)
+                session_store.append_turn(
+                    session,
+                    user_message=message,
+                    assistant_message=result.get("response"),
+                    intent=interface_result.get("intent")
+                )
+                result["session_id"] = session.session_id
+
+                # Update user activity
+                user.last_active = datetime.now()
+                db.commit()
+                db.close()
+
+                logger.info(f"Message processed successfully for {phone_number}")
+                return result
+
+            except Exception as e:
+                logger.error(f"Error processing message: {e}")
+                metrics.inc("det_errors_total", component="maestro")
+                return {
+                    "response": "Desculpe, ocorreu um erro. Por favor, tente novamente. 🔧",
+                    "error": str(e)
+                }
 
     def _get_or_create_user(self, db, phone_number: str) -> User:
         """Get existing user or create new one."""
@@ -176,24 +207,32 @@ class Maestro:
             )
 
             # Update submission with results
-            submission.overall_score = evaluation.get("overall_score")
-            submission.literacy_score = evaluation.get("subscores", {}).get("literacy")
-            submission.comprehension_score = evaluation.get("subscores", {}).get("comprehension")
-            submission.conversation_score = evaluation.get("subscores", {}).get("conversation")
-            submission.production_score = evaluation.get("subscores", {}).get("production")
+            # A provisional estimate (LLM unavailable) is kept in the feedback, not as the score
+            scored = {} if evaluation.get("provisional") else evaluation
+            submission.overall_score = scored.get("overall_score")
+            submission.literacy_score = scored.get("subscores", {}).get("literacy")
+            submission.comprehension_score = scored.get("subscores", {}).get("comprehension")
+            submission.conversation_score = scored.get("subscores", {}).get("conversation")
+            submission.production_score = scored.get("subscores", {}).get("production")
             submission.feedback = evaluation
             submission.evaluator_comments = evaluation.get("feedback")
             submission.evaluated_at = datetime.now()
             submission.evaluation_duration_ms = evaluation.get("evaluation_duration_ms")
-            submission.status = "completed"
+            submission.status = "provisional" if evaluation.get("provisional") else "completed"
+            if evaluation.get("provisional"):
+                rate_limiter.refund_submission(user.phone_number)  # No final score: the retry is on us
 
             # Update user stats
             user.total_submissions += 1
 
             db.commit()
+            self.update_plan_progress(db, submission)
 
             # Format response for WhatsApp
             response_text = self.interface.format_evaluation_results(evaluation)
+            quota = rate_limiter.remaining_submissions(user.phone_number)
+            if quota.limit is not None:
+                response_text += f"\n\n📊 Correções disponíveis hoje: {quota.remaining} de {quota.limit}"
 
             return {
                 "response": response_text,
@@ -203,11 +242,34 @@ class Maestro:
 
         except Exception as e:
             logger.error(f"Error handling submission: {e}")
+            rate_limiter.refund_submission(user.phone_number)  # Nothing was evaluated
             return {
                 "response": "Desculpe, não consegui avaliar sua resposta. Por favor, tente novamente.",
                 "error": str(e)
             }
 
+    def update_plan_progress(self, db, submission: Submission) -> Optional[Dict[str, Any]]:
+        """
+        Apply a completed submission to the user's active study plan.
+
+        Drifted plans are adjusted by the Pedagogue in the background.
+
+        Args:
+            db: Database session
+            submission: Completed submission
+
+        Returns:
+            Progress summary, or None without an active plan or on error
+        """
+        try:
+            return plan_progress.record_submission(
+                db, submission, adjuster=self.pedagogue.adjust_plan_based_on_progress
+            )
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error updating study plan progress: {e}")
+            return None
+
     def _handle_study_plan_request(self, db, user: User, message: str) -> Dict[str, Any]:
         """
         Handle study plan creation workflow.
@@ -221,6 +283,18 @@ class Maestro:
             Dict with study plan and formatted response
         """
         try:
+            # "semana 3": show a week of the active plan instead of creating a new one
+            week_request = re.search(r"semana\s*(\d+)", message.lower())
+            if week_request:
+                active_plan = (
+                    db.query(StudyPlan)
+                    .filter(StudyPlan.user_id == user.id, StudyPlan.is_active == True)
+                    .order_by(StudyPlan.created_at.desc())
+                    .first()
+                )
+                if active_plan:
+                    return self._handle_plan_week_request(db, active_plan, int(week_request.group(1)))
+
             # Extract information from message or use defaults
             # In production, this would involve a multi-turn conversation
             current_level = user.current_level or "B1"
@@ -290,6 +364,32 @@ class Maestro:
                 "error": str(e)
             }
 
+    def _handle_plan_week_request(self, db, db_plan: StudyPlan, week: int) -> Dict[str, Any]:
+        """
+        Show one week of the active study plan, generating its daily tasks on first view.
+
+        Args:
+            db: Database session
+            db_plan: Active StudyPlan row
+            week: Requested week number
+
+        Returns:
+            Dict with the formatted week
+        """
+        study_plan = copy.deepcopy(db_plan.plan_data)
+        self.pedagogue.get_week_details(study_plan, week)
+
+        if study_plan != db_plan.plan_data:
+            db_plan.plan_data = study_plan
+            flag_modified(db_plan, "plan_data")
+            db.commit()
+
+        return {
+            "response": self.interface.format_study_plan(study_plan, week=week),
+            "plan_id": db_plan.id,
+            "week": week
+        }
+
     def _handle_progress_request(self, db, user: User) -> Dict[str, Any]:
         """
         Handle progress tracking request.
@@ -0,0 +1,36 @@
+-- =====================================================
+-- DET Flow - Inbound Message Queue Migration
+-- =====================================================
+-- Version: 1.2.0
+-- Description: Persists inbound WhatsApp messages for acknowledge-then-process webhooks
+-- =====================================================
+
+-- =====================================================
+-- Table: inbound_messages
+-- Stores WhatsApp messages accepted by the webhook before processing
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS inbound_messages (
+    id SERIAL PRIMARY KEY,
+    phone_number VARCHAR(20) NOT NULL,
+
+    -- Message data
+    message_text TEXT NOT NULL,
+    session_id VARCHAR(255),
+    response_text TEXT,
+    error TEXT,
+
+    -- Timestamps
+    received_at TIMESTAMPTZ DEFAULT NOW(),
+    processed_at TIMESTAMPTZ,
+
+    -- Status
+    status VARCHAR(20) DEFAULT 'received' CHECK (status IN ('received', 'processing', 'completed', 'failed'))
+);
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS idx_inbound_messages_phone ON inbound_messages(phone_number);
+CREATE INDEX IF NOT EXISTS idx_inbound_messages_status ON inbound_messages(status);
+CREATE INDEX IF NOT EXISTS idx_inbound_messages_received_at ON inbound_messages(received_at DESC);
+
+SELECT 'Inbound message queue migration completed successfully!' AS message;
@@ -0,0 +1,14 @@
+-- =====================================================
+-- DET Flow - Inbound Message Deduplication Migration
+-- =====================================================
+-- Version: 1.2.1
+-- Description: Stores the provider message ID so redelivered WhatsApp messages are processed once
+-- =====================================================
+
+ALTER TABLE inbound_messages ADD COLUMN IF NOT EXISTS provider_message_id VARCHAR(255);
+
+-- Unique index doubles as the idempotency backstop across API workers
+CREATE UNIQUE INDEX IF NOT EXISTS idx_inbound_messages_provider_message_id
+    ON inbound_messages(provider_message_id);
+
+SELECT 'Inbound message deduplication migration completed successfully!' AS message;
@@ -0,0 +1,38 @@
+-- =====================================================
+-- DET Flow - LLM Usage Accounting Migration
+-- =====================================================
+-- Version: 1.3.0
+-- Description: Append-only ledger of LLM tokens, latency and cost per user, activity and model
+-- =====================================================
+
+-- =====================================================
+-- Table: llm_usage
+-- One row per LLM call, written in batches
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS llm_usage (
+    id SERIAL PRIMARY KEY,
+    user_id INTEGER REFERENCES users(id) ON DELETE SET NULL,
+
+    -- Call details
+    activity VARCHAR(50) NOT NULL,
+    model VARCHAR(100) NOT NULL,
+    subscription_tier VARCHAR(50),
+
+    -- Usage
+    input_tokens INTEGER DEFAULT 0,
+    cached_input_tokens INTEGER DEFAULT 0,
+    output_tokens INTEGER DEFAULT 0,
+    latency_ms INTEGER,
+    cost_usd DOUBLE PRECISION,
+
+    -- Timestamp
+    created_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- Create indexes
+CREATE INDEX IF NOT EXISTS idx_llm_usage_created_at ON llm_usage(created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_user_created ON llm_usage(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_llm_usage_activity_model ON llm_usage(activity, model);
+
+SELECT 'LLM usage accounting migration completed successfully!' AS message;
@@ -7,6 +7,8 @@ import pytest
 from agents.evaluator import EvaluatorAgent
 from agents.pedagogue import PedagogueAgent
 from agents.interface import InterfaceAgent
+from agents.context_compactor import ContextCompactor
+from agents.model_provider import extract_usage
 
 
 class TestEvaluatorAgent:
@@ -113,6 +115,13 @@ class TestInterfaceAgent:
         assert interface._detect_intent("Como está meu progresso?") == "progress"
         assert interface._detect_intent("Olá!") == "greeting"
 
+    def test_week_mentions_only_mean_a_plan_with_a_week_number(self, interface):
+        """Test that a bare "semana" does not route progress questions to plan creation."""
+        assert interface._detect_intent("Qual meu progresso nesta semana?") == "progress"
+        assert interface._detect_intent("Fiz 3 tarefas essa semana, qual minha pontuação?") == "progress"
+        assert interface._detect_intent("Me mostra a semana 3") == "plan"
+        assert interface._detect_intent("semana2") == "plan"
+
     def test_format_evaluation_results(self, interface):
         """Test evaluation results formatting."""
         evaluation = {
@@ -135,5 +144,73 @@ class TestInterfaceAgent:
         assert len(formatted) > 0
 
 
+class TestContextCompactor:
+    """Tests for prompt context compaction."""
+
+    @staticmethod
+    def _plan(weeks: int) -> dict:
+        return {
+            "plan_title": "Plano",
+            "created_at": "2024-01-01T00:00:00",
+            "study_tips": ["Estude todo dia"] * 5,
+            "weekly_schedule": [
+                {
+                    "week": week,
+                    "focus_areas": ["Grammar"],
+                    "daily_tasks": [
+                        {
+                            "day": "Monday",
+                            "duration_minutes": 60,
+                            "tasks": [{"task_type": "read_aloud", "description": "x" * 200, "resources": ["link"]}]
+                        }
+                    ] * 5
+                }
+                for week in range(1, weeks + 1)
+            ]
+        }
+
+    def test_compact_plan_keeps_remaining_weeks_only(self):
+        """Test that completed weeks and low-value fields are dropped."""
+        compact = ContextCompactor(budgets={"study_plan": 100_000}).compact_plan(self._plan(4), completed_weeks=2)
+
+        assert [week["week"] for week in compact["weekly_schedule"]] == [3, 4]
+        assert "created_at" not in compact
+        assert "study_tips" not in compact
+        assert "resources" not in compact["weekly_schedule"][0]["daily_tasks"][0]["tasks"][0]
+
+    def test_compact_plan_summarizes_to_fit_budget(self):
+        """Test that weeks are summarized when the plan exceeds the budget."""
+        compact = ContextCompactor(budgets={"study_plan": 300}).compact_plan(self._plan(8))
+
+        week = compact["weekly_schedule"][0]
+        assert "daily_tasks" not in week
+        assert week["total_minutes"] == 300
+        assert week["task_types"] == ["read_aloud"]
+
+
+class TestModelProvider:
+    """Tests for provider usage normalization."""
+
+    def test_extract_usage_openai(self):
+        """OpenAI reports cached tokens inside the prompt tokens."""
+        response = type("Run", (), {"metrics": {"input_tokens": [1500], "cache_read_tokens": [1024], "output_tokens": [200]}})()
+
+        usage = extract_usage(response, "gpt-4o-mini")
+
+        assert usage["input_tokens"] == 1500
+        assert usage["cached_input_tokens"] == 1024
+        assert usage["uncached_input_tokens"] == 476
+
+    def test_extract_usage_anthropic(self):
+        """Anthropic reports cache reads separately from uncached input tokens."""
+        response = type("Run", (), {"metrics": {"input_tokens": 300, "cache_read_tokens": 1200, "output_tokens": 100}})()
+
+        usage = extract_usage(response, "claude-3-haiku")
+
+        assert usage["input_tokens"] == 1500
+        assert usage["cached_input_tokens"] == 1200
+        assert usage["uncached_input_tokens"] == 300
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])
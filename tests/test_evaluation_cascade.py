@@ -0,0 +1,100 @@
+"""
+DET Flow - Evaluation Cascade Tests
+Tests for triage acceptance, escalation rules and cascade statistics.
+"""
+
+import json
+
+import pytest
+
+from agents import evaluator as evaluator_module
+from agents.evaluation_cascade import CascadePolicy, CascadeStats
+from agents.evaluator import EvaluatorAgent
+
+
+def evaluation(score, confidence=0.9, cefr="B2"):
+    return {
+        "overall_score": score,
+        "subscores": {"literacy": score, "comprehension": score, "conversation": score, "production": score},
+        "cefr_level": cefr,
+        "analysis": {"grammar": "", "vocabulary": "", "relevance": "", "coherence": ""},
+        "feedback": "Bom trabalho!",
+        "confidence": confidence,
+    }
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRouter:
+    def __init__(self, model_id, *answers):
+        self.model_id = model_id
+        self.answers = list(answers)
+        self.calls = 0
+        self.candidates = [model_id]
+
+    def run_with_model(self, prompt):
+        self.calls += 1
+        return FakeResponse(self.answers.pop(0)), self.model_id
+
+    def run_on(self, model_id, prompt):
+        self.calls += 1
+        return FakeResponse(self.answers.pop(0))
+
+
+@pytest.fixture
+def cascade(monkeypatch):
+    """Evaluator whose triage and strong tiers are fake routers."""
+    monkeypatch.setattr(evaluator_module.settings, "cascade_audit_rate", 0.0)
+    monkeypatch.setattr(evaluator_module, "cascade_stats", CascadeStats())
+    agent = EvaluatorAgent()
+    agent.cascade_policy = CascadePolicy(min_confidence=0.75, boundary_margin=5)
+    return agent
+
+
+def test_policy_reasons():
+    policy = CascadePolicy(min_confidence=0.75, boundary_margin=5)
+
+    assert policy.escalation_reason(None) == "malformed"
+    assert policy.escalation_reason(evaluation(100, confidence=0.5)) == "low_confidence"
+    assert policy.escalation_reason(evaluation(100, confidence=None)) == "low_confidence"
+    assert policy.escalation_reason(evaluation(118)) == "cefr_boundary"
+    assert policy.escalation_reason(evaluation(100)) is None
+
+
+def test_confident_triage_result_is_accepted(cascade):
+    cascade.triage_router = FakeRouter("gpt-4o-mini", json.dumps(evaluation(100)))
+    cascade.router = FakeRouter("gpt-4o")
+
+    result = cascade.evaluate_submission("write_about_photo", "Describe the photo.", "A man is walking his dog.")
+
+    assert result["evaluation_tier"] == "triage"
+    assert result["overall_score"] == 100
+    assert cascade.router.calls == 0
+    assert evaluator_module.cascade_stats.get_stats()["escalation_rate"] == 0.0
+
+
+def test_boundary_score_escalates_and_records_agreement(cascade):
+    cascade.triage_router = FakeRouter("gpt-4o-mini", json.dumps(evaluation(118)))
+    cascade.router = FakeRouter("gpt-4o", json.dumps(evaluation(125, cefr="C1")))
+
+    result = cascade.evaluate_submission("write_about_photo", "Describe the photo.", "A man is walking his dog.")
+
+    assert result["evaluation_tier"] == "escalated"
+    assert result["escalation_reason"] == "cefr_boundary"
+    assert result["overall_score"] == 125
+    stats = evaluator_module.cascade_stats.get_stats()
+    assert stats["reasons"]["cefr_boundary"] == 1
+    assert stats["tier_agreement"]["mean_abs_score_diff"] == 7
+
+
+def test_malformed_triage_output_escalates(cascade):
+    cascade.triage_router = FakeRouter("gpt-4o-mini", "not json", "still not json")
+    cascade.router = FakeRouter("gpt-4o", json.dumps(evaluation(100)))
+
+    result = cascade.evaluate_submission("write_about_photo", "Describe the photo.", "A man is walking his dog.")
+
+    assert result["escalation_reason"] == "malformed"
+    assert evaluator_module.cascade_stats.get_stats()["tier_agreement"]["compared"] == 0
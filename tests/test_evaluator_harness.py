@@ -0,0 +1,62 @@
+"""
+DET Flow - Evaluator Harness Tests
+Tests for the offline regression run against the recorded evaluator outputs.
+"""
+
+import pytest
+
+from benchmarks.evaluator_harness import parse_overrides, run_harness, summarize
+from benchmarks.replay import Cassette
+from benchmarks.semantic_cache_eval import DEFAULT_CORPUS, load_corpus
+from core.config import settings
+
+CASSETTE = DEFAULT_CORPUS.parent / "maestro_cassette.json"
+
+
+def test_parse_overrides_uses_setting_types():
+    overrides = parse_overrides(["evaluation_cascade_enabled=true", "max_submissions_per_day=7"])
+    assert overrides == {"evaluation_cascade_enabled": True, "max_submissions_per_day": 7}
+
+    with pytest.raises(ValueError):
+        parse_overrides(["no_such_setting=1"])
+
+
+def test_summarize_counts_failures_and_agreement():
+    rows = [
+        {"task_type": "t", "failed": False, "error": 5, "predicted_cefr": "B2", "reference_cefr": "B2",
+         "latency_ms": 10.0, "calls": 1, "input_tokens": 100, "output_tokens": 20},
+        {"task_type": "t", "failed": True, "error": None, "predicted_cefr": None, "reference_cefr": "B1",
+         "latency_ms": 30.0, "calls": 2, "input_tokens": 300, "output_tokens": 0},
+    ]
+    summary = summarize(rows, elapsed=1.0, outcomes={"parsed": 1, "failed": 1})
+
+    assert summary["mae"] == 5
+    assert summary["cefr_agreement"] == 1.0
+    assert summary["error_rate"] == 0.5
+    assert summary["parse_failure_rate"] == 0.5
+    assert summary["tokens_per_evaluation"]["input"] == 200
+
+
+def test_offline_run_reports_accuracy_latency_and_tokens():
+    corpus = load_corpus(DEFAULT_CORPUS)
+    hints = settings.lexical_hints_enabled
+
+    report = run_harness(
+        corpus,
+        model="gpt-4o-mini",
+        overrides={"lexical_hints_enabled": not hints},
+        concurrency=3,
+        cassette=Cassette.load(CASSETTE),
+        label="offline",
+    )
+
+    summary = report["summary"]
+    assert summary["items"] == len(corpus)
+    assert summary["error_rate"] == 0.0
+    assert summary["mae"] is not None
+    assert summary["latency_ms"]["p95"] is not None
+    assert summary["tokens_per_evaluation"]["input"] > 0
+    assert set(report["by_task_type"]) == {item["task_type"] for item in corpus}
+    assert report["config"]["model"] == "gpt-4o-mini"
+    # Overrides only last for the run
+    assert settings.lexical_hints_enabled == hints
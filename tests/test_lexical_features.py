@@ -0,0 +1,106 @@
+"""
+DET Flow - Lexical Feature Tests
+Tests for local lexical features, prompt hints and provisional scores.
+"""
+
+import pytest
+from sqlalchemy import create_engine
+
+from agents.evaluator import EvaluatorAgent
+from core.database import SessionLocal, engine as default_engine
+from core.models import StudyPlan, Submission, User
+from agents.lexical_features import LexicalFeatureExtractor, moving_average_ttr
+from knowledge_base.word_frequency import frequency_band
+
+
+BASIC = "I see a dog. The dog is big. It is in the park. I like the dog."
+ADVANCED = (
+    "In this photograph, a crowded market is visible. However, despite the rain, numerous vendors "
+    "continue selling fresh fruit, whereas customers hurry between stalls. Consequently, the scene "
+    "conveys a dynamic atmosphere; moreover, the colourful umbrellas highlight the contrast between "
+    "the grey sky and the vibrant goods. I beleive the photographer wanted to emphasize resilience."
+)
+
+
+@pytest.fixture
+def extractor():
+    return LexicalFeatureExtractor()
+
+
+def test_frequency_bands_handle_inflections():
+    assert frequency_band("studies") == "k1"
+    assert frequency_band("organised") == "k2"
+    assert frequency_band("analysis") == "academic"
+    assert frequency_band("zyxwv") is None
+
+
+def test_features(extractor):
+    """Counts, sentence stats, connectives and spelling slips are computed locally."""
+    features = extractor.extract(ADVANCED)
+
+    assert features["word_count"] == 53
+    assert features["sentence_count"] == 4
+    assert {"contrast", "cause", "addition"} <= set(features["connective_categories"])
+    assert "whereas" in features["advanced_connectives"]
+    assert features["spelling_errors"] == ["beleive→believe"]
+    assert abs(sum(features["band_coverage"].values()) - 1) < 0.01
+
+
+def test_mattr_is_length_independent():
+    """Repeating a varied text keeps MATTR stable while plain TTR collapses."""
+    tokens = [f"w{i % 60}" for i in range(600)]
+    assert moving_average_ttr(tokens) > 0.8
+    assert len(set(tokens)) / len(tokens) < 0.2
+
+
+def test_provisional_scores_rank_responses(extractor):
+    """Richer writing gets a higher provisional score; hints stay compact."""
+    basic, advanced = extractor.extract_batch([BASIC, ADVANCED])
+
+    assert extractor.provisional_score(basic, "write_about_photo") < extractor.provisional_score(advanced, "write_about_photo")
+    assert len(extractor.format_hints(advanced)) < 400
+
+
+def test_evaluator_falls_back_to_provisional_score():
+    """When the LLM fails on a writing task the student gets a provisional estimate, not the fixed fallback."""
+    evaluator = EvaluatorAgent()
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("provider down")
+
+    evaluator.router.run_with_model = fail
+    result = evaluator.evaluate_submission("write_about_photo", "Describe the photo.", ADVANCED)
+
+    assert result["provisional"] is True
+    assert result["error"] == "provider down"
+    assert result["overall_score"] != 50
+
+
+def test_provisional_estimate_is_not_stored_as_the_score(tmp_path, monkeypatch):
+    """An interim estimate is shown as provisional and kept out of the submission's score fields."""
+    from maestro import maestro
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'provisional.sqlite'}", connect_args={"check_same_thread": False})
+    for model in (User, StudyPlan, Submission):
+        model.__table__.create(engine)
+    SessionLocal.configure(bind=engine)
+    try:
+        provisional = {**maestro.evaluator.provisional_evaluation("write_about_photo", ADVANCED), "error": "provider down"}
+        monkeypatch.setattr(maestro.evaluator, "evaluate_submission", lambda **kwargs: provisional)
+
+        db = SessionLocal()
+        user = User(phone_number="5511911112222", total_submissions=0)
+        db.add(user)
+        db.commit()
+        result = maestro._handle_submission(db, user, ADVANCED)
+        submission = db.query(Submission).one()
+        db.close()
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        engine.dispose()
+
+    assert "Avaliação Provisória" in result["response"]
+    assert f"{provisional['overall_score']}/160" in result["response"]
+    assert submission.status == "provisional"
+    assert submission.overall_score is None and submission.production_score is None
+    assert submission.feedback["provisional"] is True
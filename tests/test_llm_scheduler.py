@@ -0,0 +1,84 @@
+"""
+DET Flow - LLM Scheduler Tests
+Tests for priority classification, provider caps and weighted fair queuing.
+"""
+
+import threading
+import time
+
+import pytest
+
+from agents.llm_scheduler import LLMQueueTimeout, LLMScheduler, classify, llm_priority
+from core.usage_ledger import usage_scope
+
+
+def test_classify_by_scope_activity_and_tier():
+    assert classify("evaluation") == "batch"  # No user: background work
+    with usage_scope(1, "free"):
+        assert classify("chat") == "interactive"
+        assert classify("evaluation") == "free_evaluation"
+        with llm_priority("batch"):
+            assert classify("chat") == "batch"
+    with usage_scope(2, "premium"):
+        assert classify("study_plan") == "paid_evaluation"
+
+    with pytest.raises(ValueError):
+        with llm_priority("urgent"):
+            pass
+
+
+def test_calls_under_the_cap_run_immediately():
+    scheduler = LLMScheduler(provider_limits={"openai": 2}, enabled=True)
+    with scheduler.slot("openai", "batch"), scheduler.slot("openai", "batch"):
+        assert scheduler.get_stats()["providers"]["openai"]["in_flight"] == 2
+    assert scheduler.get_stats()["providers"]["openai"]["in_flight"] == 0
+    assert scheduler.get_stats()["classes"]["batch"]["queued"] == 0
+
+
+def test_waiting_call_times_out_and_leaves_the_queue():
+    scheduler = LLMScheduler(provider_limits={"openai": 1}, queue_timeout_seconds=0.05, enabled=True)
+    with scheduler.slot("openai", "batch"):
+        with pytest.raises(LLMQueueTimeout):
+            scheduler.acquire("openai", "interactive")
+        # Another provider has its own slots
+        with scheduler.slot("anthropic", "batch"):
+            pass
+
+    stats = scheduler.get_stats()
+    assert stats["classes"]["interactive"]["timeouts"] == 1
+    assert stats["providers"]["openai"]["waiting"]["interactive"] == 0
+    with scheduler.slot("openai", "interactive"):
+        pass
+
+
+def test_slots_are_granted_by_weighted_fair_queuing():
+    scheduler = LLMScheduler(provider_limits={"openai": 1}, enabled=True)
+    order, lock = [], threading.Lock()
+
+    def call(priority):
+        with scheduler.slot("openai", priority):
+            with lock:
+                order.append(priority)
+
+    scheduler.acquire("openai", "batch")  # Hold the only slot while the queue fills
+    threads = []
+    for priority in ["batch"] * 4 + ["interactive"] * 4:
+        thread = threading.Thread(target=call, args=(priority,))
+        thread.start()
+        threads.append(thread)
+        time.sleep(0.01)
+    scheduler.release("openai")
+    for thread in threads:
+        thread.join(timeout=2)
+
+    # Interactive calls (weight 8) overtake batch calls queued before them
+    assert order[:4] == ["interactive"] * 4
+    assert order[4:] == ["batch"] * 4
+    assert scheduler.get_stats()["classes"]["interactive"]["queued"] == 4
+
+
+def test_disabled_scheduler_does_not_cap():
+    scheduler = LLMScheduler(provider_limits={"openai": 1}, enabled=False)
+    with scheduler.slot("openai", "batch"), scheduler.slot("openai", "batch"):
+        pass
+    assert scheduler.get_stats()["providers"] == {}
@@ -0,0 +1,281 @@
+"""
+DET Flow - Message Worker Pool Tests
+Tests for per-phone ordering, restart recovery, inbound status transitions,
+redelivery suppression and burst coalescing.
+"""
+
+import asyncio
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from core.database import SessionLocal, engine as default_engine
+from core.idempotency import IdempotencyStore
+from core.message_worker import MessageWorkerPool, persist_inbound_message
+from core.models import InboundMessage
+from core.rate_limiter import RateLimitResult
+from core.whatsapp import SenderOverloadedError
+
+
+class FakeSender:
+    def __init__(self):
+        self.sent = []
+
+    async def send_text(self, phone_number, text):
+        self.sent.append((phone_number, text))
+
+
+class RecordingProcessor:
+    """Maestro stand-in that records turns and the concurrency it saw."""
+
+    def __init__(self, delay=0.05, fail_on=None):
+        self.delay = delay
+        self.fail_on = fail_on
+        self.turns = []
+        self.statuses = []
+        self.running = {}
+        self.max_parallel = 0
+        self.max_per_phone = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, phone_number, message, session_id=None):
+        with self._lock:
+            self.running[phone_number] = self.running.get(phone_number, 0) + 1
+            self.max_parallel = max(self.max_parallel, sum(self.running.values()))
+            self.max_per_phone = max(self.max_per_phone, self.running[phone_number])
+            self.turns.append((phone_number, message))
+            self.statuses.append((message, _statuses()))
+        time.sleep(self.delay)
+        with self._lock:
+            self.running[phone_number] -= 1
+        if self.fail_on and self.fail_on in message:
+            raise RuntimeError("maestro failed")
+        return {"response": f"ok: {message}"}
+
+
+def _statuses():
+    db = SessionLocal()
+    try:
+        return {row.message_text: row.status for row in db.query(InboundMessage)}
+    finally:
+        db.close()
+
+
+def make_pool(window_ms=0, workers=4):
+    return MessageWorkerPool(
+        worker_count=workers,
+        sender=FakeSender(),
+        coalesce_window_ms=window_ms,
+        coalesce_max_wait_ms=window_ms,
+        deduplicator=IdempotencyStore(namespace="test_inbound", ttl_seconds=60)
+    )
+
+
+@pytest.fixture
+def inbound_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'inbound.sqlite'}", connect_args={"check_same_thread": False})
+    InboundMessage.__table__.create(engine)
+    SessionLocal.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        engine.dispose()
+
+
+def test_turns_are_ordered_per_phone_and_parallel_across_phones(inbound_db):
+    pool, processor = make_pool(), RecordingProcessor()
+
+    async def scenario():
+        await pool.start(processor)
+        pool.submit("5511", "a1")
+        pool.submit("5522", "b1")
+        await asyncio.sleep(0.02)  # Both lanes are busy
+        pool.submit("5511", "a2")
+        pool.submit("5511", "a3")
+        pool.submit("5522", "b2")
+        await pool.drain()
+        await pool.stop()
+
+    asyncio.run(scenario())
+
+    assert [message for phone, message in processor.turns if phone == "5511"] == ["a1", "a2\na3"]
+    assert [message for phone, message in processor.turns if phone == "5522"] == ["b1", "b2"]
+    assert processor.max_per_phone == 1
+    assert processor.max_parallel == 2
+    assert len(pool.sender.sent) == 4
+
+
+def test_pending_messages_are_recovered_in_order_after_restart(inbound_db):
+    for text, status in [("old", "completed"), ("first", "received"), ("second", "processing"), ("bad", "failed")]:
+        inbound_id = persist_inbound_message("5533", text)
+        db = SessionLocal()
+        db.query(InboundMessage).filter(InboundMessage.id == inbound_id).update({"status": status})
+        db.commit()
+        db.close()
+
+    pool, processor = make_pool(), RecordingProcessor(delay=0)
+
+    async def scenario():
+        await pool.start(processor)
+        await pool.drain()
+        await pool.stop()
+
+    asyncio.run(scenario())
+
+    # Recovered messages from one phone form a single burst, in arrival order
+    assert processor.turns == [("5533", "first\nsecond")]
+    assert _statuses() == {"old": "completed", "first": "completed", "second": "completed", "bad": "failed"}
+
+
+def test_inbound_status_moves_through_processing_to_completed_or_failed(inbound_db):
+    pool, processor = make_pool(), RecordingProcessor(delay=0, fail_on="boom")
+    good = persist_inbound_message("5544", "hello", provider_message_id="m-1")
+    bad = persist_inbound_message("5555", "boom", provider_message_id="m-2")
+    assert persist_inbound_message("5544", "hello", provider_message_id="m-1") is None  # Stored once
+
+    async def scenario():
+        await pool.start(processor)  # Picks both up as pending
+        await pool.drain()
+        await pool.stop()
+
+    asyncio.run(scenario())
+
+    assert all(seen[text] == "processing" for text, seen in processor.statuses)
+    db = SessionLocal()
+    try:
+        rows = {row.id: row for row in db.query(InboundMessage)}
+    finally:
+        db.close()
+    assert rows[good].status == "completed"
+    assert rows[good].response_text == "ok: hello"
+    assert rows[good].processed_at is not None
+    assert rows[bad].status == "failed"
+    assert rows[bad].error == "maestro failed"
+    assert pool.get_stats()["messages_failed"] == 1
+    assert pool.get_stats()["messages_processed"] == 1
+
+
+def test_redelivered_message_ids_are_claimed_once():
+    pool = make_pool()
+
+    assert pool.accept("wamid-1") is True
+    assert pool.accept("wamid-1") is False
+    assert pool.accept(None) is True  # No provider ID: nothing to deduplicate
+    assert pool.get_stats()["duplicates_dropped"] == 1
+
+
+def test_bursts_are_coalesced_and_counted_as_avoided_calls(inbound_db):
+    pool, processor = make_pool(window_ms=50), RecordingProcessor(delay=0)
+
+    async def scenario():
+        await pool.start(processor)
+        for text in ("tenho uma dúvida", "sobre o read aloud", "pode ajudar?"):
+            pool.submit("5566", text)
+            await asyncio.sleep(0.01)
+        await pool.drain()
+        await pool.stop()
+
+    pool.accept("wamid-2")
+    pool.accept("wamid-2")
+    asyncio.run(scenario())
+
+    assert processor.turns == [("5566", "tenho uma dúvida\nsobre o read aloud\npode ajudar?")]
+    stats = pool.get_stats()
+    assert stats["messages_coalesced"] == 2
+    assert stats["turns_processed"] == 1
+    assert stats["llm_calls_avoided"] == 3  # Two coalesced messages and one redelivery
+
+
+def test_webhook_drops_redeliveries_but_releases_failed_messages(monkeypatch):
+    from api import main
+
+    calls = []
+
+    def process_user_message(phone_number, message, session_id=None):
+        calls.append(message)
+        if len(calls) == 1:
+            raise RuntimeError("database unavailable")
+        return {"response": "Olá!", "session_id": session_id}
+
+    monkeypatch.setattr(main.maestro, "process_user_message", process_user_message)
+    monkeypatch.setattr(main, "message_worker_pool", make_pool())
+    client = TestClient(main.app)
+    payload = {"phone": "5511977770000", "message": "oi", "message_id": "wamid-3"}
+
+    failed = client.post("/webhook/whatsapp", json=payload).json()
+    assert failed["success"] is False
+
+    # The failure released the claim, so the provider's retry is processed
+    retried = client.post("/webhook/whatsapp", json=payload).json()
+    assert retried["success"] is True and retried["message"] == "Olá!"
+
+    duplicate = client.post("/webhook/whatsapp", json=payload).json()
+    assert duplicate["metadata"]["duplicate"] is True
+    assert calls == ["oi", "oi"]
+
+
+class RunningPool:
+    """Worker pool stand-in for fast-ack mode that records which thread did what."""
+
+    is_running = True
+
+    def __init__(self):
+        self.threads = {}
+        self.submitted = []
+
+    def accept(self, message_id):
+        return True
+
+    def submit(self, **job):
+        self.threads["submit"] = threading.current_thread()
+        self.submitted.append(job)
+
+
+class FullSender:
+    """Outbound sender whose recipient queue never has room."""
+
+    async def enqueue_text(self, phone, text, wait_timeout=None):
+        await asyncio.sleep(2 if wait_timeout is None else wait_timeout)  # Without a timeout: until room frees up
+        raise SenderOverloadedError(f"Outbound queue full for {phone}")
+
+
+def test_fast_ack_keeps_blocking_work_off_the_event_loop(monkeypatch):
+    from api import main
+
+    pool = RunningPool()
+
+    def persist(**message):
+        pool.threads["persist"] = threading.current_thread()
+        return 42
+
+    monkeypatch.setattr(main, "message_worker_pool", pool)
+    monkeypatch.setattr(main, "persist_inbound_message", persist)
+    client = TestClient(main.app)
+
+    ack = client.post("/webhook/whatsapp", json={"phone": "5511966660000", "message": "oi"}).json()
+
+    assert ack["metadata"]["queued"] is True and pool.submitted[0]["inbound_id"] == 42
+    assert pool.threads["persist"] is not pool.threads["submit"]  # The commit ran in a worker thread
+
+
+def test_rate_limit_reply_does_not_wait_for_a_full_outbound_queue(monkeypatch):
+    from api import main
+
+    class Denying:
+        def check_message(self, key, is_submission=False):
+            return RateLimitResult(False, 20, 0, 30.0, "messages")
+
+    monkeypatch.setattr(main, "message_worker_pool", RunningPool())
+    monkeypatch.setattr(main, "rate_limiter", Denying())
+    monkeypatch.setattr(main, "whatsapp_sender", FullSender())
+    client = TestClient(main.app)
+
+    start = time.monotonic()
+    ack = client.post("/webhook/whatsapp", json={"phone": "5511966660000", "message": "oi"}).json()
+
+    assert time.monotonic() - start < 1
+    assert ack["success"] is True and ack["metadata"]["rate_limited"] == "messages"
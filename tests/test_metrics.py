@@ -0,0 +1,120 @@
+"""
+DET Flow - Metrics Tests
+Tests for histograms, spans, Prometheus rendering, database timing, the /metrics
+access rules and the disabled fast path.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from agents.response_parser import extract_json_object
+from core.config import settings
+from core.metrics import MetricsRegistry, instrument_engine
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry(enabled=True)
+    for value in (0.002, 0.02, 3.0):
+        registry.observe("det_llm_call_seconds", value, activity="chat", model="m")
+
+    text = registry.render_prometheus()
+
+    assert "# TYPE det_llm_call_seconds histogram" in text
+    assert 'det_llm_call_seconds_bucket{activity="chat",model="m",le="0.005"} 1' in text
+    assert 'det_llm_call_seconds_bucket{activity="chat",model="m",le="0.025"} 2' in text
+    assert 'det_llm_call_seconds_bucket{activity="chat",model="m",le="+Inf"} 3' in text
+    assert 'det_llm_call_seconds_count{activity="chat",model="m"} 3' in text
+
+
+def test_buckets_follow_metric_unit():
+    registry = MetricsRegistry(enabled=True)
+    registry.observe("det_llm_call_tokens", 700, kind="output_tokens")
+
+    assert 'le="1000"} 1' in registry.render_prometheus()
+
+
+def test_span_records_status_and_labels():
+    registry = MetricsRegistry(enabled=True)
+    with registry.span("maestro.process_user_message") as span:
+        span.set("intent", "plan")
+    with pytest.raises(RuntimeError):
+        with registry.span("maestro.process_user_message"):
+            raise RuntimeError("boom")
+
+    series = registry.get_stats()["histograms"]["det_span_duration_seconds"]
+    assert {"span": "maestro.process_user_message", "status": "ok", "intent": "plan"} in [s["labels"] for s in series]
+    assert any(s["labels"]["status"] == "error" for s in series)
+
+
+def test_gauges_keep_the_last_value():
+    registry = MetricsRegistry(enabled=True)
+    registry.set_gauge("det_llm_queue_depth", 3, provider="openai", priority="batch")
+    registry.set_gauge("det_llm_queue_depth", 1, provider="openai", priority="batch")
+
+    text = registry.render_prometheus()
+    assert "# TYPE det_llm_queue_depth gauge" in text
+    assert 'det_llm_queue_depth{priority="batch",provider="openai"} 1' in text
+
+
+def test_label_values_are_escaped():
+    registry = MetricsRegistry(enabled=True)
+    registry.inc("det_errors_total", component='say "hi"\n')
+
+    assert 'component="say \\"hi\\"\\n"' in registry.render_prometheus()
+
+
+def test_disabled_registry_records_nothing():
+    registry = MetricsRegistry(enabled=False)
+
+    with registry.span("x") as span:
+        span.set("intent", "chat")
+    registry.observe("det_db_query_seconds", 0.1)
+    registry.inc("det_db_queries_total")
+
+    assert registry.render_prometheus() == "\n"
+
+
+def test_json_extraction_is_instrumented(monkeypatch):
+    registry = MetricsRegistry(enabled=True)
+    monkeypatch.setattr("agents.response_parser.metrics", registry)
+
+    assert extract_json_object('```json\n{"a": 1}\n```') == {"a": 1}
+
+    histograms = registry.get_stats()["histograms"]
+    assert histograms["det_json_payload_bytes"][0]["count"] == 1
+    assert histograms["det_span_duration_seconds"][0]["labels"]["span"] == "extract_json_object"
+
+
+def test_failed_statements_do_not_skew_query_timing():
+    registry = MetricsRegistry(enabled=True)
+    engine = create_engine("sqlite://")
+    instrument_engine(engine, registry)
+
+    with engine.connect() as conn:
+        for _ in range(3):
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        assert not conn.info.get("det_query_start")  # No start times left behind on the pooled connection
+
+    stats = registry.get_stats()
+    assert stats["counters"]["det_db_queries_total"] == [{"labels": {"operation": "SELECT"}, "value": 1}]
+    assert stats["histograms"]["det_db_query_seconds"][0]["count"] == 1
+
+
+def test_metrics_endpoint_needs_a_token_outside_development(monkeypatch):
+    from api.main import app
+
+    client = TestClient(app)
+    monkeypatch.setattr(settings, "metrics_token", None)
+    monkeypatch.setattr(settings, "app_env", "production")
+    assert client.get("/metrics").status_code == 403
+
+    monkeypatch.setattr(settings, "metrics_token", "scrape-me")
+    assert client.get("/metrics").status_code == 401
+    assert client.get("/metrics", headers={"Authorization": "Bearer scrape-me"}).status_code == 200
+
+    monkeypatch.setattr(settings, "metrics_token", None)
+    monkeypatch.setattr(settings, "app_env", "development")
+    assert client.get("/metrics").status_code == 200
@@ -0,0 +1,216 @@
+"""
+DET Flow - Model Router Tests
+Failover and hedging tests using fake providers with injected delays.
+"""
+
+import time
+
+import pytest
+
+from agents import model_router as model_router_module
+from agents.circuit_breaker import CircuitBreaker, CircuitBreakerRegistry, CircuitOpenError, CircuitState
+from agents.llm_scheduler import LLMQueueTimeout, LLMScheduler
+from agents.model_router import LatencyTracker, ModelRouter
+from agents.model_telemetry import ModelTelemetry
+
+
+class FakeResponse:
+    def __init__(self, content, status="COMPLETED"):
+        self.content = content
+        self.status = status
+        self.metrics = {}
+
+
+class FakeAgent:
+    """Agent stand-in that answers after a delay, or fails."""
+
+    def __init__(self, model_id, delay=0.0, fail=False, error_status=False):
+        self.model_id = model_id
+        self.delay = delay
+        self.fail = fail
+        self.error_status = error_status
+        self.calls = 0
+
+    def run(self, prompt):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.fail:
+            raise RuntimeError(f"{self.model_id} unavailable")
+        if self.error_status:
+            return FakeResponse("Connection error.", status="ERROR")
+        return FakeResponse(f"{self.model_id}: {prompt}")
+
+
+def build_router(agents, providers=None, tracker=None, **kwargs):
+    return ModelRouter(
+        "evaluation",
+        list(agents),
+        agent_factory=lambda model_id: agents[model_id],
+        providers=providers or {},
+        tracker=tracker or LatencyTracker(window_size=50, max_error_rate=0.5, error_cooldown_seconds=60),
+        telemetry=ModelTelemetry(),
+        breakers=kwargs.pop("breakers", None) or CircuitBreakerRegistry(),
+        **kwargs
+    )
+
+
+def test_failover_to_other_provider():
+    """A failing primary falls over to a model from another provider first."""
+    agents = {
+        "gpt-4o": FakeAgent("gpt-4o", fail=True),
+        "gpt-4o-mini": FakeAgent("gpt-4o-mini"),
+        "claude-3-haiku": FakeAgent("claude-3-haiku"),
+    }
+    providers = {"gpt-4o": "openai", "gpt-4o-mini": "openai", "claude-3-haiku": "anthropic"}
+    router = build_router(agents, providers, failover_enabled=True, hedging_enabled=False)
+
+    response = router.run("hello")
+
+    assert response.content == "claude-3-haiku: hello"
+    assert agents["gpt-4o-mini"].calls == 0
+    assert router.tracker.get_stats()["routing"]["evaluation"]["failovers"] == 1
+
+
+def test_calls_on_a_specific_model_are_accounted_like_routed_calls(monkeypatch):
+    """Shadow scoring and structured-output re-asks go through run_on and reach the usage ledger."""
+    recorded = []
+
+    class Ledger:
+        def record(self, activity, model, usage, latency_ms=None, cost_usd=None):
+            recorded.append((activity, model, latency_ms is not None))
+
+    monkeypatch.setattr(model_router_module, "usage_ledger", Ledger())
+    agents = {"gpt-4o": FakeAgent("gpt-4o"), "claude-3-haiku": FakeAgent("claude-3-haiku")}
+    router = build_router(agents, hedging_enabled=False)
+
+    router.run("hello")
+    router.run_on("claude-3-haiku", "shadow")
+
+    assert recorded == [
+        ("evaluation", "gpt-4o", True), ("evaluation", "claude-3-haiku", True)
+    ]
+
+
+def test_error_status_counts_as_failure_and_demotes_model():
+    """Runs returning an error status fail over, and the model is demoted while failing."""
+    agents = {"gpt-4o": FakeAgent("gpt-4o", error_status=True), "claude-3-haiku": FakeAgent("claude-3-haiku")}
+    router = build_router(agents, failover_enabled=True, hedging_enabled=False)
+
+    assert router.run("hi").content == "claude-3-haiku: hi"
+    assert router.route()[0] == "claude-3-haiku"
+    assert router.tracker.get_stats()["models"]["gpt-4o"]["error_rate"] == 1.0
+
+
+def test_all_candidates_fail():
+    """The last error is raised when no model can answer."""
+    agents = {"gpt-4o": FakeAgent("gpt-4o", fail=True), "claude-3-haiku": FakeAgent("claude-3-haiku", fail=True)}
+    router = build_router(agents, failover_enabled=True, hedging_enabled=False)
+
+    with pytest.raises(RuntimeError):
+        router.run("hi")
+
+
+def test_hedged_request_cuts_tail_latency():
+    """A request stuck past the primary's p95 is hedged and the faster backup wins."""
+    tracker = LatencyTracker(window_size=50, max_error_rate=0.5, error_cooldown_seconds=60)
+    for _ in range(10):
+        tracker.record("gpt-4o", 0.05, ok=True)
+        tracker.record("claude-3-haiku", 0.02, ok=True)
+
+    agents = {"gpt-4o": FakeAgent("gpt-4o", delay=1.0), "claude-3-haiku": FakeAgent("claude-3-haiku", delay=0.02)}
+    router = build_router(agents, tracker=tracker, hedging_enabled=True, hedge_min_samples=5, latency_slo_ms=60000)
+
+    start = time.monotonic()
+    response = router.run("hi")
+    elapsed = time.monotonic() - start
+
+    assert response.content == "claude-3-haiku: hi"
+    assert elapsed < 0.5
+    routing = tracker.get_stats()["routing"]["evaluation"]
+    assert routing["hedges_sent"] == 1
+    assert routing["hedges_won"] == 1
+
+
+def test_no_hedge_without_latency_samples():
+    """Hedging waits for enough latency samples before duplicating requests."""
+    agents = {"gpt-4o": FakeAgent("gpt-4o", delay=0.05), "claude-3-haiku": FakeAgent("claude-3-haiku")}
+    router = build_router(agents, hedging_enabled=True, hedge_min_samples=5)
+
+    assert router.run("hi").content == "gpt-4o: hi"
+    assert agents["claude-3-haiku"].calls == 0
+
+
+def test_slow_primary_yields_to_model_within_slo():
+    """A primary whose live p95 breaks the latency SLO yields to a healthy faster model."""
+    tracker = LatencyTracker(window_size=50, max_error_rate=0.5, error_cooldown_seconds=60)
+    for _ in range(5):
+        tracker.record("gpt-4o", 3.0, ok=True)
+        tracker.record("claude-3-haiku", 0.5, ok=True)
+
+    agents = {"gpt-4o": FakeAgent("gpt-4o"), "claude-3-haiku": FakeAgent("claude-3-haiku")}
+    router = build_router(agents, tracker=tracker, hedge_min_samples=5, latency_slo_ms=2000)
+
+    assert router.route() == ["claude-3-haiku", "gpt-4o"]
+
+
+def test_circuit_opens_and_recovers_after_probe():
+    """Consecutive failures open the circuit; a successful half-open probe closes it."""
+    breaker = CircuitBreaker("gpt-4o", failure_threshold=2, recovery_seconds=0.05, half_open_max_calls=1)
+
+    breaker.record_failure()
+    assert breaker.state == CircuitState.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitState.OPEN
+    assert not breaker.allow_request()
+
+    time.sleep(0.06)
+    assert breaker.allow_request()
+    assert not breaker.allow_request()  # only one probe while half-open
+
+    breaker.record_success()
+    assert breaker.state == CircuitState.CLOSED
+    assert breaker.get_stats()["trips"] == 1
+
+
+def test_open_circuit_fails_fast():
+    """With every circuit open, the router fails fast without calling the providers."""
+    agents = {"gpt-4o": FakeAgent("gpt-4o", delay=0.5), "claude-3-haiku": FakeAgent("claude-3-haiku", delay=0.5)}
+    breakers = CircuitBreakerRegistry()
+    for model_id in agents:
+        for _ in range(5):
+            breakers.get(model_id).record_failure()
+
+    router = build_router(agents, breakers=breakers, failover_enabled=True)
+
+    start = time.monotonic()
+    with pytest.raises(CircuitOpenError):
+        router.run("hi")
+
+    assert time.monotonic() - start < 0.1
+    assert agents["gpt-4o"].calls == 0
+    assert agents["claude-3-haiku"].calls == 0
+
+
+
+def test_queue_timeout_gives_back_the_half_open_probe():
+    """A probe that times out waiting for a provider slot does not wedge the breaker half-open."""
+    agents = {"gpt-4o": FakeAgent("gpt-4o")}
+    breakers = CircuitBreakerRegistry()
+    breaker = breakers.get("gpt-4o")
+    breaker.recovery_seconds, breaker.half_open_max_calls = 0.01, 1
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    time.sleep(0.02)
+
+    scheduler = LLMScheduler(provider_limits={"openai": 1}, queue_timeout_seconds=0.05, enabled=True)
+    router = build_router(agents, providers={"gpt-4o": "openai"}, breakers=breakers, scheduler=scheduler)
+
+    scheduler.acquire("openai", "batch")  # Another caller holds the only slot
+    with pytest.raises(LLMQueueTimeout):
+        router.run_on("gpt-4o", "hi")
+    scheduler.release("openai")
+    assert breaker.state == CircuitState.HALF_OPEN
+
+    # The probe slot was given back, so the next call probes and closes the circuit
+    assert router.run_on("gpt-4o", "hi").content == "gpt-4o: hi"
+    assert breaker.state == CircuitState.CLOSED
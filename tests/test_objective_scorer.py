@@ -0,0 +1,89 @@
+"""
+DET Flow - Objective Scorer Tests
+Tests for local scoring of read_and_complete, read_and_select and listen_and_type.
+"""
+
+import random
+import time
+
+import pytest
+
+from agents.evaluator import EvaluatorAgent
+from agents.objective_scorer import ObjectiveScorer, levenshtein
+
+
+def reference_levenshtein(a, b):
+    """Plain dynamic-programming edit distance."""
+    previous = list(range(len(b) + 1))
+    for i, x in enumerate(a, 1):
+        current = [i]
+        for j, y in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (x != y)))
+        previous = current
+    return previous[-1]
+
+
+@pytest.fixture
+def scorer():
+    return ObjectiveScorer(spelling_credit=0.75)
+
+
+def test_bit_parallel_levenshtein_matches_dp():
+    """Myers' algorithm agrees with the DP definition on strings and token lists."""
+    rng = random.Random(7)
+    for _ in range(300):
+        a = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 20)))
+        b = "".join(rng.choice("abcd") for _ in range(rng.randint(0, 20)))
+        assert levenshtein(a, b) == reference_levenshtein(a, b)
+    assert levenshtein(["the", "cat", "sat"], ["the", "sat"]) == 1
+
+
+def test_listen_and_type_scores(scorer):
+    """Exact transcriptions get 160, spelling slips keep most credit, missing words cost more."""
+    reference = "The library closes early on Sundays."
+
+    perfect = scorer.score("listen_and_type", "the library closes early on sundays", reference)
+    slip = scorer.score("listen_and_type", "The libary closes early on Sundays", reference)
+    missing = scorer.score("listen_and_type", "The library closes", reference)
+
+    assert perfect["overall_score"] == 160
+    assert perfect["scoring_method"] == "objective"
+    assert missing["overall_score"] < slip["overall_score"] < perfect["overall_score"]
+    assert slip["objective_details"]["misspellings"] == ["libary → library"]
+
+
+def test_read_and_complete_and_select(scorer):
+    """Blanks get positional credit; selecting pseudo-words is penalized."""
+    completion = scorer.score("read_and_complete", "house, garden, wnidow", ["house", "garden", "window"])
+    assert completion["objective_details"]["correct_words"] == 2
+    assert 10 < completion["overall_score"] < 160
+
+    everything = scorer.score("read_and_select", "cat plome dog frint", "cat dog")
+    honest = scorer.score("read_and_select", "cat dog", "cat dog")
+    assert everything["overall_score"] == 10
+    assert honest["overall_score"] == 160
+
+
+def test_scoring_is_fast(scorer):
+    """Objective items score in well under a millisecond each."""
+    reference = "Students should submit their assignments before the deadline next week."
+    start = time.perf_counter()
+    for _ in range(200):
+        scorer.score("listen_and_type", "Students shoud submit their asignments before the deadline", reference)
+    assert (time.perf_counter() - start) / 200 < 0.001
+
+
+def test_evaluator_skips_llm_for_objective_tasks():
+    """With a reference answer the evaluator never calls the model."""
+    evaluator = EvaluatorAgent()
+    evaluator.router.run_with_model = lambda *args, **kwargs: pytest.fail("LLM called")
+
+    result = evaluator.evaluate_submission(
+        task_type="listen_and_type",
+        task_prompt="Type the sentence you hear.",
+        response_text="I would like a cup of coffee",
+        reference_answer="I would like a cup of coffee."
+    )
+
+    assert result["overall_score"] == 160
+    assert result["cefr_level"] == "C2"
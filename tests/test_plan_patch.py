@@ -0,0 +1,122 @@
+"""
+DET Flow - Plan Patch Tests
+Tests for progress summaries, patch validation and the Pedagogue patch-based adjustment.
+"""
+
+import json
+
+import pytest
+
+from agents.pedagogue import PedagogueAgent
+from agents.plan_patch import PlanPatchError, apply_plan_patch, summarize_progress
+from agents.schemas import StudyPlanPatch
+
+
+def make_plan(weeks=4):
+    return {
+        "plan_title": "Plano",
+        "target_score": 120,
+        "duration_weeks": weeks,
+        "study_tips": ["Pratique todo dia"],
+        "weekly_schedule": [
+            {
+                "week": n,
+                "focus_areas": [f"Area {n}"],
+                "daily_tasks": [{"day": "Monday", "tasks": [{"task": "Read", "duration_minutes": 30}]}],
+                "checkpoint": f"Checkpoint {n}",
+            }
+            for n in range(1, weeks + 1)
+        ],
+    }
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRouter:
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def run_with_model(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.answer), "fake-model"
+
+
+def test_progress_summary_has_trend_and_gap():
+    stats = summarize_progress([90, 95, 100, 105], completed_weeks=2, plan=make_plan())
+
+    assert stats["remaining_weeks"] == 2
+    assert stats["mean"] == 97.5
+    assert stats["trend_per_submission"] == 5.0
+    assert stats["gap_to_target"] == 15
+
+
+def test_patch_updates_only_changed_weeks():
+    plan = make_plan()
+    patch = StudyPlanPatch.model_validate({
+        "weeks": [
+            {"op": "update", "week": 3, "checkpoint": "Meta 110"},
+            {"op": "replace", "week": 4, "focus_areas": ["Speaking"], "daily_tasks": []},
+        ],
+        "study_tips": ["Grave suas respostas"],
+        "rationale": "Acima do esperado",
+    }).model_dump()
+
+    patched = apply_plan_patch(plan, patch, completed_weeks=2)
+
+    weeks = patched["weekly_schedule"]
+    assert weeks[:2] == plan["weekly_schedule"][:2]
+    assert weeks[2]["checkpoint"] == "Meta 110"
+    assert weeks[2]["focus_areas"] == ["Area 3"]
+    assert weeks[3]["focus_areas"] == ["Speaking"] and weeks[3]["checkpoint"] == ""
+    assert patched["study_tips"] == ["Grave suas respostas"]
+    assert patched["plan_title"] == "Plano"
+    assert patched["adjustments"][-1]["changed_weeks"] == [3, 4]
+    assert plan["weekly_schedule"][2]["checkpoint"] == "Checkpoint 3"
+
+
+@pytest.mark.parametrize("week", [2, 9])
+def test_patch_outside_remaining_weeks_is_rejected(week):
+    patch = StudyPlanPatch.model_validate({"weeks": [{"week": week, "checkpoint": "x"}]}).model_dump()
+
+    with pytest.raises(PlanPatchError):
+        apply_plan_patch(make_plan(), patch, completed_weeks=2)
+
+
+def test_replaced_week_keeps_list_fields_as_lists():
+    patch = StudyPlanPatch.model_validate({
+        "weeks": [{"op": "replace", "week": 3, "focus_areas": [], "daily_tasks": []}],
+    }).model_dump()
+
+    week = apply_plan_patch(make_plan(), patch, completed_weeks=2)["weekly_schedule"][2]
+
+    assert week == {"week": 3, "focus_areas": [], "daily_tasks": [], "checkpoint": ""}
+
+
+def test_replace_requires_full_week():
+    with pytest.raises(ValueError):
+        StudyPlanPatch.model_validate({"weeks": [{"op": "replace", "week": 3, "checkpoint": "x"}]})
+
+
+def test_pedagogue_sends_remaining_weeks_and_applies_patch():
+    pedagogue = PedagogueAgent()
+    pedagogue.adjustment_router = FakeRouter(json.dumps({"weeks": [{"week": 4, "checkpoint": "Meta 115"}]}))
+    plan = make_plan()
+
+    adjusted = pedagogue.adjust_plan_based_on_progress(plan, [100, 104], completed_weeks=3)
+
+    prompt = pedagogue.adjustment_router.prompts[0]
+    assert "Checkpoint 1" not in prompt and "Checkpoint 4" in prompt
+    assert adjusted["weekly_schedule"][3]["checkpoint"] == "Meta 115"
+    assert adjusted["weekly_schedule"][:3] == plan["weekly_schedule"][:3]
+
+
+def test_pedagogue_keeps_plan_on_invalid_patch():
+    pedagogue = PedagogueAgent()
+    pedagogue.adjustment_router = FakeRouter(json.dumps({"weeks": [{"week": 1, "checkpoint": "x"}]}))
+    plan = make_plan()
+
+    assert pedagogue.adjust_plan_based_on_progress(plan, [100], completed_weeks=2) == plan
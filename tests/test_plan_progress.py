@@ -0,0 +1,182 @@
+"""
+DET Flow - Plan Progress Tests
+Tests for task matching, incremental completion and drift-based adjustment triggers.
+"""
+
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import create_engine
+
+from core.database import SessionLocal, engine as default_engine
+from core.models import StudyPlan, Submission, User
+from core.plan_progress import APPLIED_IDS_KEPT, PlanProgressEngine, current_week, normalize_task_type
+
+
+def make_plan(weeks=4, tasks_per_week=("read_aloud", "write_about_photo")):
+    return {
+        "target_score": 120,
+        "duration_weeks": weeks,
+        "weekly_schedule": [
+            {
+                "week": n,
+                "daily_tasks": [{"day": "Monday", "tasks": [{"task_type": t} for t in tasks_per_week]}],
+            }
+            for n in range(1, weeks + 1)
+        ],
+    }
+
+
+def engine():
+    return PlanProgressEngine(score_drift_threshold=10, completion_drift_threshold=25, min_submissions=2)
+
+
+def test_task_types_are_normalized():
+    assert normalize_task_type("Read Aloud") == normalize_task_type("read-aloud") == "read_aloud"
+
+
+def test_current_week_handles_mixed_timezones():
+    start = datetime.now(timezone.utc) - timedelta(days=15)
+    assert current_week(start, 4, datetime.now()) == 3
+    assert current_week(start - timedelta(days=100), 4) == 4
+
+
+def test_submissions_complete_current_week_then_catch_up():
+    plan, tracker = make_plan(), engine()
+
+    first = tracker.apply_submission(plan, 1, "Read Aloud", 100, week=2)
+    second = tracker.apply_submission(plan, 2, "read_aloud", 100, week=2)
+    third = tracker.apply_submission(plan, 3, "read_aloud", 100, week=2)
+
+    assert (first["matched_week"], second["matched_week"], third["matched_week"]) == (2, 1, None)
+    assert second["completion_percentage"] == 25.0
+    assert plan["progress"]["extra"] == 1
+
+
+def test_replayed_submission_is_ignored():
+    plan, tracker = make_plan(), engine()
+    tracker.apply_submission(plan, 5, "read_aloud", 100, week=1)
+
+    replay = tracker.apply_submission(plan, 5, "read_aloud", 100, week=1)
+
+    assert replay["duplicate"]
+    assert plan["progress"]["done"] == {"1": {"read_aloud": 1}}
+
+
+def test_submissions_committed_out_of_order_are_applied():
+    plan, tracker = make_plan(weeks=1), engine()
+    tracker.apply_submission(plan, 11, "read_aloud", 100, week=1)
+
+    late = tracker.apply_submission(plan, 10, "write_about_photo", 100, week=1)
+
+    assert not late.get("duplicate")
+    assert late["completion_percentage"] == 100.0
+    assert tracker.apply_submission(plan, 10, "write_about_photo", 100, week=1)["duplicate"]
+
+
+def test_applied_ids_are_bounded_and_legacy_high_water_mark_is_kept():
+    plan, tracker = make_plan(), engine()
+    plan["progress"] = {"last_submission_id": 7}
+    assert tracker.apply_submission(plan, 7, "read_aloud", 100, week=1)["duplicate"]
+
+    for submission_id in range(8, 8 + APPLIED_IDS_KEPT + 10):
+        tracker.apply_submission(plan, submission_id, "read_aloud", 100, week=1)
+    assert len(plan["progress"]["applied_ids"]) == APPLIED_IDS_KEPT
+    assert "last_submission_id" not in plan["progress"]
+    assert tracker.apply_submission(plan, 9, "read_aloud", 100, week=1)["duplicate"]  # Older than the window
+
+
+def test_skeleton_weeks_of_lazy_plans_count_as_open_slots():
+    plan = make_plan(weeks=3, tasks_per_week=("read_aloud", "write_about_photo", "listen_and_type", "read_and_select"))
+    plan["lazy_weeks"] = True
+    for week in plan["weekly_schedule"][1:]:
+        week["daily_tasks"] = []  # Weeks 2 and 3 not opened yet
+    tracker = engine()
+
+    summary = tracker.apply_submission(plan, 1, "speaking_sample", 100, week=2)
+    assert summary["matched_week"] == 2
+    assert summary["completion_percentage"] == round(100 / 12, 1)  # 4 slots per week, like week 1
+
+    # Without any detailed week, slots follow the study days of the weekly hours
+    skeleton = make_plan(weeks=2)
+    skeleton.update({"lazy_weeks": True, "student_profile": {"available_hours_per_week": 3}})
+    for week in skeleton["weekly_schedule"]:
+        week["daily_tasks"] = []
+    for submission_id in range(1, 4):
+        summary = tracker.apply_submission(skeleton, submission_id, "read_aloud", 100, week=1)
+    assert summary["completion_percentage"] == 50.0
+    assert tracker.apply_submission(skeleton, 4, "read_aloud", 100, week=1)["matched_week"] is None
+
+
+def test_on_track_plan_is_not_adjusted():
+    plan, tracker = make_plan(), engine()
+    for submission_id, score in enumerate([100, 101, 99], start=1):
+        summary = tracker.apply_submission(plan, submission_id, "read_aloud", score, week=1)
+
+    assert summary["score_drift"] == 0
+    assert not summary["needs_adjustment"]
+
+
+def test_score_drift_triggers_adjustment_once_per_week():
+    plan, tracker = make_plan(), engine()
+    tracker.apply_submission(plan, 1, "read_aloud", 90, week=1)
+    summary = tracker.apply_submission(plan, 2, "write_about_photo", 140, week=3)
+
+    assert summary["score_drift"] >= 10
+    assert summary["needs_adjustment"]
+
+    plan["progress"].update({"submissions_since_adjustment": 0, "last_adjusted_week": 3})
+    for submission_id in (3, 4):
+        summary = tracker.apply_submission(plan, submission_id, "read_aloud", 130, week=3)
+    assert not summary["needs_adjustment"]
+
+
+def test_falling_behind_schedule_triggers_adjustment():
+    plan, tracker = make_plan(), engine()
+    for submission_id in (1, 2):
+        summary = tracker.apply_submission(plan, submission_id, "read_aloud", None, week=3)
+
+    assert summary["expected_completion"] == 50.0
+    assert summary["completion_drift"] <= -25
+    assert summary["needs_adjustment"]
+
+
+def test_fallback_and_provisional_scores_do_not_count_as_scores(tmp_path):
+    db_engine = create_engine(f"sqlite:///{tmp_path / 'progress.sqlite'}", connect_args={"check_same_thread": False})
+    for model in (User, StudyPlan, Submission):
+        model.__table__.create(db_engine)
+    SessionLocal.configure(bind=db_engine)
+    try:
+        db = SessionLocal()
+        user = User(phone_number="5511900000000")
+        db.add(user)
+        db.flush()
+        db.add(StudyPlan(user_id=user.id, title="Plano", plan_data=make_plan(), duration_weeks=4,
+                         start_date=datetime.now(), is_active=True))
+        feedbacks = [
+            {"overall_score": 50, "error": "provider down"},
+            {"overall_score": 135, "provisional": True, "error": "provider down"},
+            {"overall_score": 110},
+        ]
+        submissions = [
+            Submission(user_id=user.id, task_type="read_aloud", response_text="r", status="completed",
+                       overall_score=feedback["overall_score"], feedback=feedback, evaluated_at=datetime.now())
+            for feedback in feedbacks
+        ]
+        db.add_all(submissions)
+        db.commit()
+
+        tracker = engine()
+        for submission in submissions:
+            summary = tracker.record_submission(db, submission)
+
+        progress = db.query(StudyPlan).one().plan_data["progress"]
+        db.close()
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        db_engine.dispose()
+
+    # All three tasks count as done, but only the real evaluation is a score
+    assert progress["done"] == {"1": {"read_aloud": 1}} and progress["extra"] == 2
+    assert progress["scores"] == [110]
+    assert progress["baseline_score"] == 110
+    assert summary["score_drift"] == 0
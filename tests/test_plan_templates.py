@@ -0,0 +1,102 @@
+"""
+DET Flow - Plan Template Tests
+Tests for profile bucketing, template instantiation and the Pedagogue template path.
+"""
+
+import json
+
+import pytest
+
+from agents import pedagogue as pedagogue_module
+from agents.pedagogue import PedagogueAgent
+from agents.plan_templates import PlanProfile, PlanTemplateStore
+
+
+def strings(value):
+    if isinstance(value, str):
+        yield value
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from strings(item)
+    elif isinstance(value, list):
+        for item in value:
+            yield from strings(item)
+
+
+def test_similar_students_share_a_bucket():
+    a = PlanProfile("B1", 120, 10, ["Grammar", "Listening"])
+    b = PlanProfile("b1", 125, 12, ["listening", "Gramática"])
+    rare = PlanProfile("B1", 120, 10, ["phrasal verbs"])
+
+    assert a.key == b.key
+    assert a.is_common and not rare.is_common
+    assert rare.key != a.key
+
+
+def test_curated_template_is_instantiated_with_student_values():
+    store = PlanTemplateStore()
+    plan = store.instantiate(PlanProfile("B1", 120, 6, ["Speaking"]))
+
+    assert plan["target_score"] == 120
+    assert plan["current_level"] == "B1"
+    assert plan["duration_weeks"] == len(plan["weekly_schedule"])
+    assert not any("{" in text for text in strings(plan))
+    week = plan["weekly_schedule"][0]
+    assert sum(day["duration_minutes"] for day in week["daily_tasks"]) == pytest.approx(6 * 60, abs=25)
+    assert store.get_stats()["curated"] == 1
+
+
+def test_generated_template_is_reused_and_persisted(tmp_path):
+    store = PlanTemplateStore(directory=str(tmp_path))
+    profile = PlanProfile("B2", 130, 8, ["phrasal verbs"])
+    assert store.instantiate(profile) is None
+
+    generated = {
+        "plan_title": "Plano B2 para 130",
+        "duration_weeks": 1,
+        "target_score": 130,
+        "weekly_schedule": [{"week": 1, "focus_areas": ["Phrasal verbs"], "daily_tasks": [], "checkpoint": "Meta 130"}],
+    }
+    store.save_generated(profile, generated)
+
+    reloaded = PlanTemplateStore(directory=str(tmp_path))
+    plan = reloaded.instantiate(PlanProfile("B2", 135, 8, ["Phrasal Verbs"]))
+    assert plan["plan_title"] == "Plano B2 para 135"
+    assert plan["weekly_schedule"][0]["checkpoint"] == "Meta 135"
+    assert plan["template"]["source"] == "generated"
+
+
+def test_off_bucket_deadlines_do_not_share_bucket_templates():
+    store = PlanTemplateStore()
+    common = PlanProfile("B1", 120, 10, ["Grammar"], deadline_weeks=4)
+    assert store.instantiate(PlanProfile("B1", 120, 10, ["Grammar"], deadline_weeks=8))["duration_weeks"] == 8
+
+    # 10 weeks is between the 8 and 12 week buckets: no curated plan, the LLM writes it
+    ten_weeks = PlanProfile("B1", 120, 10, ["Grammar"], deadline_weeks=10)
+    assert not ten_weeks.is_common
+    assert store.instantiate(ten_weeks) is None
+
+    # A generated 3-week plan is reused for 3-week deadlines only, not for the 4-week bucket
+    three_weeks = PlanProfile("B1", 120, 10, ["Grammar"], deadline_weeks=3)
+    assert three_weeks.key != common.key
+    store.save_generated(three_weeks, {
+        "plan_title": "Plano intensivo",
+        "duration_weeks": 3,
+        "weekly_schedule": [{"week": n, "focus_areas": ["Grammar"], "daily_tasks": []} for n in (1, 2, 3)],
+    })
+    assert store.instantiate(PlanProfile("B1", 125, 10, ["Grammar"], deadline_weeks=3))["duration_weeks"] == 3
+    four_weeks = store.instantiate(common)
+    assert four_weeks["template"]["source"] == "curated"
+    assert four_weeks["duration_weeks"] == 4
+
+
+def test_pedagogue_uses_templates_without_llm(monkeypatch):
+    monkeypatch.setattr(pedagogue_module, "plan_templates", PlanTemplateStore())
+    pedagogue = PedagogueAgent()
+    pedagogue.router.run_with_model = lambda *args, **kwargs: pytest.fail("LLM called")
+
+    plan = pedagogue.create_study_plan("A2", 90, 4, weaknesses=["Vocabulary"])
+
+    assert plan["template"]["source"] == "curated"
+    assert plan["student_profile"]["weaknesses"] == ["Vocabulary"]
+    json.dumps(plan)
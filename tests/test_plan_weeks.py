@@ -0,0 +1,130 @@
+"""
+DET Flow - Lazy Plan Week Tests
+Tests for skeleton plans, on-demand week generation, caching and prefetch.
+"""
+
+import json
+import threading
+
+import pytest
+
+from agents import pedagogue as pedagogue_module
+from agents.pedagogue import PedagogueAgent
+from agents.plan_weeks import WeekDetailCache
+
+
+def skeleton_plan(weeks=3):
+    return {
+        "plan_title": "Plano",
+        "plan_uid": "plan-1",
+        "target_score": 120,
+        "duration_weeks": weeks,
+        "lazy_weeks": True,
+        "weekly_schedule": [
+            {"week": n, "focus_areas": [f"Area {n}"], "daily_tasks": [], "checkpoint": f"Checkpoint {n}"}
+            for n in range(1, weeks + 1)
+        ],
+    }
+
+
+def week_answer(prompt):
+    week = int(prompt.split("for week ")[1].split(" ")[0])
+    return {
+        "week": week,
+        "focus_areas": [f"Area {week}"],
+        "daily_tasks": [{"day": "Monday", "duration_minutes": 60, "tasks": [{"task_type": "read_aloud"}]}],
+        "checkpoint": f"Checkpoint {week}",
+    }
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRouter:
+    def __init__(self):
+        self.prompts = []
+
+    def run_with_model(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(json.dumps(week_answer(prompt))), "fake-model"
+
+
+def test_cache_generates_once_and_waits_on_prefetch():
+    cache = WeekDetailCache(max_weeks=10)
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append("prefetch")
+        release.wait(5)
+        return {"week": 2}
+
+    cache.prefetch("plan", 2, slow)
+    cache.prefetch("plan", 2, slow)
+    release.set()
+    assert cache.get("plan", 2, lambda: pytest.fail("generated twice")) == {"week": 2}
+    assert cache.get("plan", 2, lambda: pytest.fail("generated twice")) == {"week": 2}
+    assert calls == ["prefetch"]
+    assert cache.get_stats()["prefetched"] == 1
+
+
+def test_failed_prefetch_falls_back_to_generation():
+    cache = WeekDetailCache(max_weeks=10)
+
+    def broken():
+        raise RuntimeError("provider down")
+
+    cache.prefetch("plan", 1, broken)
+    assert cache.get("plan", 1, lambda: {"week": 1}) == {"week": 1}
+    assert cache.get_stats()["generated"] == 1
+
+
+def test_week_details_are_generated_on_first_view(monkeypatch):
+    monkeypatch.setattr(pedagogue_module, "week_details", WeekDetailCache(max_weeks=10))
+    monkeypatch.setattr(pedagogue_module.settings, "plan_prefetch_enabled", False)
+    pedagogue = PedagogueAgent()
+    pedagogue.week_router = FakeRouter()
+    plan = skeleton_plan()
+
+    week = pedagogue.get_week_details(plan, 1)
+
+    assert week["daily_tasks"][0]["tasks"][0]["task_type"] == "read_aloud"
+    assert plan["weekly_schedule"][0] is week
+    assert plan["weekly_schedule"][1]["daily_tasks"] == []
+    assert "Checkpoint 1" in pedagogue.week_router.prompts[0]
+
+    pedagogue.get_week_details(plan, 1)
+    assert len(pedagogue.week_router.prompts) == 1
+
+
+def test_next_week_is_prefetched(monkeypatch):
+    cache = WeekDetailCache(max_weeks=10)
+    monkeypatch.setattr(pedagogue_module, "week_details", cache)
+    monkeypatch.setattr(pedagogue_module.settings, "plan_prefetch_enabled", True)
+    pedagogue = PedagogueAgent()
+    pedagogue.week_router = FakeRouter()
+    plan = skeleton_plan()
+
+    pedagogue.get_week_details(plan, 1)
+    pedagogue.get_week_details(plan, 2)
+
+    assert plan["weekly_schedule"][1]["daily_tasks"]
+    stats = cache.get_stats()
+    assert stats["generated"] == 1
+    assert stats["hits"] + stats["waited_on_prefetch"] == 1
+
+
+def test_skeleton_plan_has_no_daily_tasks(monkeypatch):
+    monkeypatch.setattr(pedagogue_module.settings, "plan_lazy_weeks_enabled", True)
+    monkeypatch.setattr(pedagogue_module.settings, "plan_templates_enabled", False)
+    pedagogue = PedagogueAgent()
+    answer = {**skeleton_plan(), "weekly_schedule": [week_answer("for week 1 ")]}
+    answer.pop("plan_uid")
+    pedagogue.router.run_with_model = lambda prompt: (FakeResponse(json.dumps(answer)), "fake-model")
+
+    plan = pedagogue.create_study_plan("B1", 120, 10)
+
+    assert plan["lazy_weeks"] and plan["plan_uid"]
+    assert plan["weekly_schedule"][0]["daily_tasks"] == []
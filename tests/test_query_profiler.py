@@ -0,0 +1,124 @@
+"""
+DET Flow - Query Profiler Tests
+Tests for N+1 detection, query budgets per endpoint and slow-request sampling.
+"""
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import selectinload
+
+from benchmarks.replay import seed_database
+from core.database import SessionLocal, engine as default_engine
+from core.models import Submission, User
+from core.query_profiler import (
+    QueryBudgetExceeded,
+    QueryProfiler,
+    assert_query_budget,
+    profile_queries,
+    query_profiler,
+)
+
+# Statements allowed per request: (total, executions of any single statement)
+ENDPOINT_BUDGETS = {
+    "/api/users/{user_id}/submissions": (2, 1),
+    "/api/submissions/{submission_id}": (2, 1),
+    "/api/users/{phone_number}": (2, 1),
+}
+
+
+@pytest.fixture
+def seeded_db(tmp_path):
+    engine = seed_database(tmp_path / "profiler.sqlite", users=6, seed=1)
+    query_profiler.install(engine)
+    try:
+        yield engine
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        engine.dispose()
+
+
+def test_lazy_relationship_in_a_loop_is_flagged(seeded_db):
+    db = SessionLocal()
+    try:
+        with profile_queries("lazy") as lazy:
+            for user in db.query(User).all():
+                len(user.submissions)
+        db.expunge_all()
+        with profile_queries("eager") as eager:
+            for user in db.query(User).options(selectinload(User.submissions)).all():
+                len(user.submissions)
+    finally:
+        db.close()
+
+    assert lazy.count == 7
+    assert list(lazy.repeated(threshold=3).values()) == [6]
+    with pytest.raises(QueryBudgetExceeded, match="N\\+1"):
+        assert_query_budget(lazy, max_queries=10, max_repeats=1)
+    with pytest.raises(QueryBudgetExceeded, match="budget 3"):
+        assert_query_budget(lazy, max_queries=3)
+
+    assert eager.count == 2
+    assert_query_budget(eager, max_queries=2, max_repeats=1)
+
+
+def test_endpoints_stay_within_query_budgets(seeded_db):
+    from api.main import app
+
+    client = TestClient(app)
+    db = SessionLocal()
+    try:
+        user = db.query(User).first()
+        submission = db.query(Submission).filter(Submission.user_id == user.id).first()
+    finally:
+        db.close()
+
+    urls = [
+        f"/api/users/{user.id}/submissions?limit=20",
+        f"/api/submissions/{submission.id}",
+        f"/api/users/{user.phone_number}",
+    ]
+    with query_profiler.capture() as profiles:
+        for url in urls:
+            assert client.get(url).status_code == 200
+
+    assert len(profiles) == len(urls)
+    for profile in profiles:
+        max_queries, max_repeats = ENDPOINT_BUDGETS[profile.label.split(" ", 1)[1]]
+        assert_query_budget(profile, max_queries=max_queries, max_repeats=max_repeats)
+    assert not query_profiler.active  # Nothing is profiled once the capture ends
+
+
+def test_slow_requests_are_sampled_with_their_sql(seeded_db):
+    profiler = QueryProfiler(enabled=True, slow_request_ms=0, sample_rate=1.0)
+    db = SessionLocal()
+    try:
+        started = profiler.start_request("GET /api/users")
+        for user in db.query(User).all():
+            len(user.submissions)
+        profiler.finish_request(started, "GET /api/users", 200, 0.2)
+    finally:
+        db.close()
+
+    stats = profiler.get_stats()
+    assert stats["routes"]["GET /api/users"]["max_queries"] == 7
+    assert stats["routes"]["GET /api/users"]["n_plus_one_requests"] == 1
+    sample = stats["slow_requests"][0]
+    assert sample["duration_ms"] == 200.0
+    assert sample["queries"] == 7
+    assert any("FROM submissions" in statement for statement in sample["repeated"])
+
+
+def test_failed_statements_leave_no_start_times_behind():
+    engine = create_engine("sqlite://")
+    QueryProfiler().install(engine)
+
+    with engine.connect() as conn, profile_queries("failing") as profile:
+        for _ in range(3):
+            with pytest.raises(Exception):
+                conn.execute(text("SELECT * FROM missing_table"))
+        conn.execute(text("SELECT 1"))
+        assert not conn.info.get("det_profile_start")  # Nothing left on the pooled connection
+
+    assert [statement for statement, _ in profile.statements] == ["SELECT 1"]
+    engine.dispose()
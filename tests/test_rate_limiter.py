@@ -0,0 +1,257 @@
+"""
+DET Flow - Rate Limiter Tests
+Tests for the sliding window counters and tiered message/submission quotas.
+"""
+
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+
+from core import rate_limiter as limiter_module
+from core.database import SessionLocal, engine as default_engine
+from core.models import Submission, User
+from core.rate_limiter import DAY, RateLimiter, SlidingWindowCounter, limit_message
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000 * DAY):
+        self.now = float(now)
+
+    def __call__(self):
+        return self.now
+
+
+class FakeRedis:
+    """Just enough of redis-py for the counters; pipelines run atomically like MULTI/EXEC."""
+
+    def __init__(self):
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def get(self, key):
+        with self._lock:
+            return self.values.get(key)
+
+    def incr(self, key):
+        with self._lock:
+            self.values[key] = int(self.values.get(key) or 0) + 1
+            return self.values[key]
+
+    def decr(self, key):
+        with self._lock:
+            self.values[key] = int(self.values.get(key) or 0) - 1
+            return self.values[key]
+
+    def expire(self, key, seconds):
+        return True
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        with self.redis._lock:
+            results = []
+            for name, args in self.commands:
+                if name == "get":
+                    results.append(self.redis.values.get(args[0]))
+                elif name == "incr":
+                    self.redis.values[args[0]] = int(self.redis.values.get(args[0]) or 0) + 1
+                    results.append(self.redis.values[args[0]])
+                else:
+                    results.append(True)
+        time.sleep(0.005)  # Network round trip: other workers run in between
+        return results
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def limiter(clock, monkeypatch):
+    monkeypatch.setattr(limiter_module.settings, "rate_limit_enabled", True)
+    monkeypatch.setattr(limiter_module.settings, "max_submissions_per_day", 3)
+    monkeypatch.setattr(limiter_module.settings, "rate_limit_tiers_json", '{"premium": {"submissions_per_day": 5}}')
+    return RateLimiter(counter=SlidingWindowCounter(clock=clock))
+
+
+def test_counter_denies_over_limit_without_counting(clock):
+    counter = SlidingWindowCounter(clock=clock)
+    results = [counter.hit("messages", "a", 2, 60) for _ in range(3)]
+
+    assert [r.allowed for r in results] == [True, True, False]
+    assert [r.remaining for r in results] == [1, 0, 0]
+    assert results[2].retry_after == 60
+    assert counter.hit("messages", "a", 2, 60, consume=False).remaining == 0
+    assert counter.hit("messages", "b", 2, 60).allowed
+
+
+def test_previous_window_is_weighted_as_it_slides_out(clock):
+    counter = SlidingWindowCounter(clock=clock)
+    for _ in range(4):
+        counter.hit("submissions", "a", 4, 100)
+
+    clock.now += 150  # Half of the previous window still counts: 4 x 0.5 = 2
+    assert counter.hit("submissions", "a", 4, 100).remaining == 1
+    assert counter.hit("submissions", "a", 4, 100).allowed
+    denied = counter.hit("submissions", "a", 4, 100)
+    assert not denied.allowed
+    assert 0 < denied.retry_after <= 50
+
+    clock.now += 200  # Both windows expired
+    assert counter.hit("submissions", "a", 4, 100).remaining == 3
+
+
+def test_submission_quota_follows_the_tier(limiter):
+    assert limiter.limits_for("free")["submissions_per_day"] == 3
+    assert limiter.limits_for("premium") == {"messages_per_minute": 40, "submissions_per_day": 5}
+    assert limiter.limits_for("unknown") == limiter.limits_for("free")
+
+    assert sum(limiter.check_submission("5511").allowed for _ in range(6)) == 3
+
+    limiter.remember_tier("5522", "premium")
+    assert sum(limiter.check_submission("5522").allowed for _ in range(6)) == 5
+    assert limiter.get_stats()["limited"]["submissions"] == 4
+
+
+def test_only_submissions_consume_the_daily_quota(limiter):
+    for _ in range(5):
+        assert limiter.check_message("5511").allowed
+    assert limiter.remaining_submissions("5511").remaining == 3
+
+    assert limiter.check_message("5511", is_submission=True).remaining == 2
+    assert limiter.remaining_submissions("5511").remaining == 2
+
+
+def test_message_flood_is_limited_per_minute(limiter, clock):
+    results = [limiter.check_message("5511") for _ in range(21)]
+
+    assert results[-1].scope == "messages" and not results[-1].allowed
+    assert "muito rápido" in limit_message(results[-1])
+    clock.now += 120
+    assert limiter.check_message("5511").allowed
+
+
+def test_disabled_limiter_allows_everything(limiter, monkeypatch):
+    monkeypatch.setattr(limiter_module.settings, "rate_limit_enabled", False)
+    assert all(limiter.check_submission("5511").allowed for _ in range(10))
+    assert limiter.remaining_submissions("5511").limit is None
+
+
+def test_limit_message_for_submissions(limiter):
+    for _ in range(3):
+        limiter.check_submission("5511")
+    denied = limiter.check_submission("5511")
+
+    assert "3 correções por dia" in limit_message(denied)
+
+
+def test_redis_counter_is_atomic_across_workers(clock):
+    counter = SlidingWindowCounter(clock=clock)
+    counter._redis = FakeRedis()
+    barrier = threading.Barrier(12)
+    results = []
+
+    def worker():
+        barrier.wait()
+        results.append(counter.hit("submissions", "5511", 5, DAY))
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sum(result.allowed for result in results) == 5
+    assert sorted(result.remaining for result in results if result.allowed) == [0, 1, 2, 3, 4]
+    # Denied hits were given back, so the stored count is the real usage
+    assert counter.hit("submissions", "5511", 5, DAY, consume=False).remaining == 0
+    assert list(counter._redis.values.values()) == [5]
+
+
+@pytest.fixture
+def quota_api(tmp_path, monkeypatch):
+    """The API on a scratch database with one free user and a one-submission daily quota."""
+    from api import main
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'quota.sqlite'}", connect_args={"check_same_thread": False})
+    User.__table__.create(engine)
+    Submission.__table__.create(engine)
+    SessionLocal.configure(bind=engine)
+    try:
+        db = SessionLocal()
+        user = User(phone_number="5511988887777", subscription_tier="free", total_submissions=0)
+        db.add(user)
+        db.commit()
+        user_id = user.id
+        db.close()
+
+        monkeypatch.setattr(limiter_module.settings, "rate_limit_enabled", True)
+        monkeypatch.setattr(limiter_module.settings, "max_submissions_per_day", 1)
+        monkeypatch.setattr(main, "rate_limiter", RateLimiter(counter=SlidingWindowCounter()))
+        yield main, TestClient(main.app), user_id
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        engine.dispose()
+
+
+def test_whatsapp_and_api_submissions_share_one_quota(quota_api, monkeypatch):
+    main, client, user_id = quota_api
+    monkeypatch.setattr(main.maestro, "process_user_message", lambda phone_number, message, session_id=None: {"response": "ok"})
+
+    sent = client.post("/webhook/whatsapp", json={"phone": "5511988887777", "message": "pode corrigir minha resposta?"})
+    assert sent.json()["success"] is True
+
+    denied = client.post("/api/submissions", json={
+        "user_id": user_id, "task_type": "writing_sample", "task_prompt": "p", "response_text": "r"
+    })
+    assert denied.status_code == 429
+    assert denied.headers["X-RateLimit-Limit"] == "1"
+
+
+def test_failed_evaluation_gives_the_submission_back(quota_api, monkeypatch):
+    main, client, user_id = quota_api
+
+    def fail(**kwargs):
+        raise RuntimeError("database unavailable")
+
+    monkeypatch.setattr(main.maestro.evaluator, "evaluate_submission", fail)
+    payload = {"user_id": user_id, "task_type": "writing_sample", "task_prompt": "p", "response_text": "r"}
+
+    assert client.post("/api/submissions", json=payload).status_code == 500
+    assert main.rate_limiter.remaining_submissions("5511988887777").remaining == 1
+    assert client.post("/api/submissions", json=payload).status_code == 500  # Retried, not limited
+
+
+def test_denied_submission_does_not_use_a_message_unit(limiter):
+    for _ in range(3):
+        assert limiter.check_message("5511", is_submission=True).allowed
+    for _ in range(5):
+        assert limiter.check_message("5511", is_submission=True).scope == "submissions"
+
+    messages = limiter.counter.hit("messages", "5511", 20, 60, consume=False)
+    assert messages.remaining == 17
+
+
+def test_refund_returns_a_unit_of_the_current_window_only(limiter, clock):
+    for _ in range(3):
+        limiter.check_submission("5511")
+    limiter.refund_submission("5511")
+    assert limiter.check_submission("5511").allowed
+
+    clock.now += DAY
+    limiter.refund_submission("5511")  # Nothing consumed in this window yet
+    assert limiter.remaining_submissions("5511").remaining == 0  # The previous window still weighs in fully
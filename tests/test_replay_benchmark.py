@@ -0,0 +1,56 @@
+"""
+DET Flow - Replay Benchmark Tests
+Tests for the cassette, the seeded traffic and a short replay through the Maestro and the API.
+"""
+
+import json
+
+from benchmarks.replay import (
+    Cassette,
+    build_traffic,
+    compare_reports,
+    percentile,
+    run_benchmark,
+    store_report,
+)
+
+
+def test_cassette_replays_recordings_in_order():
+    cassette = Cassette({"chat": [{"content": "a", "metrics": {"input_tokens": 10}}, {"content": "b"}]})
+    agent = cassette.factory_for("chat", live_factory=None)("gpt-4o-mini")
+
+    assert [agent.run("x").content for _ in range(3)] == ["a", "b", "a"]
+    assert agent.run("x").metrics == {}
+    assert cassette.served == {"chat": 4}
+
+
+def test_traffic_is_deterministic_per_seed():
+    users = [{"id": i, "phone": f"55{i}"} for i in range(5)]
+
+    assert build_traffic(users, 20, seed=3) == build_traffic(users, 20, seed=3)
+    assert build_traffic(users, 20, seed=3) != build_traffic(users, 20, seed=4)
+
+
+def test_percentile_nearest_rank():
+    values = list(range(1, 101))
+    assert percentile(values, 0.5) == 50
+    assert percentile(values, 0.99) == 99
+    assert percentile([], 0.5) is None
+
+
+def test_short_replay_reports_and_compares(tmp_path):
+    report = run_benchmark(turns=12, users=4, seed=1, allocation_turns=3)
+
+    for target in ("maestro", "api"):
+        result = report["targets"][target]
+        assert result["turns"] == 12
+        assert result["errors"] == 0
+        assert result["latency_ms"]["p95"] is not None
+        assert result["queries_per_turn"]["mean"] > 0
+    assert report["allocations"]["turns"] == 3
+    assert report["cassette_calls"]["chat"] > 0
+
+    path = store_report(report, tmp_path)
+    assert json.loads(path.read_text())["commit"] == report["commit"]
+    assert len((tmp_path / "history.jsonl").read_text().splitlines()) == 1
+    assert report["commit"] in compare_reports(report, report)[0]
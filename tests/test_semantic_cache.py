@@ -0,0 +1,82 @@
+"""
+DET Flow - Semantic Cache Tests
+Tests for near-duplicate lookup, calibration, eviction and the offline harness.
+"""
+
+from benchmarks.semantic_cache_eval import DEFAULT_CORPUS, evaluate_thresholds, load_corpus
+from agents.semantic_cache import SemanticEvaluationCache, cosine, embed
+
+
+PROMPT = "Write a description of the image: a busy train station."
+ORIGINAL = "This is a busy train station with many people. Some people are waiting for the train and others are walking fast."
+TYPO = "This is a busy train station with many people. Some people are waiting for the train and other are walking fast."
+DIFFERENT = "Commuters crowd the platform at rush hour while a few travellers calmly read newspapers."
+
+
+def evaluation(score):
+    return {
+        "overall_score": score,
+        "subscores": {"literacy": score, "comprehension": score, "conversation": score, "production": score},
+        "cefr_level": "B2",
+        "feedback": "Bom trabalho!",
+    }
+
+
+def make_cache(**kwargs):
+    options = {"reuse_threshold": 0.99, "calibrate_threshold": 0.9, "max_entries_per_prompt": 10,
+               "max_prompts": 10, "ttl_seconds": 3600, "dim": 1024}
+    options.update(kwargs)
+    return SemanticEvaluationCache(**options)
+
+
+def test_embeddings_rank_near_duplicates_first():
+    original = embed(ORIGINAL)
+    assert abs(cosine(original, original) - 1) < 1e-9
+    assert cosine(original, embed(TYPO)) > 0.9 > cosine(original, embed(DIFFERENT))
+
+
+def test_reuse_calibrate_and_miss():
+    cache = make_cache()
+    cache.store("write_about_photo", PROMPT, ORIGINAL, evaluation(95), tokens=1500)
+
+    exact = cache.lookup("write_about_photo", PROMPT, ORIGINAL.upper())
+    near = cache.lookup("write_about_photo", PROMPT, TYPO)
+    other_prompt = cache.lookup("write_about_photo", "Describe a beach.", ORIGINAL)
+    different = cache.lookup("write_about_photo", PROMPT, DIFFERENT)
+
+    assert exact["cache_match"] == "reused" and exact["overall_score"] == 95
+    assert near["cache_match"] == "calibrated" and "cache_calibration" in near
+    assert other_prompt is None and different is None
+    stats = cache.get_stats()
+    assert stats["tokens_saved"] == 3000
+    assert stats["misses"] == 2
+
+
+def test_failed_evaluations_are_not_cached():
+    cache = make_cache()
+    cache.store("write_about_photo", PROMPT, ORIGINAL, {**evaluation(50), "error": "timeout"})
+    assert cache.lookup("write_about_photo", PROMPT, ORIGINAL) is None
+
+
+def test_eviction_and_expiry():
+    cache = make_cache(max_entries_per_prompt=2, max_prompts=2)
+    for i in range(3):
+        cache.store("write_about_photo", PROMPT, f"{ORIGINAL} Variant number {i}.", evaluation(90))
+    assert cache.get_stats()["entries"] == 2
+
+    for prompt in ("Prompt A", "Prompt B"):
+        cache.store("write_about_photo", prompt, ORIGINAL, evaluation(90))
+    assert cache.get_stats()["prompts"] == 2
+    assert cache.lookup("write_about_photo", PROMPT, ORIGINAL) is None
+
+    expiring = make_cache(ttl_seconds=-1)
+    expiring.store("write_about_photo", PROMPT, ORIGINAL, evaluation(90))
+    assert expiring.lookup("write_about_photo", PROMPT, ORIGINAL) is None
+
+
+def test_offline_harness_reports_savings_and_accuracy_loss():
+    report = evaluate_thresholds(load_corpus(DEFAULT_CORPUS), reuse=0.97, calibrate=0.9)
+
+    assert report["hits"] > 0
+    assert 0 < report["token_savings_rate"] <= report["hit_rate"] + 0.05
+    assert report["added_mae"] <= report["mae_on_hits"]
@@ -0,0 +1,103 @@
+"""
+DET Flow - Session Store Tests
+Tests for session expiry, write-behind persistence, history trimming and deactivation.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+
+from core.database import SessionLocal, engine as default_engine
+from core.models import User, UserSession
+from core.session_store import SessionStore
+
+
+@pytest.fixture
+def sessions_db(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'sessions.sqlite'}", connect_args={"check_same_thread": False})
+    User.__table__.create(engine)
+    UserSession.__table__.create(engine)
+    SessionLocal.configure(bind=engine)
+    try:
+        yield engine
+    finally:
+        SessionLocal.configure(bind=default_engine)
+        engine.dispose()
+
+
+@pytest.fixture
+def store(sessions_db):
+    store = SessionStore(timeout_minutes=30, max_turns=3, max_chars=400, flush_interval_seconds=60)
+    yield store
+    store.close()
+
+
+def rows():
+    db = SessionLocal()
+    try:
+        return {row.session_id: row for row in db.query(UserSession)}
+    finally:
+        db.close()
+
+
+def test_session_is_reused_until_it_expires(store):
+    session = store.get_session(1)
+    assert store.get_session(1) is session
+
+    session.expires_at = datetime.now() - timedelta(seconds=1)
+    renewed = store.get_session(1)
+    assert renewed.session_id != session.session_id
+    assert renewed.expires_at > datetime.now() + timedelta(minutes=29)
+
+
+def test_turns_are_written_behind_in_one_flush(store):
+    first, second = store.get_session(1), store.get_session(2)
+    store.append_turn(first, "oi", "Olá!", intent="greeting")
+    store.append_turn(second, "quero um plano", "Claro!", intent="plan")
+    store.append_turn(first, "obrigado", "De nada!")
+    assert rows() == {}  # Nothing written until the flush
+
+    assert store.flush() == 2
+    assert store.flush() == 0
+    persisted = rows()
+    assert len(persisted[first.session_id].context["history"]) == 2
+    assert persisted[second.session_id].context["last_intent"] == "plan"
+
+    # A cold store (another worker, or after a restart) resumes from the database
+    cold = SessionStore(timeout_minutes=30, flush_interval_seconds=60)
+    resumed = cold.get_session(1)
+    assert resumed.session_id == first.session_id
+    assert [turn["user"] for turn in cold.recent_history(resumed)] == ["oi", "obrigado"]
+
+
+def test_history_is_trimmed_to_turn_and_character_budgets(store):
+    session = store.get_session(1)
+    for n in range(5):
+        store.append_turn(session, f"mensagem {n}", f"resposta {n}")
+    assert [turn["user"] for turn in session.history] == ["mensagem 2", "mensagem 3", "mensagem 4"]
+
+    store.append_turn(session, "x" * 1000, "y" * 1000)
+    turn = session.history[-1]
+    assert len(turn["user"]) == 100 and turn["user"].endswith("…")  # A quarter of the budget
+    assert sum(len(t["user"]) + len(t["assistant"]) for t in session.history) <= 400
+
+
+def test_expired_sessions_are_deactivated(store):
+    stale, live = store.get_session(1), store.get_session(2)
+    store.append_turn(stale, "oi", "Olá!")
+    store.append_turn(live, "oi", "Olá!")
+    store.flush()
+
+    db = SessionLocal()
+    db.query(UserSession).filter(UserSession.session_id == stale.session_id).update(
+        {"expires_at": datetime.now() - timedelta(minutes=1)}
+    )
+    db.commit()
+    db.close()
+
+    assert store.deactivate_expired() == 1
+    assert store.deactivate_expired() == 0
+    persisted = rows()
+    assert persisted[stale.session_id].is_active is False
+    assert persisted[live.session_id].is_active is True
@@ -0,0 +1,94 @@
+"""
+DET Flow - Structured Output Tests
+Tests for schema validation, local JSON repair and the targeted re-ask.
+"""
+
+import json
+
+import pytest
+
+from agents.model_telemetry import ModelTelemetry
+from agents.schemas import EvaluationOutput
+from agents.structured_output import StructuredOutputError, parse_structured, run_structured
+
+
+VALID_EVALUATION = {
+    "overall_score": 115,
+    "subscores": {"literacy": 110, "comprehension": 115, "conversation": 120, "production": 115},
+    "cefr_level": "B2",
+    "analysis": {"grammar": "ok", "vocabulary": "ok", "relevance": "ok", "coherence": "ok"},
+    "strengths": ["vocabulary"],
+    "weaknesses": [],
+    "feedback": "Bom trabalho!",
+    "improvement_suggestions": [],
+}
+
+
+class FakeResponse:
+    def __init__(self, content):
+        self.content = content
+
+
+class FakeRouter:
+    """Returns canned answers: the first for run_with_model, the rest for re-asks."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.prompts = []
+
+    def run_with_model(self, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.answers.pop(0)), "gpt-4o"
+
+    def run_on(self, model_id, prompt):
+        self.prompts.append(prompt)
+        return FakeResponse(self.answers.pop(0))
+
+
+def test_parse_native_and_text():
+    """Schema instances pass through; fenced JSON text is parsed."""
+    native = EvaluationOutput.model_validate(VALID_EVALUATION)
+    assert parse_structured(native, EvaluationOutput)[1] == "native"
+
+    text = f"```json\n{json.dumps(VALID_EVALUATION)}\n```"
+    result, outcome = parse_structured(text, EvaluationOutput)
+    assert outcome == "parsed"
+    assert result["overall_score"] == 115
+
+
+def test_local_repair_of_truncated_json_and_coercion():
+    """Trailing commas, truncation and string scores are repaired without a new call."""
+    broken = json.dumps({**VALID_EVALUATION, "overall_score": "115/160"})[:-1] + ',"strengths": ["grammar",'
+
+    result, outcome = parse_structured(broken, EvaluationOutput)
+
+    assert outcome == "repaired"
+    assert result["overall_score"] == 115
+    assert result["strengths"] == ["grammar"]
+
+
+def test_targeted_reask_fixes_invalid_output():
+    """An unrepairable answer triggers one re-ask containing the errors and previous answer."""
+    invalid = json.dumps({**VALID_EVALUATION, "subscores": None})
+    router = FakeRouter(invalid, json.dumps(VALID_EVALUATION))
+    telemetry = ModelTelemetry()
+
+    result, model_id = run_structured(router, "evaluate", EvaluationOutput, "evaluation", telemetry=telemetry)
+
+    assert model_id == "gpt-4o"
+    assert result["cefr_level"] == "B2"
+    assert len(router.prompts) == 2
+    assert "subscores" in router.prompts[1]
+    assert "evaluate" not in router.prompts[1]
+
+
+def test_failed_reask_raises_and_counts_failure():
+    """After one failed re-ask the caller gets StructuredOutputError (no full re-generation)."""
+    router = FakeRouter("not json at all", "still not json")
+    telemetry = ModelTelemetry()
+
+    with pytest.raises(StructuredOutputError):
+        run_structured(router, "evaluate", EvaluationOutput, "evaluation", telemetry=telemetry)
+
+    assert len(router.prompts) == 2
+    assert telemetry.get_model_stats("evaluation", "gpt-4o").parse_failure_rate == 1.0
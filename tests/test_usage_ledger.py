@@ -0,0 +1,98 @@
+"""
+DET Flow - LLM Usage Ledger Tests
+Tests for usage attribution, batched writes, rollups and tier budgets.
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from core import usage_ledger as ledger_module
+from core.models import LLMUsage
+from core.usage_ledger import UsageLedger, current_usage_scope, usage_scope
+
+
+@pytest.fixture
+def ledger():
+    engine = create_engine("sqlite://")
+    LLMUsage.__table__.create(engine)
+    ledger = UsageLedger(session_factory=sessionmaker(bind=engine), batch_size=1000, flush_interval_seconds=60)
+    yield ledger
+    ledger.close()
+
+
+def usage(input_tokens=1000, output_tokens=200, cached=0):
+    return {"input_tokens": input_tokens, "cached_input_tokens": cached, "output_tokens": output_tokens}
+
+
+def test_scope_attributes_calls_and_resets():
+    with usage_scope(7, "premium"):
+        assert current_usage_scope() == {"user_id": 7, "subscription_tier": "premium"}
+    assert current_usage_scope()["user_id"] is None
+
+
+def test_rows_are_written_in_one_batch_and_rolled_up(ledger):
+    with usage_scope(1, "free"):
+        ledger.record("evaluation", "gpt-4o-mini", usage(), latency_ms=800, cost_usd=0.001)
+        ledger.record("evaluation", "gpt-4o-mini", usage(cached=500), latency_ms=1200, cost_usd=0.0006)
+    with usage_scope(2, "premium"):
+        ledger.record("chat", "gpt-4o", usage(400, 100), latency_ms=500, cost_usd=0.002)
+    ledger.record("study_plan_week", "gpt-4o", usage(), latency_ms=3000)
+
+    assert ledger.flush() == 4
+    assert ledger.get_stats()["batches"] == 1
+
+    db = ledger.session_factory()
+    rows = ledger.rollup(db, ["activity", "model"])
+    evaluation = next(row for row in rows if row["activity"] == "evaluation")
+    assert evaluation["calls"] == 2
+    assert evaluation["cached_input_tokens"] == 500
+    assert evaluation["mean_latency_ms"] == 1000
+    assert rows[0]["activity"] == "chat"  # Most expensive first
+
+    per_user = ledger.rollup(db, ["day", "user"], user_id=1)
+    assert len(per_user) == 1 and per_user[0]["user"] == 1
+    assert per_user[0]["day"] == str(datetime.now().date())
+    assert ledger.rollup(db, ["activity"], since=datetime.now() + timedelta(days=1)) == []
+    db.close()
+
+
+def test_unknown_rollup_dimension_is_rejected(ledger):
+    with pytest.raises(ValueError):
+        ledger.rollup(None, ["phone_number"])
+
+
+class BrokenSession:
+    def execute(self, *args, **kwargs):
+        raise RuntimeError("db down")
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_failed_write_keeps_rows_for_retry(ledger):
+    factory = ledger.session_factory
+    ledger.record("chat", "gpt-4o", usage())
+
+    ledger.session_factory = BrokenSession
+    assert ledger.flush() == 0
+    ledger.session_factory = factory
+    assert ledger.flush() == 1
+    assert ledger.get_stats()["write_errors"] == 1
+
+
+def test_tier_budget(ledger, monkeypatch):
+    monkeypatch.setattr(ledger_module.settings, "llm_daily_token_budgets_json", '{"free": 2000}')
+    with usage_scope(3, "free"):
+        ledger.record("chat", "gpt-4o-mini", usage(900, 100))
+        assert not ledger.is_over_budget(3, "free")
+        ledger.record("chat", "gpt-4o-mini", usage(900, 100))
+
+    assert ledger.tokens_today(3) == 2000
+    assert ledger.is_over_budget(3, "free")
+    assert not ledger.is_over_budget(3, "premium")
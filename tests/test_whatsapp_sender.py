@@ -0,0 +1,171 @@
+"""
+DET Flow - WhatsApp Sender Tests
+Exercises the outbound sender against a local fake Evolution API server.
+"""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from core.whatsapp import WhatsAppSender, EvolutionAPIError, split_message
+
+
+class FakeEvolutionServer:
+    """Minimal Evolution API stand-in that records every sendText call."""
+
+    def __init__(self, fail_first: int = 0, status_code: int = 500):
+        self.requests = []
+        self.fail_first = fail_first
+        self.status_code = status_code
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                server.requests.append({
+                    "path": self.path,
+                    "apikey": self.headers.get("apikey"),
+                    "body": body
+                })
+
+                if server.fail_first > 0:
+                    server.fail_first -= 1
+                    self.send_response(server.status_code)
+                    self.end_headers()
+                    return
+
+                payload = json.dumps({"key": {"id": f"MSG{len(server.requests)}"}}).encode()
+                self.send_response(201)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+def make_sender(server, **kwargs):
+    options = {
+        "base_url": server.url,
+        "api_key": "test-key",
+        "instance_name": "test_instance",
+        "backoff_base_seconds": 0.01,
+        "rate_limit_per_second": 1000,
+    }
+    options.update(kwargs)
+    return WhatsAppSender(**options)
+
+
+class TestSplitMessage:
+    """Tests for message splitting."""
+
+    def test_short_message_is_not_split(self):
+        assert split_message("Olá!", 100) == ["Olá!"]
+
+    def test_prefers_paragraph_boundaries(self):
+        text = "Semana 1\nLeitura\n\nSemana 2\nEscrita"
+        assert split_message(text, 20) == ["Semana 1\nLeitura", "Semana 2\nEscrita"]
+
+    def test_chunks_respect_limit(self):
+        text = " ".join(["palavra"] * 500)
+        chunks = split_message(text, 100)
+
+        assert all(len(chunk) <= 100 for chunk in chunks)
+        assert " ".join(chunks) == text
+
+
+class TestWhatsAppSender:
+    """Tests for the outbound sender."""
+
+    def test_send_text_posts_to_evolution(self):
+        async def scenario(server):
+            sender = make_sender(server)
+            await sender.send_text("5511999999999", "Avaliação concluída! ✅")
+            await sender.close()
+
+        with FakeEvolutionServer() as server:
+            asyncio.run(scenario(server))
+
+        assert len(server.requests) == 1
+        request = server.requests[0]
+        assert request["path"] == "/message/sendText/test_instance"
+        assert request["apikey"] == "test-key"
+        assert request["body"] == {"number": "5511999999999", "text": "Avaliação concluída! ✅"}
+
+    def test_long_message_is_split_in_order(self):
+        plan_text = "\n\n".join(f"*Semana {week}*\n" + "tarefa " * 20 for week in range(1, 13))
+
+        async def scenario(server):
+            sender = make_sender(server, max_message_length=200)
+            await sender.send_text("5511999999999", plan_text)
+            await sender.close()
+
+        with FakeEvolutionServer() as server:
+            asyncio.run(scenario(server))
+
+        texts = [request["body"]["text"] for request in server.requests]
+        assert len(texts) > 1
+        assert all(len(text) <= 200 for text in texts)
+        assert texts[0].startswith("*Semana 1*")
+        assert "*Semana 12*" in texts[-1]
+
+    def test_queued_messages_are_merged_and_ordered(self):
+        async def scenario(server):
+            sender = make_sender(server)
+            futures = [await sender.enqueue_text("5511999999999", f"mensagem {i}") for i in range(5)]
+            await asyncio.gather(*futures)
+            stats = sender.get_stats()
+            await sender.close()
+            return stats
+
+        with FakeEvolutionServer() as server:
+            stats = asyncio.run(scenario(server))
+
+        delivered = "\n\n".join(request["body"]["text"] for request in server.requests)
+        assert delivered == "\n\n".join(f"mensagem {i}" for i in range(5))
+        assert len(server.requests) < 5
+        assert stats["messages_delivered"] == 5
+
+    def test_retries_transient_failures(self):
+        async def scenario(server):
+            sender = make_sender(server, max_retries=3)
+            await sender.send_text("5511999999999", "Oi")
+            stats = sender.get_stats()
+            await sender.close()
+            return stats
+
+        with FakeEvolutionServer(fail_first=2) as server:
+            stats = asyncio.run(scenario(server))
+
+        assert len(server.requests) == 3
+        assert stats["retries"] == 2
+        assert stats["messages_delivered"] == 1
+
+    def test_client_errors_are_not_retried(self):
+        async def scenario(server):
+            sender = make_sender(server, max_retries=3)
+            try:
+                with pytest.raises(EvolutionAPIError):
+                    await sender.send_text("5511999999999", "Oi")
+            finally:
+                await sender.close()
+
+        with FakeEvolutionServer(fail_first=1, status_code=400) as server:
+            asyncio.run(scenario(server))
+
+        assert len(server.requests) == 1